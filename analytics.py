@@ -9,6 +9,17 @@ import matplotlib.pyplot as plt
 import io
 import base64
 
+import kinematics
+import behavior
+import baselines
+import grouping
+import time_cube
+import profiling
+
+# Số nhóm tàu lớn nhất được mô tả chi tiết trong /detect-vessel-groups
+MAX_VESSEL_GROUPS = 200
+
+@profiling.profiled
 def detect_vessel_patterns(df):
     """Phát hiện mẫu di chuyển bất thường của tàu"""
     try:
@@ -27,33 +38,32 @@ def detect_vessel_patterns(df):
         if len(df_clean) < 10:
             return {"error": "Không đủ dữ liệu để phân tích"}
         
-        # Chuẩn hóa dữ liệu
-        coords = df_clean[[lat_col, lon_col]].values
-        coords_scaled = StandardScaler().fit_transform(coords)
+        with profiling.span("dbscan"):
+            # Chuẩn hóa dữ liệu
+            coords = df_clean[[lat_col, lon_col]].values
+            coords_scaled = StandardScaler().fit_transform(coords)
         
-        # Phát hiện cụm bằng DBSCAN
-        db = DBSCAN(eps=0.3, min_samples=5).fit(coords_scaled)
-        labels = db.labels_
+            # Phát hiện cụm bằng DBSCAN
+            db = DBSCAN(eps=0.3, min_samples=5).fit(coords_scaled)
+            labels = db.labels_
         
         # Số lượng cụm (không tính nhiễu)
         n_clusters = len(set(labels)) - (1 if -1 in labels else 0)
         
-        # Thêm nhãn cụm vào dữ liệu
-        df_clean['cluster'] = labels
-        
-        # Tính toán trung tâm của các cụm
-        clusters = []
-        for i in range(n_clusters):
-            cluster_points = df_clean[df_clean['cluster'] == i]
-            center_lat = cluster_points[lat_col].mean()
-            center_lon = cluster_points[lon_col].mean()
-            size = len(cluster_points)
-            clusters.append({
-                'id': i,
-                'center': [center_lat, center_lon],
-                'size': size,
-                'points': len(cluster_points)
-            })
+        with profiling.span("clusters"):
+            # Tính toán trung tâm của các cụm
+            clusters = []
+            for i in range(n_clusters):
+                cluster_points = df_clean[labels == i]
+                center_lat = cluster_points[lat_col].mean()
+                center_lon = cluster_points[lon_col].mean()
+                size = len(cluster_points)
+                clusters.append({
+                    'id': i,
+                    'center': [center_lat, center_lon],
+                    'size': size,
+                    'points': len(cluster_points)
+                })
         
         # Tính tỷ lệ điểm nhiễu
         noise_ratio = np.sum(labels == -1) / len(labels)
@@ -67,6 +77,7 @@ def detect_vessel_patterns(df):
     except Exception as e:
         return {"error": str(e)}
 
+@profiling.profiled
 def predict_vessel_density(df):
     """Dự đoán mật độ tàu thuyền trong khu vực"""
     try:
@@ -93,16 +104,17 @@ def predict_vessel_density(df):
         lat_bins = np.linspace(lat_min, lat_max, 11)
         lon_bins = np.linspace(lon_min, lon_max, 11)
         
-        # Đếm số lượng tàu trong mỗi ô lưới
-        density_grid = np.zeros((10, 10))
-        for i in range(10):
-            for j in range(10):
-                density_grid[i, j] = np.sum(
-                    (df_clean[lat_col] >= lat_bins[i]) & 
-                    (df_clean[lat_col] < lat_bins[i+1]) & 
-                    (df_clean[lon_col] >= lon_bins[j]) & 
-                    (df_clean[lon_col] < lon_bins[j+1])
-                )
+        with profiling.span("grid"):
+            # Đếm số lượng tàu trong mỗi ô lưới
+            density_grid = np.zeros((10, 10))
+            for i in range(10):
+                for j in range(10):
+                    density_grid[i, j] = np.sum(
+                        (df_clean[lat_col] >= lat_bins[i]) & 
+                        (df_clean[lat_col] < lat_bins[i+1]) & 
+                        (df_clean[lon_col] >= lon_bins[j]) & 
+                        (df_clean[lon_col] < lon_bins[j+1])
+                    )
         
         # Tạo dữ liệu heatmap
         heatmap_data = []
@@ -142,6 +154,7 @@ def predict_vessel_density(df):
     except Exception as e:
         return {"error": str(e)}
 
+@profiling.profiled
 def analyze_vessel_types(df):
     """Phân tích chi tiết theo loại tàu"""
     try:
@@ -157,33 +170,35 @@ def analyze_vessel_types(df):
         # Tìm cột tốc độ
         speed_col = next((col for col in ['SOG', 'Speed', 'speed'] if col in df.columns), None)
         
-        speed_stats = {}
-        if speed_col:
-            # Thống kê tốc độ theo loại tàu
-            for vessel_type in vessel_counts.keys():
-                vessel_data = df[df[vessel_col] == vessel_type]
-                if len(vessel_data) > 0:
-                    speed_stats[vessel_type] = {
-                        'avg_speed': float(vessel_data[speed_col].mean()),
-                        'max_speed': float(vessel_data[speed_col].max()),
-                        'min_speed': float(vessel_data[speed_col].min())
-                    }
+        with profiling.span("speed_stats"):
+            speed_stats = {}
+            if speed_col:
+                # Thống kê tốc độ theo loại tàu
+                for vessel_type in vessel_counts.keys():
+                    vessel_data = df[df[vessel_col] == vessel_type]
+                    if len(vessel_data) > 0:
+                        speed_stats[vessel_type] = {
+                            'avg_speed': float(vessel_data[speed_col].mean()),
+                            'max_speed': float(vessel_data[speed_col].max()),
+                            'min_speed': float(vessel_data[speed_col].min())
+                        }
         
-        # Tạo biểu đồ phân bố loại tàu
-        plt.figure(figsize=(10, 6))
-        plt.bar(vessel_counts.keys(), vessel_counts.values())
-        plt.title('Phân bố loại tàu')
-        plt.xlabel('Loại tàu')
-        plt.ylabel('Số lượng')
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        
-        # Chuyển biểu đồ thành base64 để hiển thị trên web
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png')
-        buf.seek(0)
-        chart = base64.b64encode(buf.read()).decode('utf-8')
-        plt.close()
+        with profiling.span("chart"):
+            # Tạo biểu đồ phân bố loại tàu
+            plt.figure(figsize=(10, 6))
+            plt.bar(vessel_counts.keys(), vessel_counts.values())
+            plt.title('Phân bố loại tàu')
+            plt.xlabel('Loại tàu')
+            plt.ylabel('Số lượng')
+            plt.xticks(rotation=45)
+            plt.tight_layout()
+        
+            # Chuyển biểu đồ thành base64 để hiển thị trên web
+            buf = io.BytesIO()
+            plt.savefig(buf, format='png')
+            buf.seek(0)
+            chart = base64.b64encode(buf.read()).decode('utf-8')
+            plt.close()
         
         return {
             "vessel_counts": vessel_counts,
@@ -193,8 +208,14 @@ def analyze_vessel_types(df):
     except Exception as e:
         return {"error": str(e)}
 
-def generate_advanced_map(df):
-    """Tạo bản đồ nâng cao với nhiều lớp dữ liệu sử dụng Leaflet"""
+@profiling.profiled
+def generate_advanced_map(df, current=None):
+    """
+    Tạo bản đồ nâng cao với nhiều lớp dữ liệu sử dụng Leaflet
+
+    current là các dòng báo cáo mới nhất của mỗi tàu (mới nhất trước); nếu có,
+    các điểm trên bản đồ lấy từ đây thay vì mẫu ngẫu nhiên của df.
+    """
     try:
         # Tìm cột tọa độ
         lat_col = next((col for col in ['LAT', 'Latitude', 'lat', 'latitude'] if col in df.columns), None)
@@ -297,7 +318,10 @@ def generate_advanced_map(df):
         
         # Giới hạn số điểm để tránh quá tải
         max_points = min(1000, len(df_clean))
-        df_sample = df_clean.sample(n=max_points) if len(df_clean) > max_points else df_clean
+        if current is not None:
+            df_sample = current.dropna(subset=[lat_col, lon_col]).head(max_points)
+        else:
+            df_sample = df_clean.sample(n=max_points) if len(df_clean) > max_points else df_clean
         
         # Tạo các lớp cho từng loại tàu
         vessel_types = []
@@ -440,8 +464,14 @@ def generate_advanced_map(df):
     except Exception as e:
         return f"<div>Lỗi khi tạo bản đồ: {str(e)}</div>"
 
-def detect_anomalies(df):
-    """Phát hiện dữ liệu bất thường"""
+@profiling.profiled
+def detect_anomalies(df, trajectories=None, speed_baselines=None):
+    """
+    Phát hiện dữ liệu bất thường (kèm bất thường động học nếu có kho hành trình)
+
+    Tốc độ của mỗi bản ghi được so với đường cơ sở theo loại tàu và vùng biển
+    (baselines.SpeedBaselines); khi không truyền vào, đường cơ sở được dựng từ df.
+    """
     try:
         # Tìm cột tốc độ
         speed_col = next((col for col in ['SOG', 'Speed', 'speed'] if col in df.columns), None)
@@ -455,24 +485,27 @@ def detect_anomalies(df):
         if len(df_clean) < 10:
             return {"error": "Không đủ dữ liệu để phân tích"}
         
-        # Tính ngưỡng bất thường (phương pháp IQR)
-        Q1 = df_clean[speed_col].quantile(0.25)
-        Q3 = df_clean[speed_col].quantile(0.75)
-        IQR = Q3 - Q1
-        
-        lower_bound = Q1 - 1.5 * IQR
-        upper_bound = Q3 + 1.5 * IQR
-        
-        # Phát hiện bất thường
-        anomalies = df_clean[(df_clean[speed_col] < lower_bound) | (df_clean[speed_col] > upper_bound)]
+        with profiling.span("baselines"):
+            # Ngưỡng IQR theo (loại tàu, vùng) từ phác thảo phân vị
+            if speed_baselines is None:
+                speed_baselines = baselines.SpeedBaselines.build(df_clean)
+            _, anomalous, bounds = speed_baselines.score(df_clean)
+            anomalies = df_clean[anomalous]
+            overall = speed_baselines.summary(level=2)
         
         # Thống kê
         anomaly_stats = {
             "total_anomalies": len(anomalies),
             "anomaly_ratio": len(anomalies) / len(df_clean),
+            # Ngưỡng chung của toàn bộ dữ liệu (dùng khi nhóm có quá ít mẫu)
             "speed_threshold": {
-                "lower": float(lower_bound),
-                "upper": float(upper_bound)
+                "lower": overall[0]["lower"] if overall else None,
+                "upper": overall[0]["upper"] if overall else None
+            },
+            "speed_baselines": speed_baselines.summary(level=1),
+            "baseline_levels": {
+                name: int((bounds["level"] == depth).sum())
+                for name, depth in (("type_region", 0), ("type", 1), ("global", 2))
             }
         }
         
@@ -484,10 +517,40 @@ def detect_anomalies(df):
             anomaly_by_type = anomalies[vessel_col].value_counts().to_dict()
             anomaly_stats["anomaly_by_type"] = anomaly_by_type
         
+        with profiling.span("kinematic"):
+            # Bất thường động học: nhảy vị trí và SOG không khớp tốc độ suy ra
+            if trajectories is not None:
+                in_filter = trajectories.row_mask(df.index)
+                jumps = kinematics.position_jumps(trajectories) & in_filter
+                mismatch = kinematics.speed_mismatch(trajectories) & in_filter
+                anomaly_stats["kinematic"] = {
+                    "position_jumps": int(jumps.sum()),
+                    "position_jump_vessels": int(len(np.unique(trajectories.mmsi[jumps]))),
+                    "speed_mismatches": int(mismatch.sum()),
+                    "jump_speed_threshold": kinematics.JUMP_SPEED_KN
+                }
+        
+        with profiling.span("behavior"):
+            # Hành vi theo hành trình: mất tín hiệu AIS và lượn lờ của các tàu đang lọc
+            if trajectories is not None:
+                events = behavior.detect_behavior(trajectories)
+                vessels = np.unique(trajectories.mmsi[in_filter])
+                gaps = events["gaps"][np.isin(events["gaps"]["mmsi"], vessels)]
+                loitering = events["loitering"][np.isin(events["loitering"]["mmsi"], vessels)]
+                anomaly_stats["behavior"] = {
+                    "ais_gaps": int(len(gaps)),
+                    "ais_gap_vessels": int(gaps["mmsi"].nunique()),
+                    "longest_gap_hours": round(float(gaps["duration_h"].max()), 2) if len(gaps) else 0.0,
+                    "loitering_episodes": int(len(loitering)),
+                    "loitering_vessels": int(loitering["mmsi"].nunique()),
+                    "gap_threshold_hours": behavior.GAP_THRESHOLD_S / 3600
+                }
+        
         return anomaly_stats
     except Exception as e:
         return {"error": str(e)}
 
+@profiling.profiled
 def analyze_correlations(df):
     """Phân tích tương quan giữa các biến"""
     try:
@@ -501,8 +564,9 @@ def analyze_correlations(df):
         if len(numeric_cols) < 2:
             return {"error": "Không đủ dữ liệu số để phân tích tương quan"}
         
-        # Tính ma trận tương quan
-        corr_df = df[numeric_cols].corr().round(2)
+        with profiling.span("corr"):
+            # Tính ma trận tương quan
+            corr_df = df[numeric_cols].corr().round(2)
         
         # Chuyển ma trận tương quan thành danh sách các cặp tương quan
         correlations = []
@@ -525,28 +589,29 @@ def analyze_correlations(df):
         # Sắp xếp theo độ mạnh của tương quan (giảm dần)
         correlations.sort(key=lambda x: abs(x["correlation"]), reverse=True)
         
-        # Tạo biểu đồ tương quan
-        plt.figure(figsize=(10, 8))
-        plt.matshow(corr_df, fignum=1, cmap='coolwarm', vmin=-1, vmax=1)
-        plt.colorbar()
-        plt.xticks(range(len(numeric_cols)), numeric_cols, rotation=90)
-        plt.yticks(range(len(numeric_cols)), numeric_cols)
-        
-        # Thêm giá trị tương quan vào biểu đồ
-        for i in range(len(numeric_cols)):
-            for j in range(len(numeric_cols)):
-                plt.text(i, j, f"{corr_df.iloc[j, i]:.2f}", 
-                         ha="center", va="center", 
-                         color="white" if abs(corr_df.iloc[j, i]) > 0.5 else "black")
-        
-        plt.tight_layout()
-        
-        # Chuyển biểu đồ thành base64 để hiển thị trên web
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', dpi=100)
-        buf.seek(0)
-        correlation_chart = base64.b64encode(buf.read()).decode('utf-8')
-        plt.close()
+        with profiling.span("chart"):
+            # Tạo biểu đồ tương quan
+            plt.figure(figsize=(10, 8))
+            plt.matshow(corr_df, fignum=1, cmap='coolwarm', vmin=-1, vmax=1)
+            plt.colorbar()
+            plt.xticks(range(len(numeric_cols)), numeric_cols, rotation=90)
+            plt.yticks(range(len(numeric_cols)), numeric_cols)
+        
+            # Thêm giá trị tương quan vào biểu đồ
+            for i in range(len(numeric_cols)):
+                for j in range(len(numeric_cols)):
+                    plt.text(i, j, f"{corr_df.iloc[j, i]:.2f}", 
+                             ha="center", va="center", 
+                             color="white" if abs(corr_df.iloc[j, i]) > 0.5 else "black")
+        
+            plt.tight_layout()
+        
+            # Chuyển biểu đồ thành base64 để hiển thị trên web
+            buf = io.BytesIO()
+            plt.savefig(buf, format='png', dpi=100)
+            buf.seek(0)
+            correlation_chart = base64.b64encode(buf.read()).decode('utf-8')
+            plt.close()
         
         return {
             "correlations": correlations,
@@ -556,8 +621,20 @@ def analyze_correlations(df):
     except Exception as e:
         return {"error": str(e)}
 
-def analyze_temporal_patterns(df):
-    """Phân tích mẫu theo thời gian"""
+def _nonzero(counts):
+    """Các phần tử khác 0 của mảng đếm dưới dạng Series theo chỉ số"""
+    positions = np.flatnonzero(counts)
+    return pd.Series(counts[positions], index=positions)
+
+@profiling.profiled
+def analyze_temporal_patterns(df, cube=None):
+    """
+    Phân tích mẫu theo thời gian
+
+    Số bản ghi theo giờ và ngày trong tuần được lấy từ khối tổng hợp thời gian
+    (time_cube.TimeCube) của phiên bản dữ liệu; khi không truyền vào, khối được
+    dựng từ df. df không bị sửa đổi.
+    """
     try:
         # Tìm cột thời gian
         time_col = next((col for col in ['BaseDateTime', 'DateTime', 'Timestamp', 'date_time'] if col in df.columns), None)
@@ -565,28 +642,26 @@ def analyze_temporal_patterns(df):
         if not time_col:
             return {"error": "Không tìm thấy cột thời gian"}
         
-        # Chuyển đổi cột thời gian sang định dạng datetime
-        df['parsed_time'] = pd.to_datetime(df[time_col], errors='coerce')
-        df_time = df.dropna(subset=['parsed_time'])
+        with profiling.span("time_cube"):
+            # Số bản ghi theo (ngày trong tuần, giờ) của dữ liệu đang lọc
+            if cube is None:
+                cube = time_cube.TimeCube.build(df)
+                weekly = cube.aggregate(["weekday", "hour"])
+            else:
+                weekly = cube.aggregate(["weekday", "hour"], index=df.index)
         
-        if len(df_time) < 10:
+        if weekly.sum() < 10:
             return {"error": "Không đủ dữ liệu thời gian để phân tích"}
         
-        # Thêm các cột thời gian
-        df_time['hour'] = df_time['parsed_time'].dt.hour
-        df_time['day_of_week'] = df_time['parsed_time'].dt.dayofweek
-        df_time['day_name'] = df_time['parsed_time'].dt.day_name()
-        df_time['month'] = df_time['parsed_time'].dt.month
-        
-        # Phân tích theo giờ trong ngày
-        hourly_counts = df_time['hour'].value_counts().sort_index()
+        # Phân tích theo giờ trong ngày (chỉ các giờ có dữ liệu)
+        hourly_counts = _nonzero(weekly.sum(axis=0))
         
         # Tìm giờ cao điểm
         peak_hour = hourly_counts.idxmax()
         peak_count = hourly_counts.max()
         
         # Phân tích theo ngày trong tuần
-        daily_counts = df_time['day_of_week'].value_counts().sort_index()
+        daily_counts = _nonzero(weekly.sum(axis=1))
         day_names = ['Thứ 2', 'Thứ 3', 'Thứ 4', 'Thứ 5', 'Thứ 6', 'Thứ 7', 'Chủ nhật']
         daily_data = {day_names[i]: int(daily_counts.get(i, 0)) for i in range(7)}
         
@@ -595,33 +670,34 @@ def analyze_temporal_patterns(df):
         busiest_day = day_names[busiest_day_idx]
         busiest_day_count = daily_counts.max() if not daily_counts.empty else 0
         
-        # Tạo biểu đồ phân bố theo giờ
-        plt.figure(figsize=(12, 6))
-        plt.subplot(1, 2, 1)
-        plt.bar(hourly_counts.index, hourly_counts.values, color='skyblue')
-        plt.title('Phân bố theo giờ trong ngày')
-        plt.xlabel('Giờ')
-        plt.ylabel('Số lượng')
-        plt.xticks(range(0, 24, 2))
-        plt.grid(axis='y', linestyle='--', alpha=0.7)
-        
-        # Tạo biểu đồ phân bố theo ngày trong tuần
-        plt.subplot(1, 2, 2)
-        plt.bar(day_names, [daily_data.get(day, 0) for day in day_names], color='lightgreen')
-        plt.title('Phân bố theo ngày trong tuần')
-        plt.xlabel('Ngày')
-        plt.ylabel('Số lượng')
-        plt.xticks(rotation=45)
-        plt.grid(axis='y', linestyle='--', alpha=0.7)
-        
-        plt.tight_layout()
-        
-        # Chuyển biểu đồ thành base64 để hiển thị trên web
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', dpi=100)
-        buf.seek(0)
-        time_chart = base64.b64encode(buf.read()).decode('utf-8')
-        plt.close()
+        with profiling.span("chart"):
+            # Tạo biểu đồ phân bố theo giờ
+            plt.figure(figsize=(12, 6))
+            plt.subplot(1, 2, 1)
+            plt.bar(hourly_counts.index, hourly_counts.values, color='skyblue')
+            plt.title('Phân bố theo giờ trong ngày')
+            plt.xlabel('Giờ')
+            plt.ylabel('Số lượng')
+            plt.xticks(range(0, 24, 2))
+            plt.grid(axis='y', linestyle='--', alpha=0.7)
+        
+            # Tạo biểu đồ phân bố theo ngày trong tuần
+            plt.subplot(1, 2, 2)
+            plt.bar(day_names, [daily_data.get(day, 0) for day in day_names], color='lightgreen')
+            plt.title('Phân bố theo ngày trong tuần')
+            plt.xlabel('Ngày')
+            plt.ylabel('Số lượng')
+            plt.xticks(rotation=45)
+            plt.grid(axis='y', linestyle='--', alpha=0.7)
+        
+            plt.tight_layout()
+        
+            # Chuyển biểu đồ thành base64 để hiển thị trên web
+            buf = io.BytesIO()
+            plt.savefig(buf, format='png', dpi=100)
+            buf.seek(0)
+            time_chart = base64.b64encode(buf.read()).decode('utf-8')
+            plt.close()
         
         # Tím các mẫu thời gian đặc biệt
         temporal_patterns = [
@@ -672,168 +748,92 @@ def analyze_temporal_patterns(df):
     except Exception as e:
         return {"error": str(e)}
 
-def detect_vessel_groups(df):
-    """Phát hiện các nhóm tàu di chuyển cùng nhau"""
+@profiling.profiled
+def detect_vessel_groups(df, cell_km=None, min_vessels=grouping.MIN_CELL_VESSELS,
+                         max_groups=MAX_VESSEL_GROUPS):
+    """
+    Phát hiện các nhóm tàu hoạt động gần nhau trên toàn bộ dữ liệu
+    
+    Nhóm là vùng liên thông của các ô lưới cạnh cell_km có ít nhất min_vessels
+    tàu khác nhau (xem grouping.py). Kết quả trả về dạng dữ liệu (tâm, bao lồi,
+    điểm mẫu) để giao diện tự vẽ bản đồ.
+    
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        DataFrame chứa dữ liệu AIS
+    cell_km : float, optional
+        Cạnh ô lưới (km); mặc định theo phạm vi và số tàu của dữ liệu
+        (grouping.default_cell_km)
+    min_vessels : int
+        Số tàu khác nhau tối thiểu trong một ô
+    max_groups : int
+        Số nhóm lớn nhất được mô tả chi tiết
+    
+    Returns:
+    --------
+    dict
+        Các nhóm tàu và thống kê tổng hợp
+    """
     try:
         # Tìm các cột cần thiết
         lat_col = next((col for col in ['LAT', 'Latitude', 'lat', 'latitude'] if col in df.columns), None)
         lon_col = next((col for col in ['LON', 'Longitude', 'lon', 'longitude'] if col in df.columns), None)
         mmsi_col = next((col for col in ['MMSI', 'mmsi', 'VesselId'] if col in df.columns), None)
-        time_col = next((col for col in ['BaseDateTime', 'DateTime', 'Timestamp', 'date_time'] if col in df.columns), None)
+        vessel_type_col = next((col for col in ['VesselType', 'ShipType', 'vessel_type'] if col in df.columns), None)
         
         if not all([lat_col, lon_col, mmsi_col]):
             return {"error": "Thiếu các cột dữ liệu cần thiết"}
         
-        # Lọc dữ liệu hợp lệ
-        df_clean = df.dropna(subset=[lat_col, lon_col, mmsi_col])
-        df_clean = df_clean[(df_clean[lat_col] >= -90) & (df_clean[lat_col] <= 90)]
-        df_clean = df_clean[(df_clean[lon_col] >= -180) & (df_clean[lon_col] <= 180)]
+        # Lọc dữ liệu hợp lệ (chỉ lấy các mảng cần dùng, không sao chép DataFrame)
+        lats = pd.to_numeric(df[lat_col], errors='coerce').to_numpy(dtype=np.float64)
+        lons = pd.to_numeric(df[lon_col], errors='coerce').to_numpy(dtype=np.float64)
+        vessels, mmsi_values = pd.factorize(df[mmsi_col])
+        valid = (np.abs(lats) <= 90) & (np.abs(lons) <= 180) & (vessels >= 0)
         
-        if len(df_clean) < 20:
+        if valid.sum() < 20:
             return {"error": "Không đủ dữ liệu để phát hiện nhóm tàu"}
         
-        # Nếu có cột thời gian, sẽ phân tích theo thời gian
-        if time_col and time_col in df_clean.columns:
-            df_clean['parsed_time'] = pd.to_datetime(df_clean[time_col], errors='coerce')
-            df_clean = df_clean.dropna(subset=['parsed_time'])
-            
-            # Lấy mẫu dữ liệu gần đây nhất (nếu quá lớn)
-            if len(df_clean) > 1000:
-                df_clean = df_clean.sort_values('parsed_time', ascending=False).head(1000)
+        lats, lons, vessels = lats[valid], lons[valid], vessels[valid]
+        types, type_names = None, None
+        if vessel_type_col:
+            types, type_names = pd.factorize(df[vessel_type_col])
+            types = types[valid]
         
-        # Chuẩn hóa dữ liệu
-        coords = df_clean[[lat_col, lon_col]].values
-        coords_scaled = StandardScaler().fit_transform(coords)
+        if cell_km is None:
+            cell_km = grouping.default_cell_km(lats, lons, len(np.unique(vessels)))
         
-        # Phát hiện cụm bằng DBSCAN
-        db = DBSCAN(eps=0.1, min_samples=3).fit(coords_scaled)
-        labels = db.labels_
-        
-        # Thêm nhãn cụm vào dữ liệu
-        df_clean['cluster'] = labels
-        
-        # Số lượng cụm (không tính nhiễu)
-        n_clusters = len(set(labels)) - (1 if -1 in labels else 0)
+        with profiling.span("grid"):
+            labels, n_clusters = grouping.grid_clusters(lats, lons, vessels, cell_km, min_vessels)
         
         if n_clusters == 0:
             return {"error": "Không phát hiện được nhóm tàu nào"}
         
-        # Phân tích các nhóm tàu
-        vessel_groups = []
-        
-        for i in range(n_clusters):
-            cluster_data = df_clean[df_clean['cluster'] == i]
-            
-            # Tính toán trung tâm của cụm
-            center_lat = cluster_data[lat_col].mean()
-            center_lon = cluster_data[lon_col].mean()
-            
-            # Đếm số lượng tàu duy nhất trong cụm
-            unique_vessels = cluster_data[mmsi_col].nunique()
-            
-            # Xác định loại tàu trong cụm
-            vessel_type_col = next((col for col in ['VesselType', 'ShipType', 'vessel_type'] if col in df_clean.columns), None)
-            vessel_types = []
-            if vessel_type_col:
-                vessel_types = cluster_data[vessel_type_col].unique().tolist()
-                vessel_types = [str(vt) for vt in vessel_types if pd.notna(vt)]
-            
-            # Tính khoảng cách trung bình giữa các tàu trong cụm
-            if len(cluster_data) > 1:
-                from scipy.spatial.distance import pdist
-                distances = pdist(cluster_data[[lat_col, lon_col]].values)
-                avg_distance = float(np.mean(distances))
-                # Chuyển đổi khoảng cách từ độ sang km (xấp xỉ)
-                avg_distance_km = avg_distance * 111  # 1 độ ~ 111km
-            else:
-                avg_distance_km = 0
-            
-            vessel_groups.append({
-                "group_id": i,
-                "center": [float(center_lat), float(center_lon)],
-                "vessel_count": int(unique_vessels),
-                "total_records": len(cluster_data),
-                "vessel_types": vessel_types,
-                "avg_distance_km": round(avg_distance_km, 2)
-            })
+        with profiling.span("describe"):
+            vessel_groups = grouping.describe_groups(labels, n_clusters, lats, lons, vessels, types, type_names,
+                                                     max_groups=max_groups)
         
-        # Sắp xếp theo số lượng tàu giảm dần
-        vessel_groups.sort(key=lambda x: x["vessel_count"], reverse=True)
-        
-        # Tạo bản đồ hiển thị các nhóm tàu
-        m = folium.Map(location=[df_clean[lat_col].mean(), df_clean[lon_col].mean()], zoom_start=8)
-        
-        # Màu sắc cho các cụm
-        colors = ['red', 'blue', 'green', 'purple', 'orange', 'darkred', 'darkblue', 'darkgreen', 'cadetblue', 'darkpurple']
-        
-        # Thêm các điểm vào bản đồ
-        for i in range(n_clusters):
-            cluster_data = df_clean[df_clean['cluster'] == i]
-            color = colors[i % len(colors)]
-            
-            # Tạo feature group cho cụm
-            fg = folium.FeatureGroup(name=f"Nhóm {i+1} ({len(cluster_data)} điểm)")
-            
-            # Thêm các điểm vào feature group
-            for _, row in cluster_data.iterrows():
-                popup_text = f"<b>MMSI:</b> {row[mmsi_col]}<br>"
-                
-                if vessel_type_col and vessel_type_col in row:
-                    popup_text += f"<b>Loại tàu:</b> {row[vessel_type_col]}<br>"
-                
-                popup_text += f"<b>Vị trí:</b> {row[lat_col]:.4f}, {row[lon_col]:.4f}<br>"
-                popup_text += f"<b>Nhóm:</b> {i+1}"
-                
-                folium.CircleMarker(
-                    location=[row[lat_col], row[lon_col]],
-                    radius=5,
-                    popup=folium.Popup(popup_text, max_width=300),
-                    color=color,
-                    fill=True,
-                    fill_color=color,
-                    fill_opacity=0.7
-                ).add_to(fg)
-            
-            # Thêm đường bao quanh cụm
-            if len(cluster_data) > 2:
-                from scipy.spatial import ConvexHull
-                points = cluster_data[[lon_col, lat_col]].values
-                hull = ConvexHull(points)
-                hull_points = [points[vertex] for vertex in hull.vertices]
-                hull_points.append(hull_points[0])  # Đóng đa giác
-                
-                # Đổi thứ tự tọa độ (lon, lat) -> (lat, lon) cho folium
-                hull_points_folium = [[p[1], p[0]] for p in hull_points]
-                
-                folium.Polygon(
-                    locations=hull_points_folium,
-                    color=color,
-                    weight=2,
-                    fill=True,
-                    fill_color=color,
-                    fill_opacity=0.1,
-                    popup=f"Nhóm {i+1}: {len(cluster_data)} tàu"
-                ).add_to(fg)
-            
-            fg.add_to(m)
-        
-        # Thêm điều khiển lớp
-        folium.LayerControl().add_to(m)
-        
-        # Chuyển bản đồ thành HTML
-        groups_map_html = m._repr_html_()
+        # Điểm mẫu kèm MMSI để hiển thị trên bản đồ
+        for group in vessel_groups:
+            points = group["points"]
+            points["mmsi"] = [int(v) if isinstance(v, (int, np.integer)) else str(v)
+                              for v in mmsi_values[vessels[points.pop("index")]]]
         
+        in_groups = labels >= 0
         return {
             "vessel_groups": vessel_groups,
             "total_groups": n_clusters,
-            "total_vessels_in_groups": sum(g["vessel_count"] for g in vessel_groups),
-            "map_html": groups_map_html
+            "total_vessels_in_groups": int(len(np.unique(vessels[in_groups]))),
+            "total_points": int(len(labels)),
+            "noise_ratio": float(1 - in_groups.mean()),
+            "parameters": {"cell_km": cell_km, "min_vessels": min_vessels}
         }
     except Exception as e:
         return {"error": str(e)}
 
-def extract_hidden_patterns(df):
-    """Khai phá các mẫu ẩn trong dữ liệu"""
+@profiling.profiled
+def extract_hidden_patterns(df, cube=None):
+    """Khai phá các mẫu ẩn trong dữ liệu (cube: khối tổng hợp thời gian của phiên bản dữ liệu)"""
     try:
         # Tìm cột tọa độ và thời gian
         lat_col = next((col for col in ['LAT', 'Latitude', 'lat', 'latitude'] if col in df.columns), None)
@@ -846,125 +846,128 @@ def extract_hidden_patterns(df):
         # Kết quả phân tích
         insights = []
         
-        # 1. Phân tích phân bố địa lý
-        df_clean = df.dropna(subset=[lat_col, lon_col])
-        if len(df_clean) >= 10:
-            # Chia thành lưới 4x4
-            lat_bins = pd.cut(df_clean[lat_col], 4)
-            lon_bins = pd.cut(df_clean[lon_col], 4)
+        with profiling.span("geographic"):
+            # 1. Phân tích phân bố địa lý
+            df_clean = df.dropna(subset=[lat_col, lon_col])
+            if len(df_clean) >= 10:
+                # Chia thành lưới 4x4
+                lat_bins = pd.cut(df_clean[lat_col], 4)
+                lon_bins = pd.cut(df_clean[lon_col], 4)
             
-            # Đếm số lượng tàu trong mỗi ô lưới
-            grid_counts = df_clean.groupby([lat_bins, lon_bins]).size()
+                # Đếm số lượng tàu trong mỗi ô lưới
+                grid_counts = df_clean.groupby([lat_bins, lon_bins]).size()
             
-            # Tìm ô lưới có nhiều tàu nhất
-            if not grid_counts.empty:
-                max_grid = grid_counts.idxmax()
-                max_count = grid_counts.max()
-                
-                insights.append({
-                    "type": "geographic_hotspot",
-                    "description": f"Phát hiện khu vực tập trung cao với {max_count} tàu",
-                    "details": {
-                        "lat_range": str(max_grid[0]),
-                        "lon_range": str(max_grid[1]),
-                        "count": int(max_count)
-                    }
-                })
-        
-        # 2. Phân tích theo thời gian
-        if time_col and time_col in df.columns:
-            try:
-                df['parsed_time'] = pd.to_datetime(df[time_col], errors='coerce')
-                df_time = df.dropna(subset=['parsed_time'])
+                # Tìm ô lưới có nhiều tàu nhất
+                if not grid_counts.empty:
+                    max_grid = grid_counts.idxmax()
+                    max_count = grid_counts.max()
                 
-                if len(df_time) >= 10:
-                    # Phân tích theo giờ trong ngày
-                    df_time['hour'] = df_time['parsed_time'].dt.hour
-                    hourly_counts = df_time['hour'].value_counts().sort_index()
-                    
-                    # Tìm giờ cao điểm
-                    peak_hour = hourly_counts.idxmax()
-                    peak_count = hourly_counts.max()
-                    
                     insights.append({
-                        "type": "time_pattern",
-                        "description": f"Giờ cao điểm là {peak_hour}h với {peak_count} tàu",
+                        "type": "geographic_hotspot",
+                        "description": f"Phát hiện khu vực tập trung cao với {max_count} tàu",
                         "details": {
-                            "peak_hour": int(peak_hour),
-                            "count": int(peak_count)
+                            "lat_range": str(max_grid[0]),
+                            "lon_range": str(max_grid[1]),
+                            "count": int(max_count)
                         }
                     })
-            except:
-                pass
         
-        # 3. Phân tích mối quan hệ giữa các biến
-        speed_col = next((col for col in ['SOG', 'Speed', 'speed'] if col in df.columns), None)
-        course_col = next((col for col in ['COG', 'Course', 'course'] if col in df.columns), None)
+        with profiling.span("temporal"):
+            # 2. Phân tích theo thời gian
+            if time_col and time_col in df.columns:
+                try:
+                    # Số bản ghi theo giờ từ khối tổng hợp thời gian
+                    if cube is None:
+                        hourly = time_cube.TimeCube.build(df).aggregate(["hour"])
+                    else:
+                        hourly = cube.aggregate(["hour"], index=df.index)
+                
+                    if hourly.sum() >= 10:
+                        # Phân tích theo giờ trong ngày
+                        hourly_counts = _nonzero(hourly)
+                    
+                        # Tìm giờ cao điểm
+                        peak_hour = hourly_counts.idxmax()
+                        peak_count = hourly_counts.max()
+                    
+                        insights.append({
+                            "type": "time_pattern",
+                            "description": f"Giờ cao điểm là {peak_hour}h với {peak_count} tàu",
+                            "details": {
+                                "peak_hour": int(peak_hour),
+                                "count": int(peak_count)
+                            }
+                        })
+                except:
+                    pass
+        
+        with profiling.span("correlation"):
+            # 3. Phân tích mối quan hệ giữa các biến
+            speed_col = next((col for col in ['SOG', 'Speed', 'speed'] if col in df.columns), None)
+            course_col = next((col for col in ['COG', 'Course', 'course'] if col in df.columns), None)
         
-        if speed_col and course_col:
-            df_nav = df.dropna(subset=[speed_col, course_col])
+            if speed_col and course_col:
+                df_nav = df.dropna(subset=[speed_col, course_col])
             
-            if len(df_nav) >= 10:
-                # Tính hệ số tương quan
-                correlation = df_nav[speed_col].corr(df_nav[course_col])
+                if len(df_nav) >= 10:
+                    # Tính hệ số tương quan
+                    correlation = df_nav[speed_col].corr(df_nav[course_col])
                 
-                if not pd.isna(correlation):
-                    insights.append({
-                        "type": "correlation",
-                        "description": f"Hệ số tương quan giữa tốc độ và hướng đi là {correlation:.2f}",
-                        "details": {
-                            "correlation": float(correlation),
-                            "variables": [speed_col, course_col]
-                        }
-                    })
+                    if not pd.isna(correlation):
+                        insights.append({
+                            "type": "correlation",
+                            "description": f"Hệ số tương quan giữa tốc độ và hướng đi là {correlation:.2f}",
+                            "details": {
+                                "correlation": float(correlation),
+                                "variables": [speed_col, course_col]
+                            }
+                        })
         
-        # 4. Phát hiện các nhóm tàu di chuyển cùng nhau
-        vessel_col = next((col for col in ['VesselType', 'ShipType', 'vessel_type'] if col in df.columns), None)
+        with profiling.span("vessel_groups"):
+            # 4. Phát hiện các nhóm tàu di chuyển cùng nhau
+            vessel_col = next((col for col in ['VesselType', 'ShipType', 'vessel_type'] if col in df.columns), None)
         
-        if vessel_col and lat_col and lon_col:
-            # Sử dụng DBSCAN để phát hiện các nhóm tàu gần nhau
-            df_pos = df.dropna(subset=[lat_col, lon_col, vessel_col])
+            if vessel_col and lat_col and lon_col:
+                # Sử dụng DBSCAN để phát hiện các nhóm tàu gần nhau
+                df_pos = df.dropna(subset=[lat_col, lon_col, vessel_col])
             
-            if len(df_pos) >= 20:
-                # Chuẩn hóa dữ liệu
-                coords = df_pos[[lat_col, lon_col]].values
-                coords_scaled = StandardScaler().fit_transform(coords)
+                if len(df_pos) >= 20:
+                    # Chuẩn hóa dữ liệu
+                    coords = df_pos[[lat_col, lon_col]].values
+                    coords_scaled = StandardScaler().fit_transform(coords)
                 
-                # Phát hiện cụm
-                db = DBSCAN(eps=0.1, min_samples=3).fit(coords_scaled)
-                labels = db.labels_
+                    # Phát hiện cụm
+                    db = DBSCAN(eps=0.1, min_samples=3).fit(coords_scaled)
+                    labels = db.labels_
                 
-                # Số lượng cụm (không tính nhiễu)
-                n_clusters = len(set(labels)) - (1 if -1 in labels else 0)
+                    # Số lượng cụm (không tính nhiễu)
+                    n_clusters = len(set(labels)) - (1 if -1 in labels else 0)
                 
-                if n_clusters > 0:
-                    # Phân tích thành phần của các cụm
-                    df_pos['cluster'] = labels
+                    if n_clusters > 0:
+                        # Tìm cụm có nhiều loại tàu khác nhau nhất
+                        diverse_clusters = []
                     
-                    # Tìm cụm có nhiều loại tàu khác nhau nhất
-                    diverse_clusters = []
-                    
-                    for i in range(n_clusters):
-                        cluster_data = df_pos[df_pos['cluster'] == i]
-                        vessel_types = cluster_data[vessel_col].nunique()
+                        for i in range(n_clusters):
+                            cluster_data = df_pos[labels == i]
+                            vessel_types = cluster_data[vessel_col].nunique()
                         
-                        if vessel_types > 1:
-                            diverse_clusters.append({
-                                "cluster_id": i,
-                                "vessel_types": int(vessel_types),
-                                "total_vessels": len(cluster_data)
-                            })
+                            if vessel_types > 1:
+                                diverse_clusters.append({
+                                    "cluster_id": i,
+                                    "vessel_types": int(vessel_types),
+                                    "total_vessels": len(cluster_data)
+                                })
                     
-                    if diverse_clusters:
-                        # Sắp xếp theo số lượng loại tàu giảm dần
-                        diverse_clusters.sort(key=lambda x: x['vessel_types'], reverse=True)
-                        top_cluster = diverse_clusters[0]
+                        if diverse_clusters:
+                            # Sắp xếp theo số lượng loại tàu giảm dần
+                            diverse_clusters.sort(key=lambda x: x['vessel_types'], reverse=True)
+                            top_cluster = diverse_clusters[0]
                         
-                        insights.append({
-                            "type": "vessel_group",
-                            "description": f"Phát hiện nhóm {top_cluster['total_vessels']} tàu thuộc {top_cluster['vessel_types']} loại khác nhau di chuyển gần nhau",
-                            "details": top_cluster
-                        })
+                            insights.append({
+                                "type": "vessel_group",
+                                "description": f"Phát hiện nhóm {top_cluster['total_vessels']} tàu thuộc {top_cluster['vessel_types']} loại khác nhau di chuyển gần nhau",
+                                "details": top_cluster
+                            })
         
         return {
             "insights": insights,
@@ -1,5 +1,6 @@
 from fastapi import HTTPException
 import analytics
+import grouping
 
 # API endpoints for advanced analytics
 
@@ -27,22 +28,26 @@ async def analyze_temporal_patterns(processed_data):
     if df.empty:
         raise HTTPException(status_code=400, detail="No data to analyze")
     
-    result = analytics.analyze_temporal_patterns(df)
+    result = analytics.analyze_temporal_patterns(df, cube=processed_data.get('time_cube'))
     if "error" in result:
         raise HTTPException(status_code=400, detail=result["error"])
     
     return result
 
-async def detect_vessel_groups(processed_data):
-    """Phát hiện các nhóm tàu di chuyển cùng nhau"""
+async def detect_vessel_groups(processed_data, cell_km=None, min_vessels=grouping.MIN_CELL_VESSELS):
+    """Phát hiện các nhóm tàu di chuyển cùng nhau (cell_km mặc định theo phạm vi dữ liệu)"""
     if 'filtered' not in processed_data:
         raise HTTPException(status_code=400, detail="No data available")
+    if cell_km is not None and cell_km <= 0:
+        raise HTTPException(status_code=400, detail="cell_km must be positive")
+    if min_vessels < 1:
+        raise HTTPException(status_code=400, detail="min_vessels must be at least 1")
     
     df = processed_data['filtered']
     if df.empty:
         raise HTTPException(status_code=400, detail="No data to analyze")
     
-    result = analytics.detect_vessel_groups(df)
+    result = analytics.detect_vessel_groups(df, cell_km, min_vessels)
     if "error" in result:
         raise HTTPException(status_code=400, detail=result["error"])
     
@@ -0,0 +1,280 @@
+import threading
+import numpy as np
+import pandas as pd
+
+# Đường cơ sở tốc độ (SOG) theo loại tàu và vùng biển, lưu dưới dạng phác thảo
+# phân vị có thể gộp (kiểu DDSketch): mỗi giá trị rơi vào một thùng logarit với
+# sai số tương đối RELATIVE_ACCURACY, nên phác thảo chỉ là một mảng đếm, cập nhật
+# và gộp bằng phép cộng. Mỗi bản ghi được đếm ở ba mức: (loại tàu, vùng),
+# (loại tàu, mọi vùng) và (mọi loại, mọi vùng); khi mức chi tiết có quá ít mẫu,
+# ngưỡng được lấy từ mức rộng hơn.
+
+# Sai số tương đối của phân vị (1%)
+RELATIVE_ACCURACY = 0.01
+
+# Tốc độ nhỏ hơn mức này được đếm là 0; lớn hơn mức tối đa được gộp vào thùng cuối (knot)
+MIN_SPEED_KN = 0.05
+MAX_SPEED_KN = 102.2
+
+# Cạnh ô vùng biển (độ)
+REGION_DEG = 5.0
+
+# Số mẫu tối thiểu để dùng đường cơ sở của một mức
+MIN_SAMPLES = 50
+
+# Hệ số IQR của ngưỡng bất thường (giống phương pháp IQR toàn cục trước đây)
+IQR_FACTOR = 1.5
+
+# IQR tối thiểu (knot): tránh ngưỡng suy biến khi gần như mọi tàu trong nhóm cùng tốc độ
+MIN_IQR_KN = 1.0
+
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+N_BUCKETS = int(np.ceil(np.log(MAX_SPEED_KN / MIN_SPEED_KN) / np.log(GAMMA))) + 2
+
+_LAT_CELLS = int(np.ceil(180 / REGION_DEG))
+_LON_CELLS = int(np.ceil(360 / REGION_DEG))
+# Mã vùng "mọi vùng" và mã loại "mọi loại"
+ALL_REGIONS = _LAT_CELLS * _LON_CELLS
+ALL_TYPES = 0
+
+def bucket_of(speeds):
+    """Thùng của từng tốc độ: 0 cho tốc độ ~0, -1 cho giá trị thiếu hoặc âm"""
+    speeds = np.asarray(speeds, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        index = np.floor(np.log(np.maximum(speeds, MIN_SPEED_KN) / MIN_SPEED_KN) / np.log(GAMMA)).astype(np.int64) + 1
+    index = np.minimum(index, N_BUCKETS - 1)
+    index[speeds < MIN_SPEED_KN] = 0
+    index[~np.isfinite(speeds) | (speeds < 0)] = -1
+    return index
+
+def bucket_values():
+    """Giá trị đại diện của từng thùng (sai số tương đối không quá RELATIVE_ACCURACY)"""
+    lower = MIN_SPEED_KN * GAMMA ** np.arange(N_BUCKETS - 1)
+    return np.r_[0.0, lower * (1 + GAMMA) / 2]
+
+def region_of(lats, lons):
+    """Mã ô vùng biển REGION_DEG x REGION_DEG; ALL_REGIONS khi thiếu tọa độ"""
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    row = np.clip(np.floor((lats + 90) / REGION_DEG), 0, _LAT_CELLS - 1)
+    col = np.clip(np.floor((lons + 180) / REGION_DEG), 0, _LON_CELLS - 1)
+    region = row * _LON_CELLS + col
+    return np.where(np.isfinite(region), region, ALL_REGIONS).astype(np.int64)
+
+def _columns(df):
+    speed_col = next((col for col in ['SOG', 'Speed', 'speed'] if col in df.columns), None)
+    vessel_col = next((col for col in ['VesselType', 'ShipType', 'vessel_type'] if col in df.columns), None)
+    lat_col = next((col for col in ['LAT', 'Latitude', 'lat', 'latitude'] if col in df.columns), None)
+    lon_col = next((col for col in ['LON', 'Longitude', 'lon', 'longitude'] if col in df.columns), None)
+    return speed_col, vessel_col, lat_col, lon_col
+
+class SpeedBaselines:
+    """
+    Phác thảo phân vị tốc độ theo (loại tàu, vùng), cập nhật dần khi nạp dữ liệu
+
+    keys là các khóa nhóm đã sắp xếp (mã loại * (ALL_REGIONS + 1) + mã vùng) và
+    counts[i] là số bản ghi của nhóm keys[i] trong từng thùng tốc độ. Hai mảng
+    được thay cùng lúc (một tuple) nên luồng đọc không thấy trạng thái dở dang.
+    """
+
+    def __init__(self):
+        self.type_codes = {}
+        self._table = (np.empty(0, dtype=np.int64), np.empty((0, N_BUCKETS), dtype=np.int64))
+        self.version = 0
+        self._fences = None
+        self._lock = threading.Lock()
+
+    @property
+    def keys(self):
+        return self._table[0]
+
+    @property
+    def counts(self):
+        return self._table[1]
+
+    def _add(self, keys, counts):
+        """Cộng các dòng đếm (khóa không trùng nhau) vào bảng: phép cộng trên hợp các khóa"""
+        old_keys, old_counts = self._table
+        merged_keys = np.union1d(old_keys, keys)
+        merged = np.zeros((len(merged_keys), N_BUCKETS), dtype=np.int64)
+        merged[np.searchsorted(merged_keys, old_keys)] += old_counts
+        merged[np.searchsorted(merged_keys, keys)] += counts
+        self._table = (merged_keys, merged)
+        self.version += 1
+
+    @classmethod
+    def build(cls, df):
+        baselines = cls()
+        baselines.update(df)
+        return baselines
+
+    def _type_codes(self, types, add):
+        """
+        Mã số của từng loại tàu (bắt đầu từ 1)
+
+        Khi add=False, loại chưa có trong bảng mã nhận -1 (không khớp nhóm nào).
+        """
+        inverse, uniques = pd.factorize(pd.Series(types, dtype=object), use_na_sentinel=False)
+        names = ["Unknown" if pd.isna(name) else str(name) for name in uniques]
+        if add:
+            codes = [self.type_codes.setdefault(name, len(self.type_codes) + 1) for name in names]
+        else:
+            codes = [self.type_codes.get(name, -1) for name in names]
+        return np.array(codes, dtype=np.int64)[inverse]
+
+    def _group_keys(self, df, add=False):
+        """Khóa ba mức (loại+vùng, loại, toàn bộ) của từng bản ghi, kích thước (n, 3)"""
+        _, vessel_col, lat_col, lon_col = _columns(df)
+        n = len(df)
+        types = self._type_codes(df[vessel_col].to_numpy() if vessel_col else np.full(n, None), add)
+        if lat_col and lon_col:
+            regions = region_of(pd.to_numeric(df[lat_col], errors='coerce'), pd.to_numeric(df[lon_col], errors='coerce'))
+        else:
+            regions = np.full(n, ALL_REGIONS, dtype=np.int64)
+        width = ALL_REGIONS + 1
+        # Loại chưa biết không khớp mức loại+vùng và mức loại, chỉ khớp mức toàn bộ
+        unknown = types < 0
+        return np.column_stack((np.where(unknown, -1, types * width + regions),
+                                np.where(unknown, -1, types * width + ALL_REGIONS),
+                                np.full(n, ALL_TYPES * width + ALL_REGIONS, dtype=np.int64)))
+
+    def update(self, df):
+        """Cộng các bản ghi của df vào phác thảo (dùng khi nạp hoặc thêm dữ liệu)"""
+        speed_col = _columns(df)[0]
+        if not speed_col or len(df) == 0:
+            return
+        with self._lock:
+            buckets = bucket_of(pd.to_numeric(df[speed_col], errors='coerce'))
+            keys = self._group_keys(df, add=True)
+            valid = buckets >= 0
+            keys, buckets = keys[valid].ravel(), np.repeat(buckets[valid], 3)
+            added_keys, inverse = np.unique(keys, return_inverse=True)
+            added = np.bincount(inverse * N_BUCKETS + buckets,
+                                minlength=len(added_keys) * N_BUCKETS).reshape(len(added_keys), N_BUCKETS)
+            self._add(added_keys, added)
+
+    def merge(self, other):
+        """Gộp phác thảo của other (ví dụ từ một phân vùng dữ liệu khác) vào phác thảo này"""
+        with self._lock:
+            remap = np.zeros(len(other.type_codes) + 1, dtype=np.int64)
+            for name, code in other.type_codes.items():
+                remap[code] = self.type_codes.setdefault(name, len(self.type_codes) + 1)
+            width = ALL_REGIONS + 1
+            other_keys, other_counts = other._table
+            # Bảng mã mới là đơn ánh nên các khóa sau khi đổi mã vẫn không trùng nhau
+            other_keys = remap[other_keys // width] * width + other_keys % width
+            order = np.argsort(other_keys)
+            self._add(other_keys[order], other_counts[order])
+
+    def quantiles(self, qs, counts=None):
+        """Phân vị qs của từng nhóm, kích thước (số nhóm, len(qs))"""
+        counts = self.counts if counts is None else counts
+        cumulative = np.cumsum(counts, axis=1)
+        total = cumulative[:, -1:]
+        values = bucket_values()
+        result = np.empty((len(counts), len(qs)))
+        for j, q in enumerate(qs):
+            rank = np.floor(q * np.maximum(total - 1, 0)) + 1
+            result[:, j] = values[np.argmax(cumulative >= rank, axis=1)]
+        result[total[:, 0] == 0] = np.nan
+        return result
+
+    def fences(self):
+        """Khóa, số mẫu và ngưỡng (Q1, trung vị, Q3, dưới, trên) của mọi nhóm"""
+        table = self._table
+        cached = self._fences
+        if cached is not None and cached["table"] is table:
+            return cached
+        keys, counts = table
+        q1, median, q3 = self.quantiles((0.25, 0.5, 0.75), counts).T
+        iqr = np.maximum(q3 - q1, MIN_IQR_KN)
+        fences = {
+            "table": table,
+            "keys": keys,
+            "samples": counts.sum(axis=1),
+            "q1": q1,
+            "median": median,
+            "q3": q3,
+            "lower": q1 - IQR_FACTOR * iqr,
+            "upper": q3 + IQR_FACTOR * iqr
+        }
+        self._fences = fences
+        return fences
+
+    def lookup(self, df):
+        """
+        Ngưỡng tốc độ của từng bản ghi từ mức chi tiết nhất có đủ mẫu
+
+        Returns:
+        --------
+        dict
+            Mảng theo dòng của df: lower, upper, median và level (0 = loại+vùng,
+            1 = loại, 2 = toàn bộ, -1 = không có đường cơ sở)
+        """
+        fences = self.fences()
+        n = len(df)
+        chosen = np.full(n, -1, dtype=np.int64)
+        level = np.full(n, -1, dtype=np.int64)
+        if len(fences["keys"]):
+            keys = self._group_keys(df)
+            # Duyệt từ mức rộng đến mức chi tiết: mức chi tiết đủ mẫu ghi đè mức rộng
+            for depth in (2, 1, 0):
+                pos = np.minimum(np.searchsorted(fences["keys"], keys[:, depth]), len(fences["keys"]) - 1)
+                found = (fences["keys"][pos] == keys[:, depth]) & (fences["samples"][pos] >= MIN_SAMPLES)
+                chosen[found] = pos[found]
+                level[found] = depth
+        missing = chosen < 0
+
+        def pick(name):
+            if len(fences["keys"]) == 0:
+                return np.full(n, np.nan)
+            return np.where(missing, np.nan, fences[name][np.where(missing, 0, chosen)])
+
+        return {"lower": pick("lower"), "upper": pick("upper"), "median": pick("median"), "level": level}
+
+    def score(self, df):
+        """
+        Điểm bất thường tốc độ 0-100 của từng bản ghi so với đường cơ sở của nó
+
+        Độ lệch ra ngoài ngưỡng IQR được tính theo phần trăm của ngưỡng (như phương
+        pháp toàn cục trước đây); bản ghi không có tốc độ hoặc đường cơ sở nhận NaN.
+
+        Returns:
+        --------
+        tuple
+            (điểm, mặt nạ bất thường, kết quả lookup)
+        """
+        speed_col = _columns(df)[0]
+        speeds = pd.to_numeric(df[speed_col], errors='coerce').to_numpy(dtype=np.float64)
+        bounds = self.lookup(df)
+        lower, upper = bounds["lower"], bounds["upper"]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            below = np.where((speeds < lower) & (lower > 0), (lower - speeds) / lower * 100, 0)
+            above = np.where(speeds > upper, (speeds - upper) / np.maximum(upper, MIN_SPEED_KN) * 100, 0)
+        anomalous = (speeds < lower) | (speeds > upper)
+        score = np.clip(below + above, 0, 100)
+        score[np.isnan(speeds) | np.isnan(upper)] = np.nan
+        return score, anomalous, bounds
+
+    def summary(self, level=1):
+        """Đường cơ sở ở một mức (mặc định theo loại tàu) dạng danh sách"""
+        fences = self.fences()
+        width = ALL_REGIONS + 1
+        names = {code: name for name, code in self.type_codes.items()}
+        keys = fences["keys"]
+        if level == 2:
+            rows = np.flatnonzero(keys == ALL_TYPES * width + ALL_REGIONS)
+        elif level == 1:
+            rows = np.flatnonzero((keys % width == ALL_REGIONS) & (keys // width != ALL_TYPES))
+        else:
+            rows = np.flatnonzero(keys % width != ALL_REGIONS)
+        result = []
+        for i in rows:
+            entry = {"vessel_type": names.get(int(keys[i] // width), "All"), "samples": int(fences["samples"][i])}
+            if level == 0:
+                region = int(keys[i] % width)
+                entry["region"] = [(region // _LON_CELLS) * REGION_DEG - 90, (region % _LON_CELLS) * REGION_DEG - 180]
+            for name in ("q1", "median", "q3", "lower", "upper"):
+                entry[name] = round(float(fences[name][i]), 2)
+            result.append(entry)
+        return result
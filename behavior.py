@@ -0,0 +1,227 @@
+import numpy as np
+import pandas as pd
+
+from trajectory import TrajectoryStore, EARTH_RADIUS_KM, KM_PER_NM, haversine_km
+
+# Phát hiện hành vi trên các hành trình theo tàu: khoảng mất tín hiệu AIS (tàu
+# "tắt" phát) và lượn lờ (loitering: gần như không dịch chuyển trong thời gian dài).
+# Cả hai được tính trong một lượt trên các mảng của kho hành trình. Độ phân tán của
+# mỗi cửa sổ thời gian (bán kính hồi chuyển) lấy từ tổng tích lũy của vector đơn vị
+# trên mặt cầu, nên mỗi cửa sổ chỉ tốn O(1) dù dài bao nhiêu điểm. Khi dữ liệu trực
+# tiếp được thêm vào, kết quả cũ được giữ cho các tàu không có bản ghi mới.
+
+# Khoảng cách thời gian giữa hai báo cáo liên tiếp được coi là mất tín hiệu (giây)
+GAP_THRESHOLD_S = 7200
+
+# Lượn lờ: trong cửa sổ LOITER_WINDOW_S giây, các vị trí nằm trong bán kính
+# hồi chuyển LOITER_RADIUS_NM hải lý và có ít nhất LOITER_MIN_POINTS báo cáo
+LOITER_WINDOW_S = 7200
+LOITER_RADIUS_NM = 1.0
+LOITER_MIN_POINTS = 4
+
+# Kiểu dữ liệu của bảng lượn lờ khi không có đợt nào
+LOITER_DTYPES = {"mmsi": "int64", "start_time": "datetime64[ns]", "end_time": "datetime64[ns]", "duration_h": "float64",
+                 "n_points": "int64", "lat": "float64", "lon": "float64", "radius_nm": "float64", "path_km": "float64",
+                 "avg_speed_kn": "float64"}
+
+def _unit_vectors(lats, lons):
+    lat, lon = np.radians(lats), np.radians(lons)
+    return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+def _gap_after(store, gap_s):
+    """Mặt nạ các bản ghi mà khoảng cách tới bản ghi kế tiếp cùng hành trình vượt gap_s"""
+    n = len(store)
+    gap = np.zeros(n, dtype=bool)
+    if n > 1:
+        gap[:-1] = (np.diff(store.times) > gap_s) & ~store.track_starts()[1:]
+    return gap
+
+def detect_gaps(store, gap_s=GAP_THRESHOLD_S):
+    """
+    Các khoảng mất tín hiệu AIS: hai báo cáo liên tiếp của một tàu cách nhau quá gap_s
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Theo (mmsi, thời gian): vị trí lúc mất và lúc có lại tín hiệu, thời lượng,
+        quãng đường và tốc độ suy ra trong khoảng mất tín hiệu
+    """
+    start = np.flatnonzero(_gap_after(store, gap_s))
+    end = start + 1
+    duration = (store.times[end] - store.times[start]).astype(np.float64)
+    distance = haversine_km(store.lats[start], store.lons[start], store.lats[end], store.lons[end])
+    return pd.DataFrame({
+        "mmsi": store.mmsi[start],
+        "start_time": pd.to_datetime(store.times[start], unit='s'),
+        "end_time": pd.to_datetime(store.times[end], unit='s'),
+        "duration_h": duration / 3600,
+        "start_lat": store.lats[start],
+        "start_lon": store.lons[start],
+        "end_lat": store.lats[end],
+        "end_lon": store.lons[end],
+        "distance_km": distance,
+        "implied_speed_kn": distance / KM_PER_NM / (duration / 3600)
+    })
+
+def detect_loitering(store, window_s=LOITER_WINDOW_S, radius_nm=LOITER_RADIUS_NM, min_points=LOITER_MIN_POINTS,
+                     gap_s=GAP_THRESHOLD_S):
+    """
+    Các đợt lượn lờ: cửa sổ dài ít nhất window_s mà bán kính hồi chuyển không quá radius_nm
+
+    Mỗi báo cáo là điểm cuối của một cửa sổ lùi về quá khứ window_s giây trong cùng
+    hành trình; cửa sổ chứa khoảng mất tín hiệu (> gap_s) bị bỏ qua. Các cửa sổ đạt
+    ngưỡng chồng lên nhau được gộp thành một đợt.
+
+    Parameters:
+    -----------
+    store : trajectory.TrajectoryStore
+        Kho hành trình
+    window_s : int
+        Độ dài tối thiểu của cửa sổ (giây)
+    radius_nm : float
+        Bán kính hồi chuyển tối đa (hải lý)
+    min_points : int
+        Số báo cáo tối thiểu trong cửa sổ
+    gap_s : int
+        Khoảng mất tín hiệu cắt ngang cửa sổ (giây)
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Theo (mmsi, thời gian): thời gian, số báo cáo, tâm, bán kính hồi chuyển của
+        cả đợt, quãng đường đi được và tốc độ báo cáo trung bình
+    """
+    n = len(store)
+    if n == 0:
+        return pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in LOITER_DTYPES.items()})
+    starts = store.track_starts()
+    track_first = np.repeat(store.offsets[:-1], store.lengths)
+
+    # Vector đơn vị lệch so với điểm đầu hành trình: tổng tích lũy giữ được độ chính xác
+    points = _unit_vectors(store.lats, store.lons)
+    delta = points - points[track_first]
+    sums = np.zeros((n + 1, 4))
+    sums[1:, :3] = np.cumsum(delta, axis=0)
+    sums[1:, 3] = np.cumsum((delta ** 2).sum(axis=1))
+    gaps_before = np.r_[0, np.cumsum(_gap_after(store, gap_s))]
+
+    def spread_km(lo, hi):
+        """Bán kính hồi chuyển (km) của các bản ghi lo..hi (bao gồm hai đầu)"""
+        count = (hi - lo + 1)[:, None]
+        moments = (sums[hi + 1] - sums[lo]) / count
+        variance = moments[:, 3] - (moments[:, :3] ** 2).sum(axis=1)
+        return EARTH_RADIUS_KM * np.sqrt(np.maximum(variance, 0))
+
+    # Điểm đầu cửa sổ: báo cáo cuối cùng không muộn hơn t - window_s của cùng tàu
+    keys = store.sort_keys()
+    end = np.arange(n)
+    begin = np.searchsorted(keys, keys - window_s, side='right') - 1
+    valid = ((begin >= track_first) & (end - begin + 1 >= min_points)
+             & (gaps_before[end] - gaps_before[begin] == 0))
+    begin, end = begin[valid], end[valid]
+    hit = spread_km(begin, end) <= radius_nm * KM_PER_NM
+    begin, end = begin[hit], end[hit]
+
+    # Các bản ghi thuộc ít nhất một cửa sổ đạt ngưỡng
+    cover = np.cumsum(np.bincount(begin, minlength=n + 1) - np.bincount(end + 1, minlength=n + 1))[:n] > 0
+    boundary = cover & (starts | np.r_[True, ~cover[:-1]] | np.r_[False, _gap_after(store, gap_s)[:-1]])
+    first = np.flatnonzero(boundary)
+    if len(first) == 0:
+        return pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in LOITER_DTYPES.items()})
+    # Điểm cuối mỗi đợt: bản ghi cuối của chuỗi được phủ liên tục
+    run = np.cumsum(boundary) - 1
+    last = np.zeros(len(first), dtype=np.int64)
+    np.maximum.at(last, run[cover], np.flatnonzero(cover))
+
+    step = np.r_[0.0, haversine_km(store.lats[:-1], store.lons[:-1], store.lats[1:], store.lons[1:])]
+    path = np.r_[0.0, np.cumsum(step)]
+    mean = (sums[last + 1, :3] - sums[first, :3]) / (last - first + 1)[:, None] + points[track_first[first]]
+    if store.sogs is not None:
+        sog = store.sogs.astype(np.float64)
+        known = np.isfinite(sog)
+        sog_sum = np.r_[0.0, np.cumsum(np.where(known, sog, 0))]
+        sog_n = np.r_[0, np.cumsum(known)]
+        n_known = sog_n[last + 1] - sog_n[first]
+        avg_speed = np.where(n_known > 0, (sog_sum[last + 1] - sog_sum[first]) / np.maximum(n_known, 1), np.nan)
+    else:
+        avg_speed = np.full(len(first), np.nan)
+
+    return pd.DataFrame({
+        "mmsi": store.mmsi[first],
+        "start_time": pd.to_datetime(store.times[first], unit='s'),
+        "end_time": pd.to_datetime(store.times[last], unit='s'),
+        "duration_h": (store.times[last] - store.times[first]) / 3600,
+        "n_points": last - first + 1,
+        "lat": np.degrees(np.arctan2(mean[:, 2], np.hypot(mean[:, 0], mean[:, 1]))),
+        "lon": np.degrees(np.arctan2(mean[:, 1], mean[:, 0])),
+        "radius_nm": spread_km(first, last) / KM_PER_NM,
+        # Quãng đường chỉ tính các bước nằm trong đợt
+        "path_km": path[last + 1] - path[first + 1],
+        "avg_speed_kn": avg_speed
+    })
+
+def _key(gap_s, window_s, radius_nm, min_points):
+    return ("behavior", int(gap_s), int(window_s), float(radius_nm), int(min_points))
+
+def detect_behavior(store, gap_s=GAP_THRESHOLD_S, window_s=LOITER_WINDOW_S, radius_nm=LOITER_RADIUS_NM,
+                    min_points=LOITER_MIN_POINTS):
+    """
+    Khoảng mất tín hiệu và đợt lượn lờ của mọi tàu trong kho (lưu lại theo phiên bản kho)
+
+    Returns:
+    --------
+    dict
+        "gaps" và "loitering": DataFrame của detect_gaps và detect_loitering
+    """
+    key = _key(gap_s, window_s, radius_nm, min_points)
+    if key not in store.derived:
+        store.derived[key] = {
+            "gaps": detect_gaps(store, gap_s),
+            "loitering": detect_loitering(store, window_s, radius_nm, min_points, gap_s)
+        }
+    return store.derived[key]
+
+def _subset(store, vessel_positions):
+    """Kho con gồm hành trình của các tàu tại các vị trí cho trước trong store.vessels"""
+    lengths = store.lengths[vessel_positions]
+    rows = np.repeat(store.offsets[vessel_positions] - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+
+    def pick(values):
+        return values[rows] if values is not None else None
+
+    return TrajectoryStore(row_ids=store.row_ids[rows], mmsi=store.mmsi[rows], times=store.times[rows],
+                           lats=store.lats[rows], lons=store.lons[rows], sogs=pick(store.sogs), cogs=pick(store.cogs))
+
+def carry_forward(old, new):
+    """
+    Chuyển kết quả hành vi đã tính của kho cũ sang kho mới sau khi thêm dữ liệu
+
+    Chỉ các tàu có hành trình thay đổi (độ dài khác hoặc tàu mới) được tính lại;
+    kết quả của các tàu còn lại được giữ nguyên.
+    """
+    if old is None or new is None or old is new:
+        return
+    keys = [key for key in old.derived if isinstance(key, tuple) and key[0] == "behavior"]
+    if not keys:
+        return
+    if old.n_vessels:
+        pos = np.minimum(np.searchsorted(old.vessels, new.vessels), old.n_vessels - 1)
+        touched = np.flatnonzero((old.vessels[pos] != new.vessels) | (old.lengths[pos] != new.lengths))
+    else:
+        touched = np.arange(new.n_vessels)
+    sub = _subset(new, touched)
+
+    for key in keys:
+        if key in new.derived:
+            continue
+        _, gap_s, window_s, radius_nm, min_points = key
+        fresh = {
+            "gaps": detect_gaps(sub, gap_s),
+            "loitering": detect_loitering(sub, window_s, radius_nm, min_points, gap_s)
+        }
+        merged = {}
+        for name, previous in old.derived[key].items():
+            kept = previous[~np.isin(previous["mmsi"].to_numpy(), new.vessels[touched])]
+            merged[name] = pd.concat([kept, fresh[name]], ignore_index=True).sort_values(
+                ["mmsi", "start_time"], kind='stable', ignore_index=True)
+        new.derived[key] = merged
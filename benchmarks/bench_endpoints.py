@@ -0,0 +1,157 @@
+"""
+Benchmark mọi endpoint của ứng dụng trên dữ liệu AIS tổng hợp ở nhiều quy mô
+
+Các route được gọi trong cùng tiến trình qua TestClient của FastAPI; với mỗi
+route ghi lại độ trễ (lần đầu và các phân vị), RSS đỉnh và kích thước phản hồi.
+
+Ví dụ:
+    python benchmarks/bench_endpoints.py --scales 10k,100k,1m --output bench_endpoints.json
+    python benchmarks/bench_endpoints.py --scales 10k,100k --compare bench_endpoints.json
+"""
+import io
+import os
+import sys
+import argparse
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import common  # noqa: E402
+
+DEFAULT_SCALES = "10k,100k,1m"
+
+# Các route không chạy được trong benchmark cục bộ
+SKIPPED = {
+    "/download-ais": "needs network access",
+    "/download-progress": "tracks /download-ais jobs",
+    "/ingest/start": "needs an NMEA source",
+    "/ingest/stop": "needs an NMEA source",
+    "/ingest/status": "needs an NMEA source",
+    "/ws/positions": "WebSocket stream",
+    "/upload-hazard-layer": "needs a hazard layer file"
+}
+
+def route_specs(df):
+    """
+    Danh sách (tên, phương thức, đường dẫn, tham số yêu cầu) theo thứ tự chạy
+
+    /upload-file chạy đầu tiên để nạp dữ liệu; /generate-sample-data chạy cuối vì nó thay dữ liệu.
+    """
+    mmsi = int(df['MMSI'].value_counts().index[0])
+    lat_mid, lon_mid = float(df['LAT'].median()), float(df['LON'].median())
+    bbox_filter = {"min_lat": lat_mid - 10, "max_lat": lat_mid + 10, "min_lon": lon_mid - 10, "max_lon": lon_mid + 10}
+    return [
+        ("/data-status", "GET", "/data-status", {}),
+        ("/filter-data", "POST", "/filter-data", {"json": bbox_filter}),
+        # Bỏ bộ lọc để các route sau chạy trên toàn bộ dữ liệu
+        (None, "POST", "/filter-data", {"json": {}}),
+        ("/", "GET", "/", {}),
+        ("/generate-map", "GET", "/generate-map", {}),
+        ("/advanced-map", "GET", "/advanced-map", {}),
+        ("/marine-cadastre-map", "GET", "/marine-cadastre-map", {}),
+        ("/export-data?format=csv", "GET", "/export-data", {"params": {"format": "csv"}}),
+        ("/export-data?format=parquet", "GET", "/export-data", {"params": {"format": "parquet"}}),
+        ("/detect-patterns", "GET", "/detect-patterns", {}),
+        ("/predict-density", "GET", "/predict-density", {}),
+        ("/analyze-vessel-types", "GET", "/analyze-vessel-types", {}),
+        ("/detect-anomalies", "GET", "/detect-anomalies", {}),
+        ("/analyze-correlations", "GET", "/analyze-correlations", {}),
+        ("/analyze-temporal-patterns", "GET", "/analyze-temporal-patterns", {}),
+        ("/temporal-cube", "GET", "/temporal-cube", {}),
+        ("/detect-vessel-groups", "GET", "/detect-vessel-groups", {}),
+        ("/extract-hidden-patterns", "GET", "/extract-hidden-patterns", {}),
+        ("/calculate-risk-scores", "GET", "/calculate-risk-scores", {}),
+        ("/calculate-risk-scores?current=true", "GET", "/calculate-risk-scores", {"params": {"current": "true"}}),
+        ("/identify-risky-routes", "POST", "/identify-risky-routes", {}),
+        ("/risk-map", "GET", "/risk-map", {}),
+        ("/hazard-layer", "GET", "/hazard-layer", {}),
+        ("/weather-layer", "GET", "/weather-layer", {}),
+        ("/download-cache", "GET", "/download-cache", {}),
+        ("/playback", "GET", "/playback", {"params": {"frame": 10}}),
+        ("/latest-positions", "GET", "/latest-positions", {}),
+        ("/vessel-track/{mmsi}", "GET", f"/vessel-track/{mmsi}", {}),
+        ("/segments", "GET", "/segments", {}),
+        ("/comovement", "GET", "/comovement", {}),
+        ("/behavior-events", "GET", "/behavior-events", {}),
+        ("/speed-baselines", "GET", "/speed-baselines", {}),
+        ("/vessel-tracks", "GET", "/vessel-tracks", {}),
+        ("/metrics", "GET", "/metrics", {}),
+        ("/generate-sample-data", "GET", "/generate-sample-data", {"params": {"n_records": min(len(df), 5_000_000)}})
+    ]
+
+def check_coverage(app, specs):
+    """Cảnh báo các route của ứng dụng chưa có trong benchmark"""
+    covered = {"/upload-file"} | {name.split("?")[0] for name, _, _, _ in specs if name}
+    for route in app.routes:
+        path = getattr(route, "path", "")
+        if path.startswith("/static") or path.startswith("/docs") or path.startswith("/openapi") or path.startswith("/redoc"):
+            continue
+        if path not in covered and path not in SKIPPED:
+            print(f"[WARNING] Route {path} is not benchmarked; add it to route_specs or SKIPPED")
+
+def run_scale(client, n_records, repeats, max_seconds, seed):
+    print(f"[INFO] Generating {n_records:,} synthetic records")
+    df = common.synthetic_frame(n_records, seed=seed)
+    csv_bytes = df.to_csv(index=False).encode()
+    specs = route_specs(df)
+    del df
+
+    results = []
+
+    def record(name, method, path, kwargs, runs):
+        stats, response = common.measure(lambda: client.request(method, path, **kwargs), runs, max_seconds)
+        result = {"scale": n_records, "route": name, "method": method, "status": response.status_code,
+                  "payload_bytes": len(response.content), **stats}
+        results.append(result)
+        flag = "" if response.status_code < 400 else f"  [HTTP {response.status_code}]"
+        print(f"  {name:<40} p50 {stats['p50_ms']:>10.1f} ms  first {stats['first_ms']:>10.1f} ms  "
+              f"peak {stats['peak_rss_mb']:>8.1f} MB  {len(response.content):>12,} B{flag}")
+
+    # Mỗi lần tải lên thay dữ liệu nên chỉ đo một lần
+    record("/upload-file", "POST", "/upload-file",
+           {"files": {"file": ("bench.csv", io.BytesIO(csv_bytes), "text/csv")}}, 1)
+    del csv_bytes
+
+    for name, method, path, kwargs in specs:
+        if name is None:
+            client.request(method, path, **kwargs)
+            continue
+        record(name, method, path, kwargs, 1 if name == "/generate-sample-data" else repeats)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every endpoint on synthetic AIS data")
+    parser.add_argument("--scales", default=DEFAULT_SCALES, help="comma-separated row counts, e.g. 10k,100k,1m,10m")
+    parser.add_argument("--repeats", type=int, default=5, help="runs per route (first run reported separately)")
+    parser.add_argument("--max-seconds", type=float, default=60, help="stop repeating a route after this long")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_endpoints.json", help="results file")
+    parser.add_argument("--compare", default=None, help="baseline results file to compare against")
+    parser.add_argument("--threshold", type=float, default=common.DEFAULT_THRESHOLD,
+                        help="ratio over baseline that counts as a regression")
+    args = parser.parse_args()
+    # Cảnh báo của pandas/matplotlib trong các hàm phân tích lặp lại ở mỗi lần chạy
+    warnings.simplefilter("ignore", FutureWarning)
+    warnings.simplefilter("ignore", UserWarning)
+
+    output = os.path.abspath(args.output)
+    baseline = os.path.abspath(args.compare) if args.compare else None
+    # Ứng dụng gắn thư mục static theo đường dẫn tương đối
+    os.chdir(common.ROOT)
+    from fastapi.testclient import TestClient
+    import main as app_module
+
+    check_coverage(app_module.app, route_specs(common.synthetic_frame(1000)))
+
+    results = []
+    with TestClient(app_module.app) as client:
+        for n_records in common.parse_scales(args.scales):
+            results.extend(run_scale(client, n_records, args.repeats, args.max_seconds, args.seed))
+
+    common.write_results(output, "endpoints", results, scales=args.scales, repeats=args.repeats)
+    if baseline:
+        regressions = common.compare(results, baseline, ("scale", "route"), args.threshold)
+        sys.exit(common.report_regressions(regressions, args.threshold))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Benchmark các hàm phân tích (analytics.py, risk_analysis.py) theo hình dạng dữ liệu
+
+Mỗi lần quét chỉ thay đổi một chiều so với hình dạng gốc: số bản ghi, số tàu,
+số loại tàu hoặc độ trải rộng không gian. Với các chiều số bản ghi và số tàu,
+độ dốc log-log của thời gian p50 cho biết hàm tăng tuyến tính (~1) hay siêu
+tuyến tính (> SUPERLINEAR_SLOPE).
+
+Ví dụ:
+    python benchmarks/bench_functions.py --output bench_functions.json
+    python benchmarks/bench_functions.py --rows 10k,30k,100k --functions detect_vessel_groups
+    python benchmarks/bench_functions.py --compare bench_functions.json
+"""
+import os
+import sys
+import argparse
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import common  # noqa: E402
+
+# Hình dạng gốc: mỗi lần quét chỉ thay đổi một chiều
+BASE_SHAPE = {"rows": 20_000, "vessels": 200, "types": 7, "spread": 10.0}
+
+DEFAULT_SWEEPS = {
+    "rows": "5k,20k,80k",
+    "vessels": "20,200,2000",
+    "types": "2,7,50",
+    "spread": "0.5,10,60"
+}
+
+# Độ dốc log-log lớn hơn mức này được đánh dấu là siêu tuyến tính
+SUPERLINEAR_SLOPE = 1.15
+
+# Vùng trung tâm khi co giãn tọa độ theo độ trải rộng
+CENTER_LAT, CENTER_LON = 10.0, 110.0
+
+def shaped_frame(rows, vessels, types, spread, seed=0):
+    """
+    Dữ liệu tổng hợp với hình dạng cho trước
+
+    Parameters:
+    -----------
+    rows : int
+        Số bản ghi
+    vessels : int
+        Số tàu
+    types : int
+        Số loại tàu khác nhau
+    spread : float
+        Cạnh của vùng chứa các tàu (độ); vùng nhỏ nghĩa là tàu dày đặc hơn
+    """
+    df = common.synthetic_frame(rows, seed=seed, n_vessels=vessels)
+
+    # Giữ hình dạng hành trình, chỉ co giãn về vùng spread x spread quanh tâm
+    for col, center, limit in (('LAT', CENTER_LAT, 85), ('LON', CENTER_LON, 180)):
+        values = df[col].to_numpy()
+        span = max(values.max() - values.min(), 1e-9)
+        df[col] = np.clip(center + (values - values.min()) / span * spread - spread / 2, -limit, limit)
+
+    # Loại tàu cố định theo tàu; 7 loại giữ nguyên tên thật của bộ sinh dữ liệu
+    if types != len(common.sample_data.VESSEL_TYPES):
+        codes = df['MMSI'].to_numpy() % types
+        names = np.array([f"Type {i}" for i in range(types)], dtype=object)
+        df['VesselType'] = names[codes]
+    return df
+
+def function_specs(df, store, scored):
+    """(tên, hàm không tham số) theo cách ứng dụng gọi từng hàm"""
+    import analytics
+    import risk_analysis
+    import live_dataset
+
+    # Dữ liệu dùng chung chỉ đọc như trong ứng dụng: hàm nào ghi vào df sẽ báo lỗi
+    frame = live_dataset.read_only(df)
+
+    def fresh():
+        return frame
+
+    return [
+        ("detect_vessel_patterns", lambda: analytics.detect_vessel_patterns(fresh())),
+        ("predict_vessel_density", lambda: analytics.predict_vessel_density(fresh())),
+        ("analyze_vessel_types", lambda: analytics.analyze_vessel_types(fresh())),
+        ("detect_anomalies", lambda: analytics.detect_anomalies(fresh(), trajectories=store)),
+        ("analyze_correlations", lambda: analytics.analyze_correlations(fresh())),
+        ("analyze_temporal_patterns", lambda: analytics.analyze_temporal_patterns(fresh())),
+        ("detect_vessel_groups", lambda: analytics.detect_vessel_groups(fresh())),
+        ("extract_hidden_patterns", lambda: analytics.extract_hidden_patterns(fresh())),
+        ("calculate_risk_scores", lambda: risk_analysis.calculate_risk_scores(fresh(), columns_only=True,
+                                                                              trajectories=store)),
+        ("identify_risky_routes", lambda: risk_analysis.identify_risky_routes(scored.copy(deep=False))),
+        ("generate_risk_map", lambda: risk_analysis.generate_risk_map(scored.copy(deep=False)))
+    ]
+
+def parse_sweep(dimension, text):
+    if dimension == "spread":
+        return [float(v) for v in text.split(",")]
+    return common.parse_scales(text)
+
+def run_shape(shape, selected, repeats, max_seconds, seed, slow):
+    """Đo các hàm đã chọn trên một hình dạng dữ liệu; bỏ qua hàm nằm trong slow"""
+    import risk_analysis
+    from trajectory import TrajectoryStore
+
+    df = shaped_frame(seed=seed, **shape)
+    store = TrajectoryStore.build(df)
+    scored = risk_analysis.calculate_risk_scores(df.copy(deep=False), trajectories=store)
+    if isinstance(scored, dict):
+        raise RuntimeError(f"calculate_risk_scores failed: {scored['error']}")
+
+    results = []
+    for name, fn in function_specs(df, store, scored):
+        if name not in selected:
+            continue
+        if name in slow:
+            print(f"  {name:<28} skipped (over {max_seconds:.0f} s at a smaller size)")
+            continue
+        stats, output = common.measure(fn, repeats, max_seconds)
+        error = str(output["error"]).splitlines()[0] if isinstance(output, dict) and "error" in output else None
+        results.append({"function": name, **shape, **stats, "error": error})
+        flag = f"  [error: {error}]" if error else ""
+        print(f"  {name:<28} p50 {stats['p50_ms']:>10.1f} ms  first {stats['first_ms']:>10.1f} ms  "
+              f"peak {stats['peak_rss_mb']:>8.1f} MB{flag}")
+        if stats['first_ms'] > max_seconds * 1000:
+            slow.add(name)
+    return results
+
+def scaling_slopes(results, dimension):
+    """Độ dốc log-log của p50 theo một chiều, cho từng hàm"""
+    slopes = {}
+    for name in dict.fromkeys(r["function"] for r in results):
+        points = [(r[dimension], r["p50_ms"]) for r in results
+                  if r["function"] == name and r["sweep"] == dimension and r["p50_ms"] > 0 and not r["error"]]
+        if len(points) < 2:
+            continue
+        x, y = np.log([p[0] for p in points]), np.log([p[1] for p in points])
+        slopes[name] = round(float(np.polyfit(x, y, 1)[0]), 2)
+    return slopes
+
+def report_scaling(results):
+    scaling = {}
+    for dimension in ("rows", "vessels"):
+        slopes = scaling_slopes(results, dimension)
+        if not slopes:
+            continue
+        scaling[dimension] = slopes
+        print(f"[INFO] Scaling with {dimension} (log-log slope of p50):")
+        for name, slope in sorted(slopes.items(), key=lambda item: -item[1]):
+            flag = "  SUPERLINEAR" if slope > SUPERLINEAR_SLOPE else ""
+            print(f"  {name:<28} {slope:>6.2f}{flag}")
+    return scaling
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark analytics and risk functions over data shapes")
+    parser.add_argument("--rows", default=DEFAULT_SWEEPS["rows"], help="row counts to sweep, e.g. 10k,100k,1m")
+    parser.add_argument("--vessels", default=DEFAULT_SWEEPS["vessels"], help="vessel counts to sweep")
+    parser.add_argument("--types", default=DEFAULT_SWEEPS["types"], help="vessel type cardinalities to sweep")
+    parser.add_argument("--spread", default=DEFAULT_SWEEPS["spread"], help="spatial extents (degrees) to sweep")
+    parser.add_argument("--functions", default=None, help="comma-separated subset of functions")
+    parser.add_argument("--repeats", type=int, default=3, help="runs per function (first run reported separately)")
+    parser.add_argument("--max-seconds", type=float, default=30,
+                        help="stop repeating after this long; skip larger sizes of functions slower than this")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_functions.json", help="results file")
+    parser.add_argument("--compare", default=None, help="baseline results file to compare against")
+    parser.add_argument("--threshold", type=float, default=common.DEFAULT_THRESHOLD,
+                        help="ratio over baseline that counts as a regression")
+    args = parser.parse_args()
+    # Cảnh báo của pandas/matplotlib trong các hàm phân tích lặp lại ở mỗi lần chạy
+    warnings.simplefilter("ignore", FutureWarning)
+    warnings.simplefilter("ignore", UserWarning)
+    # Copy-on-write được bật cho cả tiến trình như main.py
+    pd.set_option("mode.copy_on_write", True)
+
+    names = [name for name, _ in function_specs(None, None, None)]
+    selected = set(args.functions.split(",")) if args.functions else set(names)
+    unknown = selected - set(names)
+    if unknown:
+        parser.error(f"unknown functions: {', '.join(sorted(unknown))}")
+
+    results = []
+    for dimension in ("rows", "vessels", "types", "spread"):
+        # Hàm quá chậm ở một kích thước sẽ bỏ qua các kích thước lớn hơn của chiều này
+        slow = set()
+        for value in sorted(parse_sweep(dimension, getattr(args, dimension))):
+            shape = {**BASE_SHAPE, dimension: value}
+            print(f"[INFO] {dimension}={value}: " + ", ".join(f"{k}={v}" for k, v in shape.items()))
+            for result in run_shape(shape, selected, args.repeats, args.max_seconds, args.seed, slow):
+                results.append({"sweep": dimension, **result})
+
+    scaling = report_scaling(results)
+    common.write_results(args.output, "functions", results, base_shape=BASE_SHAPE, scaling=scaling,
+                         repeats=args.repeats)
+    if args.compare:
+        regressions = common.compare(results, args.compare, ("sweep", "function", "rows", "vessels", "types", "spread"),
+                                     args.threshold)
+        sys.exit(common.report_regressions(regressions, args.threshold))
+
+if __name__ == "__main__":
+    main()
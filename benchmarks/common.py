@@ -0,0 +1,168 @@
+import os
+import sys
+import json
+import time
+import platform
+import resource
+import threading
+import subprocess
+
+import numpy as np
+
+# Công cụ dùng chung cho các benchmark: sinh dữ liệu, đo thời gian và bộ nhớ,
+# ghi kết quả JSON và so sánh với kết quả gốc (baseline).
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from data import sample_data  # noqa: E402
+
+# Khoảng lấy mẫu RSS khi đo bộ nhớ đỉnh (giây)
+RSS_SAMPLE_INTERVAL_S = 0.005
+
+# Mặc định: chậm hơn 20% so với baseline là suy giảm
+DEFAULT_THRESHOLD = 1.2
+
+# Bỏ qua chênh lệch tuyệt đối nhỏ hơn mức này (ms hoặc MB) để tránh nhiễu đo
+MIN_DELTA = 2.0
+
+SCALE_SUFFIXES = {"k": 1_000, "m": 1_000_000}
+
+def parse_scales(text):
+    """'10k,100k,1m' -> [10000, 100000, 1000000]"""
+    scales = []
+    for part in text.split(","):
+        part = part.strip().lower()
+        factor = SCALE_SUFFIXES.get(part[-1:], 1)
+        scales.append(int(float(part.rstrip("km")) * factor))
+    return scales
+
+def synthetic_frame(n_records, seed=0, n_vessels=None):
+    """Dữ liệu AIS tổng hợp cùng định dạng với CSV của marinecadastre.gov"""
+    return sample_data.generate_sample_data(n_records, save=False, seed=seed, n_vessels=n_vessels)
+
+def rss_bytes():
+    """Bộ nhớ thường trú hiện tại của tiến trình (byte)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Không có /proc: dùng giá trị đỉnh của cả tiến trình (KB trên Linux, byte trên macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+class PeakRss:
+    """Đo RSS đỉnh trong một khối lệnh bằng luồng lấy mẫu"""
+
+    def __enter__(self):
+        self.start = self.peak = rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(RSS_SAMPLE_INTERVAL_S):
+            self.peak = max(self.peak, rss_bytes())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_bytes())
+
+def measure(fn, repeats=5, max_seconds=60):
+    """
+    Đo thời gian chạy của fn
+
+    Lần chạy đầu (lạnh) được ghi riêng; các lần sau dừng sớm khi tổng thời gian vượt max_seconds.
+
+    Returns:
+    --------
+    tuple
+        (thống kê, kết quả của lần chạy cuối)
+    """
+    samples = []
+    peak = 0
+    start_rss = rss_bytes()
+    result = None
+    budget_start = time.perf_counter()
+    for i in range(max(repeats, 1)):
+        with PeakRss() as rss:
+            t = time.perf_counter()
+            result = fn()
+            samples.append((time.perf_counter() - t) * 1000)
+        peak = max(peak, rss.peak)
+        if time.perf_counter() - budget_start > max_seconds:
+            break
+
+    warm = np.array(samples[1:] or samples)
+    return {
+        "runs": len(samples),
+        "first_ms": round(samples[0], 3),
+        "p50_ms": round(float(np.percentile(warm, 50)), 3),
+        "p90_ms": round(float(np.percentile(warm, 90)), 3),
+        "p99_ms": round(float(np.percentile(warm, 99)), 3),
+        "max_ms": round(float(warm.max()), 3),
+        "peak_rss_mb": round(peak / 2**20, 1),
+        "rss_growth_mb": round((peak - start_rss) / 2**20, 1)
+    }, result
+
+def environment():
+    """Thông tin môi trường ghi kèm kết quả"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count()
+    }
+
+def write_results(path, suite, results, **meta):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"suite": suite, "meta": {**environment(), **meta}, "results": results}, f, indent=2)
+    print(f"[INFO] Wrote {len(results)} results to {path}")
+
+def compare(results, baseline_path, key_fields, threshold=DEFAULT_THRESHOLD, metrics=("p50_ms", "peak_rss_mb"),
+            min_delta=MIN_DELTA):
+    """
+    So sánh kết quả với file baseline
+
+    Returns:
+    --------
+    list
+        Các suy giảm: dict gồm khóa, chỉ số, giá trị baseline, giá trị mới và tỷ lệ
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    base = {tuple(r[k] for k in key_fields): r for r in baseline}
+
+    regressions = []
+    for result in results:
+        key = tuple(result[k] for k in key_fields)
+        old = base.get(key)
+        if old is None:
+            continue
+        for metric in metrics:
+            if metric not in result or not old.get(metric):
+                continue
+            ratio = result[metric] / old[metric]
+            if ratio > threshold and result[metric] - old[metric] >= min_delta:
+                regressions.append({"key": " ".join(str(k) for k in key), "metric": metric,
+                                    "baseline": old[metric], "current": result[metric], "ratio": round(ratio, 2)})
+    return regressions
+
+def report_regressions(regressions, threshold):
+    """In các suy giảm; trả về mã thoát (1 nếu có suy giảm)"""
+    if not regressions:
+        print(f"[INFO] No regressions above {threshold:.2f}x baseline")
+        return 0
+    print(f"[WARNING] {len(regressions)} regressions above {threshold:.2f}x baseline:")
+    for r in regressions:
+        print(f"  {r['key']:<50} {r['metric']:<12} {r['baseline']:>10} -> {r['current']:>10} ({r['ratio']}x)")
+    return 1
@@ -0,0 +1,302 @@
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+import playback
+from trajectory import EARTH_RADIUS_KM, KM_PER_NM, haversine_km
+
+# Phát hiện các tàu đi cùng nhau theo thời gian (đoàn tàu, gặp nhau trên biển).
+# Vị trí nội suy của chỉ mục phát lại được xét theo từng khung: mỗi khung được băm
+# vào lưới ô có cạnh bằng bán kính, nên chỉ các tàu ở cùng ô hoặc ô kề mới được
+# so khoảng cách. Các lần gặp của từng cặp được gộp dần thành đoạn liên tục theo
+# từng lô khung, rồi nối qua ranh giới lô; đoạn kéo dài đủ lâu là một lần gặp.
+
+# Bán kính mặc định (hải lý) và thời gian tối thiểu của một lần gặp (giây)
+DEFAULT_RADIUS_NM = 0.5
+DEFAULT_MIN_DURATION_S = 1800
+
+# Số khung liên tiếp tối đa được phép thiếu trong một lần gặp (mất tín hiệu ngắn)
+MAX_MISSED_FRAMES = 1
+
+# Lần gặp mà cả hai tàu đều chạy chậm hơn mức này (hải lý/giờ) được xếp là
+# "rendezvous" (có thể chuyển tải giữa hai tàu); còn lại là "convoy"
+RENDEZVOUS_SPEED_KN = 3.0
+
+# Số vị trí tối đa trong một lô khung (giới hạn bộ nhớ của bước tìm cặp)
+CHUNK_POSITIONS = 1_000_000
+
+# Vĩ độ lớn nhất dùng để tính độ rộng ô theo kinh độ (gần cực ô rất rộng)
+MAX_CELL_LAT = 80.0
+
+KM_PER_DEG_LAT = EARTH_RADIUS_KM * np.pi / 180
+
+# Kiểu dữ liệu của bảng lần gặp khi không có lần gặp nào
+EPISODE_DTYPES = {"mmsi_a": "int64", "mmsi_b": "int64", "start_time": "datetime64[ns]", "end_time": "datetime64[ns]",
+                  "duration_min": "float64", "min_distance_nm": "float64", "mean_distance_nm": "float64",
+                  "mean_speed_kn": "float64", "lat": "float64", "lon": "float64", "kind": "object",
+                  "start_s": "int64", "end_s": "int64"}
+
+def _close_pairs(frames, lats, lons, radius_km):
+    """
+    Các cặp vị trí cùng khung cách nhau không quá radius_km
+
+    Ô lưới có cạnh radius_km theo vĩ độ và cùng độ rộng theo kinh độ ở vĩ độ xa
+    xích đạo nhất của lô, nên hai vị trí đủ gần luôn nằm ở cùng ô hoặc ô kề.
+    Không nối qua kinh tuyến 180.
+
+    Returns:
+    --------
+    tuple
+        (chỉ số a, chỉ số b, khoảng cách km) với a < b theo thứ tự đầu vào
+    """
+    empty = np.empty(0, dtype=np.int64)
+    if len(frames) < 2:
+        return empty, empty, np.empty(0)
+    cell_deg = radius_km / KM_PER_DEG_LAT * 1.001
+    lon_deg = cell_deg / np.cos(np.radians(min(float(np.abs(lats).max()), MAX_CELL_LAT)))
+    y = np.floor((lats + 90) / cell_deg).astype(np.int64) + 1
+    x = np.floor((lons + 180) / lon_deg).astype(np.int64) + 1
+    span = int(x.max()) + 2
+    rows = int(y.max()) + 2
+    keys = (frames - frames.min()) * (span * rows) + y * span + x
+
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    n = len(keys)
+
+    a_parts, b_parts = [], []
+    # Cùng ô (chỉ các vị trí đứng sau) và 4 ô kề theo nửa vùng lân cận
+    for offset in (0, 1, span - 1, span, span + 1):
+        if offset == 0:
+            lo = np.arange(1, n + 1)
+        else:
+            lo = np.searchsorted(sorted_keys, sorted_keys + offset, side='left')
+        hi = np.searchsorted(sorted_keys, sorted_keys + offset, side='right')
+        counts = np.maximum(hi - lo, 0)
+        total = int(counts.sum())
+        if total == 0:
+            continue
+        src = np.repeat(np.arange(n), counts)
+        dst = np.repeat(lo - np.cumsum(counts) + counts, counts) + np.arange(total)
+        a_parts.append(order[src])
+        b_parts.append(order[dst])
+    if not a_parts:
+        return empty, empty, np.empty(0)
+
+    a, b = np.concatenate(a_parts), np.concatenate(b_parts)
+    dist = haversine_km(lats[a], lons[a], lats[b], lons[b])
+    close = dist <= radius_km
+    a, b, dist = a[close], b[close], dist[close]
+    swap = a > b
+    a[swap], b[swap] = b[swap], a[swap]
+    return a, b, dist
+
+# Các tổng được cộng dồn khi nối hai đoạn
+_SUMS = ("hits", "dist_sum", "speed_sum", "speed_n", "lat_sum", "sin_sum", "cos_sum")
+
+def _runs(pair, frame, values, max_missed):
+    """
+    Gộp các lần gần nhau của từng cặp thành đoạn liên tục
+
+    Parameters:
+    -----------
+    pair, frame : numpy.ndarray
+        Mã cặp và khung của từng lần gần nhau
+    values : dict
+        Mảng "dist" (km), "speed" (hải lý/giờ, NaN nếu thiếu), "lat", "lon" (trung điểm)
+    max_missed : int
+        Số khung liên tiếp được phép thiếu trong một đoạn
+
+    Returns:
+    --------
+    dict
+        Mảng theo đoạn: pair, first, last, dist_min và các tổng trong _SUMS
+    """
+    order = np.lexsort((frame, pair))
+    pair, frame = pair[order], frame[order]
+    dist, speed = values["dist"][order], values["speed"][order]
+    rad = np.radians(values["lon"][order])
+    new = np.r_[True, (pair[1:] != pair[:-1]) | (frame[1:] - frame[:-1] > max_missed + 1)]
+    starts = np.flatnonzero(new)
+    ends = np.append(starts[1:], len(pair)) - 1
+    known = np.isfinite(speed)
+    return {
+        "pair": pair[starts],
+        "first": frame[starts],
+        "last": frame[ends],
+        "dist_min": np.minimum.reduceat(dist, starts),
+        "hits": np.diff(np.append(starts, len(pair))),
+        "dist_sum": np.add.reduceat(dist, starts),
+        "speed_sum": np.add.reduceat(np.where(known, speed, 0.0), starts),
+        "speed_n": np.add.reduceat(known.astype(np.int64), starts),
+        "lat_sum": np.add.reduceat(values["lat"][order], starts),
+        "sin_sum": np.add.reduceat(np.sin(rad), starts),
+        "cos_sum": np.add.reduceat(np.cos(rad), starts)
+    }
+
+def _merge_runs(parts, max_missed):
+    """Nối các đoạn của cùng cặp bị cắt ở ranh giới giữa hai lô khung"""
+    runs = {key: np.concatenate([p[key] for p in parts]) for key in parts[0]}
+    order = np.lexsort((runs["first"], runs["pair"]))
+    runs = {key: values[order] for key, values in runs.items()}
+    pair, first, last = runs["pair"], runs["first"], runs["last"]
+    # Các lô không chồng khung nhau, nên chỉ cần so với đoạn liền trước của cùng cặp
+    new = np.r_[True, (pair[1:] != pair[:-1]) | (first[1:] - last[:-1] > max_missed + 1)]
+    starts = np.flatnonzero(new)
+    ends = np.append(starts[1:], len(pair)) - 1
+    merged = {
+        "pair": pair[starts],
+        "first": first[starts],
+        "last": last[ends],
+        "dist_min": np.minimum.reduceat(runs["dist_min"], starts)
+    }
+    for key in _SUMS:
+        merged[key] = np.add.reduceat(runs[key], starts)
+    return merged
+
+def _groups(episodes):
+    """
+    Nhóm các lần gặp chung tàu và chồng lấn thời gian (đoàn từ 3 tàu trở lên)
+
+    Returns:
+    --------
+    list
+        Mỗi nhóm: các tàu, thời gian bắt đầu/kết thúc và số lần gặp
+    """
+    n = len(episodes)
+    if n == 0:
+        return []
+    vessel = np.concatenate([episodes["mmsi_a"].to_numpy(), episodes["mmsi_b"].to_numpy()])
+    ids = np.concatenate([np.arange(n), np.arange(n)])
+    start = np.tile(episodes["start_s"].to_numpy(), 2)
+    end = np.tile(episodes["end_s"].to_numpy(), 2)
+
+    # Theo từng tàu, các lần gặp chồng lấn liên tiếp được nối về lần đầu của cụm
+    order = np.lexsort((start, vessel))
+    vessel, ids, start, end = vessel[order], ids[order], start[order], end[order]
+    vessel_start = np.r_[True, vessel[1:] != vessel[:-1]]
+    # Điểm kết thúc xa nhất tích lũy trong từng tàu (cộng độ lệch để tàu sau luôn lớn hơn)
+    offset = (np.cumsum(vessel_start) - 1) * (end.max() - start.min() + 1)
+    reach = np.maximum.accumulate(end + offset) - offset
+    cluster_start = np.r_[True, vessel_start[1:] | (start[1:] > reach[:-1])]
+    anchor = ids[np.flatnonzero(cluster_start)[np.cumsum(cluster_start) - 1]]
+
+    graph = coo_matrix((np.ones(len(ids), dtype=np.int8), (ids, anchor)), shape=(n, n))
+    _, component = connected_components(graph, directed=False)
+
+    # Nhóm từ 3 tàu cần ít nhất 2 lần gặp
+    multi = np.flatnonzero(np.bincount(component)[component] >= 2)
+    groups = []
+    for _, members in pd.Series(multi).groupby(component[multi]):
+        part = episodes.iloc[members.to_numpy()]
+        vessels = np.unique(np.concatenate([part["mmsi_a"].to_numpy(), part["mmsi_b"].to_numpy()]))
+        if len(vessels) < 3:
+            continue
+        groups.append({
+            "vessels": vessels.tolist(),
+            "vessel_count": int(len(vessels)),
+            "episodes": int(len(part)),
+            "start_time": part["start_time"].min(),
+            "end_time": part["end_time"].max()
+        })
+    groups.sort(key=lambda g: (-g["vessel_count"], g["start_time"]))
+    return groups
+
+def detect_comovement(store, radius_nm=DEFAULT_RADIUS_NM, min_duration_s=DEFAULT_MIN_DURATION_S,
+                      step_s=playback.DEFAULT_STEP_S, max_missed_frames=MAX_MISSED_FRAMES):
+    """
+    Tìm các cặp và nhóm tàu ở gần nhau trong một khoảng thời gian đủ dài
+
+    Parameters:
+    -----------
+    store : trajectory.TrajectoryStore
+        Kho hành trình
+    radius_nm : float
+        Khoảng cách tối đa giữa hai tàu (hải lý)
+    min_duration_s : int
+        Thời gian tối thiểu của một lần gặp (giây)
+    step_s : int
+        Khoảng thời gian giữa hai khung của chỉ mục phát lại (giây)
+    max_missed_frames : int
+        Số khung liên tiếp được phép thiếu trong một lần gặp
+
+    Returns:
+    --------
+    dict
+        "episodes": DataFrame các lần gặp (mmsi_a, mmsi_b, start_time, end_time,
+        duration_min, min_distance_nm, mean_distance_nm, mean_speed_kn, lat, lon, kind),
+        "groups": danh sách các nhóm từ 3 tàu trở lên
+    """
+    key = ("comovement", float(radius_nm), int(min_duration_s), int(step_s), int(max_missed_frames))
+    if key in store.derived:
+        return store.derived[key]
+
+    index = playback.build_index(store, step_s)
+    radius_km = radius_nm * KM_PER_NM
+    vessel_codes = np.unique(index.vessels)
+    n_codes = len(vessel_codes)
+
+    parts = []
+    frame = 0
+    while frame < index.n_frames:
+        # Lô các khung liên tiếp có tổng số vị trí không quá CHUNK_POSITIONS (ít nhất một khung)
+        stop = int(np.searchsorted(index.offsets, index.offsets[frame] + CHUNK_POSITIONS, side='right')) - 1
+        stop = min(max(stop, frame + 1), index.n_frames)
+        part = slice(index.offsets[frame], index.offsets[stop])
+        frames = np.repeat(np.arange(frame, stop), np.diff(index.offsets[frame:stop + 1]))
+        lats = index.lat_e6[part] / playback.COORD_SCALE
+        lons = index.lon_e6[part] / playback.COORD_SCALE
+        frame = stop
+
+        a, b, dist = _close_pairs(frames, lats, lons, radius_km)
+        if len(a) == 0:
+            continue
+        codes = np.searchsorted(vessel_codes, index.vessels[part])
+        pair = codes[a] * n_codes + codes[b]
+        sog = index.sog_10[part].astype(np.float64)
+        sog = np.where(sog >= 0, sog / 10, np.nan)
+        dlon = (lons[b] - lons[a] + 180) % 360 - 180
+        parts.append(_runs(pair, frames[a], {
+            "dist": dist,
+            # Tốc độ của tàu nhanh hơn trong cặp: cặp chậm khi cả hai tàu đều chậm
+            "speed": np.fmax(sog[a], sog[b]),
+            "lat": (lats[a] + lats[b]) / 2,
+            "lon": lons[a] + dlon / 2
+        }, max_missed_frames))
+
+    if not parts:
+        result = {"episodes": pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in EPISODE_DTYPES.items()}),
+                  "groups": []}
+        store.derived[key] = result
+        return result
+
+    runs = _merge_runs(parts, max_missed_frames)
+    duration = (runs["last"] - runs["first"]) * index.step
+    keep = duration >= min_duration_s
+    runs = {k: v[keep] for k, v in runs.items()}
+    duration = duration[keep]
+
+    start_s = index.start + runs["first"] * index.step
+    end_s = index.start + runs["last"] * index.step
+    mean_speed = np.where(runs["speed_n"] > 0, runs["speed_sum"] / np.maximum(runs["speed_n"], 1), np.nan)
+    episodes = pd.DataFrame({
+        "mmsi_a": vessel_codes[runs["pair"] // n_codes],
+        "mmsi_b": vessel_codes[runs["pair"] % n_codes],
+        "start_time": pd.to_datetime(start_s, unit='s'),
+        "end_time": pd.to_datetime(end_s, unit='s'),
+        "duration_min": duration / 60,
+        "min_distance_nm": runs["dist_min"] / KM_PER_NM,
+        "mean_distance_nm": runs["dist_sum"] / runs["hits"] / KM_PER_NM,
+        "mean_speed_kn": mean_speed,
+        "lat": runs["lat_sum"] / runs["hits"],
+        "lon": np.degrees(np.arctan2(runs["sin_sum"], runs["cos_sum"])),
+        "kind": np.where(mean_speed <= RENDEZVOUS_SPEED_KN, "rendezvous", "convoy"),
+        "start_s": start_s,
+        "end_s": end_s
+    })
+    episodes = episodes.sort_values(["duration_min", "start_time"], ascending=[False, True], ignore_index=True)
+
+    result = {"episodes": episodes, "groups": _groups(episodes)}
+    store.derived[key] = result
+    return result
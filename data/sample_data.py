@@ -1,119 +1,230 @@
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
+import argparse
 import os
 
-def generate_sample_data(n_records=1000, save=True):
+# Sinh dữ liệu AIS mẫu dạng hành trình liên tục cho từng tàu.
+# Mọi cột được sinh trực tiếp dưới dạng mảng (không lặp theo từng bản ghi):
+# hướng và tốc độ là các bước ngẫu nhiên quanh giá trị đặc trưng của loại tàu,
+# vị trí là tích lũy quãng đường theo hướng/tốc độ. Dữ liệu lớn được sinh theo
+# khối gồm các tàu trọn vẹn, mỗi khối có hạt giống riêng nên kết quả lặp lại được.
+
+# Định nghĩa các loại tàu và tên tàu
+VESSEL_TYPES = ['Cargo', 'Tanker', 'Passenger', 'Fishing', 'Tug', 'Military', 'Sailing']
+VESSEL_NAMES = ['Ocean Explorer', 'Pacific Star', 'Atlantic Voyager', 'Northern Light',
+                'Southern Cross', 'Eastern Wind', 'Western Sun', 'Coastal Runner',
+                'Sea Dragon', 'River Queen', 'Lake Princess', 'Gulf Trader']
+STATUSES = ['Underway', 'At anchor', 'Moored', 'Restricted maneuverability']
+DESTINATIONS = ['SINGAPORE', 'HONG KONG', 'TOKYO', 'MANILA', 'BANGKOK', 'HO CHI MINH', '']
+
+# Tỷ lệ các loại tàu và khoảng tốc độ đặc trưng (knot), theo thứ tự VESSEL_TYPES
+TYPE_WEIGHTS = np.array([0.30, 0.15, 0.08, 0.25, 0.10, 0.02, 0.10])
+TYPE_SPEED = np.array([[10, 20], [8, 15], [15, 25], [3, 10], [5, 15], [20, 30], [5, 15]], dtype=np.float64)
+
+# Khu vực tập trung tàu [lat_min, lat_max, lon_min, lon_max]; khu vực cuối là tàu rải rác
+AREAS = np.array([[10, 15, 105, 110], [20, 25, 115, 120], [0, 5, 95, 100], [-10, -5, 130, 135], [-30, 30, 90, 140]],
+                 dtype=np.float64)
+
+# Mốc thời gian mặc định, cố định để cùng hạt giống cho cùng dữ liệu
+DEFAULT_START = "2024-01-01T00:00:00"
+
+# Tỷ lệ bản ghi có tốc độ bất thường
+ANOMALY_RATE = 0.05
+
+# Số bản ghi mỗi khối khi ghi Parquet
+CHUNK_ROWS = 5_000_000
+
+def _vessel_chunk(rng, first_vessel, n_vessels, n_points, start_s, interval_s):
+    """
+    Sinh hành trình cho một nhóm tàu
+
+    Returns:
+    --------
+    pandas.DataFrame
+        n_vessels * n_points bản ghi, sắp theo tàu rồi theo thời gian
+    """
+    shape = (n_vessels, n_points)
+
+    # Thuộc tính cố định theo từng tàu
+    mmsi = 100000000 + (first_vessel + np.arange(n_vessels)) * 7919 % 900000000
+    vessel_type = rng.choice(len(VESSEL_TYPES), size=n_vessels, p=TYPE_WEIGHTS)
+    large = np.isin(vessel_type, [0, 1, 2])
+    deep = np.isin(vessel_type, [0, 1])
+    length = np.where(large, rng.uniform(50, 300, n_vessels), rng.uniform(10, 50, n_vessels))
+    width = np.where(large, rng.uniform(10, 50, n_vessels), rng.uniform(5, 15, n_vessels))
+    draft = np.where(deep, rng.uniform(5, 15, n_vessels), rng.uniform(2, 8, n_vessels))
+    name_code = rng.integers(0, len(VESSEL_NAMES) * 99, n_vessels)
+    destination = rng.integers(0, len(DESTINATIONS), n_vessels)
+
+    # Vị trí và hướng ban đầu trong một khu vực tập trung
+    area = AREAS[rng.integers(0, len(AREAS), n_vessels)]
+    lat0 = rng.uniform(area[:, 0], area[:, 1])
+    lon0 = rng.uniform(area[:, 2], area[:, 3])
+    course0 = rng.uniform(0, 360, n_vessels)
+
+    # Hướng đi và tốc độ thay đổi dần theo bước ngẫu nhiên
+    cog = (course0[:, None] + np.cumsum(rng.normal(0, 3, shape), axis=1)) % 360
+    low, high = TYPE_SPEED[vessel_type, 0], TYPE_SPEED[vessel_type, 1]
+    cruise = rng.uniform(low, high)
+    sog = np.clip(cruise[:, None] + np.cumsum(rng.normal(0, 0.3, shape), axis=1), 0, high[:, None] * 1.2)
+
+    # Khoảng thời gian giữa hai báo cáo dao động quanh interval_s
+    dt = np.maximum(interval_s * rng.uniform(0.5, 1.5, shape), 1).astype(np.int64)
+    dt[:, 0] = rng.integers(0, 3600, n_vessels)
+    times = start_s + np.cumsum(dt, axis=1)
+
+    # Tích lũy quãng đường (hải lý) theo hướng đi: 1 hải lý = 1/60 độ vĩ
+    distance_nm = sog * dt / 3600
+    distance_nm[:, 0] = 0
+    heading = np.radians(cog)
+    lat = np.clip(lat0[:, None] + np.cumsum(distance_nm * np.cos(heading), axis=1) / 60, -85, 85)
+    lon = (lon0[:, None] + np.cumsum(distance_nm * np.sin(heading) / np.cos(np.radians(lat)), axis=1) / 60
+           + 180) % 360 - 180
+
+    # Thêm một số giá trị bất thường
+    reported_sog = sog.copy()
+    anomalies = rng.random(shape) < ANOMALY_RATE
+    reported_sog[anomalies] = rng.uniform(30, 50, anomalies.sum())
+
+    status = np.where(sog < 0.5, 2, np.where(sog < 2, 1, 0))
+    status[rng.random(shape) < 0.01] = 3
+
+    def per_vessel(values):
+        return np.repeat(values, n_points)
+
+    names = np.array([f"{VESSEL_NAMES[i % len(VESSEL_NAMES)]} {i // len(VESSEL_NAMES) + 1}"
+                      for i in range(len(VESSEL_NAMES) * 99)])
+    return pd.DataFrame({
+        'MMSI': per_vessel(mmsi),
+        'VesselName': pd.Categorical.from_codes(per_vessel(name_code), names),
+        'VesselType': pd.Categorical.from_codes(per_vessel(vessel_type), VESSEL_TYPES),
+        'LAT': lat.ravel(),
+        'LON': lon.ravel(),
+        'SOG': reported_sog.ravel().round(1),
+        'COG': cog.ravel().round(1),
+        'BaseDateTime': times.ravel().astype('datetime64[s]'),
+        'Status': pd.Categorical.from_codes(status.ravel(), STATUSES),
+        'Length': per_vessel(length.round(1)),
+        'Width': per_vessel(width.round(1)),
+        'Draft': per_vessel(draft.round(1)),
+        'Destination': pd.Categorical.from_codes(per_vessel(destination), DESTINATIONS)
+    })
+
+def generate_chunks(n_records, n_vessels=None, seed=0, start=DEFAULT_START, interval_s=60, chunk_rows=CHUNK_ROWS):
+    """
+    Sinh dữ liệu mẫu theo từng khối
+
+    Parameters:
+    -----------
+    n_records : int
+        Tổng số bản ghi
+    n_vessels : int
+        Số tàu (mặc định n_records / 100, ít nhất 1)
+    seed : int
+        Hạt giống ngẫu nhiên
+    start : str
+        Thời điểm bắt đầu
+    interval_s : int
+        Khoảng thời gian trung bình giữa hai báo cáo của một tàu (giây)
+    chunk_rows : int
+        Số bản ghi tối đa mỗi khối (làm tròn theo số tàu)
+
+    Yields:
+    -------
+    pandas.DataFrame
+        Các khối gồm hành trình trọn vẹn của một nhóm tàu; cột chuỗi ở dạng Categorical
+    """
+    n_vessels = max(int(n_vessels or n_records // 100), 1)
+    n_points = -(-n_records // n_vessels)
+    start_s = int(pd.Timestamp(start).timestamp())
+    vessels_per_chunk = max(chunk_rows // n_points, 1)
+
+    remaining = n_records
+    for chunk, first in enumerate(range(0, n_vessels, vessels_per_chunk)):
+        if remaining <= 0:
+            break
+        rng = np.random.default_rng([seed, chunk])
+        count = min(vessels_per_chunk, n_vessels - first)
+        df = _vessel_chunk(rng, first, count, n_points, start_s, interval_s)
+        # Bản ghi cuối của tàu cuối cùng bị cắt bớt để đúng tổng số bản ghi
+        df = df.iloc[:remaining]
+        remaining -= len(df)
+        yield df
+
+def generate_sample_data(n_records=1000, save=True, seed=0, n_vessels=None, start=DEFAULT_START, interval_s=60):
     """
     Tạo dữ liệu AIS mẫu để kiểm thử
-    
+
     Parameters:
     -----------
     n_records : int
         Số lượng bản ghi cần tạo
     save : bool
         Lưu dữ liệu vào file CSV hay không
-    
+    seed : int
+        Hạt giống ngẫu nhiên (cùng hạt giống cho cùng dữ liệu)
+    n_vessels : int
+        Số tàu (mặc định n_records / 100)
+
     Returns:
     --------
     pandas.DataFrame
-        DataFrame chứa dữ liệu mẫu
+        DataFrame chứa dữ liệu mẫu, cùng định dạng với file CSV của marinecadastre.gov
     """
-    # Định nghĩa các loại tàu và tên tàu
-    vessel_types = ['Cargo', 'Tanker', 'Passenger', 'Fishing', 'Tug', 'Military', 'Sailing']
-    vessel_names = ['Ocean Explorer', 'Pacific Star', 'Atlantic Voyager', 'Northern Light', 
-                   'Southern Cross', 'Eastern Wind', 'Western Sun', 'Coastal Runner',
-                   'Sea Dragon', 'River Queen', 'Lake Princess', 'Gulf Trader']
-    
-    # Tạo danh sách MMSI (Maritime Mobile Service Identity) ngẫu nhiên
-    mmsi_list = np.random.randint(100000000, 999999999, size=n_records // 10)
-    
-    # Tạo dữ liệu
-    data = []
-    base_time = datetime.now()
-    
-    for i in range(n_records):
-        # Chọn một MMSI từ danh sách (để mô phỏng nhiều bản ghi cho cùng một tàu)
-        mmsi = np.random.choice(mmsi_list)
-        
-        # Chọn loại tàu và tên tàu
-        vessel_type = np.random.choice(vessel_types)
-        vessel_name = np.random.choice(vessel_names) + " " + str(np.random.randint(1, 100))
-        
-        # Tạo vị trí (tập trung vào một số khu vực để tạo các cụm)
-        # Chọn một trong các khu vực tập trung
-        area = np.random.randint(0, 5)
-        
-        if area == 0:  # Khu vực 1
-            lat = np.random.uniform(10, 15)
-            lon = np.random.uniform(105, 110)
-        elif area == 1:  # Khu vực 2
-            lat = np.random.uniform(20, 25)
-            lon = np.random.uniform(115, 120)
-        elif area == 2:  # Khu vực 3
-            lat = np.random.uniform(0, 5)
-            lon = np.random.uniform(95, 100)
-        elif area == 3:  # Khu vực 4
-            lat = np.random.uniform(-10, -5)
-            lon = np.random.uniform(130, 135)
-        else:  # Các tàu rải rác
-            lat = np.random.uniform(-30, 30)
-            lon = np.random.uniform(90, 140)
-        
-        # Tạo tốc độ và hướng đi
-        # Tốc độ phụ thuộc vào loại tàu
-        if vessel_type == 'Cargo':
-            sog = np.random.uniform(10, 20)  # Knots
-        elif vessel_type == 'Tanker':
-            sog = np.random.uniform(8, 15)
-        elif vessel_type == 'Passenger':
-            sog = np.random.uniform(15, 25)
-        elif vessel_type == 'Fishing':
-            sog = np.random.uniform(3, 10)
-        elif vessel_type == 'Military':
-            sog = np.random.uniform(20, 30)
-        else:
-            sog = np.random.uniform(5, 15)
-        
-        # Thêm một số giá trị bất thường
-        if np.random.random() < 0.05:  # 5% dữ liệu bất thường
-            sog = np.random.uniform(30, 50)  # Tốc độ bất thường cao
-        
-        # Hướng đi (Course Over Ground)
-        cog = np.random.uniform(0, 359)
-        
-        # Thời gian (trong vòng 24 giờ qua)
-        time_offset = timedelta(hours=np.random.uniform(0, 24))
-        timestamp = (base_time - time_offset).strftime('%Y-%m-%d %H:%M:%S')
-        
-        # Thêm vào danh sách dữ liệu
-        data.append({
-            'MMSI': mmsi,
-            'VesselName': vessel_name,
-            'VesselType': vessel_type,
-            'LAT': lat,
-            'LON': lon,
-            'SOG': sog,
-            'COG': cog,
-            'BaseDateTime': timestamp,
-            'Status': np.random.choice(['Underway', 'At anchor', 'Moored', 'Restricted maneuverability']),
-            'Length': np.random.uniform(50, 300) if vessel_type in ['Cargo', 'Tanker', 'Passenger'] else np.random.uniform(10, 50),
-            'Width': np.random.uniform(10, 50) if vessel_type in ['Cargo', 'Tanker', 'Passenger'] else np.random.uniform(5, 15),
-            'Draft': np.random.uniform(5, 15) if vessel_type in ['Cargo', 'Tanker'] else np.random.uniform(2, 8),
-            'Destination': np.random.choice(['SINGAPORE', 'HONG KONG', 'TOKYO', 'MANILA', 'BANGKOK', 'HO CHI MINH', ''])
-        })
-    
-    # Tạo DataFrame
-    df = pd.DataFrame(data)
-    
+    chunks = list(generate_chunks(n_records, n_vessels, seed, start, interval_s))
+    df = pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0].reset_index(drop=True)
+
+    # Chuỗi thời gian và cột chuỗi thường, giống dữ liệu đọc từ CSV
+    df['BaseDateTime'] = np.datetime_as_string(df['BaseDateTime'].to_numpy(dtype='datetime64[s]'))
+    for col in ['VesselName', 'VesselType', 'Status', 'Destination']:
+        df[col] = df[col].astype(object)
+
     # Luu vao file CSV neu can
     if save:
         output_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'AIS_sample_data.csv')
         df.to_csv(output_path, index=False)
         print(f"Da luu du lieu mau vao: {output_path}")
-    
+
     return df
 
+def write_parquet(path, n_records, n_vessels=None, seed=0, start=DEFAULT_START, interval_s=60, chunk_rows=CHUNK_ROWS):
+    """
+    Ghi dữ liệu mẫu ra file Parquet theo khối, bộ nhớ chỉ phụ thuộc kích thước khối
+
+    Cần gói pyarrow.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("Parquet output requires the optional 'pyarrow' package")
+
+    writer = None
+    written = 0
+    try:
+        for df in generate_chunks(n_records, n_vessels, seed, start, interval_s, chunk_rows):
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+            written += len(df)
+            print(f"[INFO] Wrote {written:,}/{n_records:,} rows to {path}")
+    finally:
+        if writer is not None:
+            writer.close()
+    return written
+
 if __name__ == "__main__":
-    # Tạo 5000 bản ghi mẫu
-    generate_sample_data(5000)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate synthetic AIS tracks")
+    parser.add_argument("--rows", type=int, default=5000, help="number of records")
+    parser.add_argument("--vessels", type=int, default=None, help="number of vessels (default rows / 100)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--interval", type=int, default=60, help="mean seconds between reports of a vessel")
+    parser.add_argument("--parquet", default=None, help="write chunked Parquet to this path instead of the sample CSV")
+    args = parser.parse_args()
+
+    if args.parquet:
+        write_parquet(args.parquet, args.rows, args.vessels, args.seed, interval_s=args.interval)
+    else:
+        # Tạo 5000 bản ghi mẫu
+        generate_sample_data(args.rows, n_vessels=args.vessels, seed=args.seed, interval_s=args.interval)
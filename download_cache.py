@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import asyncio
+import threading
+import pandas as pd
+
+import downloader
+
+# Bộ nhớ đệm trên đĩa cho dữ liệu tải về qua /download-ais.
+# File gốc và dạng đã đọc (cột) được lưu theo SHA-256 của nội dung, nên cùng
+# một file từ nhiều URL chỉ được lưu một lần. Mỗi URL ghi nhớ ETag/Last-Modified
+# để kiểm tra lại bằng yêu cầu có điều kiện. Dung lượng được giới hạn và các
+# bản ít dùng nhất bị xóa trước (LRU).
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cache", "ais")
+INDEX_PATH = os.path.join(CACHE_DIR, "index.json")
+
+# Dung lượng tối đa của bộ nhớ đệm (byte)
+MAX_CACHE_BYTES = int(os.environ.get("AIS_CACHE_MAX_BYTES", 10 * 1024 ** 3))
+
+_lock = threading.Lock()
+
+def _raw_path(sha256, kind):
+    return os.path.join(CACHE_DIR, "raw", f"{sha256}.{kind}")
+
+def _parsed_path(sha256, fmt):
+    return os.path.join(CACHE_DIR, "parsed", f"{sha256}.{fmt}")
+
+def _load_index():
+    if not os.path.exists(INDEX_PATH):
+        return {"urls": {}, "blobs": {}}
+    try:
+        with open(INDEX_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[WARNING] Failed to read download cache index: {str(e)}")
+        return {"urls": {}, "blobs": {}}
+
+def _save_index(index):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = INDEX_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, INDEX_PATH)
+
+def _blob_files(sha256, blob):
+    files = [_raw_path(sha256, blob["kind"])]
+    if blob.get("parsed_format"):
+        files.append(_parsed_path(sha256, blob["parsed_format"]))
+    return files
+
+def _remove_blob(index, sha256):
+    blob = index["blobs"].pop(sha256, None)
+    if blob:
+        for path in _blob_files(sha256, blob):
+            if os.path.exists(path):
+                os.remove(path)
+    for url in [u for u, entry in index["urls"].items() if entry["sha256"] == sha256]:
+        del index["urls"][url]
+
+def _enforce_budget(index, keep=None):
+    """Xóa các bản ít dùng nhất cho tới khi tổng dung lượng nằm trong giới hạn"""
+    total = sum(blob["size"] for blob in index["blobs"].values())
+    for sha256, blob in sorted(index["blobs"].items(), key=lambda item: item[1]["last_access"]):
+        if total <= MAX_CACHE_BYTES:
+            break
+        if sha256 == keep:
+            continue
+        total -= blob["size"]
+        _remove_blob(index, sha256)
+
+def lookup(url):
+    """Thông tin bản đã lưu của một URL (sha256, etag, last_modified), None nếu chưa có"""
+    with _lock:
+        index = _load_index()
+        entry = index["urls"].get(url)
+        if entry is None:
+            return None
+        blob = index["blobs"].get(entry["sha256"])
+        if blob is None or not all(os.path.exists(path) for path in _blob_files(entry["sha256"], blob)):
+            _remove_blob(index, entry["sha256"])
+            _save_index(index)
+            return None
+        return dict(entry)
+
+def load(entry):
+    """Đọc dữ liệu đã lưu, ưu tiên dạng cột đã đọc sẵn"""
+    with _lock:
+        index = _load_index()
+        blob = index["blobs"][entry["sha256"]]
+        blob["last_access"] = time.time()
+        _save_index(index)
+
+    fmt = blob.get("parsed_format")
+    if fmt == "parquet":
+        return pd.read_parquet(_parsed_path(entry["sha256"], fmt))
+    if fmt == "pkl":
+        return pd.read_pickle(_parsed_path(entry["sha256"], fmt))
+    return downloader.parse_file(_raw_path(entry["sha256"], blob["kind"]), blob["kind"])
+
+def _write_parsed(sha256, df):
+    """Lưu dạng cột: Parquet nếu có pyarrow, nếu không thì pickle"""
+    os.makedirs(os.path.join(CACHE_DIR, "parsed"), exist_ok=True)
+    try:
+        import pyarrow  # noqa: F401
+        path = _parsed_path(sha256, "parquet")
+        df.to_parquet(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+        return "parquet"
+    except Exception:
+        # Không có pyarrow hoặc cột kiểu hỗn hợp không ghi được ra Parquet
+        path = _parsed_path(sha256, "pkl")
+        df.to_pickle(path + ".tmp")
+        os.replace(path + ".tmp", path)
+        return "pkl"
+
+def store(job, path, kind, df):
+    """Lưu file vừa tải (di chuyển vào bộ nhớ đệm) và dạng đã đọc của nó"""
+    try:
+        sha256 = job.sha256
+        with _lock:
+            index = _load_index()
+            blob = index["blobs"].get(sha256)
+
+        if blob is None:
+            os.makedirs(os.path.join(CACHE_DIR, "raw"), exist_ok=True)
+            os.replace(path, _raw_path(sha256, kind))
+            parsed_format = _write_parsed(sha256, df)
+            size = os.path.getsize(_raw_path(sha256, kind)) + os.path.getsize(_parsed_path(sha256, parsed_format))
+            blob = {"kind": kind, "parsed_format": parsed_format, "size": size}
+
+        with _lock:
+            index = _load_index()
+            blob["last_access"] = time.time()
+            index["blobs"][sha256] = blob
+            index["urls"][job.url] = {
+                "sha256": sha256,
+                "etag": job.etag,
+                "last_modified": job.last_modified,
+                "fetched_at": time.time()
+            }
+            _enforce_budget(index, keep=sha256)
+            _save_index(index)
+    except Exception as e:
+        print(f"[WARNING] Failed to cache download {job.url}: {str(e)}")
+
+async def fetch_dataset(job, expected_sha256=None):
+    """
+    Tải dữ liệu qua bộ nhớ đệm: dùng bản đã lưu nếu máy chủ xác nhận chưa thay đổi
+
+    Returns:
+    --------
+    tuple
+        (DataFrame, True nếu lấy từ bộ nhớ đệm)
+    """
+    found = {}
+
+    def lookup_cached():
+        # Tra cứu sau khi các lần tải trước cùng URL đã xong (có thể vừa lưu bản mới)
+        found["entry"] = lookup(job.url)
+        return found["entry"]
+
+    try:
+        df = await downloader.fetch_dataset(job, expected_sha256=expected_sha256, cached=lookup_cached,
+                                            on_complete=store)
+        return df, False
+    except downloader.NotModified:
+        entry = found["entry"]
+        if expected_sha256 and entry["sha256"] != expected_sha256.lower():
+            raise downloader.DownloadError(f"Checksum mismatch: expected {expected_sha256}, got {entry['sha256']}")
+        job.state = "loading_cache"
+        df = await asyncio.to_thread(load, entry)
+        job.sha256 = entry["sha256"]
+        job.rows_parsed = len(df)
+        job.state = "done"
+        job.finished_at = time.time()
+        return df, True
+
+def summary():
+    with _lock:
+        index = _load_index()
+    return {
+        "urls": len(index["urls"]),
+        "files": len(index["blobs"]),
+        "bytes": sum(blob["size"] for blob in index["blobs"].values()),
+        "max_bytes": MAX_CACHE_BYTES
+    }
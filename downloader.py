@@ -0,0 +1,495 @@
+import os
+import io
+import json
+import time
+import uuid
+import zlib
+import struct
+import asyncio
+import hashlib
+import zipfile
+import threading
+import weakref
+from collections import OrderedDict
+from urllib.parse import urlparse
+import aiohttp
+import pandas as pd
+
+# Tải dữ liệu AIS từ xa theo luồng xuống file tạm trên đĩa.
+# - Tiếp tục tải bằng HTTP Range khi kết nối bị ngắt (kể cả giữa các lần gọi)
+# - Kiểm tra kích thước và SHA-256 sau khi tải xong
+# - Đọc CSV song song với quá trình tải: luồng phân tích đọc file đang được ghi
+# - Tiến độ được theo dõi qua mã công việc (job id)
+
+DOWNLOAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cache", "downloads")
+
+# Kích thước mỗi khối đọc từ mạng
+CHUNK_SIZE = 1 << 20
+
+# Số lần thử lại tối đa khi kết nối bị ngắt
+MAX_RETRIES = 5
+
+# Số dòng mỗi khối khi đọc CSV
+PARSE_CHUNK_ROWS = 200_000
+
+# Số công việc được giữ lại để tra cứu tiến độ
+MAX_JOBS = 20
+
+class DownloadError(Exception):
+    pass
+
+class NotModified(Exception):
+    """Máy chủ xác nhận bản đã lưu vẫn còn mới (HTTP 304)"""
+    pass
+
+class DownloadJob:
+    """Trạng thái của một lần tải và phân tích dữ liệu"""
+
+    def __init__(self, url, job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.url = url
+        self.state = "pending"
+        self.bytes_done = 0
+        self.total_bytes = None
+        self.rows_parsed = 0
+        self.resumes = 0
+        self.sha256 = None
+        self.error = None
+        self.started_at = time.time()
+        self.finished_at = None
+        self.validator = None
+        self.etag = None
+        self.last_modified = None
+        self.hasher = hashlib.sha256()
+
+        # Đồng bộ giữa vòng lặp tải (asyncio) và luồng phân tích
+        self._cond = threading.Condition()
+        self.download_finished = False
+
+    def notify(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def wait(self, timeout=0.5):
+        with self._cond:
+            self._cond.wait(timeout)
+
+    def progress(self):
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            "job_id": self.id,
+            "url": self.url,
+            "state": self.state,
+            "bytes_downloaded": self.bytes_done,
+            "total_bytes": self.total_bytes,
+            "percent": round(100 * self.bytes_done / self.total_bytes, 1) if self.total_bytes else None,
+            "rows_parsed": self.rows_parsed,
+            "resumes": self.resumes,
+            "elapsed_seconds": round(elapsed, 1),
+            "bytes_per_second": round(self.bytes_done / elapsed) if elapsed > 0 else None,
+            "sha256": self.sha256,
+            "error": self.error
+        }
+
+_jobs = OrderedDict()
+
+def create_job(url, job_id=None):
+    job = DownloadJob(url, job_id)
+    _jobs[job.id] = job
+    while len(_jobs) > MAX_JOBS:
+        _jobs.popitem(last=False)
+    return job
+
+def get_job(job_id):
+    return _jobs.get(job_id)
+
+def latest_job():
+    return next(reversed(_jobs.values()), None)
+
+def file_kind(url):
+    """Loại file theo phần mở rộng của đường dẫn URL ('zip', 'csv' hoặc None)"""
+    path = urlparse(url).path.lower()
+    if path.endswith('.zip'):
+        return 'zip'
+    if path.endswith('.csv'):
+        return 'csv'
+    return None
+
+def _partial_paths(url, token=None):
+    """File tạm (.part, .json) của url: chỗ lưu để tiếp tục tải, hoặc file riêng của một lần tải (token)"""
+    key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    if token is not None:
+        key = f"{key}.{token}"
+    return os.path.join(DOWNLOAD_DIR, f"{key}.part"), os.path.join(DOWNLOAD_DIR, f"{key}.json")
+
+def _remove(*paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+# Khóa theo URL: các yêu cầu cùng URL được xử lý lần lượt
+_url_locks = weakref.WeakValueDictionary()
+
+def _url_lock(url):
+    lock = _url_locks.get(url)
+    if lock is None:
+        lock = _url_locks[url] = asyncio.Lock()
+    return lock
+
+def _validator(response):
+    """ETag mạnh hoặc Last-Modified dùng cho If-Range"""
+    etag = response.headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return response.headers.get("Last-Modified")
+
+def _total_size(response, offset):
+    content_range = response.headers.get("Content-Range", "")
+    if "/" in content_range and not content_range.endswith("/*"):
+        return int(content_range.rsplit("/", 1)[1])
+    length = response.headers.get("Content-Length")
+    return offset + int(length) if length is not None else None
+
+# ---------------------------------------------------------------------------
+# Tải xuống
+# ---------------------------------------------------------------------------
+
+async def _download(job, path, meta_path, ready, cached=None):
+    timeout = aiohttp.ClientTimeout(total=None, connect=30, sock_read=120)
+    attempts = 0
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        while True:
+            offset = job.bytes_done
+            # Tắt nén khi truyền để kích thước và Range khớp với nội dung file
+            headers = {"Accept-Encoding": "identity"}
+            if offset:
+                headers["Range"] = f"bytes={offset}-"
+                if job.validator:
+                    headers["If-Range"] = job.validator
+            elif cached:
+                # Yêu cầu có điều kiện: chỉ tải lại nếu file trên máy chủ đã thay đổi
+                if cached.get("etag"):
+                    headers["If-None-Match"] = cached["etag"]
+                if cached.get("last_modified"):
+                    headers["If-Modified-Since"] = cached["last_modified"]
+            try:
+                async with session.get(job.url, headers=headers) as response:
+                    if response.status == 304 and not offset and cached:
+                        raise NotModified()
+                    if response.status == 416 and offset:
+                        if offset == job.total_bytes:
+                            # Lần trước đã tải đủ file nhưng chưa đọc xong: đọc lại từ đĩa
+                            ready.set()
+                            break
+                        if not ready.is_set():
+                            # Phần đã tải không khớp với file trên máy chủ: tải lại từ đầu
+                            with open(path, "wb"):
+                                pass
+                            job.bytes_done = 0
+                            job.validator = None
+                            job.hasher = hashlib.sha256()
+                            continue
+                    if response.status not in (200, 206):
+                        raise DownloadError(f"Failed to download data: HTTP {response.status}")
+
+                    skip = 0
+                    if offset and response.status == 200:
+                        validator = _validator(response)
+                        if job.validator and validator != job.validator:
+                            if ready.is_set():
+                                raise DownloadError("Remote file changed during download")
+                            # Phần đã tải từ lần trước không còn hợp lệ: tải lại từ đầu
+                            with open(path, "wb"):
+                                pass
+                            job.bytes_done = offset = 0
+                            job.hasher = hashlib.sha256()
+                        else:
+                            # Máy chủ bỏ qua Range: bỏ qua phần đã có trong luồng trả về
+                            skip = offset
+
+                    job.validator = job.validator or _validator(response)
+                    job.etag = job.etag or response.headers.get("ETag")
+                    job.last_modified = job.last_modified or response.headers.get("Last-Modified")
+                    total = _total_size(response, offset if response.status == 206 else 0)
+                    job.total_bytes = total if total is not None else job.total_bytes
+                    with open(meta_path, "w", encoding="utf-8") as f:
+                        json.dump({"url": job.url, "validator": job.validator, "total_bytes": job.total_bytes}, f)
+
+                    job.state = "downloading"
+                    ready.set()
+                    with open(path, "ab") as f:
+                        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                            if skip:
+                                drop = min(skip, len(chunk))
+                                chunk, skip = chunk[drop:], skip - drop
+                                if not chunk:
+                                    continue
+                            f.write(chunk)
+                            f.flush()
+                            job.hasher.update(chunk)
+                            job.bytes_done += len(chunk)
+                            job.notify()
+
+                if job.total_bytes is None or job.bytes_done >= job.total_bytes:
+                    break
+                raise aiohttp.ClientPayloadError("Connection closed before download completed")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                attempts += 1
+                if attempts > MAX_RETRIES:
+                    raise DownloadError(f"Network error: {str(e)}")
+                job.resumes += 1
+                print(f"[WARNING] Download interrupted at {job.bytes_done} bytes ({str(e)}), resuming")
+                await asyncio.sleep(min(2 ** attempts, 30))
+
+# ---------------------------------------------------------------------------
+# Đọc dữ liệu trong khi đang tải
+# ---------------------------------------------------------------------------
+
+class _GrowingFile(io.RawIOBase):
+    """Đọc một file đang được ghi, chờ dữ liệu mới cho tới khi tải xong"""
+
+    def __init__(self, path, job):
+        self._file = open(path, "rb", buffering=0)
+        self._job = job
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while True:
+            n = self._file.readinto(buffer)
+            if n:
+                return n
+            if self._job.error:
+                raise DownloadError(self._job.error)
+            if self._job.download_finished:
+                return self._file.readinto(buffer) or 0
+            self._job.wait()
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+class _NotStreamable(Exception):
+    pass
+
+class _ZipEntryStream(io.RawIOBase):
+    """Giải nén file CSV đầu tiên trong ZIP trực tiếp từ luồng (theo header cục bộ)"""
+
+    _HEADER = struct.Struct("<IHHHHHIIIHH")
+
+    def __init__(self, raw):
+        self._raw = io.BufferedReader(raw, CHUNK_SIZE)
+        while True:
+            header = self._read_exact(self._HEADER.size)
+            signature, _, flags, method, _, _, _, csize, _, name_len, extra_len = self._HEADER.unpack(header)
+            if signature != 0x04034b50:
+                raise _NotStreamable()
+            name = self._read_exact(name_len).decode("utf-8", "replace")
+            self._read_exact(extra_len)
+            if method not in (0, 8) or csize == 0xFFFFFFFF and method == 0:
+                raise _NotStreamable()
+            if name.lower().endswith(".csv") and not name.startswith("__MACOSX"):
+                break
+            # Bỏ qua file không phải CSV khi biết trước kích thước
+            if flags & 0x08:
+                raise _NotStreamable()
+            self._read_exact(csize)
+
+        if method == 0 and flags & 0x08:
+            raise _NotStreamable()
+        self.name = name
+        self._remaining = csize if method == 0 else None
+        self._inflater = zlib.decompressobj(-15) if method == 8 else None
+        self._pending = b""
+        self._offset = 0
+
+    def _read_exact(self, n):
+        data = self._raw.read(n)
+        if len(data) < n:
+            raise _NotStreamable()
+        return data
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._inflater is None:
+            data = self._raw.read(min(len(buffer), self._remaining)) if self._remaining else b""
+            self._remaining -= len(data)
+            buffer[:len(data)] = data
+            return len(data)
+
+        while self._offset >= len(self._pending) and not self._inflater.eof:
+            compressed = self._raw.read1(CHUNK_SIZE)
+            if not compressed:
+                raise DownloadError("ZIP archive ended unexpectedly")
+            self._pending, self._offset = self._inflater.decompress(compressed), 0
+        n = min(len(buffer), len(self._pending) - self._offset)
+        buffer[:n] = memoryview(self._pending)[self._offset:self._offset + n]
+        self._offset += n
+        return n
+
+def _read_csv_chunks(stream, job):
+    chunks = []
+    for chunk in pd.read_csv(stream, chunksize=PARSE_CHUNK_ROWS, low_memory=False):
+        chunks.append(chunk)
+        job.rows_parsed += len(chunk)
+    return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+
+def _parse(job, path, kind):
+    """Đọc dữ liệu từ file đang tải; ZIP không đọc được theo luồng sẽ được đọc sau khi tải xong"""
+    if kind == 'csv':
+        with io.BufferedReader(_GrowingFile(path, job), CHUNK_SIZE) as stream:
+            return _read_csv_chunks(stream, job)
+
+    raw = _GrowingFile(path, job)
+    try:
+        with io.BufferedReader(_ZipEntryStream(raw), CHUNK_SIZE) as stream:
+            return _read_csv_chunks(stream, job)
+    except _NotStreamable:
+        while not job.download_finished and not job.error:
+            job.wait()
+        if job.error:
+            raise DownloadError(job.error)
+        job.rows_parsed = 0
+        return parse_file(path, kind, job)
+    finally:
+        raw.close()
+
+def parse_file(path, kind, job=None):
+    """Đọc dữ liệu từ file đã tải xong"""
+    if kind == 'zip':
+        with zipfile.ZipFile(path) as zip_file:
+            csv_files = [f for f in zip_file.namelist() if f.endswith('.csv')]
+            if not csv_files:
+                raise DownloadError("No CSV files found in ZIP archive")
+            with zip_file.open(csv_files[0]) as csv_file:
+                return _read_csv_chunks(csv_file, job) if job else pd.read_csv(csv_file, low_memory=False)
+    return pd.read_csv(path, low_memory=False)
+
+# ---------------------------------------------------------------------------
+
+def _hash_file(path):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+            hasher.update(block)
+    return hasher
+
+async def fetch_dataset(job, expected_sha256=None, cached=None, on_complete=None):
+    """
+    Tải và đọc dữ liệu của một công việc
+
+    Các công việc cùng URL chạy lần lượt. Mỗi công việc ghi vào file tạm riêng;
+    phần đã tải chỉ được chuyển vào chỗ lưu chung của URL khi bị ngắt giữa chừng,
+    để lần sau tiếp tục.
+
+    Parameters:
+    -----------
+    job : DownloadJob
+        Công việc tải (tạo bằng create_job)
+    expected_sha256 : str, optional
+        Mã SHA-256 mong đợi của file tải về
+    cached : dict or callable, optional
+        'etag'/'last_modified' của bản đã lưu; nếu máy chủ trả về 304 thì
+        ném NotModified thay vì tải lại. Hàm (không tham số) được gọi sau khi
+        chờ xong các công việc trước cùng URL, nên thấy được bản chúng vừa lưu
+    on_complete : callable, optional
+        Gọi on_complete(job, path, kind, df) trong luồng phụ sau khi tải và đọc
+        xong, trước khi file tạm bị xóa (có thể di chuyển file đi nơi khác)
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Dữ liệu đã đọc
+    """
+    kind = file_kind(job.url)
+    if kind is None:
+        job.error = "Unsupported file format. Please provide CSV or ZIP file."
+        job.state = "error"
+        raise DownloadError(job.error)
+
+    async with _url_lock(job.url):
+        if callable(cached):
+            cached = cached()
+        return await _fetch(job, kind, expected_sha256, cached, on_complete)
+
+async def _fetch(job, kind, expected_sha256, cached, on_complete):
+    os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+    resume_path, resume_meta_path = _partial_paths(job.url)
+    # Mã công việc do người dùng đặt nên không dùng làm tên file
+    path, meta_path = _partial_paths(job.url, uuid.uuid4().hex)
+
+    # Tiếp tục từ phần đã tải ở lần trước nếu còn (nhận về file riêng của công việc)
+    if os.path.exists(resume_path) and os.path.exists(resume_meta_path):
+        with open(resume_meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        os.replace(resume_path, path)
+        os.replace(resume_meta_path, meta_path)
+        if meta.get("validator"):
+            job.validator = meta["validator"]
+            job.total_bytes = meta.get("total_bytes")
+            job.bytes_done = os.path.getsize(path)
+            job.hasher = _hash_file(path)
+            job.resumes += 1
+    if not job.bytes_done:
+        with open(path, "wb"):
+            pass
+
+    ready = asyncio.Event()
+    download = asyncio.create_task(_download(job, path, meta_path, ready, cached))
+    # Bắt đầu đọc khi phần đầu file đã được xác nhận hợp lệ
+    waiter = asyncio.create_task(ready.wait())
+    await asyncio.wait([download, waiter], return_when=asyncio.FIRST_COMPLETED)
+    waiter.cancel()
+    parse = asyncio.create_task(asyncio.to_thread(_parse, job, path, kind)) if ready.is_set() else None
+
+    try:
+        await download
+        job.sha256 = job.hasher.hexdigest()
+        if job.total_bytes is not None and job.bytes_done != job.total_bytes:
+            raise DownloadError(f"Size mismatch: expected {job.total_bytes} bytes, got {job.bytes_done}")
+        if expected_sha256 and job.sha256 != expected_sha256.lower():
+            _remove(path, meta_path)
+            raise DownloadError(f"Checksum mismatch: expected {expected_sha256}, got {job.sha256}")
+    except NotModified:
+        job.state = "not_modified"
+        job.finished_at = time.time()
+        _remove(path, meta_path)
+        raise
+    except Exception as e:
+        job.error = str(e)
+        job.state = "error"
+        job.finished_at = time.time()
+        job.notify()
+        if parse is not None:
+            await asyncio.gather(parse, return_exceptions=True)
+        # Giữ phần đã tải ở chỗ lưu chung để lần sau tiếp tục; bỏ file rỗng
+        if os.path.exists(path) and os.path.getsize(path) > 0 and os.path.exists(meta_path):
+            os.replace(path, resume_path)
+            os.replace(meta_path, resume_meta_path)
+        _remove(path, meta_path)
+        raise
+
+    job.download_finished = True
+    job.state = "parsing"
+    job.notify()
+    if parse is None:
+        parse = asyncio.create_task(asyncio.to_thread(_parse, job, path, kind))
+    try:
+        df = await parse
+    except Exception as e:
+        job.error = str(e)
+        job.state = "error"
+        job.finished_at = time.time()
+        # File đã tải đủ nhưng không đọc được: xóa để lần sau không tiếp tục từ bản hỏng
+        _remove(path, meta_path)
+        raise
+
+    if on_complete is not None:
+        await asyncio.to_thread(on_complete, job, path, kind, df)
+    _remove(path, meta_path)
+    job.state = "done"
+    job.finished_at = time.time()
+    return df
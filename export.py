@@ -0,0 +1,129 @@
+import io
+import zlib
+
+# Xuất dữ liệu dạng luồng: dữ liệu được chia thành từng khối dòng và mỗi khối
+# được ghi ra socket ngay khi mã hóa xong, nên bộ nhớ dùng thêm không phụ
+# thuộc vào số dòng được xuất.
+
+# Số dòng mỗi khối khi xuất
+CHUNK_ROWS = 50_000
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "feather": ("application/vnd.apache.arrow.file", "feather")
+}
+
+class _StreamSink(io.RawIOBase):
+    """File ghi chỉ-thêm giữ lại các byte chưa gửi; vị trí ghi vẫn tăng liên tục"""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+def _chunks(df, chunk_rows):
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+def _iter_csv(df, chunk_rows):
+    for i, chunk in enumerate(_chunks(df, chunk_rows)):
+        yield chunk.to_csv(index=False, header=(i == 0)).encode("utf-8")
+    if len(df) == 0:
+        yield df.to_csv(index=False).encode("utf-8")
+
+def _arrow_schema(df, chunk_rows):
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ValueError("Parquet and Feather export require the 'pyarrow' package")
+    # Lược đồ suy ra từ khối đầu tiên (không quét toàn bộ dữ liệu); các khối sau
+    # được ép về lược đồ này để mọi khối dùng chung một lược đồ
+    schema = pa.Schema.from_pandas(df.iloc[:chunk_rows], preserve_index=False)
+    for i, field in enumerate(schema):
+        if pa.types.is_null(field.type):
+            # Cột toàn giá trị rỗng ở khối đầu: suy kiểu từ các giá trị có mặt đầu tiên
+            values = df[field.name].dropna().iloc[:chunk_rows]
+            if len(values):
+                inferred = pa.Schema.from_pandas(values.to_frame(), preserve_index=False).field(0).type
+                schema = schema.set(i, field.with_type(inferred))
+    return pa, schema
+
+def _iter_arrow(df, chunk_rows, open_writer, pa, schema):
+    sink = _StreamSink()
+    writer = open_writer(sink, schema)
+    for chunk in _chunks(df, chunk_rows):
+        writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False, safe=False))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def stream_dataframe(df, fmt="csv", columns=None, gzip=False, chunk_rows=CHUNK_ROWS):
+    """
+    Tạo luồng byte xuất dữ liệu
+
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        Dữ liệu cần xuất
+    fmt : str
+        'csv', 'parquet' hoặc 'feather'
+    columns : list, optional
+        Các cột cần xuất (mặc định tất cả)
+    gzip : bool
+        Nén toàn bộ luồng bằng gzip
+
+    Returns:
+    --------
+    tuple
+        (bộ sinh các khối byte, kiểu nội dung, phần mở rộng tên file)
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}. Use one of: {', '.join(FORMATS)}")
+    if columns:
+        missing = [col for col in columns if col not in df.columns]
+        if missing:
+            raise ValueError(f"Unknown columns: {', '.join(missing)}")
+        df = df[columns]
+
+    media_type, extension = FORMATS[fmt]
+    if fmt == "csv":
+        chunks = _iter_csv(df, chunk_rows)
+    else:
+        # Kiểm tra pyarrow và lược đồ trước khi bắt đầu gửi phản hồi
+        pa, schema = _arrow_schema(df, chunk_rows)
+        if fmt == "parquet":
+            import pyarrow.parquet as pq
+            open_writer = pq.ParquetWriter
+        else:
+            import pyarrow.ipc as ipc
+            open_writer = ipc.new_file
+        chunks = _iter_arrow(df, chunk_rows, open_writer, pa, schema)
+
+    if gzip:
+        return _gzip(chunks), "application/gzip", extension + ".gz"
+    return chunks, media_type, extension
@@ -0,0 +1,296 @@
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from trajectory import haversine_km
+
+# Phát hiện nhóm tàu trên toàn bộ dữ liệu bằng lưới không gian.
+# Mỗi bản ghi được gán vào một ô vuông cạnh cell_km (km, theo phép chiếu cục bộ);
+# ô có ít nhất min_vessels tàu khác nhau là ô "dày", và mỗi nhóm là một thành phần
+# liên thông của các ô dày kề nhau (8 hướng). Mọi bước đều chạy trên mảng numpy,
+# chi phí O(n log n) theo số bản ghi thay vì O(n²) như DBSCAN/pdist.
+
+KM_PER_DEG = 111.32
+
+# Cạnh ô lưới nhỏ nhất của cạnh mặc định (km) và số tàu tối thiểu trong một ô dày
+CELL_KM = 2.0
+MIN_CELL_VESSELS = 2
+
+# Cạnh mặc định được chọn sao cho nếu các tàu phân bố đều trên vùng dữ liệu thì mỗi
+# ô có trung bình TARGET_CELL_VESSELS tàu; ô dày khi đó là nơi tàu tập trung hơn hẳn
+TARGET_CELL_VESSELS = 0.1
+
+# Số cặp điểm lấy mẫu để ước lượng khoảng cách trung bình của một nhóm lớn;
+# nhóm có ít cặp hơn mức này được tính chính xác
+DISTANCE_SAMPLE_PAIRS = 2000
+
+# Số hướng dùng để dựng bao lồi (đa giác nội tiếp bao lồi thật, sai số < 0.5% bán kính)
+HULL_DIRECTIONS = 32
+
+# Số phần tử tối đa của ma trận hình chiếu (điểm x hướng) trong một lô
+HULL_BATCH_ELEMENTS = 8_000_000
+
+def _cell_keys(lats, lons, cell_km):
+    """Khóa ô lưới (int64) và kích thước hàng của lưới"""
+    y = np.floor(lats * KM_PER_DEG / cell_km).astype(np.int64)
+    x = np.floor(lons * KM_PER_DEG * np.cos(np.radians(lats)) / cell_km).astype(np.int64)
+    x_off = int(np.ceil(180 * KM_PER_DEG / cell_km)) + 2
+    y_off = int(np.ceil(90 * KM_PER_DEG / cell_km)) + 2
+    span = 2 * x_off + 1
+    return (y + y_off) * span + (x + x_off), span
+
+def default_cell_km(lats, lons, n_vessels):
+    """
+    Cạnh ô lưới theo phạm vi và số tàu của dữ liệu (không nhỏ hơn CELL_KM)
+
+    Vùng dữ liệu được ước lượng bằng hình chữ nhật 2 độ lệch chuẩn mỗi chiều, nên
+    dữ liệu thưa trên vùng rộng (ví dụ dữ liệu mẫu) vẫn có nhóm, còn dữ liệu dày
+    đặc dùng ô nhỏ.
+    """
+    if len(lats) == 0 or n_vessels == 0:
+        return CELL_KM
+    spread_y = np.std(lats) * KM_PER_DEG
+    spread_x = np.std(lons) * KM_PER_DEG * np.cos(np.radians(np.mean(lats)))
+    area = (2 * spread_y) * (2 * spread_x)
+    return round(float(max(CELL_KM, np.sqrt(TARGET_CELL_VESSELS * area / n_vessels))), 3)
+
+def grid_clusters(lats, lons, vessels, cell_km=CELL_KM, min_vessels=MIN_CELL_VESSELS):
+    """
+    Gán nhãn nhóm cho từng bản ghi
+
+    Parameters:
+    -----------
+    lats, lons : numpy.ndarray
+        Tọa độ (độ)
+    vessels : numpy.ndarray
+        Mã tàu dạng số nguyên 0..k-1 (ví dụ từ pandas.factorize)
+    cell_km : float
+        Cạnh ô lưới (km)
+    min_vessels : int
+        Số tàu khác nhau tối thiểu để một ô được tính là dày
+
+    Returns:
+    --------
+    tuple
+        (nhãn int64 với -1 là nhiễu, số nhóm)
+    """
+    n = len(lats)
+    if n == 0:
+        return np.empty(0, dtype=np.int64), 0
+    keys, span = _cell_keys(np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64), cell_km)
+    cells, cell_of = np.unique(keys, return_inverse=True)
+
+    # Số tàu khác nhau trong mỗi ô
+    n_codes = int(vessels.max()) + 1
+    pairs = np.unique(cell_of * n_codes + vessels)
+    distinct = np.bincount(pairs // n_codes, minlength=len(cells))
+    dense = distinct >= min_vessels
+    dense_keys = cells[dense]
+    m = len(dense_keys)
+    if m == 0:
+        return np.full(n, -1, dtype=np.int64), 0
+
+    # Nối các ô dày kề nhau (4 hướng tiến là đủ cho kề 8 hướng vô hướng)
+    src, dst = [], []
+    for offset in (1, span - 1, span, span + 1):
+        pos = np.searchsorted(dense_keys, dense_keys + offset)
+        found = pos < m
+        found[found] = dense_keys[pos[found]] == dense_keys[found] + offset
+        src.append(np.flatnonzero(found))
+        dst.append(pos[found])
+    src, dst = np.concatenate(src), np.concatenate(dst)
+    graph = coo_matrix((np.ones(len(src), dtype=np.int8), (src, dst)), shape=(m, m))
+    n_clusters, component = connected_components(graph, directed=False)
+
+    dense_rank = np.cumsum(dense) - 1
+    labels = np.where(dense[cell_of], component[dense_rank[cell_of]], -1).astype(np.int64)
+    return labels, int(n_clusters)
+
+def _segments(labels, n_clusters):
+    """Thứ tự bản ghi theo nhóm (bỏ nhiễu), điểm bắt đầu và số bản ghi của mỗi nhóm"""
+    order = np.flatnonzero(labels >= 0)
+    order = order[np.argsort(labels[order], kind='stable')]
+    counts = np.bincount(labels[order], minlength=n_clusters)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    return order, starts, counts
+
+def _local_km(lats, lons, center_lat, center_lon):
+    """Tọa độ phẳng (km) quanh tâm nhóm, xử lý kinh tuyến 180"""
+    dlon = (lons - center_lon + 180) % 360 - 180
+    return dlon * KM_PER_DEG * np.cos(np.radians(center_lat)), (lats - center_lat) * KM_PER_DEG
+
+def _pair_distances(lats, lons, starts, counts, max_pairs, rng):
+    """
+    Khoảng cách trung bình giữa các cặp điểm của mỗi nhóm
+
+    Nhóm có không quá max_pairs cặp được tính chính xác; nhóm lớn hơn được ước lượng
+    từ max_pairs cặp ngẫu nhiên, kèm nửa khoảng tin cậy 95% của ước lượng.
+    """
+    k = len(counts)
+    mean = np.zeros(k)
+    error = np.zeros(k)
+    n_pairs = counts * (counts - 1) // 2
+    exact = n_pairs <= max_pairs
+
+    # Chính xác: liệt kê mọi cặp, gộp theo kích thước nhóm
+    for size in np.unique(counts[exact & (counts > 1)]):
+        groups = np.flatnonzero(exact & (counts == size))
+        i, j = np.triu_indices(size, 1)
+        a = (starts[groups][:, None] + i[None, :]).ravel()
+        b = (starts[groups][:, None] + j[None, :]).ravel()
+        d = haversine_km(lats[a], lons[a], lats[b], lons[b]).reshape(len(groups), -1)
+        mean[groups] = d.mean(axis=1)
+
+    # Lấy mẫu: cặp (a, b) ngẫu nhiên trong cùng nhóm, bỏ cặp trùng điểm
+    sampled = np.flatnonzero(~exact)
+    if len(sampled):
+        n = counts[sampled][:, None]
+        a = starts[sampled][:, None] + (rng.random((len(sampled), max_pairs)) * n).astype(np.int64)
+        b = starts[sampled][:, None] + (rng.random((len(sampled), max_pairs)) * n).astype(np.int64)
+        d = haversine_km(lats[a], lons[a], lats[b], lons[b])
+        valid = a != b
+        used = valid.sum(axis=1)
+        mean[sampled] = np.where(valid, d, 0).sum(axis=1) / used
+        var = np.where(valid, (d - mean[sampled][:, None]) ** 2, 0).sum(axis=1) / np.maximum(used - 1, 1)
+        error[sampled] = 1.96 * np.sqrt(var / used)
+    return mean, error
+
+def _argmax_segments(values, starts, counts):
+    """Chỉ số phần tử lớn nhất (đầu tiên) trong từng đoạn liên tiếp"""
+    hits = np.flatnonzero(values == np.repeat(np.maximum.reduceat(values, starts), counts))
+    return hits[np.searchsorted(hits, starts)]
+
+def _extremes(x, y, starts, counts, angles):
+    """Chỉ số điểm có hình chiếu lớn nhất theo từng hướng trong mỗi nhóm, kích thước (số nhóm, số hướng)"""
+    vertices = np.empty((len(counts), len(angles)), dtype=np.int64)
+    step = int(np.clip(HULL_BATCH_ELEMENTS // max(len(x), 1), 1, len(angles)))
+    for lo in range(0, len(angles), step):
+        batch = angles[lo:lo + step]
+        proj = x[:, None] * np.cos(batch)[None, :] + y[:, None] * np.sin(batch)[None, :]
+        for j in range(len(batch)):
+            vertices[:, lo + j] = _argmax_segments(proj[:, j], starts, counts)
+    return vertices
+
+def _hulls(x, y, starts, counts, directions=HULL_DIRECTIONS):
+    """
+    Đỉnh bao lồi của mọi nhóm, tính theo lô hướng
+
+    Với mỗi hướng, điểm có hình chiếu lớn nhất trong nhóm là một đỉnh của bao lồi;
+    các đỉnh theo thứ tự hướng tạo thành đa giác nội tiếp bao lồi thật. Trước đó
+    các điểm nằm hẳn trong tứ giác của 4 điểm cực trị (Akl-Toussaint) được loại bỏ.
+
+    Returns:
+    --------
+    numpy.ndarray
+        Chỉ số điểm (theo thứ tự đã sắp) của đỉnh, kích thước (số nhóm, directions)
+    """
+    k = len(counts)
+    # Cực trị theo 4 hướng trục, ngược chiều kim đồng hồ
+    quad = np.stack([_argmax_segments(v, starts, counts) for v in (x, y, -x, -y)], axis=1)
+    group = np.repeat(np.arange(k), counts)
+    inside = np.ones(len(x), dtype=bool)
+    for a, b in ((0, 1), (1, 2), (2, 3), (3, 0)):
+        pa, pb = quad[group, a], quad[group, b]
+        inside &= (x[pb] - x[pa]) * (y - y[pa]) - (y[pb] - y[pa]) * (x - x[pa]) > 0
+    keep = np.flatnonzero(~inside)
+
+    kept_counts = np.bincount(group[keep], minlength=k)
+    kept_starts = np.concatenate([[0], np.cumsum(kept_counts)[:-1]])
+    angles = np.linspace(0, 2 * np.pi, directions, endpoint=False)
+    return keep[_extremes(x[keep], y[keep], kept_starts, kept_counts, angles)]
+
+def describe_groups(labels, n_clusters, lats, lons, vessels, types=None, type_names=None, max_groups=None,
+                    map_points=100, max_pairs=DISTANCE_SAMPLE_PAIRS, seed=0):
+    """
+    Thống kê các nhóm: tâm, số tàu, loại tàu, khoảng cách trung bình, bao lồi và điểm mẫu
+
+    Parameters:
+    -----------
+    labels : numpy.ndarray
+        Nhãn từ grid_clusters
+    vessels : numpy.ndarray
+        Mã tàu 0..k-1
+    types : numpy.ndarray
+        Mã loại tàu 0..t-1 (-1 nếu thiếu), tùy chọn
+    type_names : sequence
+        Tên ứng với mã loại tàu
+    max_groups : int
+        Chỉ mô tả chi tiết các nhóm có nhiều tàu nhất
+    map_points : int
+        Số điểm mẫu tối đa của mỗi nhóm để hiển thị
+
+    Returns:
+    --------
+    list
+        Các nhóm, sắp theo số tàu giảm dần; points.index là vị trí của điểm mẫu trong mảng đầu vào
+    """
+    if n_clusters == 0:
+        return []
+    order, starts, counts = _segments(labels, n_clusters)
+    lab = labels[order]
+    lat, lon = lats[order], lons[order]
+
+    # Tâm nhóm: trung bình vĩ độ, trung bình vòng của kinh độ
+    center_lat = np.bincount(lab, lat, n_clusters) / counts
+    rad = np.radians(lon)
+    center_lon = np.degrees(np.arctan2(np.bincount(lab, np.sin(rad), n_clusters),
+                                       np.bincount(lab, np.cos(rad), n_clusters)))
+
+    n_codes = int(vessels.max()) + 1
+    vessel_pairs = np.unique(lab * n_codes + vessels[order])
+    vessel_count = np.bincount(vessel_pairs // n_codes, minlength=n_clusters)
+
+    # Chỉ mô tả chi tiết các nhóm lớn nhất
+    ranked = np.lexsort((-counts, -vessel_count))
+    if max_groups is not None:
+        ranked = ranked[:max_groups]
+
+    x, y = _local_km(lat, lon, center_lat[lab], center_lon[lab])
+    # Khoảng cách trung bình phương giữa hai điểm, tính giải tích từ phương sai:
+    # E|p_i - p_j|² = 2 n/(n-1) * (var_x + var_y)
+    spread = np.bincount(lab, x ** 2 + y ** 2, n_clusters) / counts
+    rms_km = np.sqrt(2 * spread * counts / np.maximum(counts - 1, 1))
+
+    # Các bước tốn kém hơn chỉ chạy trên các nhóm được chọn
+    sel_starts, sel_counts = starts[ranked], counts[ranked]
+    index = np.concatenate([np.arange(s, s + c) for s, c in zip(sel_starts, sel_counts)])
+    sub_starts = np.concatenate([[0], np.cumsum(sel_counts)[:-1]])
+    rng = np.random.default_rng(seed)
+    avg_km, avg_err = _pair_distances(lat[index], lon[index], sub_starts, sel_counts, max_pairs, rng)
+    hull_idx = _hulls(x[index], y[index], sub_starts, sel_counts)
+
+    group_types = {}
+    if types is not None and type_names is not None:
+        type_pairs = np.unique(lab * (len(type_names) + 1) + types[order] + 1)
+        for g, t in zip(type_pairs // (len(type_names) + 1), type_pairs % (len(type_names) + 1) - 1):
+            if t >= 0:
+                group_types.setdefault(int(g), []).append(str(type_names[t]))
+
+    sel_lat, sel_lon = lat[index], lon[index]
+    sel_rows = order[index]
+    groups = []
+    for k, g in enumerate(ranked):
+        s, c = sub_starts[k], sel_counts[k]
+        # Đỉnh bao lồi theo thứ tự hướng, bỏ đỉnh trùng liên tiếp
+        hull = hull_idx[k]
+        hull = hull[np.r_[True, hull[1:] != hull[:-1]]]
+        if len(hull) > 1 and hull[0] == hull[-1]:
+            hull = hull[:-1]
+        sample = s + np.unique(np.linspace(0, c - 1, min(c, map_points)).astype(np.int64))
+        groups.append({
+            "group_id": k,
+            "center": [round(float(center_lat[g]), 6), round(float(center_lon[g]), 6)],
+            "vessel_count": int(vessel_count[g]),
+            "total_records": int(c),
+            "vessel_types": group_types.get(int(g), []),
+            "avg_distance_km": round(float(avg_km[k]), 3),
+            "avg_distance_error_km": round(float(avg_err[k]), 3),
+            "rms_distance_km": round(float(rms_km[g]), 3),
+            "hull": [[round(float(sel_lat[i]), 6), round(float(sel_lon[i]), 6)] for i in hull],
+            "points": {
+                "index": sel_rows[sample].tolist(),
+                "lat": sel_lat[sample].round(6).tolist(),
+                "lon": sel_lon[sample].round(6).tolist()
+            }
+        })
+    return groups
@@ -0,0 +1,383 @@
+import os
+import io
+import json
+import zipfile
+import hashlib
+from collections import OrderedDict
+import numpy as np
+from scipy.spatial import cKDTree
+from matplotlib.path import Path
+
+# Lớp chướng ngại vật hàng hải tĩnh (xác tàu, bãi cạn, giàn khoan...).
+# Hình học được nạp từ GeoJSON/shapefile, chuyển thành các điểm trên mặt cầu
+# và lập chỉ mục không gian (KD-tree) để tra khoảng cách gần nhất theo lô.
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Khoảng cách tối đa giữa hai đỉnh khi làm dày đường/đa giác (km)
+DENSIFY_SPACING_KM = 0.25
+
+# Số điểm truy vấn mỗi lô
+BATCH_SIZE = 1_000_000
+
+# Cạnh ô nhỏ nhất (độ) của chỉ mục bbox đa giác và số ô tối đa một bbox được ghi vào
+MIN_INDEX_CELL_DEG = 0.01
+MAX_INDEX_CELLS = 4096
+
+def _to_unit_vectors(lats, lons):
+    """Chuyển vĩ độ/kinh độ (độ) sang vector đơn vị 3D"""
+    lat_r = np.radians(np.asarray(lats, dtype=np.float64))
+    lon_r = np.radians(np.asarray(lons, dtype=np.float64))
+    cos_lat = np.cos(lat_r)
+    return np.column_stack((cos_lat * np.cos(lon_r), cos_lat * np.sin(lon_r), np.sin(lat_r)))
+
+def _chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1))
+
+def _km_to_chord(km):
+    return 2 * np.sin(km / (2 * EARTH_RADIUS_KM))
+
+def _unwrap(coords):
+    """Mảng (lon, lat) với kinh độ được nối liền qua kinh tuyến 180 (bước nhảy > 180 độ được bù 360)"""
+    coords = np.array(coords, dtype=np.float64)
+    if coords.ndim != 2:
+        return np.empty((0, 2))
+    coords = coords[:, :2].copy()
+    coords[1:, 0] -= 360 * np.cumsum(np.round(np.diff(coords[:, 0]) / 360))
+    return coords
+
+def _densify(coords):
+    """Chèn thêm điểm trên các cạnh dài để khoảng cách tới đường được xấp xỉ tốt"""
+    # Cạnh cắt kinh tuyến 180 được làm dày theo đường ngắn qua kinh tuyến đó
+    coords = _unwrap(coords)
+    if len(coords) < 2:
+        return coords
+    start, end = coords[:-1], coords[1:]
+    # Độ dài cạnh xấp xỉ theo phép chiếu phẳng cục bộ
+    mid_lat = np.radians((start[:, 1] + end[:, 1]) / 2)
+    dx = (end[:, 0] - start[:, 0]) * np.cos(mid_lat) * 111.32
+    dy = (end[:, 1] - start[:, 1]) * 110.57
+    steps = np.maximum(1, np.ceil(np.hypot(dx, dy) / DENSIFY_SPACING_KM).astype(np.int64))
+    # Tham số nội suy t cho từng điểm của mọi cạnh cùng lúc
+    seg = np.repeat(np.arange(len(steps)), steps)
+    t = (np.arange(steps.sum()) - np.repeat(np.cumsum(steps) - steps, steps)) / np.repeat(steps, steps)
+    points = np.vstack((start[seg] + (end[seg] - start[seg]) * t[:, None], coords[-1:]))
+    points[:, 0] = (points[:, 0] + 180) % 360 - 180
+    return points
+
+def _geometry_points(geometry):
+    """Trả về mảng (lon, lat) đại diện cho một hình học GeoJSON"""
+    if not geometry:
+        return np.empty((0, 2))
+    geom_type = geometry.get("type")
+    coords = geometry.get("coordinates")
+    if geom_type == "Point":
+        return np.asarray([coords[:2]], dtype=np.float64)
+    if geom_type == "MultiPoint":
+        return np.asarray([c[:2] for c in coords], dtype=np.float64).reshape(-1, 2)
+    if geom_type == "LineString":
+        return _densify(coords)
+    if geom_type in ("MultiLineString", "Polygon"):
+        return np.vstack([_densify(ring) for ring in coords]) if coords else np.empty((0, 2))
+    if geom_type == "MultiPolygon":
+        parts = [_densify(ring) for polygon in coords for ring in polygon]
+        return np.vstack(parts) if parts else np.empty((0, 2))
+    if geom_type == "GeometryCollection":
+        parts = [_geometry_points(g) for g in geometry.get("geometries", [])]
+        return np.vstack(parts) if parts else np.empty((0, 2))
+    return np.empty((0, 2))
+
+def _geometry_polygons(geometry):
+    """Danh sách đa giác (mỗi đa giác là danh sách vòng, vòng đầu là biên ngoài) của hình học GeoJSON"""
+    if not geometry:
+        return []
+    geom_type = geometry.get("type")
+    coords = geometry.get("coordinates")
+    if geom_type == "Polygon":
+        return [coords] if coords else []
+    if geom_type == "MultiPolygon":
+        return [polygon for polygon in coords if polygon]
+    if geom_type == "GeometryCollection":
+        return [polygon for g in geometry.get("geometries", []) for polygon in _geometry_polygons(g)]
+    return []
+
+class _Polygon:
+    """Đa giác dùng để kiểm tra vị trí nằm bên trong (khoảng cách tới chướng ngại vật bằng 0)"""
+
+    def __init__(self, rings, point):
+        rings = [_unwrap(ring) for ring in rings if len(ring) >= 3]
+        self.outer = Path(rings[0])
+        self.holes = [Path(ring) for ring in rings[1:]]
+        # Kinh độ của bbox có thể vượt [-180, 180] khi biên ngoài cắt kinh tuyến 180
+        self.lon_min, self.lat_min = rings[0].min(axis=0)
+        self.lon_max, self.lat_max = rings[0].max(axis=0)
+        # Chỉ số một đỉnh của đa giác, trả về làm chướng ngại vật gần nhất
+        self.point = point
+
+    def contains(self, lats, lons):
+        """Mặt nạ các vị trí (kinh độ cùng hệ với biên ngoài đã nối liền) nằm trong biên ngoài, ngoài các lỗ"""
+        points = np.column_stack((lons, lats))
+        hit = self.outer.contains_points(points)
+        for hole in self.holes:
+            hit &= ~hole.contains_points(points)
+        return hit
+
+class _PolygonIndex:
+    """
+    Chỉ mục lưới theo bbox của các đa giác
+
+    Mỗi bbox được ghi vào các ô lưới nó phủ; một vị trí chỉ được kiểm tra với các
+    đa giác ghi trong ô của nó và có bbox chứa nó. Đa giác cắt kinh tuyến 180 được
+    ghi thêm một bản dịch 360 độ. Bbox phủ quá MAX_INDEX_CELLS ô được kiểm tra
+    riêng bằng bbox trên mọi vị trí.
+    """
+
+    def __init__(self, polygons):
+        self.polygons = polygons
+        n = len(polygons)
+        boxes = np.array([[p.lon_min, p.lat_min, p.lon_max, p.lat_max] for p in polygons],
+                         dtype=np.float64).reshape(n, 4)
+        # Bản ghi: (đa giác, độ dịch kinh độ cộng vào vị trí khi kiểm tra)
+        owners = [np.arange(n), np.flatnonzero(boxes[:, 2] > 180), np.flatnonzero(boxes[:, 0] < -180)]
+        shifts = [np.zeros(len(owners[0])), np.full(len(owners[1]), 360.0), np.full(len(owners[2]), -360.0)]
+        self.owner = np.concatenate(owners)
+        self.shift = np.concatenate(shifts)
+        # Bbox của bản ghi trong hệ kinh độ [-180, 180] của vị trí
+        self.boxes = boxes[self.owner] - self.shift[:, None] * np.array([1.0, 0.0, 1.0, 0.0])
+        self.boxes[:, [0, 2]] = np.clip(self.boxes[:, [0, 2]], -180, 180)
+
+        extent = np.maximum(self.boxes[:, 2] - self.boxes[:, 0], self.boxes[:, 3] - self.boxes[:, 1])
+        self.cell = float(np.clip(np.median(extent), MIN_INDEX_CELL_DEG, 10.0)) if len(extent) else 1.0
+        self.n_cols = int(np.ceil(360 / self.cell)) + 1
+        r0, c0 = self._rows_cols(self.boxes[:, 1], self.boxes[:, 0])
+        r1, c1 = self._rows_cols(self.boxes[:, 3], self.boxes[:, 2])
+        widths = c1 - c0 + 1
+        counts = (r1 - r0 + 1) * widths
+        small = counts <= MAX_INDEX_CELLS
+        self.large = np.flatnonzero(~small)
+
+        # Ô phủ bởi từng bbox nhỏ, dạng CSR theo khóa ô
+        entries = np.repeat(np.flatnonzero(small), counts[small])
+        k = np.arange(len(entries)) - np.repeat(np.cumsum(counts[small]) - counts[small], counts[small])
+        keys = (r0[entries] + k // widths[entries]) * self.n_cols + c0[entries] + k % widths[entries]
+        order = np.argsort(keys, kind="stable")
+        self.cell_keys, starts = np.unique(keys[order], return_index=True)
+        self.cell_offsets = np.append(starts, len(order))
+        self.cell_entries = entries[order]
+
+    def _rows_cols(self, lats, lons):
+        rows = np.floor((np.clip(lats, -90, 90) + 90) / self.cell).astype(np.int64)
+        cols = np.floor((np.clip(lons, -180, 180) + 180) / self.cell).astype(np.int64)
+        return rows, cols
+
+    def contains(self, lats, lons):
+        """
+        Vị trí nằm trong một đa giác
+
+        Returns:
+        --------
+        tuple
+            (mặt nạ vị trí nằm trong, chỉ số đỉnh đại diện của đa giác chứa nó hoặc -1)
+        """
+        inside = np.zeros(len(lats), dtype=bool)
+        owner_point = np.full(len(lats), -1, dtype=np.int64)
+
+        # Cặp (vị trí, bản ghi) ứng viên từ ô lưới của vị trí
+        rows, cols = self._rows_cols(lats, lons)
+        keys = rows * self.n_cols + cols
+        pos = np.searchsorted(self.cell_keys, keys)
+        found = pos < len(self.cell_keys)
+        found[found] = self.cell_keys[pos[found]] == keys[found]
+        points = np.flatnonzero(found)
+        first, last = self.cell_offsets[pos[points]], self.cell_offsets[pos[points] + 1]
+        counts = last - first
+        point = np.repeat(points, counts)
+        entry = self.cell_entries[np.repeat(first, counts) + np.arange(counts.sum())
+                                  - np.repeat(np.cumsum(counts) - counts, counts)]
+        for large in self.large:
+            box = self.boxes[large]
+            extra = np.flatnonzero((lats >= box[1]) & (lats <= box[3]) & (lons >= box[0]) & (lons <= box[2]))
+            point = np.concatenate([point, extra])
+            entry = np.concatenate([entry, np.full(len(extra), large)])
+
+        # Kiểm tra chính xác bbox rồi đa giác, gom theo đa giác
+        box = self.boxes[entry]
+        keep = ((lats[point] >= box[:, 1]) & (lats[point] <= box[:, 3]) &
+                (lons[point] >= box[:, 0]) & (lons[point] <= box[:, 2]))
+        point, entry = point[keep], entry[keep]
+        order = np.argsort(entry, kind="stable")
+        point, entry = point[order], entry[order]
+        bounds = np.flatnonzero(np.diff(entry)) + 1
+        for part_points, part_entry in zip(np.split(point, bounds), entry[np.append(0, bounds)] if len(entry) else []):
+            polygon = self.polygons[self.owner[part_entry]]
+            hit = part_points[polygon.contains(lats[part_points], lons[part_points] + self.shift[part_entry])]
+            inside[hit] = True
+            owner_point[hit] = polygon.point
+        return inside, owner_point
+
+class HazardLayer:
+    """Tập chướng ngại vật đã lập chỉ mục không gian"""
+
+    def __init__(self, name, lons, lats, kinds, polygons=()):
+        self.name = name
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.kinds = np.asarray(kinds, dtype=object)
+        self.polygons = list(polygons)
+        self.polygon_index = _PolygonIndex(self.polygons) if self.polygons else None
+        self.tree = cKDTree(_to_unit_vectors(self.lats, self.lons))
+
+        # Phiên bản của lớp dựa trên nội dung hình học
+        hasher = hashlib.sha1()
+        hasher.update(self.lons.tobytes())
+        hasher.update(self.lats.tobytes())
+        self.version = hasher.hexdigest()[:16]
+
+    def __len__(self):
+        return len(self.lats)
+
+    @classmethod
+    def from_features(cls, name, features):
+        lon_parts, lat_parts, kind_parts, polygons = [], [], [], []
+        offset = 0
+        for feature in features:
+            geometry = feature.get("geometry")
+            points = _geometry_points(geometry)
+            if len(points) == 0:
+                continue
+            properties = feature.get("properties") or {}
+            kind = properties.get("type") or properties.get("kind") or properties.get("category") or "hazard"
+            lon_parts.append(points[:, 0])
+            lat_parts.append(points[:, 1])
+            kind_parts.append(np.full(len(points), str(kind), dtype=object))
+            polygons.extend(_Polygon(rings, offset) for rings in _geometry_polygons(geometry)
+                            if rings and len(rings[0]) >= 3)
+            offset += len(points)
+        if not lon_parts:
+            raise ValueError("Hazard layer contains no usable geometry")
+        return cls(name, np.concatenate(lon_parts), np.concatenate(lat_parts), np.concatenate(kind_parts), polygons)
+
+    @classmethod
+    def from_geojson(cls, source, name=None):
+        """Nạp lớp từ đường dẫn hoặc nội dung (bytes/str) GeoJSON"""
+        if isinstance(source, (bytes, str)) and not (isinstance(source, str) and os.path.exists(source)):
+            data = json.loads(source)
+        else:
+            with open(source, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            name = name or os.path.basename(source)
+        if data.get("type") == "FeatureCollection":
+            features = data.get("features", [])
+        elif data.get("type") == "Feature":
+            features = [data]
+        else:
+            features = [{"geometry": data, "properties": {}}]
+        return cls.from_features(name or "hazards", features)
+
+    @classmethod
+    def from_shapefile(cls, source, name=None):
+        """Nạp lớp từ shapefile (đường dẫn .shp hoặc file ZIP) - cần thư viện pyshp"""
+        try:
+            import shapefile
+        except ImportError:
+            raise ValueError("Reading shapefiles requires the 'pyshp' package")
+
+        if isinstance(source, (bytes, bytearray)):
+            with zipfile.ZipFile(io.BytesIO(source)) as zf:
+                members = {os.path.splitext(n)[1].lower(): n for n in zf.namelist()}
+                if ".shp" not in members:
+                    raise ValueError("No .shp file found in ZIP archive")
+                streams = {ext: io.BytesIO(zf.read(members[ext])) for ext in (".shp", ".shx", ".dbf") if ext in members}
+                reader = shapefile.Reader(shp=streams.get(".shp"), shx=streams.get(".shx"), dbf=streams.get(".dbf"))
+                name = name or os.path.basename(members[".shp"])
+        else:
+            reader = shapefile.Reader(source)
+            name = name or os.path.basename(source)
+
+        with reader:
+            features = [{"geometry": record.shape.__geo_interface__, "properties": record.record.as_dict()}
+                        for record in reader.iterShapeRecords()]
+        return cls.from_features(name, features)
+
+    def nearest(self, lats, lons, max_km=None, batch_size=BATCH_SIZE):
+        """
+        Tính khoảng cách (km) từ mỗi vị trí tới chướng ngại vật gần nhất
+
+        Parameters:
+        -----------
+        lats, lons : array-like
+            Vị trí cần tra cứu (độ)
+        max_km : float, optional
+            Bỏ qua chướng ngại vật xa hơn ngưỡng này (khoảng cách trả về là inf)
+
+        Returns:
+        --------
+        tuple
+            (khoảng cách km, chỉ số chướng ngại vật; -1 nếu không có)
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        distances = np.full(len(lats), np.inf)
+        indices = np.full(len(lats), -1, dtype=np.int64)
+        bound = _km_to_chord(max_km) if max_km is not None else np.inf
+
+        valid = np.flatnonzero(np.isfinite(lats) & np.isfinite(lons))
+        for start in range(0, len(valid), batch_size):
+            rows = valid[start:start + batch_size]
+            chord, idx = self.tree.query(_to_unit_vectors(lats[rows], lons[rows]),
+                                         distance_upper_bound=bound, workers=-1)
+            found = np.isfinite(chord)
+            distances[rows[found]] = _chord_to_km(chord[found])
+            indices[rows[found]] = idx[found]
+
+            # Vị trí nằm trong đa giác (bãi cạn, vùng cấm...) có khoảng cách 0
+            if self.polygon_index is not None:
+                inside, owner = self.polygon_index.contains(lats[rows], lons[rows])
+                hit = rows[inside]
+                distances[hit] = 0.0
+                indices[hit] = np.where(indices[hit] >= 0, indices[hit], owner[inside])
+        return distances, indices
+
+    def summary(self):
+        kinds, counts = np.unique(self.kinds.astype(str), return_counts=True)
+        return {
+            "name": self.name,
+            "version": self.version,
+            "points": len(self),
+            "kinds": {str(k): int(c) for k, c in zip(kinds, counts)}
+        }
+
+# Bộ nhớ đệm khoảng cách theo (phiên bản lớp, vị trí, ngưỡng)
+_distance_cache = OrderedDict()
+_DISTANCE_CACHE_SIZE = 4
+
+def nearest_hazard_km(layer, lats, lons, max_km=None):
+    """Khoảng cách tới chướng ngại vật gần nhất, lưu đệm theo phiên bản lớp"""
+    lats = np.ascontiguousarray(lats, dtype=np.float64)
+    lons = np.ascontiguousarray(lons, dtype=np.float64)
+    hasher = hashlib.sha1()
+    hasher.update(lats.tobytes())
+    hasher.update(lons.tobytes())
+    key = (layer.version, hasher.hexdigest(), max_km)
+
+    if key in _distance_cache:
+        _distance_cache.move_to_end(key)
+        return _distance_cache[key]
+
+    distances, _ = layer.nearest(lats, lons, max_km=max_km)
+    _distance_cache[key] = distances
+    while len(_distance_cache) > _DISTANCE_CACHE_SIZE:
+        _distance_cache.popitem(last=False)
+    return distances
+
+def load_hazard_layer(path):
+    """Nạp lớp chướng ngại vật từ file theo phần mở rộng"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".geojson", ".json"):
+        return HazardLayer.from_geojson(path)
+    if ext == ".shp":
+        return HazardLayer.from_shapefile(path)
+    if ext == ".zip":
+        with open(path, "rb") as f:
+            return HazardLayer.from_shapefile(f.read(), name=os.path.basename(path))
+    raise ValueError(f"Unsupported hazard layer format: {ext}")
@@ -0,0 +1,202 @@
+import os
+import time
+import socket
+import asyncio
+
+import nmea
+
+# Dịch vụ nhận dữ liệu AIS thô (NMEA) theo thời gian thực từ TCP, UDP hoặc
+# file (đọc đuôi file đang được ghi, hoặc phát lại một bản ghi có sẵn).
+# Các câu được gom thành lô nhỏ, giải mã theo lô và chuyển cho hàm sink
+# (ví dụ thêm vào tập dữ liệu đang chạy).
+
+# Khoảng thời gian tối đa giữa hai lần xả lô (giây)
+BATCH_INTERVAL_S = 1.0
+
+# Số câu tối đa mỗi lô
+BATCH_MAX_LINES = 50_000
+
+# Thời gian chờ trước khi kết nối lại nguồn TCP (giây)
+RECONNECT_DELAY_S = 5
+
+# Kích thước bộ đệm nhận của socket UDP (byte)
+UDP_RECEIVE_BUFFER = 4 * 1024 * 1024
+
+SOURCES = ("tcp", "udp", "file")
+
+class _UdpProtocol(asyncio.DatagramProtocol):
+    def __init__(self, service):
+        self.service = service
+
+    def datagram_received(self, data, addr):
+        self.service._add_lines(data.decode("ascii", "replace").splitlines())
+
+class IngestService:
+    """
+    Nhận câu NMEA từ một nguồn và chuyển các bản ghi vị trí đã giải mã cho sink theo lô
+
+    Parameters:
+    -----------
+    source : str
+        'tcp' (kết nối tới máy chủ phát dữ liệu), 'udp' (lắng nghe cổng) hoặc 'file'
+    sink : callable
+        Hàm nhận mỗi lô bản ghi vị trí (pandas.DataFrame), được gọi trong luồng phụ
+    host, port : str, int
+        Địa chỉ nguồn TCP hoặc cổng lắng nghe UDP
+    path : str
+        Đường dẫn file nguồn
+    follow : bool
+        Tiếp tục đọc dữ liệu mới được ghi thêm vào file (như tail -f)
+    """
+
+    def __init__(self, source, sink, host="127.0.0.1", port=10110, path=None, follow=False,
+                 batch_interval=BATCH_INTERVAL_S, batch_max_lines=BATCH_MAX_LINES):
+        if source not in SOURCES:
+            raise ValueError(f"Unsupported ingest source: {source}. Use one of: {', '.join(SOURCES)}")
+        if source == "file" and not (path and os.path.exists(path)):
+            raise ValueError(f"File not found: {path}")
+
+        self.source = source
+        self.sink = sink
+        self.host = host
+        self.port = port
+        self.path = path
+        self.follow = follow
+        self.batch_interval = batch_interval
+        self.batch_max_lines = batch_max_lines
+
+        self.decoder = nmea.AisDecoder()
+        self._lines = []
+        self._partial = ""
+        self._has_lines = asyncio.Event()
+        self._tasks = []
+        self._transport = None
+        self.running = False
+        self.finished = False
+        self.error = None
+        self.started_at = None
+        self.batches = 0
+        self.records = 0
+        self.last_batch_at = None
+
+    def _add_lines(self, lines):
+        self._lines.extend(lines)
+        if len(self._lines) >= self.batch_max_lines:
+            self._has_lines.set()
+
+    async def start(self):
+        self.running = True
+        self.started_at = time.time()
+        if self.source == "udp":
+            loop = asyncio.get_running_loop()
+            self._transport, _ = await loop.create_datagram_endpoint(
+                lambda: _UdpProtocol(self), local_addr=(self.host, self.port))
+            # Bộ đệm nhận lớn để không mất gói khi nguồn phát dồn dập
+            self._transport.get_extra_info("socket").setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UDP_RECEIVE_BUFFER)
+            reader = None
+        else:
+            reader = asyncio.create_task(self._read_tcp() if self.source == "tcp" else self._read_file())
+            self._tasks.append(reader)
+        self._tasks.append(asyncio.create_task(self._flush_loop(reader)))
+
+    async def stop(self):
+        self.running = False
+        if self._transport is not None:
+            self._transport.close()
+        # Dừng nguồn đọc; vòng xả lô tự kết thúc sau khi xả phần còn lại trong bộ đệm
+        for task in self._tasks[:-1]:
+            task.cancel()
+        self._has_lines.set()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _read_tcp(self):
+        while self.running:
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+                print(f"[INFO] Ingest connected to {self.host}:{self.port}")
+                self.error = None
+                try:
+                    while True:
+                        data = await reader.read(1 << 16)
+                        if not data:
+                            break
+                        self._feed(data)
+                finally:
+                    writer.close()
+            except (OSError, asyncio.IncompleteReadError) as e:
+                self.error = str(e)
+                print(f"[WARNING] Ingest connection to {self.host}:{self.port} failed: {str(e)}")
+            await asyncio.sleep(RECONNECT_DELAY_S)
+
+    async def _read_file(self):
+        with open(self.path, "rb") as f:
+            while self.running:
+                data = f.read(1 << 20)
+                if data:
+                    self._feed(data)
+                    # Nhường vòng lặp sự kiện để lô được xả khi phát lại file lớn
+                    await asyncio.sleep(0)
+                elif self.follow:
+                    await asyncio.sleep(0.2)
+                else:
+                    break
+        # Dòng cuối file có thể không có ký tự xuống dòng
+        if self._partial:
+            self._add_lines([self._partial])
+            self._partial = ""
+        self._has_lines.set()
+
+    def _feed(self, data):
+        """Tách dữ liệu nhận được thành từng dòng, giữ lại phần dòng chưa kết thúc"""
+        text = self._partial + data.decode("ascii", "replace")
+        lines = text.split("\n")
+        self._partial = lines.pop()
+        self._add_lines(lines)
+
+    async def _flush_loop(self, reader):
+        while True:
+            try:
+                await asyncio.wait_for(self._has_lines.wait(), timeout=self.batch_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._has_lines.clear()
+            await self._flush()
+            if self._lines:
+                continue
+            if not self.running:
+                return
+            if reader is not None and reader.done():
+                self.finished = True
+                self.running = False
+                return
+
+    async def _flush(self):
+        while self._lines:
+            lines = self._lines[:self.batch_max_lines]
+            del self._lines[:self.batch_max_lines]
+            try:
+                batch = await asyncio.to_thread(self.decoder.decode, lines)
+                if len(batch):
+                    await asyncio.to_thread(self.sink, batch)
+                    self.batches += 1
+                    self.records += len(batch)
+                    self.last_batch_at = time.time()
+            except Exception as e:
+                self.error = str(e)
+                print(f"[WARNING] Failed to ingest batch: {str(e)}")
+
+    def status(self):
+        elapsed = time.time() - self.started_at if self.started_at else 0
+        return {
+            "source": self.source,
+            "address": self.path if self.source == "file" else f"{self.host}:{self.port}",
+            "running": self.running,
+            "finished": self.finished,
+            "batches": self.batches,
+            "records": self.records,
+            "records_per_second": round(self.records / elapsed, 1) if elapsed > 0 else None,
+            "pending_lines": len(self._lines),
+            "decoder": dict(self.decoder.stats),
+            "error": self.error
+        }
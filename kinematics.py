@@ -0,0 +1,174 @@
+import numpy as np
+import pandas as pd
+
+from trajectory import haversine_km, KM_PER_NM
+
+# Động học suy ra từ các vị trí liên tiếp và phân đoạn hành trình thành các
+# chuyến đi (voyage) và các lần dừng (stop). Mọi phép tính thực hiện trên toàn
+# bộ mảng của kho hành trình, không lặp theo từng tàu.
+
+# Khoảng trống thời gian tách hành trình thành chuyến mới (giây)
+MAX_GAP_S = 3600
+
+# Tàu được coi là đứng yên dưới tốc độ này (knot)
+STOP_SPEED_KN = 0.5
+
+# Thời gian đứng yên tối thiểu để tính là một lần dừng (giây)
+MIN_STOP_S = 1800
+
+# Tốc độ suy ra vượt ngưỡng này được coi là nhảy vị trí (knot)
+JUMP_SPEED_KN = 50
+
+# Bỏ qua hướng đi khi quãng đường quá ngắn (km)
+MIN_BEARING_DISTANCE_KM = 0.01
+
+def _bearing_deg(lat1, lon1, lat2, lon2):
+    """Hướng ban đầu (độ, 0-360) từ điểm 1 tới điểm 2"""
+    lat1, lon1, lat2, lon2 = (np.radians(a) for a in (lat1, lon1, lat2, lon2))
+    dlon = lon2 - lon1
+    x = np.sin(dlon) * np.cos(lat2)
+    y = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+    return np.degrees(np.arctan2(x, y)) % 360
+
+def derive_kinematics(store):
+    """
+    Tính động học cho từng bản ghi của kho hành trình
+
+    Parameters:
+    -----------
+    store : trajectory.TrajectoryStore
+        Kho hành trình
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Theo thứ tự của kho: dt_s, distance_km, implied_speed_kn, bearing_deg,
+        acceleration_kn_per_min, turn_rate_deg_per_min (NaN khi không xác định)
+    """
+    if "kinematics" in store.derived:
+        return store.derived["kinematics"]
+
+    n = len(store)
+    starts = store.track_starts()
+    dt = np.full(n, np.nan)
+    distance = np.full(n, np.nan)
+    bearing = np.full(n, np.nan)
+    if n > 1:
+        dt[1:] = np.diff(store.times).astype(np.float64)
+        distance[1:] = haversine_km(store.lats[:-1], store.lons[:-1], store.lats[1:], store.lons[1:])
+        bearing[1:] = _bearing_deg(store.lats[:-1], store.lons[:-1], store.lats[1:], store.lons[1:])
+    dt[starts] = np.nan
+    distance[starts] = np.nan
+    bearing[starts | (distance < MIN_BEARING_DISTANCE_KM)] = np.nan
+
+    positive_dt = np.where(dt > 0, dt, np.nan)
+    speed = distance / KM_PER_NM / (positive_dt / 3600)
+
+    # Gia tốc và tốc độ quay so với bước trước trong cùng hành trình
+    acceleration = np.full(n, np.nan)
+    turn_rate = np.full(n, np.nan)
+    if n > 2:
+        acceleration[1:] = np.diff(speed) / (positive_dt[1:] / 60)
+        turn = (np.diff(bearing) + 180) % 360 - 180
+        turn_rate[1:] = turn / (positive_dt[1:] / 60)
+
+    kinematics = pd.DataFrame({
+        "row_id": store.row_ids,
+        "mmsi": store.mmsi,
+        "dt_s": dt,
+        "distance_km": distance,
+        "implied_speed_kn": speed,
+        "bearing_deg": bearing,
+        "acceleration_kn_per_min": acceleration,
+        "turn_rate_deg_per_min": turn_rate
+    })
+    store.derived["kinematics"] = kinematics
+    return kinematics
+
+def _run_reduce(ufunc, values, run_starts):
+    return ufunc.reduceat(values, run_starts) if len(run_starts) else np.empty(0)
+
+def segment_tracks(store, max_gap_s=MAX_GAP_S, stop_speed_kn=STOP_SPEED_KN, min_stop_s=MIN_STOP_S):
+    """
+    Tách hành trình thành các đoạn tại khoảng trống thời gian và các lần dừng
+
+    Returns:
+    --------
+    tuple
+        (mã đoạn của từng bản ghi theo thứ tự kho, bảng đoạn dạng DataFrame)
+    """
+    key = ("segments", max_gap_s, stop_speed_kn, min_stop_s)
+    if key in store.derived:
+        return store.derived[key]
+
+    kin = derive_kinematics(store)
+    n = len(store)
+    starts = store.track_starts()
+    dt = kin["dt_s"].to_numpy()
+    speed = kin["implied_speed_kn"].to_numpy()
+    gap = dt > max_gap_s
+
+    # Đứng yên: cả tốc độ báo cáo (nếu có) và tốc độ suy ra đều thấp
+    reported = store.sogs.astype(np.float64) if store.sogs is not None else np.full(n, np.nan)
+    reported_slow = np.isnan(reported) | (reported < stop_speed_kn)
+    implied_slow = np.isnan(speed) | (speed < stop_speed_kn)
+    slow = reported_slow & implied_slow & ~(np.isnan(reported) & np.isnan(speed))
+
+    # Các chuỗi liên tiếp cùng trạng thái, bị cắt tại đầu hành trình và khoảng trống
+    change = starts | gap
+    change[1:] |= slow[1:] != slow[:-1]
+    run_starts = np.flatnonzero(change)
+    run_id = np.cumsum(change) - 1
+    run_duration = _run_reduce(np.maximum, store.times, run_starts) - _run_reduce(np.minimum, store.times, run_starts)
+    is_stop_run = slow[run_starts] & (run_duration >= min_stop_s)
+    is_stop = is_stop_run[run_id] if n else np.zeros(0, dtype=bool)
+
+    # Ranh giới đoạn: đầu hành trình, khoảng trống, chuyển giữa dừng và di chuyển
+    boundary = starts | gap
+    boundary[1:] |= is_stop[1:] != is_stop[:-1]
+    seg_starts = np.flatnonzero(boundary)
+    segment_ids = np.cumsum(boundary) - 1
+    seg_ends = np.append(seg_starts[1:], n) - 1
+
+    # Quãng đường trong đoạn không tính bước nhảy vào điểm đầu đoạn
+    inner_distance = np.where(boundary, 0, np.nan_to_num(kin["distance_km"].to_numpy()))
+    inner_speed = np.where(boundary, np.nan, speed)
+    seg_distance = _run_reduce(np.add, inner_distance, seg_starts)
+    seg_max_speed = _run_reduce(np.fmax, inner_speed, seg_starts)
+    duration = (store.times[seg_ends] - store.times[seg_starts]).astype(np.float64)
+
+    segments = pd.DataFrame({
+        "segment_id": np.arange(len(seg_starts)),
+        "mmsi": store.mmsi[seg_starts],
+        "kind": np.where(is_stop[seg_starts], "stop", "voyage") if n else np.empty(0, dtype=object),
+        "start_time": pd.to_datetime(store.times[seg_starts], unit='s'),
+        "end_time": pd.to_datetime(store.times[seg_ends], unit='s'),
+        "duration_s": duration,
+        "n_points": seg_ends - seg_starts + 1,
+        "distance_km": seg_distance,
+        "avg_speed_kn": np.divide(seg_distance / KM_PER_NM, duration / 3600,
+                                  out=np.zeros(len(duration)), where=duration > 0),
+        "max_speed_kn": seg_max_speed,
+        "start_lat": store.lats[seg_starts],
+        "start_lon": store.lons[seg_starts],
+        "end_lat": store.lats[seg_ends],
+        "end_lon": store.lons[seg_ends]
+    })
+    store.derived[key] = (segment_ids, segments)
+    return segment_ids, segments
+
+def position_jumps(store, jump_speed_kn=JUMP_SPEED_KN, min_distance_km=1.0):
+    """Mặt nạ các bản ghi có bước nhảy vị trí không thể thực hiện được (nghi giả mạo)"""
+    kin = derive_kinematics(store)
+    speed = kin["implied_speed_kn"].to_numpy()
+    distance = kin["distance_km"].to_numpy()
+    return (speed > jump_speed_kn) & (distance > min_distance_km)
+
+def speed_mismatch(store, tolerance_kn=10.0, max_dt_s=600):
+    """Mặt nạ các bản ghi có SOG báo cáo khác xa tốc độ suy ra từ vị trí"""
+    if store.sogs is None:
+        return np.zeros(len(store), dtype=bool)
+    kin = derive_kinematics(store)
+    dt = kin["dt_s"].to_numpy()
+    speed = kin["implied_speed_kn"].to_numpy()
+    return (dt <= max_dt_s) & (np.abs(store.sogs - speed) > tolerance_kn)
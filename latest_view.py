@@ -0,0 +1,198 @@
+import threading
+import numpy as np
+import pandas as pd
+
+import trajectory
+
+# Bảng "hình ảnh hiện tại": báo cáo mới nhất của mỗi tàu (MMSI).
+# Mỗi tàu chiếm một ô cố định trong các mảng cột; từ điển MMSI -> ô cho phép
+# cập nhật O(1) cho mỗi bản tin. Bảng được dựng một lần từ kho hành trình khi
+# nạp dữ liệu và cập nhật dần khi có lô mới, nhỏ hơn nhiều so với toàn bộ lịch sử.
+
+# Tàu không có báo cáo mới trong khoảng này (giây) được coi là cũ
+STALE_AFTER_S = 3600
+
+COLUMNS = ("mmsi", "time", "lat", "lon", "sog", "cog", "type", "row_id")
+
+def _vessel_type_column(df):
+    return next((col for col in ['VesselType', 'ShipType', 'vessel_type'] if col in df.columns), None)
+
+def latest_positions(store, df):
+    """
+    Vị trí mới nhất của từng tàu trong kho hành trình
+
+    Parameters:
+    -----------
+    store : trajectory.TrajectoryStore
+        Kho hành trình xây dựng từ df
+    df : pandas.DataFrame
+        Dữ liệu gốc (để lấy loại tàu)
+
+    Returns:
+    --------
+    dict
+        Các mảng cột mmsi, time (giây), lat, lon, sog, cog, type (None nếu không rõ), row_id
+    """
+    last = store.last_positions()
+    row_ids = store.row_ids[last]
+    type_col = _vessel_type_column(df)
+    if type_col:
+        types = df[type_col].loc[row_ids]
+        types = types.astype(str).where(types.notna(), None).to_numpy(dtype=object)
+    else:
+        types = np.full(len(last), None, dtype=object)
+    return {
+        "mmsi": store.mmsi[last],
+        "time": store.times[last],
+        "lat": store.lats[last],
+        "lon": store.lons[last],
+        "sog": store.sogs[last] if store.sogs is not None else np.full(len(last), np.nan, dtype=np.float32),
+        "cog": store.cogs[last] if store.cogs is not None else np.full(len(last), np.nan, dtype=np.float32),
+        "type": types,
+        "row_id": row_ids
+    }
+
+class LatestView:
+    """
+    Báo cáo mới nhất của mỗi tàu
+
+    Parameters:
+    -----------
+    dataset_id : str
+        Mã tập dữ liệu mà bảng phản ánh
+    version : int
+        Phiên bản dữ liệu đã áp dụng
+    """
+
+    def __init__(self, dataset_id, version=0, capacity=1024):
+        self.dataset_id = dataset_id
+        self.version = version
+        self.n = 0
+        self._slots = {}
+        self._lock = threading.Lock()
+        self.mmsi = np.zeros(capacity, dtype=np.int64)
+        self.time = np.zeros(capacity, dtype=np.int64)
+        self.lat = np.zeros(capacity, dtype=np.float64)
+        self.lon = np.zeros(capacity, dtype=np.float64)
+        self.sog = np.zeros(capacity, dtype=np.float32)
+        self.cog = np.zeros(capacity, dtype=np.float32)
+        self.type = np.full(capacity, "Unknown", dtype=object)
+        self.row_id = np.zeros(capacity, dtype=np.int64)
+
+    @classmethod
+    def build(cls, store, df, dataset_id, version=0):
+        """Dựng bảng từ kho hành trình của toàn bộ dữ liệu"""
+        columns = latest_positions(store, df)
+        view = cls(dataset_id, version, capacity=max(2 * len(columns["mmsi"]), 1024))
+        n = len(columns["mmsi"])
+        for name in COLUMNS:
+            values = columns[name]
+            if name == "type":
+                values = np.where(pd.isna(values), "Unknown", values)
+            getattr(view, name)[:n] = values
+        view.n = n
+        view._slots = dict(zip(columns["mmsi"].tolist(), range(n)))
+        return view
+
+    def __len__(self):
+        return self.n
+
+    def _grow(self):
+        for name in COLUMNS:
+            values = getattr(self, name)
+            grown = np.full(2 * len(values), "Unknown", dtype=object) if name == "type" else np.zeros(2 * len(values), dtype=values.dtype)
+            grown[:len(values)] = values
+            setattr(self, name, grown)
+
+    def update(self, mmsi, time, lat, lon, sog=np.nan, cog=np.nan, vessel_type=None, row_id=-1):
+        """
+        Cập nhật O(1) với một bản tin vị trí
+
+        Bản tin cũ hơn báo cáo đã có bị bỏ qua; loại tàu chỉ được ghi đè khi bản tin có thông tin này.
+
+        Returns:
+        --------
+        bool
+            True nếu bảng thay đổi
+        """
+        slot = self._slots.get(mmsi)
+        if slot is None:
+            if self.n == len(self.mmsi):
+                self._grow()
+            slot = self._slots[mmsi] = self.n
+            self.n += 1
+            self.mmsi[slot] = mmsi
+        elif time < self.time[slot]:
+            return False
+        self.time[slot] = time
+        self.lat[slot] = lat
+        self.lon[slot] = lon
+        self.sog[slot] = sog
+        self.cog[slot] = cog
+        self.row_id[slot] = row_id
+        if vessel_type is not None:
+            self.type[slot] = vessel_type
+        return True
+
+    def apply(self, batch, version):
+        """
+        Áp dụng một lô bản ghi mới của tập dữ liệu
+
+        Lô được rút gọn (vector hóa) thành báo cáo mới nhất của mỗi tàu trước khi cập nhật.
+
+        Returns:
+        --------
+        dict
+            Các cột (như snapshot) của những tàu đã thay đổi
+        """
+        store = trajectory.TrajectoryStore.build(batch)
+        columns = latest_positions(store, batch) if store is not None else None
+        with self._lock:
+            changed = []
+            if columns is not None:
+                for values in zip(*(columns[name] for name in COLUMNS)):
+                    if self.update(*values):
+                        changed.append(self._slots[values[0]])
+            self.version = version
+            return self._columns(np.asarray(changed, dtype=np.int64))
+
+    def _columns(self, slots):
+        return {name: getattr(self, name)[slots] for name in COLUMNS}
+
+    @property
+    def latest_time(self):
+        """Thời điểm báo cáo mới nhất trong bảng (giây), dùng làm mốc "hiện tại" cho dữ liệu lịch sử"""
+        return int(self.time[:self.n].max()) if self.n else None
+
+    def snapshot(self, max_age_s=None, now=None):
+        """
+        Bản sao các cột của bảng, có thể bỏ các tàu đã cũ
+
+        Parameters:
+        -----------
+        max_age_s : int
+            Chỉ giữ tàu có báo cáo trong khoảng này trước thời điểm now
+        now : int
+            Mốc thời gian (giây); mặc định là báo cáo mới nhất trong bảng
+
+        Returns:
+        --------
+        tuple
+            (phiên bản, dict các cột)
+        """
+        with self._lock:
+            slots = np.arange(self.n)
+            if max_age_s is not None and self.n:
+                reference = now if now is not None else self.latest_time
+                slots = slots[self.time[:self.n] >= reference - max_age_s]
+            return self.version, self._columns(slots)
+
+    def summary(self, max_age_s=STALE_AFTER_S):
+        _, current = self.snapshot(max_age_s)
+        latest = self.latest_time
+        return {
+            "vessels": int(self.n),
+            "active_vessels": int(len(current["mmsi"])),
+            "stale_after_s": max_age_s,
+            "latest_report": pd.Timestamp(latest, unit='s').isoformat() if latest is not None else None
+        }
@@ -0,0 +1,266 @@
+import threading
+import numpy as np
+import pandas as pd
+
+# Tập dữ liệu chỉ-thêm (append-only) cho dữ liệu AIS trực tiếp.
+# Dữ liệu được giữ thành các khối DataFrame không bao giờ bị sửa sau khi thêm;
+# mỗi lần thêm tăng số phiên bản. Ảnh chụp (snapshot) chỉ giữ tham chiếu tới
+# danh sách khối tại một phiên bản nên người đọc luôn thấy dữ liệu nhất quán mà
+# không cần sao chép. Các khối nhỏ được gộp dần theo kiểu bộ đếm nhị phân nên
+# số khối chỉ tăng theo log(số dòng).
+#
+# Dữ liệu dùng chung là chỉ đọc: frame() trả về ReadOnlyFrame, không cho ghi cột,
+# ô hay thao tác inplace; các phép biến đổi trả về DataFrame thường. Ứng dụng
+# (main.py) bật chế độ copy-on-write của pandas nên việc ghi vào kết quả dẫn xuất
+# không bao giờ chạm tới dữ liệu gốc. Cột tính thêm (thời gian đã phân tích...)
+# nằm trong bộ nhớ đệm cột dẫn xuất theo mã dòng, dùng chung cho mọi phiên bản.
+
+# Gộp hai khối cuối khi khối trước nhỏ hơn tỷ lệ này nhân với khối sau
+COMPACTION_RATIO = 2
+
+# Số khối tối đa trước khi gộp toàn bộ phần đuôi
+MAX_CHUNKS = 32
+
+class ReadOnlyError(TypeError):
+    """Ghi vào dữ liệu dùng chung"""
+
+def _read_only(*args, **kwargs):
+    raise ReadOnlyError("Shared dataset frames are read-only: work on a copy or use live_dataset.derived_column")
+
+class _ReadOnlyIndexer:
+    """Bộ chỉ mục loc/iloc/at/iat chỉ cho đọc"""
+
+    def __init__(self, indexer):
+        self._indexer = indexer
+
+    def __getitem__(self, key):
+        return self._indexer[key]
+
+    def __call__(self, axis=None):
+        return _ReadOnlyIndexer(self._indexer(axis))
+
+    def __getattr__(self, name):
+        return getattr(self._indexer, name)
+
+    __setitem__ = _read_only
+
+class ReadOnlyFrame(pd.DataFrame):
+    """
+    DataFrame dùng chung giữa các yêu cầu, gắn với ảnh chụp tạo ra nó
+
+    Mọi phép ghi trực tiếp (gán cột/ô, xóa cột, inplace=True) đều báo ReadOnlyError.
+    Kết quả của các phép biến đổi (lọc, dropna, copy...) là DataFrame thường.
+    """
+    _metadata = ['snapshot']
+
+    def __init__(self, data=None, *args, snapshot=None, **kwargs):
+        super().__init__(data, *args, **kwargs)
+        self.snapshot = snapshot
+
+    @property
+    def _constructor(self):
+        return pd.DataFrame
+
+    @property
+    def loc(self):
+        return _ReadOnlyIndexer(super().loc)
+
+    @property
+    def iloc(self):
+        return _ReadOnlyIndexer(super().iloc)
+
+    @property
+    def at(self):
+        return _ReadOnlyIndexer(super().at)
+
+    @property
+    def iat(self):
+        return _ReadOnlyIndexer(super().iat)
+
+    __setitem__ = __delitem__ = insert = isetitem = _update_inplace = _set_axis = _read_only
+
+def read_only(df, snapshot=None):
+    """Bản chỉ đọc của df (không sao chép dữ liệu) gắn với ảnh chụp chứa các dòng của nó"""
+    if isinstance(df, ReadOnlyFrame) and df.snapshot is snapshot:
+        return df
+    return ReadOnlyFrame(df, snapshot=snapshot)
+
+class DerivedColumns:
+    """
+    Bộ nhớ đệm cột dẫn xuất của một tập dữ liệu, theo mã dòng
+
+    Dữ liệu chỉ-thêm nên giá trị của các dòng đã tính không đổi giữa các phiên
+    bản: mỗi cột chỉ tính thêm cho các dòng mới và mọi ảnh chụp dùng chung mảng.
+    """
+
+    def __init__(self):
+        self._columns = {}
+        # Phép tính một cột có thể đọc cột dẫn xuất khác
+        self._lock = threading.RLock()
+
+    def get(self, snapshot, name, compute):
+        """Cột name của các dòng trong snapshot; compute(df) tính cột cho các dòng của df"""
+        with self._lock:
+            values = self._columns.get(name)
+            done = 0 if values is None else len(values)
+            if done < snapshot.n_rows:
+                added = np.asarray(compute(snapshot.rows_since(done)))
+                values = added if values is None else np.concatenate([values, added])
+                values.flags.writeable = False
+                self._columns[name] = values
+        return values[:snapshot.n_rows]
+
+def derived_column(df, name, compute):
+    """
+    Cột dẫn xuất name của df, theo thứ tự dòng của df
+
+    Với dữ liệu của tập dữ liệu (ReadOnlyFrame gắn ảnh chụp), cột được lấy từ bộ
+    nhớ đệm cột dẫn xuất và chỉ tính một lần cho mỗi dòng; với DataFrame khác,
+    cột được tính trực tiếp. Không sửa mảng trả về: nó có thể là mảng của bộ nhớ đệm.
+    """
+    snapshot = df.snapshot if isinstance(df, ReadOnlyFrame) else None
+    if snapshot is None:
+        return np.asarray(compute(df))
+    values = snapshot.column(name, compute)
+    if df.index.equals(pd.RangeIndex(snapshot.n_rows)):
+        return values
+    return values[df.index.to_numpy()]
+
+class Snapshot:
+    """Trạng thái bất biến của tập dữ liệu tại một phiên bản"""
+
+    def __init__(self, dataset_id, version, chunks, derived=None):
+        self.dataset_id = dataset_id
+        self.version = version
+        self.chunks = chunks
+        self.n_rows = sum(len(chunk) for chunk in chunks)
+        self.derived = derived if derived is not None else DerivedColumns()
+        self._frame = None
+        self._lock = threading.Lock()
+
+    @property
+    def key(self):
+        """Khóa dùng cho các bộ nhớ đệm theo phiên bản"""
+        return f"{self.dataset_id}-v{self.version}"
+
+    def frame(self):
+        """Toàn bộ dữ liệu dưới dạng một ReadOnlyFrame (ghép một lần rồi dùng lại)"""
+        with self._lock:
+            if self._frame is None:
+                self._frame = read_only(self.chunks[0] if len(self.chunks) == 1 else pd.concat(self.chunks), self)
+            return self._frame
+
+    def column(self, name, compute):
+        """Cột dẫn xuất name của mọi dòng (xem DerivedColumns.get)"""
+        return self.derived.get(self, name, compute)
+
+    def take(self, row_ids):
+        """Các dòng có mã dòng trong row_ids (tăng dần), lấy từ từng khối, dạng ReadOnlyFrame"""
+        row_ids = np.asarray(row_ids, dtype=np.int64)
+        parts = []
+        start = 0
+        for chunk in self.chunks:
+            end = start + len(chunk)
+            lo, hi = np.searchsorted(row_ids, [start, end])
+            if hi > lo:
+                parts.append(chunk.iloc[row_ids[lo:hi] - start])
+            start = end
+        if not parts:
+            return read_only(self.chunks[0].iloc[0:0], self)
+        return read_only(parts[0] if len(parts) == 1 else pd.concat(parts), self)
+
+    def rows_since(self, start):
+        """Các dòng có mã dòng >= start (chỉ đọc các khối cuối), dạng ReadOnlyFrame"""
+        return read_only(self._rows_since(start), self)
+
+    def _rows_since(self, start):
+        parts = []
+        end = self.n_rows
+        for chunk in reversed(self.chunks):
+            if end <= start:
+                break
+            chunk_start = end - len(chunk)
+            parts.append(chunk.iloc[max(start - chunk_start, 0):])
+            end = chunk_start
+        if not parts:
+            return self.chunks[0].iloc[0:0]
+        return parts[0] if len(parts) == 1 else pd.concat(parts[::-1])
+
+class LiveDataset:
+    """
+    Tập dữ liệu chỉ-thêm có phiên bản
+
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        Dữ liệu ban đầu (có thể rỗng)
+    dataset_id : str
+        Mã của tập dữ liệu gốc
+    """
+
+    def __init__(self, df, dataset_id):
+        self.dataset_id = dataset_id
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self._derived = DerivedColumns()
+        self._snapshot = Snapshot(dataset_id, 0, (df.reset_index(drop=True),), self._derived)
+
+    def snapshot(self):
+        return self._snapshot
+
+    @property
+    def version(self):
+        return self._snapshot.version
+
+    def subscribe(self, callback):
+        """Đăng ký callback(snapshot, lô mới) được gọi sau mỗi lần thêm (lô là ReadOnlyFrame của snapshot)"""
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def append(self, batch):
+        """
+        Thêm một lô bản ghi
+
+        Mã dòng của lô tiếp nối mã dòng hiện có. Lô được đưa về cùng tập cột
+        với dữ liệu gốc (nếu dữ liệu gốc có cột).
+
+        Returns:
+        --------
+        Snapshot
+            Ảnh chụp phiên bản mới
+        """
+        with self._lock:
+            current = self._snapshot
+            columns = current.chunks[0].columns
+            if len(columns):
+                batch = batch.reindex(columns=columns)
+            batch = batch.set_axis(pd.RangeIndex(current.n_rows, current.n_rows + len(batch)))
+            chunks = self._compact(list(current.chunks) + [batch])
+            snapshot = self._snapshot = Snapshot(self.dataset_id, current.version + 1, tuple(chunks), self._derived)
+            batch = read_only(batch, snapshot)
+
+        for callback in list(self._subscribers):
+            try:
+                callback(snapshot, batch)
+            except Exception as e:
+                print(f"[WARNING] Dataset subscriber failed: {str(e)}")
+        return snapshot
+
+    @staticmethod
+    def _compact(chunks):
+        """Gộp các khối cuối có kích thước tương đương; khối cũ không bị sửa"""
+        while len(chunks) > 1 and (len(chunks[-2]) < COMPACTION_RATIO * len(chunks[-1]) or len(chunks) > MAX_CHUNKS):
+            chunks[-2:] = [pd.concat(chunks[-2:])]
+        return chunks
+
+    def summary(self):
+        snapshot = self._snapshot
+        return {
+            "dataset_id": self.dataset_id,
+            "version": snapshot.version,
+            "rows": snapshot.n_rows,
+            "chunks": len(snapshot.chunks)
+        }
@@ -0,0 +1,219 @@
+import json
+import struct
+import asyncio
+import threading
+from collections import deque
+
+import numpy as np
+
+# Đẩy vị trí tàu thay đổi tới bản đồ qua WebSocket.
+# Mỗi lần tập dữ liệu trực tiếp được thêm một lô, các tàu có vị trí mới (theo
+# bảng vị trí mới nhất, latest_view) được lưu vào một vòng đệm các delta theo
+# phiên bản. Mỗi client chỉ giữ phiên bản đã nhận và bộ lọc (khung nhìn, loại tàu): khi được đánh thức nó
+# gộp mọi delta từ phiên bản đó, giữ vị trí mới nhất của mỗi tàu và gửi một
+# khung nhị phân. Client chậm không làm tăng bộ nhớ: các lô đến trong lúc chờ
+# gửi được gộp vào lần gửi sau; client tụt quá xa vòng đệm nhận lại ảnh toàn bộ.
+
+# Số delta (lô) gần nhất được giữ lại
+HISTORY_BATCHES = 512
+
+# Khoảng cách tối thiểu giữa hai lần gửi cho một client (giây), để gộp các lô
+MIN_SEND_INTERVAL_S = 0.25
+
+FIELDS = ("mmsi", "time", "lat", "lon", "sog", "cog")
+
+def _take(columns, index):
+    return {name: values[index] for name, values in columns.items()}
+
+def coalesce(parts):
+    """Gộp nhiều delta theo thứ tự phiên bản, giữ vị trí cuối cùng của mỗi tàu"""
+    if len(parts) == 1:
+        return parts[0]
+    columns = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+    # Lần xuất hiện cuối cùng của mỗi MMSI là vị trí mới nhất
+    _, first_from_end = np.unique(columns["mmsi"][::-1], return_index=True)
+    return _take(columns, len(columns["mmsi"]) - 1 - first_from_end)
+
+class ClientFilter:
+    """Khung nhìn [min_lon, min_lat, max_lon, max_lat] và danh sách loại tàu của một client"""
+
+    def __init__(self, bbox=None, types=None):
+        self.bbox = bbox
+        self.types = set(str(t) for t in types) if types else None
+
+    @classmethod
+    def from_message(cls, message):
+        bbox = message.get("bbox")
+        if bbox is not None and len(bbox) != 4:
+            raise ValueError("bbox must be [min_lon, min_lat, max_lon, max_lat]")
+        return cls([float(v) for v in bbox] if bbox is not None else None, message.get("types"))
+
+    def apply(self, columns):
+        mask = np.ones(len(columns["mmsi"]), dtype=bool)
+        if self.bbox is not None:
+            min_lon, min_lat, max_lon, max_lat = self.bbox
+            lats, lons = columns["lat"], columns["lon"]
+            mask &= (lats >= min_lat) & (lats <= max_lat)
+            # Khung nhìn vắt qua kinh tuyến 180 có min_lon > max_lon
+            if min_lon <= max_lon:
+                mask &= (lons >= min_lon) & (lons <= max_lon)
+            else:
+                mask &= (lons >= min_lon) | (lons <= max_lon)
+        if self.types is not None:
+            mask &= np.isin(columns["type"], list(self.types))
+        return columns if mask.all() else _take(columns, mask)
+
+def encode_frame(dataset_id, version, reset, columns):
+    """
+    Mã hóa một khung nhị phân dạng cột (little-endian)
+
+    Khung gồm: độ dài phần đầu (uint32), phần đầu JSON (đệm tới bội số của 4 byte),
+    sau đó các cột mmsi (uint32), time (uint32, giây), lat, lon, sog, cog (float32)
+    và type (uint16, chỉ số trong danh sách "types" của phần đầu).
+    """
+    count = len(columns["mmsi"])
+    types, type_codes = np.unique(columns["type"].astype(str), return_inverse=True) if count else ([], np.empty(0))
+    header = json.dumps({
+        "dataset": dataset_id,
+        "version": version,
+        "reset": reset,
+        "count": count,
+        "fields": list(FIELDS) + ["type"],
+        "types": [str(t) for t in types]
+    }).encode()
+    header += b" " * (-len(header) % 4)
+    return b"".join([
+        struct.pack("<I", len(header)),
+        header,
+        columns["mmsi"].astype("<u4").tobytes(),
+        np.clip(columns["time"], 0, 2**32 - 1).astype("<u4").tobytes(),
+        columns["lat"].astype("<f4").tobytes(),
+        columns["lon"].astype("<f4").tobytes(),
+        columns["sog"].astype("<f4").tobytes(),
+        columns["cog"].astype("<f4").tobytes(),
+        type_codes.astype("<u2").tobytes()
+    ])
+
+class _Client:
+    def __init__(self, loop, client_filter):
+        self.loop = loop
+        self.filter = client_filter
+        self.version = None
+        self.dataset_id = None
+        self.wake = asyncio.Event()
+
+    def notify(self):
+        self.loop.call_soon_threadsafe(self.wake.set)
+
+class PositionFeed:
+    """
+    Nguồn delta vị trí theo phiên bản cho các client WebSocket
+
+    Parameters:
+    -----------
+    snapshot_source : callable
+        Hàm trả về (dataset_id, phiên bản, các cột vị trí mới nhất) của toàn bộ dữ liệu,
+        dùng khi client mới kết nối, đổi bộ lọc hoặc tụt quá xa vòng đệm
+    """
+
+    def __init__(self, snapshot_source, history=HISTORY_BATCHES):
+        self.snapshot_source = snapshot_source
+        self.dataset_id = None
+        self._deltas = deque(maxlen=history)
+        self._clients = set()
+        self._lock = threading.Lock()
+
+    def reset(self, dataset_id):
+        """Tập dữ liệu mới được nạp: mọi client nhận lại ảnh toàn bộ"""
+        with self._lock:
+            self.dataset_id = dataset_id
+            self._deltas.clear()
+        self._notify_all()
+
+    def publish(self, dataset_id, version, columns):
+        """Lưu delta (các tàu có vị trí mới) của một phiên bản và đánh thức các client"""
+        if not len(columns["mmsi"]):
+            return
+        with self._lock:
+            if dataset_id != self.dataset_id:
+                return
+            self._deltas.append((version, columns))
+        self._notify_all()
+
+    def _notify_all(self):
+        for client in list(self._clients):
+            client.notify()
+
+    def changes_since(self, dataset_id, version):
+        """
+        Các vị trí thay đổi sau một phiên bản
+
+        Returns:
+        --------
+        tuple
+            (dataset_id, phiên bản mới, có phải ảnh toàn bộ, các cột hoặc None nếu không đổi)
+        """
+        with self._lock:
+            current_id = self.dataset_id
+            deltas = list(self._deltas)
+
+        if version is not None and dataset_id == current_id:
+            if not deltas or deltas[-1][0] <= version:
+                return current_id, version, False, None
+            # Vòng đệm còn đủ các delta từ phiên bản của client
+            if deltas[0][0] <= version + 1:
+                parts = [columns for v, columns in deltas if v > version]
+                return current_id, deltas[-1][0], False, coalesce(parts)
+
+        snapshot_id, snapshot_version, columns = self.snapshot_source()
+        return snapshot_id, snapshot_version, True, columns
+
+    async def serve(self, websocket):
+        """
+        Phục vụ một client WebSocket cho tới khi ngắt kết nối
+
+        Client gửi thông điệp JSON {"bbox": [...], "types": [...]} để đặt bộ lọc;
+        mỗi lần đổi bộ lọc sẽ nhận ảnh toàn bộ trong khung nhìn mới.
+        """
+        client = _Client(asyncio.get_running_loop(), ClientFilter())
+        self._clients.add(client)
+        client.wake.set()
+
+        async def receive():
+            while True:
+                message = await websocket.receive_json()
+                try:
+                    client.filter = ClientFilter.from_message(message)
+                except (TypeError, ValueError) as e:
+                    await websocket.send_json({"error": str(e)})
+                    continue
+                client.version = None
+                client.wake.set()
+
+        receiver = asyncio.create_task(receive())
+        try:
+            while not receiver.done():
+                waiter = asyncio.create_task(client.wake.wait())
+                await asyncio.wait({waiter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+                waiter.cancel()
+                if receiver.done():
+                    break
+                client.wake.clear()
+
+                dataset_id, version, reset, columns = self.changes_since(client.dataset_id, client.version)
+                if columns is not None:
+                    columns = client.filter.apply(columns)
+                    if reset or len(columns["mmsi"]):
+                        # Gửi chờ client nhận xong (áp lực ngược); các lô đến trong lúc chờ được gộp lần sau
+                        await websocket.send_bytes(encode_frame(dataset_id, version, reset, columns))
+                client.dataset_id, client.version = dataset_id, version
+                await asyncio.sleep(MIN_SEND_INTERVAL_S)
+        finally:
+            receiver.cancel()
+            self._clients.discard(client)
+        if not receiver.cancelled() and receiver.exception() is not None:
+            raise receiver.exception()
+
+    @property
+    def n_clients(self):
+        return len(self._clients)
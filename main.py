@@ -1,32 +1,69 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks, File, UploadFile, Form
+from fastapi import FastAPI, HTTPException, BackgroundTasks, File, UploadFile, Form, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, StreamingResponse
+from fastapi.responses import HTMLResponse, StreamingResponse, JSONResponse, Response
 import requests
 import pandas as pd
+import numpy as np
 import zipfile
 from io import BytesIO, StringIO
 import folium
 from datetime import datetime
 import asyncio
-import aiohttp
 from typing import List, Optional
 from pydantic import BaseModel
 import json
 import os
 import glob
+import threading
 
 # Import module phân tích dữ liệu
 import analytics
+import baselines
 import risk_analysis
+import risk_store
+import hazards
+import weather
+import trajectory
+import kinematics
+import simplify
+import export
+import downloader
+import download_cache
+import ingest
+import live_dataset
+import live_feed
+import latest_view
+import playback
+import comovement
+import grouping
+import behavior
+import metrics
+import profiling
+import time_cube
 import api_endpoints
+from data import sample_data
 import requests
 from urllib.parse import urlencode
 
+# Shared dataset frames are read-only (live_dataset.ReadOnlyFrame). With pandas
+# copy-on-write, frames derived from them (filters, column selections) never write
+# back into the shared data. Enabled here for the application process rather than
+# as a side effect of importing live_dataset.
+pd.set_option("mode.copy_on_write", True)
+
 app = FastAPI(title="AIS Data Analyzer", description="Marine Traffic Analysis Tool")
 
+# Stage timings of a request returned with ?profile=1 (cProfile dump with ?profile=cprofile)
+app.add_middleware(profiling.ProfilingMiddleware)
+# Per-route latency, response size and in-flight metrics (exposed on /metrics)
+app.add_middleware(metrics.MetricsMiddleware, router_app=app)
+
 # Mount static files directory
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+# Largest dataset /generate-sample-data builds in memory (use data/sample_data.py --parquet for more)
+MAX_SAMPLE_RECORDS = 5_000_000
+
 class VesselFilter(BaseModel):
     vessel_types: Optional[List[str]] = None
     min_lat: Optional[float] = None
@@ -36,11 +73,324 @@ class VesselFilter(BaseModel):
     start_date: Optional[str] = None
     end_date: Optional[str] = None
 
+class IngestRequest(BaseModel):
+    source: str
+    host: Optional[str] = "127.0.0.1"
+    port: Optional[int] = 10110
+    path: Optional[str] = None
+    follow: bool = False
+
 class DownloadRequest(BaseModel):
     url: str
+    job_id: Optional[str] = None
+    sha256: Optional[str] = None
+
+def apply_filters(df, filters):
+    """
+    Apply vessel type and geographic filters to a dataset
+    """
+    if filters is None:
+        return df
+    
+    if filters.vessel_types:
+        # Try different possible column names for vessel type
+        vessel_col = None
+        for col in ['VesselType', 'VesselName', 'ShipType', 'vessel_type']:
+            if col in df.columns:
+                vessel_col = col
+                break
+        
+        if vessel_col:
+            df = df[df[vessel_col].isin(filters.vessel_types)]
+    
+    # Apply geographic filters
+    lat_col = None
+    lon_col = None
+    for col in ['LAT', 'Latitude', 'lat', 'latitude']:
+        if col in df.columns:
+            lat_col = col
+            break
+    for col in ['LON', 'Longitude', 'lon', 'longitude']:
+        if col in df.columns:
+            lon_col = col
+            break
+    
+    if lat_col and lon_col:
+        if filters.min_lat is not None:
+            df = df[df[lat_col] >= filters.min_lat]
+        if filters.max_lat is not None:
+            df = df[df[lat_col] <= filters.max_lat]
+        if filters.min_lon is not None:
+            df = df[df[lon_col] >= filters.min_lon]
+        if filters.max_lon is not None:
+            df = df[df[lon_col] <= filters.max_lon]
+    
+    return df
+
+class DatasetState(dict):
+    """
+    Global storage whose dataset views follow the live dataset
+    
+    'original', 'filtered', 'version', 'trajectories', 'speed_baselines' and
+    'time_cube' are brought up to the latest snapshot on first access after an
+    append. Only the appended rows are filtered, inserted into the trajectory
+    store and added to the speed baselines and time cube; nothing is rebuilt.
+    The filtered view is kept as sorted row IDs ('filtered_rows', None when no
+    filter is applied), and the 'original' and 'filtered' frames are only
+    assembled from the snapshot chunks when they are read, once per snapshot.
+    """
+    LIVE_KEYS = ('original', 'filtered', 'version', 'trajectories', 'speed_baselines', 'time_cube')
+    FRAME_KEYS = ('original', 'filtered')
+    
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+    
+    def _refresh(self):
+        dataset = dict.get(self, 'dataset')
+        if dataset is None:
+            return
+        with self._lock:
+            snapshot = dataset.snapshot()
+            built = dict.get(self, 'snapshot')
+            if built is snapshot:
+                return
+            # Chỉ xử lý các dòng được thêm sau ảnh chụp đã dựng
+            new_rows = snapshot.rows_since(built.n_rows)
+            rows = dict.get(self, 'filtered_rows')
+            if rows is not None:
+                added = apply_filters(new_rows, dict.get(self, 'filters')).index.to_numpy(dtype=np.int64)
+                rows = np.concatenate([rows, added])
+            store = dict.get(self, 'trajectories')
+            extended = store.extend(new_rows) if store is not None else trajectory.TrajectoryStore.build(snapshot.frame())
+            # Kết quả hành vi chỉ được tính lại cho các tàu có bản ghi mới
+            behavior.carry_forward(store, extended)
+            # Phác thảo phân vị tốc độ chỉ cần cộng thêm các dòng mới
+            speed_baselines = dict.get(self, 'speed_baselines')
+            if speed_baselines is not None:
+                speed_baselines.update(new_rows)
+            cube = dict.get(self, 'time_cube')
+            cube = cube.extend(new_rows) if cube is not None else time_cube.TimeCube.build(snapshot.frame())
+            dict.update(self, {
+                # Khung cũ được bỏ để giải phóng bộ nhớ; dựng lại khi được đọc
+                'original': None,
+                'filtered': None,
+                'filtered_rows': rows,
+                'version': snapshot.key,
+                'trajectories': extended,
+                'time_cube': cube,
+                'snapshot': snapshot
+            })
+    
+    def _frame(self, key, default=None):
+        """'original' or 'filtered' at the current snapshot, assembled on first read"""
+        with self._lock:
+            snapshot = dict.get(self, 'snapshot')
+            frame = dict.get(self, key, default)
+            if snapshot is None or getattr(frame, 'snapshot', None) is snapshot:
+                return frame
+            rows = dict.get(self, 'filtered_rows')
+            if key == 'original' or rows is None:
+                frame = snapshot.frame()
+            else:
+                frame = snapshot.take(rows)
+            dict.__setitem__(self, key, frame)
+            return frame
+    
+    def __setitem__(self, key, value):
+        if key == 'filtered':
+            # Row IDs of the new filtered view; None when it is the original frame itself
+            rows = None if value is dict.get(self, 'original') else np.sort(value.index.to_numpy(dtype=np.int64))
+            dict.__setitem__(self, 'filtered_rows', rows)
+        dict.__setitem__(self, key, value)
+    
+    def __getitem__(self, key):
+        if key in self.LIVE_KEYS:
+            self._refresh()
+            if key in self.FRAME_KEYS and dict.__contains__(self, key):
+                return self._frame(key)
+        return dict.__getitem__(self, key)
+    
+    def get(self, key, default=None):
+        if key in self.LIVE_KEYS:
+            self._refresh()
+            if key in self.FRAME_KEYS:
+                return self._frame(key, default)
+        return dict.get(self, key, default)
 
 # Global storage for processed data
-processed_data = {}
+processed_data = DatasetState()
+
+def latest_positions_snapshot():
+    """
+    Latest position of every vessel in the current dataset, for live map clients
+    """
+    view = processed_data.get('latest')
+    if view is None:
+        return None, None, None
+    version, columns = view.snapshot()
+    return view.dataset_id, version, columns
+
+def on_dataset_append(snapshot, batch):
+    """
+    Update the latest-position view with appended records and push the changes
+    """
+    view = processed_data.get('latest')
+    if view is None or view.dataset_id != snapshot.dataset_id:
+        return
+    changed = view.apply(batch, snapshot.version)
+    position_feed.publish(snapshot.dataset_id, snapshot.version, changed)
+
+def current_positions(df, max_age_s=None):
+    """
+    Latest report of each vessel whose latest row is in df, most recent first
+    
+    Returns the latest-view columns (mmsi, time, lat, lon, ..., row_id), or None
+    when no latest-position view is available.
+    """
+    view = processed_data.get('latest')
+    if view is None:
+        return None
+    _, columns = view.snapshot(max_age_s)
+    keep = df.index.get_indexer(columns['row_id']) >= 0
+    order = np.flatnonzero(keep)[np.argsort(-columns['time'][keep], kind='stable')]
+    return {name: values[order] for name, values in columns.items()}
+
+# Pushes position deltas of appended records to WebSocket clients
+position_feed = live_feed.PositionFeed(latest_positions_snapshot)
+
+def store_dataset(df):
+    """
+    Store a newly loaded dataset and tag it with a content-based version
+    
+    The stored frames are read-only and shared by all requests; derived columns
+    (parsed times...) live in the dataset's derived-column cache.
+    """
+    # Row IDs are the positional index of the original dataset
+    df = df.reset_index(drop=True)
+    dataset = live_dataset.LiveDataset(df, risk_store.dataset_version(df))
+    snapshot = dataset.snapshot()
+    df = snapshot.frame()
+    store = trajectory.TrajectoryStore.build(df)
+    processed_data.update({
+        'dataset': dataset,
+        'snapshot': snapshot,
+        'original': df,
+        # Without filters the filtered view is the original frame itself (no copy)
+        'filtered': df,
+        'filtered_rows': None,
+        'filters': None,
+        'version': snapshot.key,
+        # Per-vessel, time-ordered tracks used by risk, grouping and anomaly features
+        'trajectories': store,
+        # Per-type, per-region speed quantile sketches used for anomaly scoring
+        'speed_baselines': baselines.SpeedBaselines.build(df),
+        # Record counts by hour x weekday x vessel type x cell for temporal analytics
+        'time_cube': time_cube.TimeCube.build(df),
+        # Latest report per vessel, updated in place on every append
+        'latest': latest_view.LatestView.build(store, df, dataset.dataset_id) if store is not None else None
+    })
+    position_feed.reset(dataset.dataset_id)
+    dataset.subscribe(on_dataset_append)
+    return df
+
+def append_dataset(batch):
+    """
+    Append newly ingested records to the live dataset
+    """
+    dataset = processed_data.get('dataset')
+    if dataset is None or dataset.snapshot().n_rows == 0:
+        return store_dataset(batch)
+    return dataset.append(batch)
+
+def dataset_metrics():
+    """
+    Size of the live dataset and number of live map clients, for /metrics
+    """
+    dataset = dict.get(processed_data, 'dataset')
+    snapshot = dataset.snapshot() if dataset is not None else None
+    return [
+        ("ais_dataset_rows", "Rows in the current dataset snapshot", "gauge",
+         [({}, snapshot.n_rows if snapshot is not None else 0)]),
+        ("ais_dataset_chunks", "Chunks held by the live dataset", "gauge",
+         [({}, len(snapshot.chunks) if snapshot is not None else 0)]),
+        ("ais_live_feed_clients", "Connected /ws/positions clients", "gauge", [({}, position_feed.n_clients)])
+    ]
+
+def dataset_memory_items():
+    """
+    Stored objects for the memory gauges, brought up to the current snapshot
+    
+    The snapshot's chunks are reported once, as 'dataset'. Entries that only alias
+    them are skipped: 'snapshot', 'original' of a single-chunk snapshot and
+    'filtered' when no filter is applied.
+    """
+    # Incremental refresh only; stale frames are released, not rebuilt
+    processed_data.get('version')
+    items = dict(dict.items(processed_data))
+    snapshot = items.pop('snapshot', None)
+    if snapshot is not None:
+        items['dataset'] = snapshot.chunks
+        if len(snapshot.chunks) == 1:
+            items.pop('original', None)
+    if items.get('filtered_rows') is None:
+        items.pop('filtered', None)
+    return list(items.items())
+
+# Memory of each stored object (frames, trajectory store, views, layers), recomputed
+# when replaced or when the dataset version changes (some objects grow in place)
+dataset_memory = metrics.MemoryTracker(dataset_memory_items, version=lambda: dict.get(processed_data, 'version'))
+metrics.REGISTRY.collector(dataset_memory.collect)
+metrics.REGISTRY.collector(dataset_metrics)
+loop_monitor_task = None
+
+@app.on_event("startup")
+async def start_event_loop_monitor():
+    """
+    Sample event loop lag in the background for /metrics
+    """
+    global loop_monitor_task
+    loop_monitor_task = asyncio.create_task(metrics.monitor_event_loop())
+
+# Load static hazard layer (wrecks, shoals, platforms) on startup
+@app.on_event("startup")
+async def load_hazard_layer():
+    """
+    Load the first hazard layer found in data/hazards (GeoJSON or shapefile)
+    """
+    hazard_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "hazards")
+    if not os.path.exists(hazard_dir):
+        return
+    
+    for pattern in ["*.geojson", "*.json", "*.shp", "*.zip"]:
+        for path in sorted(glob.glob(os.path.join(hazard_dir, pattern))):
+            try:
+                layer = hazards.load_hazard_layer(path)
+                processed_data['hazard_layer'] = layer
+                print(f"[INFO] Loaded hazard layer {layer.name} with {len(layer)} points")
+                return
+            except Exception as e:
+                print(f"[WARNING] Failed to load hazard layer {path}: {str(e)}")
+
+# Load gridded weather layer (wind/wave fields) on startup
+@app.on_event("startup")
+async def load_weather_layer():
+    """
+    Load the first weather layer found in data/weather
+    """
+    weather_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "weather")
+    if not os.path.exists(weather_dir):
+        return
+    
+    for name in sorted(os.listdir(weather_dir)):
+        path = os.path.join(weather_dir, name)
+        try:
+            layer = weather.load_weather_layer(path)
+            processed_data['weather_layer'] = layer
+            print(f"[INFO] Loaded weather layer {layer.name} with fields {', '.join(layer.fields)}")
+            return
+        except Exception as e:
+            print(f"[WARNING] Skipping weather source {path}: {str(e)}")
 
 # Load data from local files on startup
 @app.on_event("startup")
@@ -75,8 +425,7 @@ async def load_local_data():
         df.columns = df.columns.str.strip()
         
         # Store processed data
-        processed_data['original'] = df
-        processed_data['filtered'] = df.copy()
+        df = store_dataset(df)
         
         # Generate statistics
         stats = generate_statistics(df)
@@ -117,8 +466,7 @@ async def upload_file(file: UploadFile = File(...)):
         df.columns = df.columns.str.strip()
         
         # Store processed data
-        processed_data['original'] = df
-        processed_data['filtered'] = df.copy()
+        df = store_dataset(df)
         
         # Generate statistics
         stats = generate_statistics(df)
@@ -135,60 +483,21 @@ async def upload_file(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"Error processing uploaded file: {str(e)}")
 
 @app.get("/generate-sample-data")
-async def generate_sample_data():
+async def generate_sample_data(n_records: int = 1000, n_vessels: Optional[int] = None, seed: int = 0):
     """
     Generate sample AIS data for testing without downloading
+    
+    Vessels follow continuous tracks with a fixed type per MMSI; the same seed
+    always gives the same data.
     """
+    if not 1 <= n_records <= MAX_SAMPLE_RECORDS:
+        raise HTTPException(status_code=400, detail=f"n_records must be between 1 and {MAX_SAMPLE_RECORDS}")
+    
     try:
-        # Create sample data with common AIS fields
-        import random
-        from datetime import datetime, timedelta
-        
-        # Define vessel types and names
-        vessel_types = ['Cargo', 'Tanker', 'Passenger', 'Fishing', 'Tug', 'Military', 'Sailing']
-        vessel_names = ['Ocean Explorer', 'Pacific Star', 'Atlantic Voyager', 'Northern Light', 
-                       'Southern Cross', 'Eastern Wind', 'Western Sun', 'Coastal Runner',
-                       'Sea Dragon', 'River Queen', 'Lake Princess', 'Gulf Trader']
-        
-        # Generate random data
-        data = []
-        base_time = datetime.now()
-        
-        # Generate 1000 random vessel positions
-        for i in range(1000):
-            mmsi = random.randint(100000000, 999999999)
-            vessel_type = random.choice(vessel_types)
-            vessel_name = random.choice(vessel_names) + " " + str(random.randint(1, 100))
-            
-            # Generate positions around the world
-            lat = random.uniform(-80, 80)
-            lon = random.uniform(-179, 179)
-            
-            # Random speed and course
-            sog = random.uniform(0, 20)  # Speed Over Ground in knots
-            cog = random.uniform(0, 359)  # Course Over Ground in degrees
-            
-            # Random timestamp within the last 24 hours
-            time_offset = timedelta(hours=random.uniform(0, 24))
-            timestamp = (base_time - time_offset).strftime('%Y-%m-%d %H:%M:%S')
-            
-            data.append({
-                'MMSI': mmsi,
-                'VesselName': vessel_name,
-                'VesselType': vessel_type,
-                'LAT': lat,
-                'LON': lon,
-                'SOG': sog,
-                'COG': cog,
-                'BaseDateTime': timestamp
-            })
-        
-        # Convert to DataFrame
-        df = pd.DataFrame(data)
+        df = await asyncio.to_thread(sample_data.generate_sample_data, n_records, False, seed, n_vessels)
         
         # Store processed data
-        processed_data['original'] = df
-        processed_data['filtered'] = df.copy()
+        df = store_dataset(df)
         
         # Generate statistics
         stats = generate_statistics(df)
@@ -569,6 +878,8 @@ async def home():
         <script src="/static/js/tab_animation.js"></script>
         <script src="/static/js/dashboard.js"></script>
         <script src="/static/js/risk_map.js"></script>
+        <script src="/static/js/live_positions.js"></script>
+        <script src="/static/js/playback.js"></script>
     </head>
     <body>
         <div class="container">
@@ -635,7 +946,13 @@ async def home():
                 </div>
                 <button onclick="filterData()" style="margin-top: 15px;">Apply Filters</button>
                 <button onclick="clearFilters()" style="background: #6c757d;">Clear Filters</button>
-                <button onclick="exportData()" style="background: #28a745;">Export CSV</button>
+                <button onclick="exportData()" style="background: #28a745;">Export</button>
+                <select id="exportFormat">
+                    <option value="csv">CSV</option>
+                    <option value="parquet">Parquet</option>
+                    <option value="feather">Feather</option>
+                </select>
+                <label><input type="checkbox" id="exportGzip"> gzip</label>
             </div>
             
             <!-- Tab Navigation -->
@@ -874,11 +1191,23 @@ async def home():
                 document.getElementById('downloadBtn').innerHTML = '<span class="loading"></span> Processing...';
                 showStatus('Downloading and processing data... This may take a few minutes.', 'info');
                 
+                // Theo dõi tiến độ tải trong khi chờ máy chủ xử lý
+                const jobId = Date.now().toString(36) + Math.random().toString(36).slice(2);
+                const progressTimer = setInterval(async () => {
+                    try {
+                        const progress = await (await fetch('/download-progress?job_id=' + jobId)).json();
+                        if (!progress.state || progress.state === 'done' || progress.state === 'error') return;
+                        const mb = (progress.bytes_downloaded / 1048576).toFixed(1);
+                        const size = progress.total_bytes ? ` / ${(progress.total_bytes / 1048576).toFixed(1)} MB (${progress.percent}%)` : ' MB';
+                        showStatus(`Downloading ${mb}${size} - ${progress.rows_parsed.toLocaleString()} records parsed`, 'info');
+                    } catch (e) {}
+                }, 1000);
+                
                 try {
                     const response = await fetch('/download-ais', {
                         method: 'POST',
                         headers: {'Content-Type': 'application/json'},
-                        body: JSON.stringify({url: url})
+                        body: JSON.stringify({url: url, job_id: jobId})
                     });
                     
                     if (!response.ok) {
@@ -893,6 +1222,7 @@ async def home():
                 } catch (error) {
                     showStatus('❌ Error: ' + error.message, 'error');
                 } finally {
+                    clearInterval(progressTimer);
                     isProcessing = false;
                     document.getElementById('downloadBtn').innerHTML = 'Download & Process';
                 }
@@ -940,32 +1270,17 @@ async def home():
             }
             
             async function exportData() {
-                try {
-                    showStatus('Preparing export...', 'info');
-                    const response = await fetch('/export-data');
-                    
-                    if (!response.ok) {
-                        const error = await response.json();
-                        throw new Error(error.detail || 'Export failed');
-                    }
-                    
-                    const result = await response.json();
-                    
-                    // Create download link
-                    const blob = new Blob([result.csv_data], { type: 'text/csv' });
-                    const url = window.URL.createObjectURL(blob);
-                    const a = document.createElement('a');
-                    a.href = url;
-                    a.download = result.filename;
-                    document.body.appendChild(a);
-                    a.click();
-                    document.body.removeChild(a);
-                    window.URL.revokeObjectURL(url);
-                    
-                    showStatus('✅ Data exported successfully', 'success');
-                } catch (error) {
-                    showStatus('❌ Error exporting data: ' + error.message, 'error');
-                }
+                // Trình duyệt tải trực tiếp luồng dữ liệu từ máy chủ xuống đĩa
+                const format = document.getElementById('exportFormat').value;
+                const gzip = document.getElementById('exportGzip').checked;
+                const a = document.createElement('a');
+                a.href = `/export-data?format=${format}&gzip=${gzip}`;
+                a.download = '';
+                document.body.appendChild(a);
+                a.click();
+                document.body.removeChild(a);
+                
+                showStatus('✅ Export started', 'success');
             }
             
             function showStatus(message, type) {
@@ -1243,6 +1558,13 @@ async def home():
                         html += '</ul>';
                     }
                     
+                    if (result.kinematic) {
+                        html += '<h5>Bất thường động học:</h5><ul>';
+                        html += `<li>Nhảy vị trí (> ${result.kinematic.jump_speed_threshold} knốt): ${result.kinematic.position_jumps} lần, ${result.kinematic.position_jump_vessels} tàu</li>`;
+                        html += `<li>SOG không khớp tốc độ suy ra: ${result.kinematic.speed_mismatches} bản ghi</li>`;
+                        html += '</ul>';
+                    }
+                    
                     document.getElementById('anomalies-result').innerHTML = html;
                 } catch (error) {
                     document.getElementById('anomalies-result').innerHTML = `<div style="text-align: center; padding: 20px; color: #dc3545;">Lỗi: ${error.message}</div>`;
@@ -1378,31 +1700,11 @@ async def download_ais_data(request: DownloadRequest):
     if not url:
         raise HTTPException(status_code=400, detail="URL is required")
     
+    job = downloader.create_job(url, request.job_id)
     try:
-        # Download data with timeout
-        timeout = aiohttp.ClientTimeout(total=300)  # 5 minutes timeout
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.get(url) as response:
-                if response.status != 200:
-                    raise HTTPException(status_code=400, detail=f"Failed to download data: HTTP {response.status}")
-                
-                content = await response.read()
-        
-        # Process data based on file type
-        df = None
-        if url.endswith('.zip'):
-            with zipfile.ZipFile(BytesIO(content)) as zip_file:
-                csv_files = [f for f in zip_file.namelist() if f.endswith('.csv')]
-                if not csv_files:
-                    raise HTTPException(status_code=400, detail="No CSV files found in ZIP archive")
-                
-                # Read the first CSV file
-                with zip_file.open(csv_files[0]) as csv_file:
-                    df = pd.read_csv(csv_file, low_memory=False)
-        elif url.endswith('.csv'):
-            df = pd.read_csv(BytesIO(content), low_memory=False)
-        else:
-            raise HTTPException(status_code=400, detail="Unsupported file format. Please provide CSV or ZIP file.")
+        # Tải theo luồng xuống đĩa (đọc CSV trong khi đang tải), hoặc dùng bản
+        # đã lưu nếu máy chủ xác nhận file chưa thay đổi
+        df, from_cache = await download_cache.fetch_dataset(job, expected_sha256=request.sha256)
         
         if df is None or df.empty:
             raise HTTPException(status_code=400, detail="No data found in the file")
@@ -1411,8 +1713,7 @@ async def download_ais_data(request: DownloadRequest):
         df.columns = df.columns.str.strip()
         
         # Store processed data
-        processed_data['original'] = df
-        processed_data['filtered'] = df.copy()
+        df = store_dataset(df)
         
         # Generate statistics
         stats = generate_statistics(df)
@@ -1420,18 +1721,100 @@ async def download_ais_data(request: DownloadRequest):
         return {
             "total_records": len(df),
             "stats": stats,
-            "message": "Data processed successfully"
+            "job_id": job.id,
+            "sha256": job.sha256,
+            "cached": from_cache,
+            "message": "Data loaded from cache" if from_cache else "Data processed successfully"
         }
         
-    except aiohttp.ClientError as e:
-        raise HTTPException(status_code=400, detail=f"Network error: {str(e)}")
+    except HTTPException:
+        raise
+    except downloader.DownloadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except pd.errors.EmptyDataError:
         raise HTTPException(status_code=400, detail="The file appears to be empty or corrupted")
     except pd.errors.ParserError as e:
         raise HTTPException(status_code=400, detail=f"Error parsing CSV file: {str(e)}")
+    except (zipfile.BadZipFile, zipfile.LargeZipFile) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid ZIP archive: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
+@app.get("/download-progress")
+async def download_progress(job_id: Optional[str] = None):
+    """
+    Report progress of a download job (the most recent one if no id is given)
+    """
+    job = downloader.get_job(job_id) if job_id else downloader.latest_job()
+    if job is None:
+        raise HTTPException(status_code=404, detail="Download job not found")
+    
+    return job.progress()
+
+@app.post("/ingest/start")
+async def start_ingest(request: IngestRequest):
+    """
+    Start ingesting raw NMEA AIS sentences from TCP, UDP or a file into the dataset
+    """
+    service = processed_data.get('ingest')
+    if service is not None and service.running:
+        raise HTTPException(status_code=400, detail="Ingest is already running. Stop it first.")
+    
+    try:
+        service = ingest.IngestService(request.source, append_dataset, host=request.host, port=request.port,
+                                       path=request.path, follow=request.follow)
+        await service.start()
+    except (ValueError, OSError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    processed_data['ingest'] = service
+    print(f"[INFO] Started {request.source} ingest")
+    return service.status()
+
+@app.post("/ingest/stop")
+async def stop_ingest():
+    """
+    Stop the running ingest service, flushing buffered sentences
+    """
+    service = processed_data.get('ingest')
+    if service is None:
+        raise HTTPException(status_code=400, detail="No ingest service")
+    
+    await service.stop()
+    return service.status()
+
+@app.get("/ingest/status")
+async def ingest_status():
+    """
+    Return counters of the ingest service
+    """
+    service = processed_data.get('ingest')
+    if service is None:
+        return {"running": False}
+    
+    return service.status()
+
+@app.websocket("/ws/positions")
+async def positions_socket(websocket: WebSocket):
+    """
+    Push binary deltas of vessel positions changed since the client's last frame
+    
+    Clients send {"bbox": [min_lon, min_lat, max_lon, max_lat], "types": [...]}
+    to set their viewport; frame layout is described in live_feed.encode_frame.
+    """
+    await websocket.accept()
+    try:
+        await position_feed.serve(websocket)
+    except WebSocketDisconnect:
+        pass
+
+@app.get("/download-cache")
+async def download_cache_status():
+    """
+    Return size and usage of the local download cache
+    """
+    return download_cache.summary()
+
 @app.get("/data-status")
 async def data_status():
     """
@@ -1446,51 +1829,31 @@ async def data_status():
     return {
         "loaded": True,
         "total_records": len(df),
+        "dataset": processed_data['dataset'].summary(),
+        "latest": processed_data['latest'].summary() if processed_data.get('latest') is not None else None,
         "stats": stats
     }
 
+@app.get("/metrics")
+async def metrics_endpoint():
+    """
+    Prometheus text exposition of request, event loop and dataset memory metrics
+    """
+    # Deep memory estimates of new frames can take a while; keep them off the event loop
+    body = await asyncio.to_thread(metrics.REGISTRY.render)
+    return Response(content=body, media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.post("/filter-data")
 async def filter_data(filters: VesselFilter):
     if 'original' not in processed_data:
         raise HTTPException(status_code=400, detail="No data loaded. Please download data first.")
     
-    df = processed_data['original'].copy()
-    
-    # Apply filters
-    if filters.vessel_types:
-        # Try different possible column names for vessel type
-        vessel_col = None
-        for col in ['VesselType', 'VesselName', 'ShipType', 'vessel_type']:
-            if col in df.columns:
-                vessel_col = col
-                break
-        
-        if vessel_col:
-            df = df[df[vessel_col].isin(filters.vessel_types)]
-    
-    # Apply geographic filters
-    lat_col = None
-    lon_col = None
-    for col in ['LAT', 'Latitude', 'lat', 'latitude']:
-        if col in df.columns:
-            lat_col = col
-            break
-    for col in ['LON', 'Longitude', 'lon', 'longitude']:
-        if col in df.columns:
-            lon_col = col
-            break
-    
-    if lat_col and lon_col:
-        if filters.min_lat is not None:
-            df = df[df[lat_col] >= filters.min_lat]
-        if filters.max_lat is not None:
-            df = df[df[lat_col] <= filters.max_lat]
-        if filters.min_lon is not None:
-            df = df[df[lon_col] >= filters.min_lon]
-        if filters.max_lon is not None:
-            df = df[df[lon_col] <= filters.max_lon]
+    # Filtered frames share the original's data (copy-on-write) and stay read-only
+    df = live_dataset.read_only(apply_filters(processed_data['original'], filters), processed_data['snapshot'])
     
     processed_data['filtered'] = df
+    # Keep the filter so appended records are filtered the same way
+    processed_data['filters'] = filters
     stats = generate_statistics(df)
     
     return {
@@ -1575,7 +1938,6 @@ async def generate_map():
     
     # Giới hạn số điểm để tránh quá tải
     max_points = min(500, len(df_clean))
-    df_sample = df_clean.sample(n=max_points) if len(df_clean) > max_points else df_clean
     
     # Tìm cột loại tàu
     vessel_col = None
@@ -1584,6 +1946,25 @@ async def generate_map():
             vessel_col = col
             break
     
+    # Đánh dấu báo cáo mới nhất của mỗi tàu (bảng vị trí hiện tại) và vẽ hành trình
+    # đã đơn giản hóa của các tàu đó thay vì lấy mẫu ngẫu nhiên các điểm rời rạc
+    tracks_data = []
+    store = processed_data.get('trajectories')
+    current = current_positions(df_clean)
+    if store is not None and current is not None:
+        shown = current['mmsi'][:max_points]
+        df_sample = df_clean.loc[current['row_id'][:max_points]]
+        vessel_types = df_sample[vessel_col].astype(str).tolist() if vessel_col else ['Unknown'] * len(shown)
+        track_types = dict(zip(shown.tolist(), vessel_types))
+        
+        keep = simplify.simplify_tracks(store, simplify.zoom_tolerance_m(8))
+        vessels, offsets, positions = simplify.group_by_vessel(store, keep & store.row_mask(df_clean.index))
+        for i in np.flatnonzero(np.isin(vessels, shown)):
+            part = positions[offsets[i]:offsets[i + 1]]
+            tracks_data.append([np.column_stack((store.lats[part], store.lons[part])).round(5).tolist(), track_types[vessels[i]]])
+    else:
+        df_sample = df_clean.sample(n=max_points) if len(df_clean) > max_points else df_clean
+    
     # Thêm các điểm vào bản đồ
     points_data = []
     for _, row in df_sample.iterrows():
@@ -1605,10 +1986,10 @@ async def generate_map():
     
     # Thêm các điểm vào mã JavaScript
     map_html += ',\n                '.join(points_data)
+    map_html += '\n            ];\n            var tracks = ' + json.dumps(tracks_data) + ';'
     
     # Hoàn thành mã JavaScript
     map_html += '''
-            ];
             
             // Màu sắc cho các loại tàu
             var vesselColors = {
@@ -1622,6 +2003,16 @@ async def generate_map():
                 'Unknown': '#6c757d'
             };
             
+            // Vẽ hành trình của các tàu
+            tracks.forEach(function(track) {
+                var color = vesselColors[track[1]] || vesselColors['Unknown'];
+                L.polyline(track[0], {
+                    color: color,
+                    weight: 2,
+                    opacity: 0.6
+                }).addTo(map);
+            });
+            
             // Thêm các điểm vào bản đồ
             points.forEach(function(point) {
                 var lat = point[0];
@@ -1661,6 +2052,16 @@ async def generate_map():
                 return div;
             };
             legend.addTo(map);
+            
+            // Cập nhật vị trí tàu theo thời gian thực khi có dữ liệu mới
+            if (window.AisLiveFeed) {
+                AisLiveFeed.attach(map);
+            }
+            
+            // Điều khiển phát lại giao thông theo thời gian
+            if (window.AisPlayback) {
+                AisPlayback.attach(map);
+            }
         }}
     </script>
     '''
@@ -1755,7 +2156,13 @@ async def generate_map():
     return trusted_html
 
 @app.get("/export-data")
-async def export_data():
+async def export_data(format: str = "csv", columns: Optional[str] = None, gzip: bool = False):
+    """
+    Stream the filtered data as CSV, Parquet or Feather
+    
+    Rows are encoded and sent in chunks, so large exports use constant extra memory.
+    `columns` is a comma-separated list of columns to include.
+    """
     if 'filtered' not in processed_data:
         raise HTTPException(status_code=400, detail="No data available")
     
@@ -1763,13 +2170,15 @@ async def export_data():
     if df.empty:
         raise HTTPException(status_code=400, detail="No data to export")
     
-    csv_data = df.to_csv(index=False)
-    filename = f"ais_filtered_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    selected = [col.strip() for col in columns.split(',') if col.strip()] if columns else None
+    try:
+        chunks, media_type, extension = export.stream_dataframe(df, format, columns=selected, gzip=gzip)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    return {
-        "csv_data": csv_data,
-        "filename": filename
-    }
+    filename = f"ais_filtered_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+    return StreamingResponse(chunks, media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
 
 @app.get("/detect-patterns")
 async def detect_patterns():
@@ -1829,7 +2238,9 @@ async def advanced_map():
     if df.empty:
         return "<div style='text-align: center; padding: 50px; color: #666;'><h3>No data to display</h3><p>The filtered dataset is empty.</p></div>"
     
-    return analytics.generate_advanced_map(df)
+    # Đánh dấu báo cáo mới nhất của mỗi tàu thay vì các dòng ngẫu nhiên
+    current = current_positions(df)
+    return analytics.generate_advanced_map(df, current=df.loc[current['row_id']] if current is not None else None)
 
 @app.get("/detect-anomalies")
 async def detect_anomalies():
@@ -1841,12 +2252,32 @@ async def detect_anomalies():
     if df.empty:
         raise HTTPException(status_code=400, detail="No data to analyze")
     
-    result = analytics.detect_anomalies(df)
+    result = analytics.detect_anomalies(df, trajectories=processed_data.get('trajectories'),
+                                        speed_baselines=processed_data.get('speed_baselines'))
     if "error" in result:
         raise HTTPException(status_code=400, detail=result["error"])
     
     return result
 
+@app.get("/speed-baselines")
+async def speed_baselines(level: str = "type"):
+    """
+    Speed baselines (quantiles and anomaly fences) per vessel type, per type and region, or overall
+    """
+    levels = {"type_region": 0, "type": 1, "global": 2}
+    if level not in levels:
+        raise HTTPException(status_code=400, detail=f"level must be one of {', '.join(levels)}")
+    sketches = processed_data.get('speed_baselines')
+    if sketches is None:
+        raise HTTPException(status_code=400, detail="No data available")
+
+    return {
+        "level": level,
+        "relative_accuracy": baselines.RELATIVE_ACCURACY,
+        "min_samples": baselines.MIN_SAMPLES,
+        "baselines": await asyncio.to_thread(sketches.summary, levels[level])
+    }
+
 @app.get("/analyze-correlations")
 async def analyze_correlations_endpoint():
     """Phân tích tương quan giữa các biến"""
@@ -1857,10 +2288,53 @@ async def analyze_temporal_patterns_endpoint():
     """Phân tích mẫu theo thời gian"""
     return await api_endpoints.analyze_temporal_patterns(processed_data)
 
+@app.get("/temporal-cube")
+async def temporal_cube(by: str = "weekday,hour", vessel_types: Optional[str] = None):
+    """
+    Return record counts of the filtered data grouped by any of weekday, hour, vessel_type and cell
+
+    Counts are sliced from the time cube built once per dataset version.
+    vessel_types is an optional comma-separated list. Only non-empty combinations
+    are returned, as columns; cells are given by their south-west corner (lat, lon,
+    null when the position is missing) and size in degrees.
+    """
+    cube = processed_data.get('time_cube')
+    if cube is None:
+        raise HTTPException(status_code=400, detail="No data available")
+    dims = [dim.strip() for dim in by.split(",") if dim.strip()]
+    if not dims or any(dim not in time_cube.DIMENSIONS for dim in dims) or len(set(dims)) != len(dims):
+        raise HTTPException(status_code=400, detail=f"by must list distinct dimensions among {', '.join(time_cube.DIMENSIONS)}")
+
+    df = processed_data['filtered']
+    types = [name.strip() for name in vessel_types.split(",")] if vessel_types else None
+    positions, counts = await asyncio.to_thread(cube.aggregate_sparse, dims, df.index, types)
+    groups = {}
+    for dim, values in zip(dims, positions):
+        if dim == "vessel_type":
+            groups[dim] = [cube.vessel_types[i] for i in values]
+        elif dim == "cell":
+            known = values != time_cube.NO_CELL
+            groups["lat"], groups["lon"] = ([float(b) if k else None for b, k in zip(bound, known)]
+                                            for bound in time_cube.cell_bounds(values))
+        else:
+            groups[dim] = values.tolist()
+    return {
+        "by": dims,
+        "cell_deg": time_cube.CELL_DEG,
+        "total": int(counts.sum()),
+        "groups": {**groups, "count": counts.tolist()}
+    }
+
 @app.get("/detect-vessel-groups")
-async def detect_vessel_groups_endpoint():
-    """Phát hiện các nhóm tàu di chuyển cùng nhau"""
-    return await api_endpoints.detect_vessel_groups(processed_data)
+async def detect_vessel_groups_endpoint(cell_km: Optional[float] = None, min_vessels: int = grouping.MIN_CELL_VESSELS):
+    """
+    Detect groups of vessels operating close together
+    
+    cell_km is the grid cell size; by default it is derived from the extent and
+    number of vessels of the data. A cell is part of a group when it holds at
+    least min_vessels distinct vessels.
+    """
+    return await api_endpoints.detect_vessel_groups(processed_data, cell_km, min_vessels)
 
 @app.get("/extract-hidden-patterns")
 async def extract_hidden_patterns():
@@ -1872,15 +2346,27 @@ async def extract_hidden_patterns():
     if df.empty:
         raise HTTPException(status_code=400, detail="No data to analyze")
     
-    result = analytics.extract_hidden_patterns(df)
+    result = analytics.extract_hidden_patterns(df, cube=processed_data.get('time_cube'))
     if "error" in result:
         raise HTTPException(status_code=400, detail=result["error"])
     
     return result
 
+def get_risk_frame(df):
+    """Ghép điểm rủi ro của phiên bản dữ liệu hiện tại vào dữ liệu đang lọc"""
+    scores = risk_store.get_risk_scores(processed_data['original'], processed_data['version'],
+                                        hazard_layer=processed_data.get('hazard_layer'),
+                                        weather_layer=processed_data.get('weather_layer'),
+                                        trajectories=processed_data.get('trajectories'),
+                                        speed_baselines=processed_data.get('speed_baselines'))
+    if isinstance(scores, dict) and "error" in scores:
+        raise HTTPException(status_code=400, detail=scores["error"])
+    
+    return risk_store.join_risk_scores(df, scores)
+
 @app.get("/calculate-risk-scores")
-async def calculate_risk_scores():
-    """Tính toán điểm rủi ro cho các tàu"""
+async def calculate_risk_scores(current: bool = False, max_age_minutes: Optional[int] = None):
+    """Tính toán điểm rủi ro cho các tàu (current=true: chỉ báo cáo mới nhất của mỗi tàu)"""
     if 'filtered' not in processed_data:
         raise HTTPException(status_code=400, detail="No data available")
     
@@ -1888,19 +2374,21 @@ async def calculate_risk_scores():
     if df.empty:
         raise HTTPException(status_code=400, detail="No data to analyze")
     
-    result_df = risk_analysis.calculate_risk_scores(df)
-    if isinstance(result_df, dict) and "error" in result_df:
-        raise HTTPException(status_code=400, detail=result_df["error"])
-    
-    # Lưu kết quả vào processed_data
-    processed_data['risk_analyzed'] = result_df
+    result_df = get_risk_frame(df)
+    if current:
+        positions = current_positions(df, max_age_minutes * 60 if max_age_minutes is not None else None)
+        if positions is None:
+            raise HTTPException(status_code=400, detail="No vessel positions available")
+        result_df = result_df.loc[positions['row_id']]
+        if result_df.empty:
+            raise HTTPException(status_code=400, detail="No current vessel positions")
     
     # Tạo thống kê rủi ro
     risk_stats = {
         "total_vessels": len(result_df),
-        "high_risk": int(sum(result_df['RiskScore'] >= 70)),
-        "medium_risk": int(sum((result_df['RiskScore'] >= 40) & (result_df['RiskScore'] < 70))),
-        "low_risk": int(sum(result_df['RiskScore'] < 40)),
+        "high_risk": int((result_df['RiskScore'] >= 70).sum()),
+        "medium_risk": int(((result_df['RiskScore'] >= 40) & (result_df['RiskScore'] < 70)).sum()),
+        "low_risk": int((result_df['RiskScore'] < 40).sum()),
         "avg_risk_score": float(result_df['RiskScore'].mean()),
         "max_risk_score": float(result_df['RiskScore'].max()),
         "risk_factors": {
@@ -1924,9 +2412,8 @@ async def identify_risky_routes(risk_threshold: int = 70):
     if df.empty:
         raise HTTPException(status_code=400, detail="No data to analyze")
     
-    # Sử dụng dữ liệu đã phân tích rủi ro nếu có
-    if 'risk_analyzed' in processed_data and not processed_data['risk_analyzed'].empty:
-        df = processed_data['risk_analyzed']
+    # Ghép điểm rủi ro đã lưu của phiên bản dữ liệu hiện tại
+    df = get_risk_frame(df)
     
     risky_routes = risk_analysis.identify_risky_routes(df, risk_threshold)
     if isinstance(risky_routes, dict) and "error" in risky_routes:
@@ -1948,12 +2435,362 @@ async def risk_map():
     if df.empty:
         return "<div style='text-align: center; padding: 50px; color: #666;'><h3>No data to display</h3><p>The filtered dataset is empty.</p></div>"
     
-    # Sử dụng dữ liệu đã phân tích rủi ro nếu có
-    if 'risk_analyzed' in processed_data and not processed_data['risk_analyzed'].empty:
-        df = processed_data['risk_analyzed']
+    # Ghép điểm rủi ro đã lưu của phiên bản dữ liệu hiện tại
+    try:
+        df = get_risk_frame(df)
+    except HTTPException as e:
+        return f"<div>Lỗi: {e.detail}</div>"
     
     return risk_analysis.generate_risk_map(df)
 
+@app.post("/upload-hazard-layer")
+async def upload_hazard_layer(file: UploadFile = File(...)):
+    """
+    Upload a static hazard layer (GeoJSON, or zipped shapefile)
+    """
+    try:
+        content = await file.read()
+        filename = file.filename.lower()
+        
+        if filename.endswith('.geojson') or filename.endswith('.json'):
+            layer = hazards.HazardLayer.from_geojson(content, name=file.filename)
+        elif filename.endswith('.zip'):
+            layer = hazards.HazardLayer.from_shapefile(content, name=file.filename)
+        else:
+            raise HTTPException(status_code=400, detail="Unsupported format. Please provide GeoJSON or zipped shapefile.")
+        
+        processed_data['hazard_layer'] = layer
+        return {
+            "hazard_layer": layer.summary(),
+            "message": "Hazard layer loaded successfully"
+        }
+        
+    except HTTPException:
+        raise
+    except (ValueError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid hazard layer: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error loading hazard layer: {str(e)}")
+
+@app.get("/hazard-layer")
+async def hazard_layer_status():
+    """
+    Return the currently loaded hazard layer, if any
+    """
+    layer = processed_data.get('hazard_layer')
+    if layer is None:
+        return {"loaded": False}
+    
+    return {"loaded": True, **layer.summary()}
+
+@app.get("/playback")
+async def playback_frame(t: Optional[str] = None, frame: Optional[int] = None, step: int = playback.DEFAULT_STEP_S,
+                         prefetch: int = 0, bbox: Optional[str] = None):
+    """
+    Return interpolated vessel positions at the playback frame nearest to time t
+    
+    Frames are precomputed once per dataset version and step. prefetch=N also
+    returns the N frames before and after, so the client can scrub without waiting.
+    Only vessels with records in the current filtered data are returned.
+    """
+    store = processed_data.get('trajectories')
+    if store is None:
+        raise HTTPException(status_code=400, detail="No vessel tracks available. Dataset needs MMSI, time and coordinate columns.")
+    if step < 10:
+        raise HTTPException(status_code=400, detail="step must be at least 10 seconds")
+    
+    try:
+        index = await asyncio.to_thread(playback.build_index, store, step)
+        viewport = [float(v) for v in bbox.split(',')] if bbox else None
+        if viewport is not None and len(viewport) != 4:
+            raise ValueError("bbox must be min_lon,min_lat,max_lon,max_lat")
+        if t is not None:
+            moment = float(t) if t.replace('.', '', 1).isdigit() else pd.Timestamp(t).timestamp()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if index.n_frames == 0:
+        raise HTTPException(status_code=400, detail="No positions to play back")
+    if frame is not None:
+        k = int(np.clip(frame, 0, index.n_frames - 1))
+    else:
+        k = index.frame_index(moment) if t is not None else 0
+    
+    prefetch = int(np.clip(prefetch, 0, 10))
+    frames = range(max(k - prefetch, 0), min(k + prefetch, index.n_frames - 1) + 1)
+    
+    # Chỉ giữ các tàu còn trong dữ liệu đang lọc
+    df = processed_data.get('filtered')
+    vessels = None
+    if df is not None and len(df) != len(processed_data['original']):
+        vessels = np.unique(store.mmsi[store.row_mask(df.index)])
+    
+    # Trả trực tiếp JSONResponse để bỏ qua bước chuyển đổi đệ quy của FastAPI trên các danh sách lớn
+    return JSONResponse({
+        **index.summary(),
+        "frame": k,
+        "frames_data": [index.frame_json(i, viewport, vessels) for i in frames]
+    })
+
+@app.get("/latest-positions")
+async def latest_positions(max_age_minutes: Optional[int] = None, limit: int = 5000):
+    """
+    Return the latest report of each vessel in the filtered data, most recent first
+    
+    Vessels without a report in the last max_age_minutes (relative to the newest
+    report) are left out.
+    """
+    if 'filtered' not in processed_data:
+        raise HTTPException(status_code=400, detail="No data available")
+    
+    current = current_positions(processed_data['filtered'], max_age_minutes * 60 if max_age_minutes is not None else None)
+    if current is None:
+        raise HTTPException(status_code=400, detail="Dataset has no MMSI, time or coordinate columns")
+    
+    limit = max(limit, 0)
+    vessels = pd.DataFrame({
+        "mmsi": current['mmsi'][:limit],
+        "time": pd.to_datetime(current['time'][:limit], unit='s').strftime('%Y-%m-%dT%H:%M:%S'),
+        "lat": current['lat'][:limit].round(6),
+        "lon": current['lon'][:limit].round(6),
+        "sog": current['sog'][:limit].astype(np.float64).round(2),
+        "cog": current['cog'][:limit].astype(np.float64).round(1),
+        "vessel_type": current['type'][:limit]
+    })
+    
+    return {
+        "total_vessels": int(len(current['mmsi'])),
+        "returned": len(vessels),
+        "vessels": vessels.astype(object).where(vessels.notna(), None).to_dict(orient="records")
+    }
+
+@app.get("/vessel-track/{mmsi}")
+async def vessel_track(mmsi: int, start_date: Optional[str] = None, end_date: Optional[str] = None):
+    """
+    Return the time-ordered track of one vessel from the trajectory store
+    """
+    store = processed_data.get('trajectories')
+    if store is None:
+        raise HTTPException(status_code=400, detail="No trajectory data available. Data needs MMSI, time and position columns.")
+    
+    try:
+        start_time = int(pd.Timestamp(start_date).timestamp()) if start_date else None
+        end_time = int(pd.Timestamp(end_date).timestamp()) if end_date else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {str(e)}")
+    
+    track = store.track(mmsi, start_time, end_time)
+    if track is None:
+        raise HTTPException(status_code=404, detail=f"Vessel {mmsi} not found")
+    
+    return {
+        "mmsi": mmsi,
+        "points": len(track["times"]),
+        "times": [pd.Timestamp(t, unit='s').strftime('%Y-%m-%d %H:%M:%S') for t in track["times"]],
+        "positions": [[float(lat), float(lon)] for lat, lon in zip(track["lats"], track["lons"])],
+        "sog": track["sogs"].tolist() if track["sogs"] is not None else None,
+        "cog": track["cogs"].tolist() if track["cogs"] is not None else None
+    }
+
+@app.get("/segments")
+async def track_segments(mmsi: Optional[int] = None, kind: Optional[str] = None, limit: int = 1000):
+    """
+    Return the voyage/stop segment table derived from the trajectory store
+    """
+    store = processed_data.get('trajectories')
+    if store is None:
+        raise HTTPException(status_code=400, detail="No trajectory data available. Data needs MMSI, time and position columns.")
+    
+    _, segments = kinematics.segment_tracks(store)
+    
+    # Chỉ giữ các tàu còn trong dữ liệu đang lọc
+    df = processed_data.get('filtered')
+    if df is not None and len(df) != len(processed_data['original']):
+        in_filter = store.row_mask(df.index)
+        segments = segments[np.isin(segments["mmsi"], np.unique(store.mmsi[in_filter]))]
+    if mmsi is not None:
+        segments = segments[segments["mmsi"] == mmsi]
+    if kind is not None:
+        segments = segments[segments["kind"] == kind]
+    
+    result = segments.head(max(limit, 0)).copy()
+    result["start_time"] = result["start_time"].dt.strftime('%Y-%m-%d %H:%M:%S')
+    result["end_time"] = result["end_time"].dt.strftime('%Y-%m-%d %H:%M:%S')
+    
+    return {
+        "total_segments": int(len(segments)),
+        "voyages": int((segments["kind"] == "voyage").sum()),
+        "stops": int((segments["kind"] == "stop").sum()),
+        "segments": result.astype(object).where(result.notna(), None).to_dict(orient="records")
+    }
+
+@app.get("/comovement")
+async def vessel_comovement(radius_nm: float = comovement.DEFAULT_RADIUS_NM, min_minutes: float = comovement.DEFAULT_MIN_DURATION_S / 60,
+                            step: int = playback.DEFAULT_STEP_S, kind: Optional[str] = None, mmsi: Optional[int] = None,
+                            limit: int = 1000):
+    """
+    Return episodes of vessel pairs staying within radius_nm of each other for at least min_minutes
+
+    Positions are compared at the playback frames (every step seconds). Episodes
+    where both vessels are slow are marked 'rendezvous' (possible ship-to-ship
+    transfer), the rest 'convoy'. Groups of three or more vessels linked by
+    overlapping episodes are returned separately.
+    """
+    store = processed_data.get('trajectories')
+    if store is None:
+        raise HTTPException(status_code=400, detail="No trajectory data available. Data needs MMSI, time and position columns.")
+    if radius_nm <= 0 or min_minutes < 0:
+        raise HTTPException(status_code=400, detail="radius_nm must be positive and min_minutes non-negative")
+    if step < 10:
+        raise HTTPException(status_code=400, detail="step must be at least 10 seconds")
+    if kind is not None and kind not in ("convoy", "rendezvous"):
+        raise HTTPException(status_code=400, detail="kind must be 'convoy' or 'rendezvous'")
+
+    try:
+        result = await asyncio.to_thread(comovement.detect_comovement, store, radius_nm, int(min_minutes * 60), step)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    episodes, groups = result["episodes"], result["groups"]
+
+    # Chỉ giữ các lần gặp mà cả hai tàu còn trong dữ liệu đang lọc
+    df = processed_data.get('filtered')
+    if df is not None and len(df) != len(processed_data['original']):
+        in_filter = np.unique(store.mmsi[store.row_mask(df.index)])
+        episodes = episodes[np.isin(episodes["mmsi_a"], in_filter) & np.isin(episodes["mmsi_b"], in_filter)]
+        groups = [g for g in groups if np.isin(g["vessels"], in_filter).all()]
+    if mmsi is not None:
+        episodes = episodes[(episodes["mmsi_a"] == mmsi) | (episodes["mmsi_b"] == mmsi)]
+        groups = [g for g in groups if mmsi in g["vessels"]]
+    if kind is not None:
+        episodes = episodes[episodes["kind"] == kind]
+
+    result = episodes.drop(columns=["start_s", "end_s"]).head(max(limit, 0)).round(
+        {"duration_min": 1, "min_distance_nm": 3, "mean_distance_nm": 3, "mean_speed_kn": 1, "lat": 6, "lon": 6})
+    result["start_time"] = result["start_time"].dt.strftime('%Y-%m-%d %H:%M:%S')
+    result["end_time"] = result["end_time"].dt.strftime('%Y-%m-%d %H:%M:%S')
+
+    return {
+        "radius_nm": radius_nm,
+        "min_minutes": min_minutes,
+        "step_s": step,
+        "total_episodes": int(len(episodes)),
+        "rendezvous": int((episodes["kind"] == "rendezvous").sum()),
+        "convoys": int((episodes["kind"] == "convoy").sum()),
+        "episodes": result.astype(object).where(result.notna(), None).to_dict(orient="records"),
+        "groups": [
+            {**g, "start_time": g["start_time"].strftime('%Y-%m-%d %H:%M:%S'),
+             "end_time": g["end_time"].strftime('%Y-%m-%d %H:%M:%S')}
+            for g in groups
+        ]
+    }
+
+@app.get("/behavior-events")
+async def behavior_events(kind: str = "all", mmsi: Optional[int] = None, gap_hours: float = behavior.GAP_THRESHOLD_S / 3600,
+                          window_minutes: float = behavior.LOITER_WINDOW_S / 60, radius_nm: float = behavior.LOITER_RADIUS_NM,
+                          limit: int = 1000):
+    """
+    Return AIS transmission gaps and loitering episodes detected on the per-vessel tracks
+
+    A gap is two consecutive reports more than gap_hours apart, with the positions
+    where the signal was lost and regained. Loitering is a stretch where every
+    window of window_minutes stays within radius_nm (radius of gyration).
+    """
+    store = processed_data.get('trajectories')
+    if store is None:
+        raise HTTPException(status_code=400, detail="No trajectory data available. Data needs MMSI, time and position columns.")
+    if kind not in ("all", "gaps", "loitering"):
+        raise HTTPException(status_code=400, detail="kind must be 'all', 'gaps' or 'loitering'")
+    if gap_hours <= 0 or window_minutes <= 0 or radius_nm <= 0:
+        raise HTTPException(status_code=400, detail="gap_hours, window_minutes and radius_nm must be positive")
+
+    events = await asyncio.to_thread(behavior.detect_behavior, store, int(gap_hours * 3600), int(window_minutes * 60), radius_nm)
+
+    # Chỉ giữ các tàu còn trong dữ liệu đang lọc
+    df = processed_data.get('filtered')
+    vessels = None
+    if df is not None and len(df) != len(processed_data['original']):
+        vessels = np.unique(store.mmsi[store.row_mask(df.index)])
+
+    response = {"gap_hours": gap_hours, "window_minutes": window_minutes, "radius_nm": radius_nm}
+    for name in ("gaps", "loitering"):
+        table = events[name]
+        if vessels is not None:
+            table = table[np.isin(table["mmsi"], vessels)]
+        if mmsi is not None:
+            table = table[table["mmsi"] == mmsi]
+        response[f"total_{name}"] = int(len(table))
+        if kind not in ("all", name):
+            continue
+        result = table.head(max(limit, 0)).round(6)
+        result["start_time"] = result["start_time"].dt.strftime('%Y-%m-%d %H:%M:%S')
+        result["end_time"] = result["end_time"].dt.strftime('%Y-%m-%d %H:%M:%S')
+        response[name] = result.astype(object).where(result.notna(), None).to_dict(orient="records")
+    return response
+
+@app.get("/vessel-tracks")
+async def vessel_tracks(zoom: int = 8, encoding: str = "polyline", time_aware: bool = False, limit: Optional[int] = None):
+    """
+    Return simplified per-vessel tracks of the filtered data for map rendering
+    
+    The simplification tolerance follows the map zoom level (about one pixel).
+    Tracks are sent as encoded polylines or as [lat, lon] coordinate lists.
+    """
+    store = processed_data.get('trajectories')
+    if store is None:
+        raise HTTPException(status_code=400, detail="No trajectory data available. Data needs MMSI, time and position columns.")
+    if encoding not in ("polyline", "coords"):
+        raise HTTPException(status_code=400, detail="Encoding must be 'polyline' or 'coords'")
+    
+    tolerance = simplify.zoom_tolerance_m(zoom)
+    keep = simplify.simplify_tracks(store, tolerance, time_aware=time_aware)
+    
+    df = processed_data['filtered']
+    in_filter = store.row_mask(df.index)
+    vessels, offsets, positions = simplify.group_by_vessel(store, keep & in_filter)
+    if limit is not None:
+        vessels, offsets = vessels[:max(limit, 0)], offsets[:max(limit, 0) + 1]
+        positions = positions[:offsets[-1]]
+    
+    lats, lons = store.lats[positions], store.lons[positions]
+    if encoding == "polyline":
+        shapes = simplify.encode_polylines(lats, lons, offsets)
+    else:
+        shapes = [np.column_stack((lats[a:b], lons[a:b])).round(5).tolist() for a, b in zip(offsets[:-1], offsets[1:])]
+    
+    # Loại tàu lấy từ bản ghi đầu tiên của mỗi hành trình
+    original = processed_data['original']
+    vessel_col = next((col for col in ['VesselType', 'ShipType', 'vessel_type'] if col in original.columns), None)
+    vessel_types = original.loc[store.row_ids[positions[offsets[:-1]]], vessel_col].to_numpy() if vessel_col and len(vessels) else [None] * len(vessels)
+    
+    return {
+        "zoom": zoom,
+        "tolerance_m": tolerance,
+        "encoding": encoding,
+        "vessels": int(len(vessels)),
+        "points_original": int(in_filter.sum()),
+        "points_simplified": int(len(positions)),
+        "tracks": [
+            {
+                "mmsi": int(mmsi),
+                "vessel_type": str(vessel_type) if vessel_type is not None and pd.notna(vessel_type) else None,
+                "points": int(b - a),
+                "track": shape
+            }
+            for mmsi, vessel_type, a, b, shape in zip(vessels, vessel_types, offsets[:-1], offsets[1:], shapes)
+        ]
+    }
+
+@app.get("/weather-layer")
+async def weather_layer_status():
+    """
+    Return the currently loaded weather layer, if any
+    """
+    layer = processed_data.get('weather_layer')
+    if layer is None:
+        return {"loaded": False}
+    
+    return {"loaded": True, **layer.summary()}
+
 @app.get("/marine-cadastre-map", response_class=HTMLResponse)
 async def marine_cadastre_map():
     """Tích hợp bản đồ từ marinecadastre.gov"""
@@ -2125,7 +2962,9 @@ def generate_statistics(df):
     time_span = "N/A"
     if date_col:
         try:
-            dates = pd.to_datetime(df[date_col], errors='coerce').dropna()
+            # Parsed times come from the dataset's derived-column cache
+            seconds, valid = trajectory.frame_times(df)
+            dates = pd.to_datetime(seconds[valid], unit='s')
             if not dates.empty:
                 date_start = dates.min().strftime('%Y-%m-%d %H:%M')
                 date_end = dates.max().strftime('%Y-%m-%d %H:%M')
@@ -0,0 +1,311 @@
+import os
+import json
+import time
+import asyncio
+import weakref
+import threading
+
+import numpy as np
+import pandas as pd
+from starlette.routing import Match
+
+# Số liệu vận hành theo định dạng văn bản của Prometheus (không cần thư viện ngoài):
+# độ trễ, kích thước phản hồi và số yêu cầu đang xử lý theo từng route, độ trễ
+# vòng lặp sự kiện và bộ nhớ của từng dữ liệu được lưu. Mỗi yêu cầu có thể được
+# ghi thành một dòng JSON (đặt AIS_TIMING_LOG là đường dẫn file, hoặc "-" để in ra).
+
+# Ngưỡng của histogram độ trễ (giây) và kích thước phản hồi (byte)
+LATENCY_BUCKETS_S = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+LOOP_LAG_BUCKETS_S = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
+# Chu kỳ đo độ trễ vòng lặp sự kiện (giây)
+LOOP_LAG_INTERVAL_S = 0.5
+
+# Nhãn route cho yêu cầu không khớp route nào (tránh số nhãn tăng không giới hạn)
+UNMATCHED_ROUTE = "<unmatched>"
+
+TIMING_LOG = os.environ.get("AIS_TIMING_LOG")
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Bộ đếm tăng dần theo nhãn"""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, _labels(self.label_names, key), value) for key, value in sorted(self._values.items())]
+
+class Gauge(Counter):
+    """Giá trị có thể tăng giảm theo nhãn"""
+
+    kind = "gauge"
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value):
+        with self._lock:
+            self._values[labels] = value
+
+class Histogram:
+    """Histogram tích lũy theo nhãn, cùng tổng và số lần quan sát"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS_S):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = np.asarray(buckets, dtype=np.float64)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [np.zeros(len(self.buckets) + 1, dtype=np.int64), 0.0]
+            series[0][np.searchsorted(self.buckets, value, side='left')] += 1
+            series[1] += value
+
+    def samples(self):
+        result = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._series.items()):
+                cumulative = np.cumsum(counts)
+                for bound, count in zip(list(self.buckets) + [float("inf")], cumulative):
+                    le = "+Inf" if bound == float("inf") else _number(float(bound))
+                    result.append((f"{self.name}_bucket", _labels(self.label_names, key, [("le", le)]), int(count)))
+                result.append((f"{self.name}_sum", _labels(self.label_names, key), total))
+                result.append((f"{self.name}_count", _labels(self.label_names, key), int(cumulative[-1])))
+        return result
+
+class Registry:
+    """Tập các số liệu và hàm thu thập chạy khi có yêu cầu /metrics"""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        """
+        Đăng ký hàm thu thập; fn() trả về danh sách (tên, mô tả, loại, [(nhãn dict, giá trị)])
+        """
+        self.collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name}{labels} {_number(value)}" for name, labels, value in metric.samples())
+        for fn in self.collectors:
+            try:
+                families = fn()
+            except Exception as e:
+                print(f"[WARNING] Metrics collector {getattr(fn, '__name__', fn)} failed: {str(e)}")
+                continue
+            for name, help, kind, samples in families:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_labels(labels.keys(), labels.values())} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+REQUEST_LATENCY = REGISTRY.add(Histogram(
+    "ais_http_request_duration_seconds", "Request latency by route", ("method", "route", "status")))
+RESPONSE_SIZE = REGISTRY.add(Histogram(
+    "ais_http_response_size_bytes", "Response body size by route", ("method", "route"), SIZE_BUCKETS))
+IN_FLIGHT = REGISTRY.add(Gauge(
+    "ais_http_requests_in_flight", "Requests currently being handled", ("method", "route")))
+EXCEPTIONS = REGISTRY.add(Counter(
+    "ais_http_exceptions_total", "Requests that raised an unhandled exception", ("method", "route")))
+LOOP_LAG = REGISTRY.add(Histogram(
+    "ais_event_loop_lag_seconds", "Delay of a periodic event loop callback beyond its schedule", (),
+    LOOP_LAG_BUCKETS_S))
+LOOP_LAG_LAST = REGISTRY.add(Gauge(
+    "ais_event_loop_lag_last_seconds", "Most recent event loop lag sample"))
+
+def route_name(app, scope):
+    """Mẫu đường dẫn của route khớp với yêu cầu (ví dụ /vessel-track/{mmsi})"""
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", UNMATCHED_ROUTE)
+    return UNMATCHED_ROUTE
+
+_log_lock = threading.Lock()
+
+def log_timing(record):
+    """Ghi một dòng JSON cho yêu cầu nếu AIS_TIMING_LOG được đặt"""
+    if not TIMING_LOG:
+        return
+    line = json.dumps(record, separators=(",", ":"))
+    if TIMING_LOG == "-":
+        print(line, flush=True)
+        return
+    with _log_lock, open(TIMING_LOG, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI đo từng yêu cầu HTTP
+
+    Viết trực tiếp trên ASGI (không dùng BaseHTTPMiddleware) để không chặn
+    phản hồi dạng stream; kích thước phản hồi được cộng dồn từ các khối gửi đi.
+    """
+
+    def __init__(self, app, router_app=None):
+        self.app = app
+        self.router_app = router_app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = route_name(self.router_app, scope) if self.router_app is not None else scope["path"]
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        IN_FLIGHT.inc(method, route)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            EXCEPTIONS.inc(method, route)
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            IN_FLIGHT.dec(method, route)
+            REQUEST_LATENCY.observe(duration, method, route, str(status))
+            RESPONSE_SIZE.observe(size, method, route)
+            log_timing({
+                "ts": round(time.time(), 3),
+                "method": method,
+                "route": route,
+                "path": scope["path"],
+                "status": status,
+                "duration_ms": round(duration * 1000, 3),
+                "bytes": size
+            })
+
+async def monitor_event_loop(interval_s=LOOP_LAG_INTERVAL_S):
+    """Đo độ trễ vòng lặp sự kiện: thời gian thức dậy muộn hơn lịch của một lần sleep"""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval_s
+        await asyncio.sleep(interval_s)
+        lag = max(loop.time() - expected, 0.0)
+        LOOP_LAG.observe(lag)
+        LOOP_LAG_LAST.set(value=lag)
+
+def nbytes(obj, depth=3):
+    """
+    Ước lượng bộ nhớ của một đối tượng dữ liệu (byte)
+
+    DataFrame/Series tính cả chuỗi trong cột object; các đối tượng khác được cộng
+    theo mảng numpy, thuộc tính nbytes hoặc các thuộc tính con (tối đa depth cấp).
+    """
+    if obj is None:
+        return 0
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        usage = obj.memory_usage(index=True, deep=True)
+        return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    size = getattr(type(obj), "nbytes", None)
+    if isinstance(size, property):
+        return int(obj.nbytes)
+    if depth <= 0:
+        return 0
+    if isinstance(obj, dict):
+        return sum(nbytes(value, depth - 1) for value in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(nbytes(value, depth - 1) for value in obj)
+    if hasattr(obj, "__dict__"):
+        return sum(nbytes(value, depth - 1) for value in vars(obj).values())
+    return 0
+
+class MemoryTracker:
+    """
+    Bộ nhớ của từng mục trong một dict dữ liệu, tính lại khi đối tượng hoặc phiên bản thay đổi
+
+    Ước lượng sâu của DataFrame lớn tốn thời gian, nên kết quả được giữ theo đối
+    tượng (tham chiếu yếu nếu có thể) và phiên bản dữ liệu (version()) cho đến khi
+    mục đó được thay bằng đối tượng khác hoặc dữ liệu được thêm (đối tượng lớn dần
+    tại chỗ như chế độ xem vị trí mới nhất).
+    """
+
+    def __init__(self, items, version=None):
+        self.items = items
+        self.version = version or (lambda: None)
+        self._sizes = {}
+
+    def _size(self, key, obj, version):
+        cached = self._sizes.get(key)
+        if cached is not None and cached[0]() is obj and cached[1] == version:
+            return cached[2]
+        size = nbytes(obj)
+        try:
+            ref = weakref.ref(obj)
+        except TypeError:
+            # Không hỗ trợ tham chiếu yếu: giữ tham chiếu mạnh đến lần đo sau
+            ref = lambda obj=obj: obj  # noqa: E731
+        self._sizes[key] = (ref, version, size)
+        return size
+
+    def collect(self):
+        items = self.items()
+        version = self.version()
+        samples = [({"key": key}, self._size(key, obj, version))
+                   for key, obj in sorted(items, key=lambda item: item[0])]
+        # Bỏ các mục không chứa dữ liệu (cấu hình, chuỗi phiên bản)
+        samples = [(labels, size) for labels, size in samples if size > 0]
+        for key in set(self._sizes) - {key for key, _ in items}:
+            del self._sizes[key]
+        return [("ais_dataset_memory_bytes",
+                 "Estimated memory of each stored dataset object (shared snapshot chunks are counted once)",
+                 "gauge", samples)]
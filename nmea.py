@@ -0,0 +1,274 @@
+import time
+import string
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+# Giải mã câu NMEA 0183 AIS (!AIVDM / !AIVDO) theo lô.
+# Phần phân tách câu và ghép các mảnh thực hiện bằng Python thuần (chỉ là
+# tách chuỗi), còn kiểm tra checksum và giải mã payload 6-bit được vector hóa:
+# payload cùng loại được xếp thành mảng 2 chiều, khai triển thành bit và mỗi
+# trường được đọc một lần cho cả lô.
+
+# Ký tự hợp lệ của checksum (hai chữ số hex)
+_HEX_DIGITS = frozenset(string.hexdigits)
+
+# Bảng ký tự 6-bit của AIS
+_SIXBIT_TEXT = np.frombuffer(b"@ABCDEFGHIJKLMNOPQRSTUVWXYZ[\\]^_ !\"#$%&'()*+,-./0123456789:;<=>?", dtype=np.uint8)
+
+# Độ dài tối thiểu (bit) để giải mã mỗi loại bản tin
+_MIN_BITS = {1: 143, 2: 143, 3: 143, 18: 139, 19: 301, 5: 302, 24: 160}
+
+# Thời gian tối đa chờ đủ các mảnh của một bản tin nhiều phần (giây)
+FRAGMENT_TIMEOUT_S = 60
+MAX_PENDING_FRAGMENTS = 10_000
+
+# Cột đầu ra theo định dạng MarineCadastre
+POSITION_COLUMNS = ['MMSI', 'BaseDateTime', 'LAT', 'LON', 'SOG', 'COG', 'Heading', 'VesselName', 'IMO',
+                    'CallSign', 'VesselType', 'Status', 'Length', 'Width', 'Draft', 'TransceiverClass']
+STATIC_COLUMNS = ['VesselName', 'IMO', 'CallSign', 'VesselType', 'Length', 'Width', 'Draft']
+
+def _checksums_valid(bodies, checksums):
+    """Kiểm tra checksum XOR của nhiều câu cùng lúc"""
+    if not bodies:
+        return np.zeros(0, dtype=bool)
+    lengths = np.fromiter((len(b) for b in bodies), dtype=np.int64, count=len(bodies))
+    data = np.frombuffer("".join(bodies).encode("ascii", "replace"), dtype=np.uint8)
+    starts = np.cumsum(lengths) - lengths
+    nonempty = lengths > 0
+    xor = np.zeros(len(bodies), dtype=np.int64)
+    xor[nonempty] = np.bitwise_xor.reduceat(data, starts[nonempty])
+    # Checksum không phải hai chữ số hex (vd. 'ZZ') không bao giờ khớp
+    expected = np.array([int(c, 16) if len(c) == 2 and _HEX_DIGITS.issuperset(c) else -1 for c in checksums],
+                        dtype=np.int64)
+    return xor == expected
+
+def _payload_bits(payloads):
+    """Khai triển các payload 6-bit thành mảng bit (n, 6 * độ dài lớn nhất) và số bit thực của mỗi payload"""
+    lengths = np.fromiter((len(p) for p in payloads), dtype=np.int64, count=len(payloads))
+    width = int(lengths.max()) if len(lengths) else 0
+    # Ký tự '0' có giá trị 6-bit bằng 0 nên dùng để đệm
+    chars = np.frombuffer("".join(p.ljust(width, "0") for p in payloads).encode("ascii", "replace"),
+                          dtype=np.uint8).reshape(len(payloads), width)
+    values = chars - 48
+    values[values > 40] -= 8
+    bits = np.unpackbits(values[:, :, None], axis=2)[:, :, 2:].reshape(len(payloads), width * 6)
+    return bits, lengths * 6
+
+def _uint(bits, start, length):
+    field = bits[:, start:start + length].astype(np.int64)
+    return field @ (np.int64(1) << np.arange(length - 1, -1, -1, dtype=np.int64))
+
+def _int(bits, start, length):
+    value = _uint(bits, start, length)
+    return np.where(value >= 1 << (length - 1), value - (1 << length), value)
+
+def _text(bits, start, nchars):
+    codes = np.zeros((len(bits), nchars), dtype=np.int64)
+    for i in range(6):
+        codes = (codes << 1) | bits[:, start + i:start + nchars * 6:6][:, :nchars]
+    raw = _SIXBIT_TEXT[codes].view(f"S{nchars}").ravel()
+    text = pd.Series(raw).str.decode("ascii").str.rstrip("@ ").str.replace("@", "", regex=False)
+    return text.where(text != "", None).to_numpy()
+
+def _position_fields(bits, class_b):
+    """Trường vị trí của bản tin loại 1/2/3 (lớp A) hoặc 18/19 (lớp B)"""
+    offset = -4 if class_b else 0
+    fields = {
+        "MMSI": _uint(bits, 8, 30),
+        "SOG": _uint(bits, 50 + offset, 10) / 10,
+        "LON": _int(bits, 61 + offset, 28) / 600000,
+        "LAT": _int(bits, 89 + offset, 27) / 600000,
+        "COG": _uint(bits, 116 + offset, 12) / 10,
+        "Heading": _uint(bits, 128 + offset, 9).astype(np.float64),
+        "Status": np.full(len(bits), np.nan) if class_b else _uint(bits, 38, 4).astype(np.float64),
+        "TransceiverClass": "B" if class_b else "A"
+    }
+    fields["SOG"][fields["SOG"] == 102.3] = np.nan
+    fields["COG"][fields["COG"] == 360.0] = np.nan
+    fields["Heading"][fields["Heading"] == 511] = np.nan
+    return fields
+
+def _static_type5(bits, nbits):
+    imo = _uint(bits, 40, 30)
+    return {
+        "MMSI": _uint(bits, 8, 30),
+        "IMO": np.where(imo > 0, np.char.add("IMO", imo.astype(str)), None),
+        "CallSign": _text(bits, 70, 7),
+        "VesselName": _text(bits, 112, 20),
+        "VesselType": _uint(bits, 232, 8).astype(np.float64),
+        "Length": (_uint(bits, 240, 9) + _uint(bits, 249, 9)).astype(np.float64),
+        "Width": (_uint(bits, 258, 6) + _uint(bits, 264, 6)).astype(np.float64),
+        "Draft": _uint(bits, 294, 8) / 10
+    }
+
+def _static_type19(bits, nbits):
+    return {
+        "MMSI": _uint(bits, 8, 30),
+        "VesselName": _text(bits, 143, 20),
+        "VesselType": _uint(bits, 263, 8).astype(np.float64),
+        "Length": (_uint(bits, 271, 9) + _uint(bits, 280, 9)).astype(np.float64),
+        "Width": (_uint(bits, 289, 6) + _uint(bits, 295, 6)).astype(np.float64)
+    }
+
+def _static_type24(bits, nbits):
+    part = _uint(bits, 38, 2)
+    part_b = part == 1
+    dims = nbits >= 162
+    return {
+        "MMSI": _uint(bits, 8, 30),
+        "VesselName": np.where(part == 0, _text(bits, 40, 20), None),
+        "VesselType": np.where(part_b, _uint(bits, 40, 8), np.nan),
+        "CallSign": np.where(part_b, _text(bits, 90, 7), None),
+        "Length": np.where(part_b & dims, _uint(bits, 132, 9) + _uint(bits, 141, 9), np.nan),
+        "Width": np.where(part_b & dims, _uint(bits, 150, 6) + _uint(bits, 156, 6), np.nan)
+    }
+
+class AisDecoder:
+    """
+    Bộ giải mã AIS có trạng thái: ghép bản tin nhiều mảnh giữa các lô và giữ
+    thông tin tĩnh (tên, loại tàu, kích thước) mới nhất của từng MMSI để gắn vào
+    các bản tin vị trí
+    """
+
+    def __init__(self):
+        self._fragments = OrderedDict()
+        self.static = pd.DataFrame(columns=STATIC_COLUMNS, index=pd.Index([], name="MMSI", dtype=np.int64))
+        self.stats = {"sentences": 0, "bad_checksum": 0, "messages": 0, "positions": 0, "static": 0, "unsupported": 0}
+
+    def _split(self, lines, received_at):
+        """Tách câu NMEA thành (phần thân, checksum, các trường, thời điểm nhận)"""
+        bodies, checksums, parts, times = [], [], [], []
+        for line in lines:
+            line = line.strip()
+            timestamp = received_at
+            # Khối TAG (NMEA 4.10) có thể mang thời điểm nhận 'c:<unix>'
+            if line.startswith("\\"):
+                end = line.find("\\", 1)
+                for tag in line[1:end].split("*")[0].split(","):
+                    if tag.startswith("c:"):
+                        try:
+                            value = float(tag[2:])
+                            timestamp = value / 1000 if value > 1e11 else value
+                        except ValueError:
+                            pass
+                line = line[end + 1:]
+            start = line.find("!")
+            star = line.rfind("*")
+            if start < 0 or star < start:
+                continue
+            fields = line[start + 1:star].split(",")
+            if len(fields) < 7 or fields[0][-3:] not in ("VDM", "VDO"):
+                continue
+            bodies.append(line[start + 1:star])
+            checksums.append(line[star + 1:star + 3])
+            parts.append(fields)
+            times.append(timestamp)
+        return bodies, checksums, parts, times
+
+    def _assemble(self, parts, times):
+        """Ghép các mảnh thành payload đầy đủ"""
+        payloads, payload_times = [], []
+        now = time.time()
+        for fields, timestamp in zip(parts, times):
+            try:
+                count, number = int(fields[1]), int(fields[2])
+            except ValueError:
+                continue
+            if count == 1:
+                payloads.append(fields[5])
+                payload_times.append(timestamp)
+                continue
+            key = (fields[3], fields[4], count)
+            entry = self._fragments.get(key)
+            if number == 1 or entry is None:
+                entry = self._fragments[key] = {"parts": {}, "time": timestamp, "arrived": now}
+            entry["parts"][number] = fields[5]
+            if len(entry["parts"]) == count:
+                del self._fragments[key]
+                payloads.append("".join(entry["parts"].get(i, "") for i in range(1, count + 1)))
+                payload_times.append(entry["time"])
+
+        # Bỏ các bản tin không đủ mảnh sau một khoảng thời gian
+        while self._fragments and (len(self._fragments) > MAX_PENDING_FRAGMENTS or
+                                   now - next(iter(self._fragments.values()))["arrived"] > FRAGMENT_TIMEOUT_S):
+            self._fragments.popitem(last=False)
+        return payloads, payload_times
+
+    def _update_static(self, frames):
+        """Cập nhật thông tin tĩnh, giá trị mới ghi đè giá trị cũ (trừ khi rỗng)"""
+        updates = pd.concat(frames, ignore_index=True)
+        updates = updates.groupby("MMSI", sort=False).last()
+        self.static = updates.combine_first(self.static) if len(self.static) else updates.reindex(columns=STATIC_COLUMNS)
+        self.stats["static"] += len(updates)
+
+    def decode(self, lines, received_at=None):
+        """
+        Giải mã một lô câu NMEA
+
+        Parameters:
+        -----------
+        lines : list
+            Các câu NMEA (str)
+        received_at : float, optional
+            Thời điểm nhận (giây unix) dùng khi câu không có khối TAG
+
+        Returns:
+        --------
+        pandas.DataFrame
+            Các bản ghi vị trí theo cột MarineCadastre
+        """
+        received_at = time.time() if received_at is None else received_at
+        bodies, checksums, parts, times = self._split(lines, received_at)
+        self.stats["sentences"] += len(bodies)
+
+        valid = _checksums_valid(bodies, checksums)
+        self.stats["bad_checksum"] += int((~valid).sum())
+        payloads, payload_times = self._assemble([p for p, ok in zip(parts, valid) if ok],
+                                                 [t for t, ok in zip(times, valid) if ok])
+        self.stats["messages"] += len(payloads)
+        if not payloads:
+            return pd.DataFrame(columns=POSITION_COLUMNS)
+
+        # Loại bản tin nằm ở ký tự đầu tiên của payload
+        first = np.frombuffer("".join(p[:1] or "0" for p in payloads).encode("ascii", "replace"), dtype=np.uint8) - 48
+        first[first > 40] -= 8
+        payload_times = np.asarray(payload_times, dtype=np.float64)
+
+        positions, statics = [], []
+        for types, decode_static in (((1, 2, 3), None), ((18,), None), ((19,), _static_type19),
+                                     ((5,), _static_type5), ((24,), _static_type24)):
+            rows = np.flatnonzero(np.isin(first, types))
+            if not len(rows):
+                continue
+            bits, nbits = _payload_bits([payloads[i] for i in rows])
+            ok = nbits >= _MIN_BITS[types[0]]
+            bits, nbits, rows = bits[ok], nbits[ok], rows[ok]
+            if not len(rows):
+                continue
+            if types[0] in (1, 18, 19):
+                fields = _position_fields(bits, class_b=types[0] >= 18)
+                fields["_time"] = payload_times[rows]
+                positions.append(pd.DataFrame(fields))
+            if decode_static is not None:
+                statics.append(pd.DataFrame(decode_static(bits, nbits)))
+        self.stats["unsupported"] += int((~np.isin(first, (1, 2, 3, 5, 18, 19, 24))).sum())
+
+        if statics:
+            self._update_static(statics)
+        if not positions:
+            return pd.DataFrame(columns=POSITION_COLUMNS)
+
+        result = pd.concat(positions, ignore_index=True)
+        # Bỏ bản tin không có vị trí (lon=181, lat=91)
+        result = result[(result["LON"].abs() <= 180) & (result["LAT"].abs() <= 90)]
+        order = np.argsort(result["_time"].to_numpy(), kind="stable")
+        result = result.iloc[order].reset_index(drop=True)
+        result["BaseDateTime"] = pd.to_datetime(result.pop("_time"), unit="s").dt.strftime("%Y-%m-%dT%H:%M:%S")
+
+        # Gắn thông tin tĩnh mới nhất của từng tàu
+        static = self.static.reindex(result["MMSI"].to_numpy())
+        for col in STATIC_COLUMNS:
+            result[col] = static[col].to_numpy()
+        self.stats["positions"] += len(result)
+        return result[POSITION_COLUMNS]
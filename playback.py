@@ -0,0 +1,196 @@
+import numpy as np
+import pandas as pd
+
+from kinematics import MAX_GAP_S
+
+# Chỉ mục phát lại: vị trí nội suy của mỗi tàu tại các mốc thời gian cố định
+# (ví dụ mỗi 1 hoặc 5 phút). Các khung được sắp theo mốc thời gian và lưu gọn
+# (tọa độ int32 nhân 1e6, tốc độ/hướng int16 nhân 10), nên lấy một khung chỉ là
+# cắt một đoạn mảng liên tục.
+
+# Bước thời gian mặc định giữa hai khung (giây)
+DEFAULT_STEP_S = 300
+
+# Hệ số nhân tọa độ khi lưu dạng int32 (độ chính xác ~0.1 m)
+COORD_SCALE = 1_000_000
+
+# Số khung tối đa của một chỉ mục
+MAX_FRAMES = 20_000
+
+class PlaybackIndex:
+    """Vị trí các tàu tại từng khung thời gian, khung k ứng với thời điểm start + k * step"""
+
+    def __init__(self, start, step, n_frames, offsets, vessels, lat_e6, lon_e6, sog_10, cog_10):
+        self.start = start
+        self.step = step
+        self.n_frames = n_frames
+        self.offsets = offsets
+        self.vessels = vessels
+        self.lat_e6 = lat_e6
+        self.lon_e6 = lon_e6
+        self.sog_10 = sog_10
+        self.cog_10 = cog_10
+
+    def frame_index(self, t):
+        """Khung gần nhất với thời điểm t (giây), giới hạn trong chỉ mục"""
+        return int(np.clip(round((t - self.start) / self.step), 0, max(self.n_frames - 1, 0)))
+
+    def frame_time(self, k):
+        return self.start + k * self.step
+
+    def frame(self, k, bbox=None, vessels=None):
+        """
+        Vị trí các tàu trong khung k
+
+        Parameters:
+        -----------
+        k : int
+            Chỉ số khung
+        bbox : list
+            [min_lon, min_lat, max_lon, max_lat] để chỉ lấy tàu trong khung nhìn
+        vessels : numpy.ndarray, optional
+            Chỉ lấy các tàu có MMSI trong mảng này (ví dụ tàu của dữ liệu đang lọc)
+
+        Returns:
+        --------
+        dict
+            Các mảng mmsi, lat, lon, sog, cog
+        """
+        part = slice(self.offsets[k], self.offsets[k + 1])
+        lat_e6, lon_e6 = self.lat_e6[part], self.lon_e6[part]
+        index = slice(None)
+        if bbox is not None or vessels is not None:
+            inside = np.ones(len(lat_e6), dtype=bool)
+            if bbox is not None:
+                min_lon, min_lat, max_lon, max_lat = (int(round(v * COORD_SCALE)) for v in bbox)
+                inside &= (lat_e6 >= min_lat) & (lat_e6 <= max_lat)
+                if min_lon <= max_lon:
+                    inside &= (lon_e6 >= min_lon) & (lon_e6 <= max_lon)
+                else:
+                    inside &= (lon_e6 >= min_lon) | (lon_e6 <= max_lon)
+            if vessels is not None:
+                inside &= np.isin(self.vessels[part], vessels)
+            index = np.flatnonzero(inside)
+        sog, cog = self.sog_10[part][index], self.cog_10[part][index]
+        return {
+            "mmsi": self.vessels[part][index],
+            "lat": lat_e6[index] / COORD_SCALE,
+            "lon": lon_e6[index] / COORD_SCALE,
+            "sog": np.where(sog >= 0, sog / 10, np.nan),
+            "cog": np.where(cog >= 0, cog / 10, np.nan)
+        }
+
+    def frame_json(self, k, bbox=None, vessels=None):
+        """Khung k dạng cột, sẵn sàng trả về JSON (giá trị thiếu là None)"""
+        frame = self.frame(k, bbox, vessels)
+        return {
+            "frame": k,
+            "time": pd.Timestamp(self.frame_time(k), unit='s').isoformat(),
+            "mmsi": frame["mmsi"].tolist(),
+            "lat": frame["lat"].round(6).tolist(),
+            "lon": frame["lon"].round(6).tolist(),
+            "sog": [None if np.isnan(v) else v for v in frame["sog"].tolist()],
+            "cog": [None if np.isnan(v) else v for v in frame["cog"].tolist()]
+        }
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.offsets, self.vessels, self.lat_e6, self.lon_e6, self.sog_10, self.cog_10))
+
+    def summary(self):
+        return {
+            "start": pd.Timestamp(self.start, unit='s').isoformat(),
+            "end": pd.Timestamp(self.frame_time(max(self.n_frames - 1, 0)), unit='s').isoformat(),
+            "step_s": self.step,
+            "frames": self.n_frames,
+            "positions": int(len(self.vessels)),
+            "bytes": int(self.nbytes)
+        }
+
+def _scaled(values, scale, dtype):
+    """Nhân tỷ lệ và làm tròn; giá trị thiếu được lưu là -1"""
+    return np.where(np.isfinite(values), np.round(values * scale), -1).astype(dtype)
+
+def build_index(store, step_s=DEFAULT_STEP_S, max_gap_s=MAX_GAP_S):
+    """
+    Xây dựng chỉ mục phát lại từ kho hành trình
+
+    Tàu xuất hiện ở khung t nếu có hai báo cáo liên tiếp cách nhau không quá
+    max_gap_s bao quanh t (vị trí được nội suy tuyến tính), hoặc nếu có một báo
+    cáo cách t không quá nửa bước (dùng nguyên vị trí báo cáo).
+
+    Parameters:
+    -----------
+    store : trajectory.TrajectoryStore
+        Kho hành trình
+    step_s : int
+        Khoảng thời gian giữa hai khung (giây)
+    max_gap_s : int
+        Khoảng trống tối đa giữa hai báo cáo để nội suy
+
+    Returns:
+    --------
+    PlaybackIndex
+    """
+    key = ("playback", int(step_s), int(max_gap_s))
+    if key in store.derived:
+        return store.derived[key]
+
+    times = store.times
+    start = int(times.min() // step_s * step_s) if len(store) else 0
+    n_frames = int((times.max() - start) // step_s + 1) if len(store) else 0
+    if n_frames > MAX_FRAMES:
+        raise ValueError(f"Time range needs {n_frames} frames; use a larger step (limit {MAX_FRAMES})")
+
+    sogs = store.sogs.astype(np.float64) if store.sogs is not None else np.full(len(store), np.nan)
+    cogs = store.cogs.astype(np.float64) if store.cogs is not None else np.full(len(store), np.nan)
+
+    # Các cặp báo cáo liên tiếp trong cùng hành trình, đủ gần để nội suy
+    pair = np.flatnonzero(~store.track_starts()[1:]) if len(store) > 1 else np.empty(0, dtype=np.int64)
+    dt = times[pair + 1] - times[pair]
+    pair, dt = pair[(dt > 0) & (dt <= max_gap_s)], dt[(dt > 0) & (dt <= max_gap_s)]
+
+    # Các khung nằm trong [t_i, t_{i+1}) của mỗi cặp
+    first = -((start - times[pair]) // step_s)
+    last = -((start - times[pair + 1]) // step_s)
+    counts = np.maximum(last - first, 0)
+    src = np.repeat(pair, counts)
+    frames = np.repeat(first, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    frac = (start + frames * step_s - times[src]) / np.repeat(dt, counts)
+    nxt = src + 1
+
+    lat = store.lats[src] + (store.lats[nxt] - store.lats[src]) * frac
+    # Nội suy kinh độ theo đường ngắn nhất qua kinh tuyến 180
+    dlon = (store.lons[nxt] - store.lons[src] + 180) % 360 - 180
+    lon = (store.lons[src] + dlon * frac + 180) % 360 - 180
+    sog = sogs[src] + (sogs[nxt] - sogs[src]) * frac
+    cog = cogs[src]
+
+    # Báo cáo ở gần mốc thời gian: dùng cho tàu chỉ có báo cáo rời rạc và điểm cuối chuyến
+    near = np.rint((times - start) / step_s).astype(np.int64)
+
+    all_frames = np.concatenate([frames, near])
+    vessel = np.concatenate([store.mmsi[src], store.mmsi])
+    # Ưu tiên vị trí nội suy khi một tàu có cả hai trong cùng khung
+    priority = np.concatenate([np.zeros(len(frames), dtype=np.int8), np.ones(len(store), dtype=np.int8)])
+    order = np.lexsort((priority, vessel, all_frames))
+    all_frames, vessel = all_frames[order], vessel[order]
+    unique = np.r_[True, (all_frames[1:] != all_frames[:-1]) | (vessel[1:] != vessel[:-1])] if len(order) else np.empty(0, dtype=bool)
+    order, all_frames, vessel = order[unique], all_frames[unique], vessel[unique]
+
+    def column(interpolated, reported):
+        return np.concatenate([interpolated, reported])[order]
+
+    index = PlaybackIndex(
+        start=start,
+        step=int(step_s),
+        n_frames=n_frames,
+        offsets=np.searchsorted(all_frames, np.arange(n_frames + 1)).astype(np.int64),
+        vessels=vessel.astype(np.int64),
+        lat_e6=_scaled(column(lat, store.lats), COORD_SCALE, np.int32),
+        lon_e6=_scaled(column(lon, store.lons), COORD_SCALE, np.int32),
+        sog_10=_scaled(column(sog, sogs), 10, np.int16),
+        cog_10=_scaled(column(cog, cogs), 10, np.int16)
+    )
+    store.derived[key] = index
+    return index
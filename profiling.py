@@ -0,0 +1,260 @@
+import os
+import re
+import json
+import time
+import asyncio
+import cProfile
+import pstats
+import functools
+import threading
+import tracemalloc
+import contextvars
+from urllib.parse import parse_qs
+
+import metrics
+
+# Đo thời gian theo từng giai đoạn trong các hàm phân tích.
+# Mỗi giai đoạn được bao bởi span("tên"); thời gian luôn được cộng vào histogram
+# của /metrics. Khi yêu cầu có ?profile=1, các span của yêu cầu đó được ghi lại
+# cùng bộ nhớ cấp phát (tracemalloc) và trả về trong phản hồi; ?profile=cprofile
+# ghi thêm file cProfile vào AIS_PROFILE_DIR (chỉ khi biến này được đặt).
+# tracemalloc đo toàn tiến trình nên các yêu cầu được đo chạy lần lượt từng cái;
+# báo cáo cho biết có yêu cầu khác chạy xen vào hay không (khi đó số liệu bộ nhớ
+# gồm cả cấp phát của các yêu cầu đó).
+
+PROFILE_DIR = os.environ.get("AIS_PROFILE_DIR")
+
+STAGE_LATENCY = metrics.REGISTRY.add(metrics.Histogram(
+    "ais_stage_duration_seconds", "Wall time of instrumented analytics stages", ("stage",)))
+STAGE_PEAK_ALLOC = metrics.REGISTRY.add(metrics.Histogram(
+    "ais_stage_peak_alloc_bytes", "Peak traced allocation of stages in profiled requests", ("stage",),
+    metrics.SIZE_BUCKETS))
+
+# Profile của yêu cầu hiện tại và span đang mở (truyền sang luồng qua asyncio.to_thread)
+_profile = contextvars.ContextVar("ais_profile", default=None)
+_parent = contextvars.ContextVar("ais_span", default=None)
+
+# tracemalloc dùng chung cho cả tiến trình: bật khi có ít nhất một yêu cầu đang đo
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+
+def _start_tracing():
+    global _tracing_users
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _tracing_users += 1
+
+def _stop_tracing():
+    global _tracing_users
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0 and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+class Profile:
+    """Các span của một yêu cầu được đo"""
+
+    def __init__(self, cprofile=False):
+        self.spans = []
+        self.cprofile = cprofile and PROFILE_DIR is not None
+        self.stats = None
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        _start_tracing()
+        self._token = _profile.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        _profile.reset(self._token)
+        _stop_tracing()
+
+    def record(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def add_stats(self, profiler):
+        with self._lock:
+            if self.stats is None:
+                self.stats = pstats.Stats(profiler)
+            else:
+                self.stats.add(profiler)
+
+    def dump(self, name):
+        """Ghi kết quả cProfile; trả về đường dẫn file hoặc None"""
+        if self.stats is None:
+            return None
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", name).strip("_") or "root"
+        path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{slug}.prof")
+        self.stats.dump_stats(path)
+        return path
+
+    def report(self):
+        """Các giai đoạn theo thứ tự bắt đầu; span cùng tên (ví dụ trong vòng lặp) được cộng dồn"""
+        stages = {}
+        for s in sorted(self.spans, key=lambda s: s.start):
+            entry = stages.setdefault(s.stage, {"stage": s.stage, "depth": s.depth, "calls": 0, "wall_ms": 0.0,
+                                                "alloc_bytes": None, "peak_alloc_bytes": None})
+            entry["calls"] += 1
+            entry["wall_ms"] += s.wall_s * 1000
+            if s.alloc is not None:
+                entry["alloc_bytes"] = (entry["alloc_bytes"] or 0) + s.alloc
+                entry["peak_alloc_bytes"] = max(entry["peak_alloc_bytes"] or 0, s.peak)
+        for entry in stages.values():
+            entry["wall_ms"] = round(entry["wall_ms"], 3)
+        return {
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            "spans": list(stages.values())
+        }
+
+class span:
+    """
+    Đo một giai đoạn: with profiling.span("dbscan"): ...
+
+    Tên giai đoạn được ghép với span cha (ví dụ detect_vessel_groups/dbscan).
+    """
+
+    __slots__ = ("stage", "depth", "start", "wall_s", "alloc", "peak", "_peak_seen", "_mem_start",
+                 "_profile", "_token", "_profiler")
+
+    def __init__(self, name):
+        parent = _parent.get()
+        self.stage = f"{parent.stage}/{name}" if parent is not None else name
+        self.depth = parent.depth + 1 if parent is not None else 0
+        self.alloc = self.peak = self._mem_start = None
+        self._profiler = None
+
+    def __enter__(self):
+        self._profile = _profile.get()
+        self._token = _parent.set(self)
+        if self._profile is not None and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            parent = self._parent_span()
+            if parent is not None:
+                parent._peak_seen = max(parent._peak_seen, peak)
+            tracemalloc.reset_peak()
+            self._mem_start = self._peak_seen = current
+            # cProfile chỉ bật ở span ngoài cùng, trong luồng đang chạy giai đoạn đó
+            if self._profile.cprofile and self.depth == 0:
+                self._profiler = cProfile.Profile()
+                self._profiler.enable()
+        self.start = time.perf_counter()
+        return self
+
+    def _parent_span(self):
+        parent = self._token.old_value
+        return parent if isinstance(parent, span) else None
+
+    def __exit__(self, *exc):
+        self.wall_s = time.perf_counter() - self.start
+        _parent.reset(self._token)
+        STAGE_LATENCY.observe(self.wall_s, self.stage)
+        if self._profile is None:
+            return False
+
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profile.add_stats(self._profiler)
+        if self._mem_start is not None and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            self.alloc = current - self._mem_start
+            self.peak = max(self._peak_seen, peak) - self._mem_start
+            tracemalloc.reset_peak()
+            parent = self._parent_span()
+            if parent is not None:
+                parent._peak_seen = max(parent._peak_seen, peak)
+            STAGE_PEAK_ALLOC.observe(self.peak, self.stage)
+        self._profile.record(self)
+        return False
+
+def profiled(fn):
+    """Bao cả hàm trong một span mang tên hàm"""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with span(fn.__name__):
+            return fn(*args, **kwargs)
+    return wrapper
+
+def _server_timing(report):
+    """Header Server-Timing (hiển thị trong công cụ phát triển của trình duyệt)"""
+    entries = [f"total;dur={report['total_ms']}"]
+    for s in report["spans"]:
+        entries.append(f"s{len(entries)};desc=\"{s['stage']}\";dur={s['wall_ms']}")
+    return ", ".join(entries)
+
+class ProfilingMiddleware:
+    """
+    Middleware ASGI xử lý ?profile=1 và ?profile=cprofile
+
+    Phản hồi của yêu cầu được đo sẽ được giữ lại đến khi xong: phản hồi JSON dạng
+    object có thêm khóa "profile"; mọi phản hồi có thêm header Server-Timing.
+    Các yêu cầu được đo chạy lần lượt; "memory_isolated" trong báo cáo là False
+    khi có yêu cầu không đo chạy cùng lúc.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        # Chỉ một yêu cầu được đo tại một thời điểm (tracemalloc và reset_peak dùng chung)
+        self._profile_lock = asyncio.Lock()
+        # Số yêu cầu không đo đang chạy và tổng số đã bắt đầu, để phát hiện yêu cầu chạy xen
+        self._active = 0
+        self._started = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        mode = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("profile", [None])[-1]
+        if mode not in ("1", "true", "cprofile"):
+            self._active += 1
+            self._started += 1
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                self._active -= 1
+            return
+
+        start_message = None
+        chunks = []
+
+        async def capture(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    return
+            else:
+                await send(message)
+
+        async with self._profile_lock:
+            started, active = self._started, self._active
+            with Profile(cprofile=mode == "cprofile") as profile:
+                await self.app(scope, receive, capture)
+            concurrent = active > 0 or self._started != started
+
+        report = profile.report()
+        # Bộ nhớ chỉ đúng cho riêng yêu cầu này khi không có yêu cầu nào khác chạy cùng lúc
+        report["memory_isolated"] = not concurrent
+        if mode == "cprofile":
+            report["cprofile"] = profile.dump(scope["path"]) if PROFILE_DIR else "disabled (set AIS_PROFILE_DIR)"
+
+        body = b"".join(chunks)
+        headers = [(k, v) for k, v in start_message["headers"] if k.lower() != b"content-length"]
+        content_type = next((v for k, v in headers if k.lower() == b"content-type"), b"")
+        if content_type.startswith(b"application/json"):
+            try:
+                payload = json.loads(body)
+                if isinstance(payload, dict):
+                    payload["profile"] = report
+                    body = json.dumps(payload).encode()
+            except ValueError:
+                pass
+        headers.append((b"server-timing", _server_timing(report).encode("latin-1", "replace")))
+        headers.append((b"content-length", str(len(body)).encode()))
+        await send({**start_message, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
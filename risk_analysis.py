@@ -7,7 +7,27 @@ import matplotlib.pyplot as plt
 import io
 import base64
 
-def calculate_risk_scores(df):
+import baselines
+import hazards
+import weather
+import profiling
+import trajectory
+
+# Các cột rủi ro được thêm vào dữ liệu
+RISK_COLUMNS = ['CollisionRisk', 'WeatherRisk', 'RouteDeviation', 'SpeedAnomaly', 'NavigationHazard', 'RiskScore']
+
+# Phiên bản mô hình điểm rủi ro: tăng khi cách tính thay đổi để bỏ qua điểm đã lưu
+MODEL_VERSION = 2
+
+# Bán kính ảnh hưởng của chướng ngại vật thực tế (5 hải lý)
+HAZARD_INFLUENCE_KM = 9.26
+
+# Độ lệch hành trình ứng với điểm rủi ro tối đa (1 hải lý)
+ROUTE_DEVIATION_KM = 1.852
+
+@profiling.profiled
+def calculate_risk_scores(df, columns_only=False, hazard_layer=None, weather_layer=None, trajectories=None,
+                          speed_baselines=None):
     """
     Tính toán điểm rủi ro cho các tàu dựa trên dữ liệu AIS
     
@@ -15,6 +35,18 @@ def calculate_risk_scores(df):
     -----------
     df : pandas.DataFrame
         DataFrame chứa dữ liệu AIS
+    columns_only : bool
+        Chỉ trả về các cột rủi ro (cùng chỉ số dòng với df) thay vì
+        bản sao đầy đủ của dữ liệu
+    hazard_layer : hazards.HazardLayer, optional
+        Lớp chướng ngại vật thực tế; nếu không có sẽ dùng dữ liệu giả lập
+    weather_layer : weather.WeatherLayer, optional
+        Lưới thời tiết (gió, sóng); nếu không có sẽ dùng dữ liệu giả lập
+    trajectories : trajectory.TrajectoryStore, optional
+        Kho hành trình của df; nếu có, độ lệch tuyến được đo so với hành trình
+        của chính tàu thay vì vị trí trung bình của loại tàu
+    speed_baselines : baselines.SpeedBaselines, optional
+        Đường cơ sở tốc độ theo loại tàu và vùng; nếu không có sẽ dựng từ df
     
     Returns:
     --------
@@ -22,148 +54,170 @@ def calculate_risk_scores(df):
         DataFrame với các cột rủi ro được thêm vào
     """
     try:
-        # Tạo bản sao của DataFrame để không ảnh hưởng đến dữ liệu gốc
-        risk_df = df.copy()
-        
         # Tìm các cột cần thiết
         lat_col = next((col for col in ['LAT', 'Latitude', 'lat', 'latitude'] if col in df.columns), None)
         lon_col = next((col for col in ['LON', 'Longitude', 'lon', 'longitude'] if col in df.columns), None)
         speed_col = next((col for col in ['SOG', 'Speed', 'speed'] if col in df.columns), None)
         course_col = next((col for col in ['COG', 'Course', 'course'] if col in df.columns), None)
         vessel_col = next((col for col in ['VesselType', 'ShipType', 'vessel_type'] if col in df.columns), None)
+        time_col = next((col for col in ['BaseDateTime', 'DateTime', 'Timestamp', 'date_time'] if col in df.columns), None)
         
         if not all([lat_col, lon_col, speed_col]):
             return {"error": "Thiếu các cột dữ liệu cần thiết"}
         
-        # 1. Tính toán rủi ro va chạm dựa trên mật độ tàu
-        # Tạo lưới không gian và đếm số lượng tàu trong mỗi ô
-        lat_bins = np.linspace(df[lat_col].min(), df[lat_col].max(), 20)
-        lon_bins = np.linspace(df[lon_col].min(), df[lon_col].max(), 20)
-        
-        # Gán nhóm cho mỗi tàu
-        risk_df['lat_bin'] = pd.cut(risk_df[lat_col], bins=lat_bins, labels=False)
-        risk_df['lon_bin'] = pd.cut(risk_df[lon_col], bins=lon_bins, labels=False)
-        
-        # Đếm số lượng tàu trong mỗi ô lưới
-        grid_counts = risk_df.groupby(['lat_bin', 'lon_bin']).size().reset_index(name='vessel_count')
-        
-        # Gộp lại với DataFrame gốc
-        risk_df = pd.merge(risk_df, grid_counts, on=['lat_bin', 'lon_bin'], how='left')
+        # Chỉ lấy các cột dùng để tính toán; nhờ copy-on-write, các cột thêm vào
+        # risk_df không sao chép và không ghi vào dữ liệu dùng chung
+        used_cols = [col for col in [lat_col, lon_col, speed_col, vessel_col, time_col] if col]
+        risk_df = df[used_cols]
         
-        # Chuẩn hóa số lượng tàu thành điểm rủi ro va chạm (0-100)
-        max_count = risk_df['vessel_count'].max()
-        risk_df['CollisionRisk'] = (risk_df['vessel_count'] / max_count * 100).clip(0, 100)
+        with profiling.span("collision"):
+            # 1. Tính toán rủi ro va chạm dựa trên mật độ tàu
+            # Tạo lưới không gian và đếm số lượng tàu trong mỗi ô
+            lat_bins = np.linspace(df[lat_col].min(), df[lat_col].max(), 20)
+            lon_bins = np.linspace(df[lon_col].min(), df[lon_col].max(), 20)
         
-        # 2. Tính toán rủi ro thời tiết (giả lập)
-        # Trong thực tế, sẽ sử dụng dữ liệu thời tiết thực tế
-        # Ở đây, chúng ta giả lập dựa trên vị trí và thời gian
-        np.random.seed(42)  # Để kết quả nhất quán
-        risk_df['WeatherRisk'] = np.random.uniform(20, 80, size=len(risk_df))
+            # Gán nhóm cho mỗi tàu
+            risk_df['lat_bin'] = pd.cut(risk_df[lat_col], bins=lat_bins, labels=False)
+            risk_df['lon_bin'] = pd.cut(risk_df[lon_col], bins=lon_bins, labels=False)
         
-        # Điều chỉnh rủi ro thời tiết dựa trên vĩ độ (giả định thời tiết xấu hơn ở vĩ độ cao)
-        risk_df['WeatherRisk'] = risk_df['WeatherRisk'] + (abs(risk_df[lat_col]) / 90 * 20)
-        risk_df['WeatherRisk'] = risk_df['WeatherRisk'].clip(0, 100)
+            # Đếm số lượng tàu trong mỗi ô lưới
+            grid_counts = risk_df.groupby(['lat_bin', 'lon_bin']).size().reset_index(name='vessel_count')
         
-        # 3. Tính toán rủi ro lệch tuyến đường
-        if vessel_col in risk_df.columns:
-            # Tính trung bình vị trí cho mỗi loại tàu
-            vessel_avg_positions = risk_df.groupby(vessel_col)[[lat_col, lon_col]].mean().reset_index()
-            vessel_avg_positions.columns = [vessel_col, 'avg_lat', 'avg_lon']
-            
             # Gộp lại với DataFrame gốc
-            risk_df = pd.merge(risk_df, vessel_avg_positions, on=vessel_col, how='left')
+            risk_df = pd.merge(risk_df, grid_counts, on=['lat_bin', 'lon_bin'], how='left')
+        
+            # Chuẩn hóa số lượng tàu thành điểm rủi ro va chạm (0-100)
+            max_count = risk_df['vessel_count'].max()
+            risk_df['CollisionRisk'] = (risk_df['vessel_count'] / max_count * 100).clip(0, 100)
+        
+        with profiling.span("weather"):
+            # 2. Tính toán rủi ro thời tiết
+            if weather_layer is not None and time_col:
+                # Lấy mẫu gió và sóng từ lưới thời tiết tại vị trí và thời điểm của từng bản ghi
+                # Thời gian đã phân tích lấy từ bộ nhớ đệm cột dẫn xuất của tập dữ liệu
+                seconds, valid_time = trajectory.frame_times(df)
+                times_s = np.where(valid_time, seconds, np.nan)
+                risk_df['WeatherRisk'] = weather.weather_risk(weather_layer, risk_df[lat_col].to_numpy(),
+                                                              risk_df[lon_col].to_numpy(), times_s)
+                # Vị trí nằm ngoài lưới thời tiết nhận giá trị mặc định
+                risk_df['WeatherRisk'] = risk_df['WeatherRisk'].fillna(50)
+            else:
+                # Giả lập dựa trên vị trí khi chưa nạp lưới thời tiết
+                np.random.seed(42)  # Để kết quả nhất quán
+                risk_df['WeatherRisk'] = np.random.uniform(20, 80, size=len(risk_df))
+            
+                # Điều chỉnh rủi ro thời tiết dựa trên vĩ độ (giả định thời tiết xấu hơn ở vĩ độ cao)
+                risk_df['WeatherRisk'] = risk_df['WeatherRisk'] + (abs(risk_df[lat_col]) / 90 * 20)
+                risk_df['WeatherRisk'] = risk_df['WeatherRisk'].clip(0, 100)
+        
+        with profiling.span("route_deviation"):
+            # 3. Tính toán rủi ro lệch tuyến đường
+            if trajectories is not None and len(trajectories) > 0:
+                # Độ lệch so với vị trí nội suy giữa hai báo cáo kề nhau của chính tàu đó
+                deviation_km = trajectories.to_row_order(trajectories.route_deviation_km(), df.index)
+                route_risk = np.clip(deviation_km / ROUTE_DEVIATION_KM * 100, 0, 100)
+                # Bản ghi không thuộc hành trình nào (thiếu thời gian/MMSI) nhận giá trị mặc định
+                risk_df['RouteDeviation'] = np.where(np.isnan(route_risk), 50, route_risk)
+            elif vessel_col in risk_df.columns:
+                # Tính trung bình vị trí cho mỗi loại tàu
+                vessel_avg_positions = risk_df.groupby(vessel_col)[[lat_col, lon_col]].mean().reset_index()
+                vessel_avg_positions.columns = [vessel_col, 'avg_lat', 'avg_lon']
             
-            # Tính khoảng cách từ vị trí hiện tại đến vị trí trung bình
-            risk_df['dist_from_avg'] = np.sqrt((risk_df[lat_col] - risk_df['avg_lat'])**2 + 
-                                              (risk_df[lon_col] - risk_df['avg_lon'])**2)
+                # Gộp lại với DataFrame gốc
+                risk_df = pd.merge(risk_df, vessel_avg_positions, on=vessel_col, how='left')
             
-            # Chuẩn hóa thành điểm rủi ro lệch tuyến đường
-            max_dist = risk_df['dist_from_avg'].max()
-            if max_dist > 0:
-                risk_df['RouteDeviation'] = (risk_df['dist_from_avg'] / max_dist * 100).clip(0, 100)
+                # Tính khoảng cách từ vị trí hiện tại đến vị trí trung bình
+                risk_df['dist_from_avg'] = np.sqrt((risk_df[lat_col] - risk_df['avg_lat'])**2 + 
+                                                  (risk_df[lon_col] - risk_df['avg_lon'])**2)
+            
+                # Chuẩn hóa thành điểm rủi ro lệch tuyến đường
+                max_dist = risk_df['dist_from_avg'].max()
+                if max_dist > 0:
+                    risk_df['RouteDeviation'] = (risk_df['dist_from_avg'] / max_dist * 100).clip(0, 100)
+                else:
+                    risk_df['RouteDeviation'] = 0
             else:
-                risk_df['RouteDeviation'] = 0
-        else:
-            # Nếu không có thông tin loại tàu, gán giá trị mặc định
-            risk_df['RouteDeviation'] = 50
-        
-        # 4. Tính toán rủi ro tốc độ bất thường
-        if speed_col in risk_df.columns:
-            # Tính ngưỡng tốc độ bất thường (phương pháp IQR)
-            Q1 = risk_df[speed_col].quantile(0.25)
-            Q3 = risk_df[speed_col].quantile(0.75)
-            IQR = Q3 - Q1
+                # Nếu không có thông tin loại tàu, gán giá trị mặc định
+                risk_df['RouteDeviation'] = 50
+        
+        with profiling.span("speed_anomaly"):
+            # 4. Tính toán rủi ro tốc độ bất thường
+            if speed_col in risk_df.columns:
+                # Độ lệch so với ngưỡng IQR của đường cơ sở theo (loại tàu, vùng)
+                if speed_baselines is None:
+                    speed_baselines = baselines.SpeedBaselines.build(risk_df)
+                speed_deviation, _, _ = speed_baselines.score(risk_df)
             
-            lower_bound = Q1 - 1.5 * IQR
-            upper_bound = Q3 + 1.5 * IQR
+                # Chuẩn hóa thành điểm rủi ro tốc độ bất thường (không có tốc độ: 0)
+                risk_df['SpeedAnomaly'] = np.nan_to_num(speed_deviation, nan=0.0)
+            else:
+                # Nếu không có thông tin tốc độ, gán giá trị mặc định
+                risk_df['SpeedAnomaly'] = 50
+        
+        with profiling.span("navigation_hazard"):
+            # 5. Tính toán rủi ro chướng ngại vật hàng hải
+            if hazard_layer is not None:
+                # Khoảng cách tới chướng ngại vật gần nhất từ chỉ mục không gian
+                dist_km = hazards.nearest_hazard_km(hazard_layer, risk_df[lat_col].to_numpy(), risk_df[lon_col].to_numpy(),
+                                                    max_km=HAZARD_INFLUENCE_KM)
+                risk_df['NavigationHazard'] = np.clip(1 - dist_km / HAZARD_INFLUENCE_KM, 0, 1) * 100
+            else:
+                # Giả lập dựa trên vị trí khi chưa nạp lớp chướng ngại vật
+                np.random.seed(123)  # Để kết quả nhất quán
+                risk_df['NavigationHazard'] = np.random.uniform(10, 60, size=len(risk_df))
             
-            # Tính độ lệch so với ngưỡng
-            risk_df['speed_deviation'] = 0
-            risk_df.loc[risk_df[speed_col] < lower_bound, 'speed_deviation'] = (lower_bound - risk_df[speed_col]) / lower_bound * 100
-            risk_df.loc[risk_df[speed_col] > upper_bound, 'speed_deviation'] = (risk_df[speed_col] - upper_bound) / upper_bound * 100
+                # Tạo một số "điểm nóng" nguy hiểm
+                hazard_points = [
+                    {'lat': df[lat_col].min() + (df[lat_col].max() - df[lat_col].min()) * 0.3, 
+                     'lon': df[lon_col].min() + (df[lon_col].max() - df[lon_col].min()) * 0.7},
+                    {'lat': df[lat_col].min() + (df[lat_col].max() - df[lat_col].min()) * 0.7, 
+                     'lon': df[lon_col].min() + (df[lon_col].max() - df[lon_col].min()) * 0.2},
+                    {'lat': df[lat_col].min() + (df[lat_col].max() - df[lat_col].min()) * 0.5, 
+                     'lon': df[lon_col].min() + (df[lon_col].max() - df[lon_col].min()) * 0.5}
+                ]
             
-            # Chuẩn hóa thành điểm rủi ro tốc độ bất thường
-            risk_df['SpeedAnomaly'] = risk_df['speed_deviation'].clip(0, 100)
-        else:
-            # Nếu không có thông tin tốc độ, gán giá trị mặc định
-            risk_df['SpeedAnomaly'] = 50
-        
-        # 5. Tính toán rủi ro chướng ngại vật hàng hải (giả lập)
-        # Trong thực tế, sẽ sử dụng dữ liệu về chướng ngại vật thực tế
-        # Ở đây, chúng ta giả lập dựa trên vị trí
-        np.random.seed(123)  # Để kết quả nhất quán
-        risk_df['NavigationHazard'] = np.random.uniform(10, 60, size=len(risk_df))
-        
-        # Tạo một số "điểm nóng" nguy hiểm
-        hazard_points = [
-            {'lat': df[lat_col].min() + (df[lat_col].max() - df[lat_col].min()) * 0.3, 
-             'lon': df[lon_col].min() + (df[lon_col].max() - df[lon_col].min()) * 0.7},
-            {'lat': df[lat_col].min() + (df[lat_col].max() - df[lat_col].min()) * 0.7, 
-             'lon': df[lon_col].min() + (df[lon_col].max() - df[lon_col].min()) * 0.2},
-            {'lat': df[lat_col].min() + (df[lat_col].max() - df[lat_col].min()) * 0.5, 
-             'lon': df[lon_col].min() + (df[lon_col].max() - df[lon_col].min()) * 0.5}
-        ]
-        
-        # Tính khoảng cách đến các điểm nguy hiểm và tăng rủi ro nếu gần
-        for point in hazard_points:
-            dist = np.sqrt((risk_df[lat_col] - point['lat'])**2 + (risk_df[lon_col] - point['lon'])**2)
-            max_effect_dist = 0.1  # Ngưỡng khoảng cách có ảnh hưởng
-            risk_increase = np.maximum(0, (1 - dist / max_effect_dist) * 40)  # Tăng tối đa 40 điểm
-            risk_df['NavigationHazard'] = np.minimum(100, risk_df['NavigationHazard'] + risk_increase)
-        
-        # 6. Tính điểm rủi ro tổng hợp
-        # Trọng số cho từng loại rủi ro
-        weights = {
-            'CollisionRisk': 0.3,
-            'WeatherRisk': 0.2,
-            'RouteDeviation': 0.15,
-            'SpeedAnomaly': 0.2,
-            'NavigationHazard': 0.15
-        }
-        
-        # Tính điểm rủi ro tổng hợp
-        risk_df['RiskScore'] = (
-            weights['CollisionRisk'] * risk_df['CollisionRisk'] +
-            weights['WeatherRisk'] * risk_df['WeatherRisk'] +
-            weights['RouteDeviation'] * risk_df['RouteDeviation'] +
-            weights['SpeedAnomaly'] * risk_df['SpeedAnomaly'] +
-            weights['NavigationHazard'] * risk_df['NavigationHazard']
-        )
-        
-        # Làm tròn các giá trị
-        for col in ['CollisionRisk', 'WeatherRisk', 'RouteDeviation', 'SpeedAnomaly', 'NavigationHazard', 'RiskScore']:
-            risk_df[col] = risk_df[col].round(1)
-        
-        # Loại bỏ các cột tạm thời
-        risk_df = risk_df.drop(['lat_bin', 'lon_bin', 'vessel_count', 'dist_from_avg', 'speed_deviation'], axis=1, errors='ignore')
-        if 'avg_lat' in risk_df.columns:
-            risk_df = risk_df.drop(['avg_lat', 'avg_lon'], axis=1)
-        
-        return risk_df
+                # Tính khoảng cách đến các điểm nguy hiểm và tăng rủi ro nếu gần
+                for point in hazard_points:
+                    dist = np.sqrt((risk_df[lat_col] - point['lat'])**2 + (risk_df[lon_col] - point['lon'])**2)
+                    max_effect_dist = 0.1  # Ngưỡng khoảng cách có ảnh hưởng
+                    risk_increase = np.maximum(0, (1 - dist / max_effect_dist) * 40)  # Tăng tối đa 40 điểm
+                    risk_df['NavigationHazard'] = np.minimum(100, risk_df['NavigationHazard'] + risk_increase)
+        
+        with profiling.span("combine"):
+            # 6. Tính điểm rủi ro tổng hợp
+            # Trọng số cho từng loại rủi ro
+            weights = {
+                'CollisionRisk': 0.3,
+                'WeatherRisk': 0.2,
+                'RouteDeviation': 0.15,
+                'SpeedAnomaly': 0.2,
+                'NavigationHazard': 0.15
+            }
+        
+            # Tính điểm rủi ro tổng hợp
+            risk_df['RiskScore'] = (
+                weights['CollisionRisk'] * risk_df['CollisionRisk'] +
+                weights['WeatherRisk'] * risk_df['WeatherRisk'] +
+                weights['RouteDeviation'] * risk_df['RouteDeviation'] +
+                weights['SpeedAnomaly'] * risk_df['SpeedAnomaly'] +
+                weights['NavigationHazard'] * risk_df['NavigationHazard']
+            )
+        
+            # Làm tròn các giá trị
+            for col in ['CollisionRisk', 'WeatherRisk', 'RouteDeviation', 'SpeedAnomaly', 'NavigationHazard', 'RiskScore']:
+                risk_df[col] = risk_df[col].round(1)
+        
+        # Các phép merge ở trên đặt lại chỉ số, gắn lại chỉ số dòng của dữ liệu gốc
+        risk_columns = risk_df[RISK_COLUMNS].set_axis(df.index)
+        if columns_only:
+            return risk_columns
+        
+        return pd.concat([df, risk_columns], axis=1)
     
     except Exception as e:
         return {"error": str(e)}
 
+@profiling.profiled
 def identify_risky_routes(df, risk_threshold=70):
     """
     Xác định các hành trình có rủi ro cao
@@ -200,52 +254,53 @@ def identify_risky_routes(df, risk_threshold=70):
         # Tạo danh sách các hành trình có rủi ro cao
         risky_routes = []
         
-        # Nhóm theo tàu (MMSI)
-        if mmsi_col:
-            for mmsi, group in risky_vessels.groupby(mmsi_col):
-                vessel_name = group[vessel_name_col].iloc[0] if vessel_name_col in group.columns else "Unknown"
-                vessel_type = group[vessel_type_col].iloc[0] if vessel_type_col in group.columns else "Unknown"
+        with profiling.span("routes"):
+            # Nhóm theo tàu (MMSI)
+            if mmsi_col:
+                for mmsi, group in risky_vessels.groupby(mmsi_col):
+                    vessel_name = group[vessel_name_col].iloc[0] if vessel_name_col in group.columns else "Unknown"
+                    vessel_type = group[vessel_type_col].iloc[0] if vessel_type_col in group.columns else "Unknown"
                 
-                # Lấy điểm rủi ro cao nhất
-                max_risk_idx = group['RiskScore'].idxmax()
-                max_risk_row = group.loc[max_risk_idx]
+                    # Lấy điểm rủi ro cao nhất
+                    max_risk_idx = group['RiskScore'].idxmax()
+                    max_risk_row = group.loc[max_risk_idx]
                 
-                # Tạo mô tả rủi ro
-                risk_descriptions = []
-                if max_risk_row['CollisionRisk'] >= 70:
-                    risk_descriptions.append("nguy cơ va chạm cao")
-                if max_risk_row['WeatherRisk'] >= 70:
-                    risk_descriptions.append("điều kiện thời tiết xấu")
-                if max_risk_row['RouteDeviation'] >= 70:
-                    risk_descriptions.append("lệch tuyến đường đáng kể")
-                if max_risk_row['SpeedAnomaly'] >= 70:
-                    risk_descriptions.append("tốc độ bất thường")
-                if max_risk_row['NavigationHazard'] >= 70:
-                    risk_descriptions.append("gần chướng ngại vật nguy hiểm")
+                    # Tạo mô tả rủi ro
+                    risk_descriptions = []
+                    if max_risk_row['CollisionRisk'] >= 70:
+                        risk_descriptions.append("nguy cơ va chạm cao")
+                    if max_risk_row['WeatherRisk'] >= 70:
+                        risk_descriptions.append("điều kiện thời tiết xấu")
+                    if max_risk_row['RouteDeviation'] >= 70:
+                        risk_descriptions.append("lệch tuyến đường đáng kể")
+                    if max_risk_row['SpeedAnomaly'] >= 70:
+                        risk_descriptions.append("tốc độ bất thường")
+                    if max_risk_row['NavigationHazard'] >= 70:
+                        risk_descriptions.append("gần chướng ngại vật nguy hiểm")
                 
-                if not risk_descriptions:
-                    risk_descriptions.append("nhiều yếu tố rủi ro kết hợp")
+                    if not risk_descriptions:
+                        risk_descriptions.append("nhiều yếu tố rủi ro kết hợp")
                 
-                description = "Tàu đang có " + ", ".join(risk_descriptions)
+                    description = "Tàu đang có " + ", ".join(risk_descriptions)
                 
-                # Tạo đối tượng hành trình rủi ro
-                route = {
-                    'mmsi': mmsi,
-                    'vesselName': vessel_name,
-                    'vesselType': vessel_type,
-                    'riskScore': float(max_risk_row['RiskScore']),
-                    'riskFactors': {
-                        'collision': float(max_risk_row['CollisionRisk']),
-                        'weather': float(max_risk_row['WeatherRisk']),
-                        'route': float(max_risk_row['RouteDeviation']),
-                        'speed': float(max_risk_row['SpeedAnomaly']),
-                        'navigation': float(max_risk_row['NavigationHazard'])
-                    },
-                    'location': [float(max_risk_row[lat_col]), float(max_risk_row[lon_col])] if lat_col and lon_col else [0, 0],
-                    'description': description
-                }
+                    # Tạo đối tượng hành trình rủi ro
+                    route = {
+                        'mmsi': mmsi,
+                        'vesselName': vessel_name,
+                        'vesselType': vessel_type,
+                        'riskScore': float(max_risk_row['RiskScore']),
+                        'riskFactors': {
+                            'collision': float(max_risk_row['CollisionRisk']),
+                            'weather': float(max_risk_row['WeatherRisk']),
+                            'route': float(max_risk_row['RouteDeviation']),
+                            'speed': float(max_risk_row['SpeedAnomaly']),
+                            'navigation': float(max_risk_row['NavigationHazard'])
+                        },
+                        'location': [float(max_risk_row[lat_col]), float(max_risk_row[lon_col])] if lat_col and lon_col else [0, 0],
+                        'description': description
+                    }
                 
-                risky_routes.append(route)
+                    risky_routes.append(route)
         
         # Sắp xếp theo điểm rủi ro giảm dần
         risky_routes.sort(key=lambda x: x['riskScore'], reverse=True)
@@ -255,6 +310,7 @@ def identify_risky_routes(df, risk_threshold=70):
     except Exception as e:
         return {"error": str(e)}
 
+@profiling.profiled
 def generate_risk_map(df):
     """
     Tạo bản đồ hiển thị các khu vực có rủi ro cao sử dụng Leaflet
@@ -341,12 +397,13 @@ def generate_risk_map(df):
                 var heatData = [
         '''
         
-        # Tạo dữ liệu cho bản đồ nhiệt rủi ro
-        heat_data = []
-        for _, row in df_clean.iterrows():
-            # Trọng số dựa trên điểm rủi ro
-            weight = float(row['RiskScore']) / 100 * 2  # Nhân với 2 để tăng cường hiệu ứng
-            heat_data.append(f"[{float(row[lat_col])}, {float(row[lon_col])}, {weight}]")
+        with profiling.span("heat_data"):
+            # Tạo dữ liệu cho bản đồ nhiệt rủi ro
+            heat_data = []
+            for _, row in df_clean.iterrows():
+                # Trọng số dựa trên điểm rủi ro
+                weight = float(row['RiskScore']) / 100 * 2  # Nhân với 2 để tăng cường hiệu ứng
+                heat_data.append(f"[{float(row[lat_col])}, {float(row[lon_col])}, {weight}]")
         
         # Thêm dữ liệu vào mã JavaScript
         map_html += ',\n                    '.join(heat_data)
@@ -374,33 +431,34 @@ def generate_risk_map(df):
                 var highRiskPoints = [
         '''
         
-        # Thêm các điểm rủi ro cao
-        high_risk_points = []
-        for _, row in high_risk_vessels.iterrows():
-            # Tạo popup text
-            popup_text = f"Điểm rủi ro: {row['RiskScore']}"
+        with profiling.span("high_risk_points"):
+            # Thêm các điểm rủi ro cao
+            high_risk_points = []
+            for _, row in high_risk_vessels.iterrows():
+                # Tạo popup text
+                popup_text = f"Điểm rủi ro: {row['RiskScore']}"
             
-            if mmsi_col and mmsi_col in row:
-                popup_text += f"<br>MMSI: {row[mmsi_col]}"
+                if mmsi_col and mmsi_col in row:
+                    popup_text += f"<br>MMSI: {row[mmsi_col]}"
             
-            if vessel_name_col and vessel_name_col in row:
-                popup_text += f"<br>Tàu: {row[vessel_name_col]}"
+                if vessel_name_col and vessel_name_col in row:
+                    popup_text += f"<br>Tàu: {row[vessel_name_col]}"
             
-            if vessel_type_col and vessel_type_col in row:
-                popup_text += f"<br>Loại: {row[vessel_type_col]}"
+                if vessel_type_col and vessel_type_col in row:
+                    popup_text += f"<br>Loại: {row[vessel_type_col]}"
             
-            popup_text += f"<br>Vị trí: {row[lat_col]:.4f}, {row[lon_col]:.4f}"
-            popup_text += "<br>Các yếu tố rủi ro:"
-            popup_text += f"<br>- Va chạm: {row['CollisionRisk']}"
-            popup_text += f"<br>- Thời tiết: {row['WeatherRisk']}"
-            popup_text += f"<br>- Lệch tuyến: {row['RouteDeviation']}"
-            popup_text += f"<br>- Tốc độ bất thường: {row['SpeedAnomaly']}"
-            popup_text += f"<br>- Chướng ngại vật: {row['NavigationHazard']}"
+                popup_text += f"<br>Vị trí: {row[lat_col]:.4f}, {row[lon_col]:.4f}"
+                popup_text += "<br>Các yếu tố rủi ro:"
+                popup_text += f"<br>- Va chạm: {row['CollisionRisk']}"
+                popup_text += f"<br>- Thời tiết: {row['WeatherRisk']}"
+                popup_text += f"<br>- Lệch tuyến: {row['RouteDeviation']}"
+                popup_text += f"<br>- Tốc độ bất thường: {row['SpeedAnomaly']}"
+                popup_text += f"<br>- Chướng ngại vật: {row['NavigationHazard']}"
             
-            # Escape single quotes
-            popup_text = popup_text.replace("'", "\\'") 
+                # Escape single quotes
+                popup_text = popup_text.replace("'", "\\'") 
             
-            high_risk_points.append(f"[{float(row[lat_col])}, {float(row[lon_col])}, '{popup_text}']")
+                high_risk_points.append(f"[{float(row[lat_col])}, {float(row[lon_col])}, '{popup_text}']")
         
         # Thêm các điểm vào mã JavaScript
         map_html += ',\n                    '.join(high_risk_points)
@@ -0,0 +1,140 @@
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+
+import risk_analysis
+
+# Kho lưu điểm rủi ro dạng cột, gắn với phiên bản dữ liệu và mã dòng.
+# Điểm rủi ro được tính một lần trên toàn bộ dữ liệu gốc, lưu dưới dạng
+# int16 (đơn vị 0.1 điểm) và chỉ được ghép vào dữ liệu đang lọc khi cần.
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cache", "risk")
+
+# Giá trị int16 dùng để biểu diễn NaN
+_MISSING = np.iinfo(np.int16).min
+
+# Số phiên bản được giữ lại trên đĩa
+MAX_CACHED_VERSIONS = 20
+
+# Chỉ giữ trong bộ nhớ điểm rủi ro của phiên bản dữ liệu hiện tại
+_scores = {}
+
+def dataset_version(df):
+    """Tạo mã phiên bản ổn định từ nội dung dữ liệu (giữ nguyên sau khi khởi động lại)"""
+    hasher = hashlib.sha1()
+    hasher.update(",".join(map(str, df.columns)).encode("utf-8"))
+    hasher.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    return hasher.hexdigest()[:16]
+
+def _cache_path(version):
+    return os.path.join(CACHE_DIR, f"{version}.npz")
+
+def _encode(scores):
+    """Chuyển các cột rủi ro sang int16 (đơn vị 0.1 điểm)"""
+    encoded = {}
+    for col in risk_analysis.RISK_COLUMNS:
+        values = scores[col].to_numpy(dtype=np.float64)
+        column = np.full(len(values), _MISSING, dtype=np.int16)
+        valid = ~np.isnan(values)
+        column[valid] = np.rint(values[valid] * 10).astype(np.int16)
+        encoded[col] = column
+    return encoded
+
+def _decode(encoded, positions):
+    """Giải mã các cột rủi ro tại các vị trí cho trước (-1 = không có điểm)"""
+    missing = positions < 0
+    columns = {}
+    for col in risk_analysis.RISK_COLUMNS:
+        raw = encoded[col][positions]
+        values = raw.astype(np.float64) / 10
+        values[(raw == _MISSING) | missing] = np.nan
+        columns[col] = values
+    return columns
+
+def _load(version):
+    path = _cache_path(version)
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as data:
+            return {"row_id": data["row_id"], **{col: data[col] for col in risk_analysis.RISK_COLUMNS}}
+    except Exception as e:
+        print(f"[WARNING] Failed to read risk score cache {path}: {str(e)}")
+        return None
+
+def _save(version, stored):
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Ghi ra file tạm rồi đổi tên để tránh file hỏng khi bị ngắt giữa chừng
+        tmp_path = _cache_path(version) + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **stored)
+        os.replace(tmp_path, _cache_path(version))
+        
+        # Xóa các phiên bản cũ nhất nếu vượt quá giới hạn
+        files = sorted((os.path.join(CACHE_DIR, f) for f in os.listdir(CACHE_DIR) if f.endswith(".npz")),
+                       key=os.path.getmtime)
+        for path in files[:-MAX_CACHED_VERSIONS]:
+            os.remove(path)
+    except Exception as e:
+        print(f"[WARNING] Failed to persist risk scores: {str(e)}")
+
+def risk_version(version, hazard_layer=None, weather_layer=None):
+    """Khóa lưu trữ: phiên bản dữ liệu kết hợp phiên bản mô hình và các lớp đầu vào"""
+    version = f"{version}-m{risk_analysis.MODEL_VERSION}"
+    if hazard_layer is not None:
+        version = f"{version}-h{hazard_layer.version}"
+    if weather_layer is not None:
+        version = f"{version}-w{weather_layer.version}"
+    return version
+
+def get_risk_scores(df, version, hazard_layer=None, weather_layer=None, trajectories=None, speed_baselines=None):
+    """
+    Lấy điểm rủi ro của một phiên bản dữ liệu, tính toán nếu chưa có
+
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        Dữ liệu gốc (chưa lọc) của phiên bản
+    version : str
+        Mã phiên bản dữ liệu
+    hazard_layer : hazards.HazardLayer, optional
+        Lớp chướng ngại vật dùng khi tính điểm
+    weather_layer : weather.WeatherLayer, optional
+        Lưới thời tiết dùng khi tính điểm
+    trajectories : trajectory.TrajectoryStore, optional
+        Kho hành trình của phiên bản dữ liệu
+    speed_baselines : baselines.SpeedBaselines, optional
+        Đường cơ sở tốc độ của phiên bản dữ liệu
+
+    Returns:
+    --------
+    dict
+        Các cột rủi ro int16 và mảng mã dòng 'row_id'
+    """
+    key = risk_version(version, hazard_layer, weather_layer)
+    if key in _scores:
+        return _scores[key]
+
+    stored = _load(key)
+    if stored is None:
+        result = risk_analysis.calculate_risk_scores(df, columns_only=True, hazard_layer=hazard_layer,
+                                                     weather_layer=weather_layer, trajectories=trajectories,
+                                                     speed_baselines=speed_baselines)
+        if isinstance(result, dict) and "error" in result:
+            return result
+        stored = {"row_id": result.index.to_numpy(), **_encode(result)}
+        _save(key, stored)
+
+    _scores.clear()
+    _scores[key] = stored
+    return stored
+
+def join_risk_scores(df, stored):
+    """Ghép các cột rủi ro vào dữ liệu đang lọc theo mã dòng"""
+    if "index" not in stored:
+        stored["index"] = pd.Index(stored["row_id"])
+    positions = stored["index"].get_indexer(df.index)
+    scores = pd.DataFrame(_decode(stored, positions), index=df.index)
+    return pd.concat([df, scores], axis=1)
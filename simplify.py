@@ -0,0 +1,160 @@
+import numpy as np
+
+# Đơn giản hóa hành trình (Ramer-Douglas-Peucker và biến thể theo thời gian)
+# để vẽ bản đồ và xuất dữ liệu. Thuật toán chạy lặp trên toàn bộ kho hành
+# trình: mỗi vòng xử lý đồng thời mọi đoạn đang mở của mọi tàu.
+
+# Mét trên mỗi pixel ở mức zoom 0 tại xích đạo (Web Mercator, ô 256px)
+METERS_PER_PIXEL_Z0 = 156543.03392
+
+# Sai số cho phép tính bằng pixel trên màn hình
+PIXEL_TOLERANCE = 1.0
+
+MIN_ZOOM = 0
+MAX_ZOOM = 20
+
+def zoom_tolerance_m(zoom, pixel_tolerance=PIXEL_TOLERANCE):
+    """Sai số (m) tương ứng với một mức zoom bản đồ"""
+    zoom = int(min(max(zoom, MIN_ZOOM), MAX_ZOOM))
+    return METERS_PER_PIXEL_Z0 / 2 ** zoom * pixel_tolerance
+
+def _local_xy(store):
+    """Chiếu vị trí sang mặt phẳng cục bộ (m) theo vĩ độ trung bình của từng hành trình"""
+    n = len(store)
+    starts = store.track_starts()
+    # Mở kinh độ liên tục qua kinh tuyến 180 trong mỗi hành trình
+    dlon = np.zeros(n)
+    if n > 1:
+        dlon[1:] = (np.diff(store.lons) + 180) % 360 - 180
+    dlon[starts] = 0
+    csum = np.cumsum(dlon)
+    lons = store.lons[store.offsets[:-1]].repeat(store.lengths) + csum - csum[store.offsets[:-1]].repeat(store.lengths)
+
+    mean_lat = np.add.reduceat(store.lats, store.offsets[:-1]) / store.lengths
+    cos_lat = np.cos(np.radians(mean_lat)).repeat(store.lengths)
+    return np.radians(lons) * 6371008.8 * cos_lat, np.radians(store.lats) * 6371008.8
+
+def _interval_distances(x, y, t, lo, hi, time_aware):
+    """Khoảng cách của các điểm bên trong mỗi đoạn [lo, hi] tới đoạn thẳng nối hai đầu"""
+    counts = hi - lo - 1
+    interval = np.repeat(np.arange(len(lo)), counts)
+    idx = lo[interval] + 1 + (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts))
+    a, b = lo[interval], hi[interval]
+    ax, ay = x[a], y[a]
+    dx, dy = x[b] - ax, y[b] - ay
+    if time_aware:
+        # Khoảng cách đồng bộ thời gian (SED): so với vị trí nội suy tại cùng thời điểm
+        span = (t[b] - t[a]).astype(np.float64)
+        frac = np.divide((t[idx] - t[a]).astype(np.float64), span, out=np.full(len(idx), 0.5), where=span > 0)
+    else:
+        # Khoảng cách vuông góc tới đoạn thẳng (kẹp trong đoạn)
+        length2 = dx * dx + dy * dy
+        frac = np.divide((x[idx] - ax) * dx + (y[idx] - ay) * dy, length2,
+                         out=np.zeros(len(idx)), where=length2 > 0)
+        frac = np.clip(frac, 0, 1)
+    return idx, interval, np.hypot(x[idx] - (ax + frac * dx), y[idx] - (ay + frac * dy))
+
+def simplify_tracks(store, tolerance_m, time_aware=False):
+    """
+    Đơn giản hóa mọi hành trình trong kho
+
+    Parameters:
+    -----------
+    store : trajectory.TrajectoryStore
+        Kho hành trình
+    tolerance_m : float
+        Sai số tối đa (m) giữa hành trình gốc và hành trình đơn giản hóa
+    time_aware : bool
+        Dùng khoảng cách đồng bộ thời gian (SED) thay cho khoảng cách vuông góc
+
+    Returns:
+    --------
+    numpy.ndarray
+        Mặt nạ các điểm được giữ lại, theo thứ tự của kho
+    """
+    key = ("simplify", round(float(tolerance_m), 3), bool(time_aware))
+    if key in store.derived:
+        return store.derived[key]
+
+    keep = np.zeros(len(store), dtype=bool)
+    if len(store):
+        # Luôn giữ điểm đầu và cuối của mỗi hành trình
+        keep[store.offsets[:-1]] = True
+        keep[store.offsets[1:] - 1] = True
+
+        x, y = _local_xy(store)
+        lo, hi = store.offsets[:-1], store.offsets[1:] - 1
+        while True:
+            open_ = hi - lo > 1
+            lo, hi = lo[open_], hi[open_]
+            if not len(lo):
+                break
+            idx, interval, dist = _interval_distances(x, y, store.times, lo, hi, time_aware)
+
+            # Điểm xa nhất của mỗi đoạn (điểm đầu tiên nếu bằng nhau); các điểm
+            # của cùng một đoạn nằm liền nhau nên dùng reduceat thay cho sắp xếp
+            counts = hi - lo - 1
+            group_starts = np.cumsum(counts) - counts
+            peak = np.maximum.reduceat(dist, group_starts)
+            candidates = np.flatnonzero(dist == peak[interval])
+            best = candidates[np.r_[True, interval[candidates][1:] != interval[candidates][:-1]]]
+            split = dist[best] > tolerance_m
+
+            split_idx = idx[best][split]
+            keep[split_idx] = True
+            lo, hi = np.concatenate((lo[split], split_idx)), np.concatenate((split_idx, hi[split]))
+
+    store.derived[key] = keep
+    return keep
+
+def group_by_vessel(store, mask):
+    """
+    Gom các điểm được chọn theo tàu
+
+    Returns:
+    --------
+    tuple
+        (MMSI của từng nhóm, offsets của nhóm, vị trí các điểm trong kho)
+    """
+    positions = np.flatnonzero(mask)
+    vessel = store.vessel_ids()[positions]
+    starts = np.flatnonzero(np.r_[True, vessel[1:] != vessel[:-1]]) if len(vessel) else np.empty(0, dtype=np.int64)
+    return store.vessels[vessel[starts]], np.append(starts, len(positions)), positions
+
+def _zigzag_chunks(values):
+    """Mã hóa các số nguyên theo thuật toán polyline của Google, trả về mảng byte và số byte mỗi giá trị"""
+    values = values.astype(np.int64)
+    u = np.where(values < 0, ~(values << 1), values << 1).astype(np.uint64)
+    shifts = np.arange(0, 35, 5, dtype=np.uint64)
+    groups = (u[:, None] >> shifts) & np.uint64(31)
+    lengths = 1 + ((u[:, None] >> shifts[1:]) > 0).sum(axis=1)
+    position = np.arange(len(shifts))
+    used = position < lengths[:, None]
+    more = position < (lengths - 1)[:, None]
+    chars = (groups | np.where(more, np.uint64(0x20), np.uint64(0))) + np.uint64(63)
+    return chars[used].astype(np.uint8), lengths
+
+def encode_polylines(lats, lons, offsets):
+    """
+    Mã hóa nhiều đường (nối tiếp nhau trong mảng, ranh giới theo offsets) thành chuỗi polyline
+
+    Returns:
+    --------
+    list
+        Một chuỗi polyline (độ chính xác 1e-5) cho mỗi đường
+    """
+    n = len(lats)
+    if n == 0:
+        return [""] * (len(offsets) - 1)
+    ilat = np.rint(np.asarray(lats) * 1e5).astype(np.int64)
+    ilon = np.rint(np.asarray(lons) * 1e5).astype(np.int64)
+    dlat, dlon = np.diff(ilat, prepend=0), np.diff(ilon, prepend=0)
+    # Điểm đầu mỗi đường mã hóa giá trị tuyệt đối
+    starts = offsets[:-1][offsets[:-1] < n]
+    dlat[starts], dlon[starts] = ilat[starts], ilon[starts]
+
+    # Xen kẽ lat/lon rồi mã hóa tất cả trong một lượt
+    chars, lengths = _zigzag_chunks(np.column_stack((dlat, dlon)).ravel())
+    text = chars.tobytes().decode("ascii")
+    bounds = np.r_[0, np.cumsum(lengths)][2 * np.asarray(offsets)]
+    return [text[bounds[i]:bounds[i + 1]] for i in range(len(offsets) - 1)]
@@ -165,7 +165,7 @@ function renderVesselGroups(data) {
                     <div class="group-header">Nhóm ${index + 1}</div>
                     <div class="group-details">
                         <p><strong>Số tàu:</strong> ${group.vessel_count}</p>
-                        <p><strong>Khoảng cách TB:</strong> ${group.avg_distance_km} km</p>
+                        <p><strong>Khoảng cách TB:</strong> ${group.avg_distance_km} km${group.avg_distance_error_km ? ` (±${group.avg_distance_error_km})` : ''}</p>
                         <p><strong>Loại tàu:</strong> ${group.vessel_types.join(', ') || 'Không xác định'}</p>
                     </div>
                 </div>
@@ -221,8 +221,13 @@ async function showVesselGroupsMap() {
             throw new Error(data.error);
         }
         
-        // Hiển thị bản đồ
-        document.getElementById('vessel-groups-map').innerHTML = data.map_html || '<div class="error-message">Không có dữ liệu bản đồ</div>';
+        // Vẽ bản đồ từ dữ liệu nhóm (bao lồi và các điểm mẫu)
+        if (!data.vessel_groups || data.vessel_groups.length === 0) {
+            document.getElementById('vessel-groups-map').innerHTML = '<div class="error-message">Không có dữ liệu bản đồ</div>';
+            return;
+        }
+        await loadLeaflet();
+        drawVesselGroups(document.getElementById('vessel-groups-map'), data.vessel_groups);
         
     } catch (error) {
         if (document.getElementById('vessel-groups-map')) {
@@ -231,6 +236,66 @@ async function showVesselGroupsMap() {
     }
 }
 
+// Tải Leaflet nếu trang chưa có
+function loadLeaflet() {
+    if (typeof L !== 'undefined') {
+        return Promise.resolve();
+    }
+    return new Promise((resolve, reject) => {
+        const leafletCSS = document.createElement('link');
+        leafletCSS.rel = 'stylesheet';
+        leafletCSS.href = 'https://unpkg.com/leaflet@1.7.1/dist/leaflet.css';
+        document.head.appendChild(leafletCSS);
+
+        const leafletJS = document.createElement('script');
+        leafletJS.src = 'https://unpkg.com/leaflet@1.7.1/dist/leaflet.js';
+        leafletJS.onload = resolve;
+        leafletJS.onerror = () => reject(new Error('Không thể tải Leaflet'));
+        document.head.appendChild(leafletJS);
+    });
+}
+
+// Vẽ các nhóm tàu: mỗi nhóm một đa giác bao lồi cùng các điểm mẫu
+function drawVesselGroups(container, groups) {
+    const colors = ['#e03131', '#1971c2', '#2f9e44', '#f08c00', '#9c36b5', '#0c8599', '#c2255c', '#5c940d', '#e8590c', '#3b5bdb'];
+
+    container.innerHTML = '';
+    const mapDiv = document.createElement('div');
+    mapDiv.style.height = '100%';
+    container.appendChild(mapDiv);
+
+    const map = L.map(mapDiv);
+    L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {
+        attribution: '&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors'
+    }).addTo(map);
+
+    const bounds = L.latLngBounds([]);
+    groups.forEach((group, index) => {
+        const color = colors[index % colors.length];
+        const popup = `<b>Nhóm ${group.group_id}</b><br>Số tàu: ${group.vessel_count}<br>` +
+            `Khoảng cách TB: ${group.avg_distance_km} km<br>Loại tàu: ${group.vessel_types.join(', ') || 'Không xác định'}`;
+
+        if (group.hull && group.hull.length >= 3) {
+            L.polygon(group.hull, { color: color, weight: 2, fillOpacity: 0.15 }).bindPopup(popup).addTo(map);
+        }
+        // Các điểm mẫu được trả về theo cột: points.lat[i], points.lon[i], points.mmsi[i]
+        const points = group.points || { lat: [], lon: [], mmsi: [] };
+        points.lat.forEach((lat, i) => {
+            L.circleMarker([lat, points.lon[i]], {
+                radius: 3, color: color, weight: 1, fillOpacity: 0.8
+            }).bindPopup(`MMSI: ${points.mmsi[i]}<br>Nhóm ${group.group_id}`).addTo(map);
+        });
+
+        (group.hull && group.hull.length ? group.hull : [group.center]).forEach(latLng => bounds.extend(latLng));
+    });
+
+    if (bounds.isValid()) {
+        map.fitBounds(bounds, { padding: [20, 20] });
+    } else {
+        map.setView([0, 0], 2);
+    }
+}
+
 // Add CSS for dashboard
 document.addEventListener('DOMContentLoaded', function() {
     const style = document.createElement('style');
@@ -0,0 +1,129 @@
+// Live vessel positions pushed by the server over WebSocket (/ws/positions)
+
+const AisLiveFeed = (function() {
+    const vesselColors = {
+        'Cargo': '#3388ff',
+        'Tanker': '#dc3545',
+        'Passenger': '#28a745',
+        'Fishing': '#fd7e14',
+        'Tug': '#6f42c1',
+        'Military': '#000000',
+        'Sailing': '#e83e8c',
+        'Unknown': '#6c757d'
+    };
+
+    let socket = null;
+    let map = null;
+    let layer = null;
+    let types = null;
+    let reconnectTimer = null;
+    const markers = new Map();
+
+    // Decode a columnar frame (see live_feed.encode_frame)
+    function decodeFrame(buffer) {
+        const headerLength = new DataView(buffer).getUint32(0, true);
+        const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 4, headerLength)));
+        const n = header.count;
+        let offset = 4 + headerLength;
+        function column(ArrayType) {
+            const values = new ArrayType(buffer, offset, n);
+            offset += n * ArrayType.BYTES_PER_ELEMENT;
+            return values;
+        }
+        header.mmsi = column(Uint32Array);
+        header.time = column(Uint32Array);
+        header.lat = column(Float32Array);
+        header.lon = column(Float32Array);
+        header.sog = column(Float32Array);
+        header.cog = column(Float32Array);
+        header.type = column(Uint16Array);
+        return header;
+    }
+
+    function popupText(frame, i) {
+        const type = frame.types[frame.type[i]];
+        let text = `MMSI: ${frame.mmsi[i]}<br>Loại tàu: ${type}`;
+        if (!isNaN(frame.sog[i])) text += `<br>SOG: ${frame.sog[i].toFixed(1)}`;
+        if (!isNaN(frame.cog[i])) text += `<br>COG: ${frame.cog[i].toFixed(1)}`;
+        text += `<br>${new Date(frame.time[i] * 1000).toISOString()}`;
+        return text;
+    }
+
+    function applyFrame(frame) {
+        if (frame.reset) {
+            layer.clearLayers();
+            markers.clear();
+        }
+        for (let i = 0; i < frame.count; i++) {
+            const mmsi = frame.mmsi[i];
+            const latLng = [frame.lat[i], frame.lon[i]];
+            let marker = markers.get(mmsi);
+            if (marker) {
+                marker.setLatLng(latLng);
+                marker.setPopupContent(popupText(frame, i));
+            } else {
+                const color = vesselColors[frame.types[frame.type[i]]] || vesselColors['Unknown'];
+                marker = L.circleMarker(latLng, {
+                    radius: 5,
+                    color: color,
+                    fillColor: color,
+                    fillOpacity: 0.7,
+                    weight: 2
+                }).bindPopup(popupText(frame, i)).addTo(layer);
+                markers.set(mmsi, marker);
+            }
+        }
+    }
+
+    function sendViewport() {
+        if (!socket || socket.readyState !== WebSocket.OPEN) return;
+        const bounds = map.getBounds().pad(0.1);
+        socket.send(JSON.stringify({
+            bbox: [bounds.getWest(), bounds.getSouth(), bounds.getEast(), bounds.getNorth()],
+            types: types
+        }));
+    }
+
+    function connect() {
+        const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+        socket = new WebSocket(`${protocol}//${window.location.host}/ws/positions`);
+        socket.binaryType = 'arraybuffer';
+        socket.onopen = sendViewport;
+        socket.onmessage = function(event) {
+            if (typeof event.data === 'string') {
+                console.warn('Live feed:', event.data);
+                return;
+            }
+            applyFrame(decodeFrame(event.data));
+        };
+        socket.onclose = function() {
+            socket = null;
+            // Kết nối lại nếu bản đồ vẫn đang theo dõi
+            if (map) reconnectTimer = setTimeout(connect, 5000);
+        };
+    }
+
+    function attach(leafletMap, options) {
+        detach();
+        map = leafletMap;
+        types = (options && options.types) || null;
+        layer = L.layerGroup().addTo(map);
+        map.on('moveend', sendViewport);
+        connect();
+    }
+
+    function detach() {
+        clearTimeout(reconnectTimer);
+        if (map) {
+            map.off('moveend', sendViewport);
+            map.removeLayer(layer);
+        }
+        map = null;
+        markers.clear();
+        if (socket) socket.close();
+    }
+
+    return { attach: attach, detach: detach, decodeFrame: decodeFrame };
+})();
+
+window.AisLiveFeed = AisLiveFeed;
@@ -0,0 +1,154 @@
+// Map playback: scrub through precomputed, interpolated vessel positions (/playback)
+
+const AisPlayback = (function() {
+    const PREFETCH = 3;
+    const PLAY_INTERVAL_MS = 500;
+
+    let map = null;
+    let layer = null;
+    let panel = null;
+    let slider = null;
+    let label = null;
+    let playTimer = null;
+    let info = null;
+    const frames = new Map();
+    const pending = new Map();
+    const markers = new Map();
+
+    // Lấy khung k cùng các khung kề (prefetch), dùng lại các khung đã có
+    function fetchFrame(k) {
+        if (frames.has(k)) return Promise.resolve(frames.get(k));
+        if (pending.has(k)) return pending.get(k);
+        const request = fetch(`/playback?frame=${k}&prefetch=${PREFETCH}`)
+            .then(response => {
+                if (!response.ok) throw new Error('Failed to load playback frame');
+                return response.json();
+            })
+            .then(result => {
+                info = result;
+                result.frames_data.forEach(frame => {
+                    frames.set(frame.frame, frame);
+                    pending.delete(frame.frame);
+                });
+                return frames.get(k);
+            })
+            .finally(() => pending.delete(k));
+        for (let i = k - PREFETCH; i <= k + PREFETCH; i++) {
+            if (!frames.has(i)) pending.set(i, request);
+        }
+        return request;
+    }
+
+    function render(frame) {
+        const seen = new Set();
+        for (let i = 0; i < frame.mmsi.length; i++) {
+            const mmsi = frame.mmsi[i];
+            seen.add(mmsi);
+            const latLng = [frame.lat[i], frame.lon[i]];
+            const marker = markers.get(mmsi);
+            if (marker) {
+                marker.setLatLng(latLng);
+            } else {
+                markers.set(mmsi, L.circleMarker(latLng, {
+                    radius: 4,
+                    color: '#3388ff',
+                    fillOpacity: 0.7,
+                    weight: 1
+                }).bindTooltip(`MMSI: ${mmsi}`).addTo(layer));
+            }
+        }
+        markers.forEach((marker, mmsi) => {
+            if (!seen.has(mmsi)) {
+                layer.removeLayer(marker);
+                markers.delete(mmsi);
+            }
+        });
+        label.textContent = `${frame.time} (${frame.mmsi.length} tàu)`;
+    }
+
+    async function show(k) {
+        try {
+            render(await fetchFrame(k));
+            // Tải trước các khung tiếp theo khi đang phát
+            if (!frames.has(k + PREFETCH) && info && k + PREFETCH < info.frames) fetchFrame(k + PREFETCH);
+        } catch (error) {
+            label.textContent = error.message;
+            stop();
+        }
+    }
+
+    function stop() {
+        clearInterval(playTimer);
+        playTimer = null;
+    }
+
+    function togglePlay(button) {
+        if (playTimer) {
+            stop();
+            button.textContent = '▶';
+            return;
+        }
+        button.textContent = '⏸';
+        playTimer = setInterval(function() {
+            const k = Number(slider.value) + 1;
+            if (!info || k >= info.frames) {
+                stop();
+                button.textContent = '▶';
+                return;
+            }
+            slider.value = k;
+            show(k);
+        }, PLAY_INTERVAL_MS);
+    }
+
+    function open() {
+        if (window.AisLiveFeed) AisLiveFeed.detach();
+        layer = L.layerGroup().addTo(map);
+        panel.querySelector('.playback-controls').style.display = 'block';
+        fetchFrame(0).then(frame => {
+            slider.max = info.frames - 1;
+            render(frame);
+        }).catch(error => { label.textContent = error.message; });
+    }
+
+    function close() {
+        stop();
+        map.removeLayer(layer);
+        markers.clear();
+        frames.clear();
+        panel.querySelector('.playback-controls').style.display = 'none';
+        if (window.AisLiveFeed) AisLiveFeed.attach(map);
+    }
+
+    function attach(leafletMap) {
+        map = leafletMap;
+        const control = L.control({position: 'topright'});
+        control.onAdd = function() {
+            panel = L.DomUtil.create('div', 'playback-panel');
+            panel.style.background = 'white';
+            panel.style.padding = '8px';
+            panel.style.borderRadius = '5px';
+            panel.innerHTML = `
+                <label><input type="checkbox" class="playback-toggle"> ⏱ Phát lại</label>
+                <div class="playback-controls" style="display: none; margin-top: 5px;">
+                    <button class="playback-play">▶</button>
+                    <input type="range" class="playback-slider" min="0" max="0" value="0" style="width: 220px;">
+                    <div class="playback-label" style="font-size: 12px;"></div>
+                </div>`;
+            L.DomEvent.disableClickPropagation(panel);
+            slider = panel.querySelector('.playback-slider');
+            label = panel.querySelector('.playback-label');
+            slider.addEventListener('input', () => show(Number(slider.value)));
+            panel.querySelector('.playback-play').addEventListener('click', event => togglePlay(event.target));
+            panel.querySelector('.playback-toggle').addEventListener('change', event => {
+                if (event.target.checked) open(); else close();
+            });
+            return panel;
+        };
+        control.addTo(map);
+    }
+
+    return { attach: attach };
+})();
+
+window.AisPlayback = AisPlayback;
@@ -0,0 +1,205 @@
+import numpy as np
+import pandas as pd
+
+from trajectory import frame_times
+
+# Khối tổng hợp theo thời gian: số bản ghi theo (giờ trong ngày x ngày trong tuần
+# x loại tàu x ô không gian), dựng một lần cho mỗi phiên bản dữ liệu bằng
+# bincount. Mỗi bản ghi chỉ giữ hai mã nhỏ (khe thời gian uint8 và vị trí int32)
+# nên dữ liệu đang lọc được tổng hợp lại mà không cần phân tích chuỗi thời gian;
+# các phân tích theo giờ/ngày chỉ là phép cộng trên khối thưa.
+
+# Cạnh ô không gian (độ)
+CELL_DEG = 1.0
+
+HOURS = 24
+WEEKDAYS = 7
+# Khe thời gian = ngày trong tuần * 24 + giờ; NO_SLOT cho thời gian không hợp lệ
+SLOTS = HOURS * WEEKDAYS
+NO_SLOT = 255
+
+_LAT_CELLS = int(np.ceil(180 / CELL_DEG))
+_LON_CELLS = int(np.ceil(360 / CELL_DEG))
+# Mã ô cho bản ghi thiếu tọa độ
+NO_CELL = _LAT_CELLS * _LON_CELLS
+N_CELLS = NO_CELL + 1
+
+# Các chiều của khối
+DIMENSIONS = ("weekday", "hour", "vessel_type", "cell")
+
+# Số phần tử tối đa của mảng đếm dày trả về bởi aggregate; tổ hợp lớn hơn (ví dụ có
+# chiều cell) dùng aggregate_sparse
+MAX_DENSE_SIZE = 1_000_000
+
+def time_slots(times, valid):
+    """Khe thời gian (ngày trong tuần * 24 + giờ) từ giây epoch; ngày 1970-01-01 là thứ Năm"""
+    slots = ((times // 86400 + 3) % WEEKDAYS) * HOURS + (times // 3600) % HOURS
+    return np.where(valid, slots, NO_SLOT).astype(np.uint8)
+
+def cell_of(lats, lons):
+    """Mã ô CELL_DEG x CELL_DEG của từng vị trí; NO_CELL khi thiếu tọa độ"""
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    row = np.clip(np.floor((lats + 90) / CELL_DEG), 0, _LAT_CELLS - 1)
+    col = np.clip(np.floor((lons + 180) / CELL_DEG), 0, _LON_CELLS - 1)
+    cell = row * _LON_CELLS + col
+    return np.where(np.isfinite(cell), cell, NO_CELL).astype(np.int64)
+
+def cell_bounds(cells):
+    """Góc tây nam (lat, lon) của các ô"""
+    cells = np.asarray(cells, dtype=np.int64)
+    return (cells // _LON_CELLS) * CELL_DEG - 90, (cells % _LON_CELLS) * CELL_DEG - 180
+
+class TimeCube:
+    """
+    Khối đếm thưa theo (loại tàu, ô, ngày trong tuần, giờ) của một phiên bản dữ liệu
+
+    slots và places là mã của từng bản ghi theo mã dòng (vị trí trong dữ liệu
+    gốc); keys/counts là khối đã tổng hợp của toàn bộ dữ liệu với
+    khóa = vị trí * SLOTS + khe và vị trí = mã loại * N_CELLS + ô.
+    """
+
+    def __init__(self, vessel_types, slots, places, keys=None, counts=None):
+        self.vessel_types = vessel_types
+        self.slots = slots
+        self.places = places
+        if keys is None:
+            keys, counts = self._aggregate(slots, places)
+        self.keys, self.counts = keys, counts
+
+    @staticmethod
+    def _aggregate(slots, places):
+        valid = slots != NO_SLOT
+        keys = places[valid].astype(np.int64) * SLOTS + slots[valid]
+        keys, counts = np.unique(keys, return_counts=True)
+        return keys, counts
+
+    @staticmethod
+    def _codes(df, vessel_types):
+        """Khe thời gian và vị trí của từng bản ghi; vessel_types được bổ sung loại mới"""
+        vessel_col = next((col for col in ['VesselType', 'ShipType', 'vessel_type'] if col in df.columns), None)
+        lat_col = next((col for col in ['LAT', 'Latitude', 'lat', 'latitude'] if col in df.columns), None)
+        lon_col = next((col for col in ['LON', 'Longitude', 'lon', 'longitude'] if col in df.columns), None)
+        n = len(df)
+
+        slots = time_slots(*frame_times(df))
+
+        if vessel_col:
+            inverse, uniques = pd.factorize(df[vessel_col], use_na_sentinel=False)
+            names = ["Unknown" if pd.isna(name) else str(name) for name in uniques]
+            codes = {name: code for code, name in enumerate(vessel_types)}
+            mapping = np.array([codes.setdefault(name, len(codes)) for name in names], dtype=np.int64)
+            vessel_types[:] = sorted(codes, key=codes.get)
+            types = mapping[inverse] if len(mapping) else np.zeros(n, dtype=np.int64)
+        else:
+            if "Unknown" not in vessel_types:
+                vessel_types.append("Unknown")
+            types = np.full(n, vessel_types.index("Unknown"), dtype=np.int64)
+
+        if lat_col and lon_col:
+            cells = cell_of(pd.to_numeric(df[lat_col], errors='coerce'), pd.to_numeric(df[lon_col], errors='coerce'))
+        else:
+            cells = np.full(n, NO_CELL, dtype=np.int64)
+        return slots, (types * N_CELLS + cells).astype(np.int32)
+
+    @classmethod
+    def build(cls, df):
+        vessel_types = []
+        slots, places = cls._codes(df, vessel_types)
+        return cls(vessel_types, slots, places)
+
+    def extend(self, df):
+        """Khối mới gồm các bản ghi hiện có và các bản ghi thêm vào (mã dòng tiếp nối)"""
+        if len(df) == 0:
+            return self
+        vessel_types = list(self.vessel_types)
+        slots, places = self._codes(df, vessel_types)
+        # Chỉ tổng hợp các dòng mới rồi cộng vào khối hiện có
+        added_keys, added = self._aggregate(slots, places)
+        keys = np.union1d(self.keys, added_keys)
+        counts = np.zeros(len(keys), dtype=np.int64)
+        counts[np.searchsorted(keys, self.keys)] += self.counts
+        counts[np.searchsorted(keys, added_keys)] += added
+        return TimeCube(vessel_types, np.concatenate([self.slots, slots]), np.concatenate([self.places, places]),
+                        keys, counts)
+
+    def __len__(self):
+        return len(self.slots)
+
+    def subset(self, index=None):
+        """
+        Khối (keys, counts) của các bản ghi có mã dòng trong index
+
+        Không có index hoặc index phủ toàn bộ dữ liệu thì dùng khối đã tổng hợp;
+        ngược lại chỉ gom mã của các dòng được chọn.
+        """
+        if index is None or len(index) == len(self):
+            return self.keys, self.counts
+        positions = np.asarray(index, dtype=np.int64)
+        return self._aggregate(self.slots[positions], self.places[positions])
+
+    def _grouped(self, by, index, vessel_types):
+        """Khóa phẳng theo các chiều trong by (thứ tự C) và số đếm của từng khóa của khối, cùng kích thước các trục"""
+        keys, counts = self.subset(index)
+        slots, places = keys % SLOTS, keys // SLOTS
+        values = {
+            "weekday": slots // HOURS,
+            "hour": slots % HOURS,
+            "vessel_type": places // N_CELLS,
+            "cell": places % N_CELLS
+        }
+        sizes = {"weekday": WEEKDAYS, "hour": HOURS, "vessel_type": len(self.vessel_types), "cell": N_CELLS}
+        if vessel_types is not None:
+            names = set(map(str, vessel_types))
+            wanted = [i for i, name in enumerate(self.vessel_types) if name in names]
+            keep = np.isin(values["vessel_type"], wanted)
+            counts = counts[keep]
+            values = {name: column[keep] for name, column in values.items()}
+
+        flat = np.zeros(len(counts), dtype=np.int64)
+        for dim in by:
+            flat = flat * sizes[dim] + values[dim]
+        return flat, counts, tuple(sizes[dim] for dim in by)
+
+    def aggregate(self, by, index=None, vessel_types=None):
+        """
+        Tổng số bản ghi theo các chiều trong by (tập con của DIMENSIONS), dạng mảng dày
+
+        Parameters:
+        -----------
+        by : list
+            Các chiều giữ lại, theo thứ tự của mảng kết quả
+        index : array-like, optional
+            Mã dòng của dữ liệu đang lọc
+        vessel_types : list, optional
+            Chỉ tính các loại tàu này
+
+        Returns:
+        --------
+        numpy.ndarray
+            Mảng đếm dày, mỗi trục là một chiều của by; ValueError nếu mảng lớn
+            hơn MAX_DENSE_SIZE phần tử (dùng aggregate_sparse)
+        """
+        flat, counts, shape = self._grouped(by, index, vessel_types)
+        size = int(np.prod(shape))
+        if size > MAX_DENSE_SIZE:
+            raise ValueError(f"Dense aggregate by {', '.join(by)} needs {size} cells; use aggregate_sparse")
+        return np.bincount(flat, weights=counts, minlength=size).astype(np.int64).reshape(shape)
+
+    def aggregate_sparse(self, by, index=None, vessel_types=None):
+        """
+        Tổng số bản ghi của các tổ hợp khác rỗng theo các chiều trong by
+
+        Bộ nhớ chỉ phụ thuộc số tổ hợp có bản ghi, không phụ thuộc tích kích thước
+        các chiều. Tham số như aggregate.
+
+        Returns:
+        --------
+        tuple
+            (bộ mảng chỉ số theo từng chiều của by, số đếm), theo thứ tự như
+            numpy.nonzero trên mảng dày
+        """
+        flat, counts, shape = self._grouped(by, index, vessel_types)
+        keys, inverse = np.unique(flat, return_inverse=True)
+        totals = np.bincount(inverse, weights=counts, minlength=len(keys)).astype(np.int64)
+        return np.unravel_index(keys, shape), totals
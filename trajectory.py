@@ -0,0 +1,254 @@
+import numpy as np
+import pandas as pd
+
+import live_dataset
+
+# Kho hành trình theo từng tàu, được xây dựng một lần khi nạp dữ liệu.
+# Các bản ghi được sắp xếp theo (MMSI, thời gian); mảng offsets cho biết đoạn
+# liên tục của mỗi tàu, nên mọi thao tác theo tàu chỉ tốn O(độ dài hành trình)
+# và không cần groupby.
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_NM = 1.852
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Khoảng cách vòng lớn (km) giữa các cặp điểm, tính trên toàn mảng"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=np.float64)) for a in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+def parse_times(series):
+    """Chuyển cột thời gian sang giây kể từ epoch (int64) và mặt nạ hợp lệ"""
+    parsed = pd.to_datetime(series, errors='coerce')
+    valid = parsed.notna().to_numpy()
+    seconds = parsed.astype('int64').to_numpy() // 10**9
+    return np.where(valid, seconds, 0), valid
+
+# Giá trị của cột dẫn xuất "time_s" cho thời gian không hợp lệ
+_NO_TIME = np.iinfo(np.int64).min
+
+def _time_seconds(df):
+    time_col = next((col for col in ['BaseDateTime', 'DateTime', 'Timestamp', 'date_time'] if col in df.columns), None)
+    if not time_col:
+        return np.full(len(df), _NO_TIME, dtype=np.int64)
+    seconds, valid = parse_times(df[time_col])
+    return np.where(valid, seconds, _NO_TIME)
+
+def frame_times(df):
+    """
+    Giây kể từ epoch (int64) và mặt nạ hợp lệ của cột thời gian của df
+
+    Thời gian được phân tích một lần cho mỗi dòng của tập dữ liệu và lưu trong
+    bộ nhớ đệm cột dẫn xuất (live_dataset.derived_column).
+    """
+    seconds = live_dataset.derived_column(df, "time_s", _time_seconds)
+    valid = seconds != _NO_TIME
+    return np.where(valid, seconds, 0), valid
+
+class TrajectoryStore:
+    """Các hành trình theo tàu, sắp xếp theo (MMSI, thời gian)"""
+
+    def __init__(self, row_ids, mmsi, times, lats, lons, sogs=None, cogs=None):
+        self.row_ids = row_ids
+        self.mmsi = mmsi
+        self.times = times
+        self.lats = lats
+        self.lons = lons
+        self.sogs = sogs
+        self.cogs = cogs
+
+        # Kết quả dẫn xuất (động học, phân đoạn...) của phiên bản dữ liệu này
+        self.derived = {}
+
+        # Ranh giới hành trình của từng tàu
+        starts = np.flatnonzero(np.r_[True, mmsi[1:] != mmsi[:-1]]) if len(mmsi) else np.empty(0, dtype=np.int64)
+        self.vessels = mmsi[starts]
+        self.offsets = np.append(starts, len(mmsi)).astype(np.int64)
+
+    @classmethod
+    def build(cls, df):
+        """
+        Xây dựng kho hành trình từ dữ liệu AIS
+
+        Các bản ghi thiếu MMSI, thời gian hoặc tọa độ hợp lệ không thuộc hành trình nào.
+        Trả về None nếu dữ liệu không có các cột cần thiết.
+        """
+        mmsi_col = next((col for col in ['MMSI', 'mmsi', 'VesselId'] if col in df.columns), None)
+        time_col = next((col for col in ['BaseDateTime', 'DateTime', 'Timestamp', 'date_time'] if col in df.columns), None)
+        lat_col = next((col for col in ['LAT', 'Latitude', 'lat', 'latitude'] if col in df.columns), None)
+        lon_col = next((col for col in ['LON', 'Longitude', 'lon', 'longitude'] if col in df.columns), None)
+        speed_col = next((col for col in ['SOG', 'Speed', 'speed'] if col in df.columns), None)
+        course_col = next((col for col in ['COG', 'Course', 'course'] if col in df.columns), None)
+
+        if not all([mmsi_col, time_col, lat_col, lon_col]):
+            return None
+
+        mmsi = pd.to_numeric(df[mmsi_col], errors='coerce').to_numpy(dtype=np.float64)
+        lats = pd.to_numeric(df[lat_col], errors='coerce').to_numpy(dtype=np.float64)
+        lons = pd.to_numeric(df[lon_col], errors='coerce').to_numpy(dtype=np.float64)
+        times, valid_time = frame_times(df)
+
+        valid = (valid_time & np.isfinite(mmsi) & np.isfinite(lats) & np.isfinite(lons)
+                 & (np.abs(lats) <= 90) & (np.abs(lons) <= 180))
+        rows = np.flatnonzero(valid)
+        order = rows[np.lexsort((times[rows], mmsi[rows]))]
+
+        def column(col, dtype):
+            if not col:
+                return None
+            return pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=dtype)[order]
+
+        return cls(
+            row_ids=df.index.to_numpy()[order],
+            mmsi=mmsi[order].astype(np.int64),
+            times=times[order],
+            lats=lats[order],
+            lons=lons[order],
+            sogs=column(speed_col, np.float32),
+            cogs=column(course_col, np.float32)
+        )
+
+    def extend(self, df):
+        """
+        Kho mới gồm các bản ghi hiện có và các bản ghi của df
+
+        Bản ghi mới được chèn vào đúng vị trí theo (MMSI, thời gian) bằng tìm kiếm
+        nhị phân trên kho đã sắp xếp, không cần sắp xếp lại toàn bộ. Bản ghi mới
+        cùng khóa được đặt sau bản ghi cũ, giống thứ tự ổn định của build().
+        """
+        new = TrajectoryStore.build(df)
+        if new is None or not len(new):
+            return self
+        positions = np.searchsorted(self.sort_keys(), new.sort_keys(), side='right')
+
+        def merge(old, added):
+            if old is None or added is None:
+                return None
+            return np.insert(old, positions, added)
+
+        return TrajectoryStore(
+            row_ids=merge(self.row_ids, new.row_ids),
+            mmsi=merge(self.mmsi, new.mmsi),
+            times=merge(self.times, new.times),
+            lats=merge(self.lats, new.lats),
+            lons=merge(self.lons, new.lons),
+            sogs=merge(self.sogs, new.sogs),
+            cogs=merge(self.cogs, new.cogs)
+        )
+
+    def sort_keys(self):
+        """Khóa sắp xếp (MMSI, thời gian) gộp thành một số int64 (thời gian trong khoảng 1970-2106)"""
+        return (self.mmsi << 32) | np.clip(self.times, 0, 2**32 - 1)
+
+    def __len__(self):
+        return len(self.row_ids)
+
+    @property
+    def n_vessels(self):
+        return len(self.vessels)
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def vessel_ids(self):
+        """Chỉ số tàu (vị trí trong self.vessels) của từng bản ghi"""
+        return np.repeat(np.arange(self.n_vessels), self.lengths)
+
+    def track_starts(self):
+        """Mặt nạ đánh dấu bản ghi đầu tiên của mỗi hành trình"""
+        starts = np.zeros(len(self), dtype=bool)
+        starts[self.offsets[:-1]] = True
+        return starts
+
+    def vessel_index(self, mmsi):
+        """Vị trí của tàu trong self.vessels, -1 nếu không có"""
+        i = int(np.searchsorted(self.vessels, mmsi))
+        return i if i < self.n_vessels and self.vessels[i] == mmsi else -1
+
+    def track_slice(self, i):
+        return slice(self.offsets[i], self.offsets[i + 1])
+
+    def track(self, mmsi, start_time=None, end_time=None):
+        """Hành trình của một tàu (có thể giới hạn theo khoảng thời gian, tính bằng giây)"""
+        i = self.vessel_index(mmsi)
+        if i < 0:
+            return None
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        # Hành trình đã sắp theo thời gian nên chỉ cần tìm kiếm nhị phân trong đoạn
+        if start_time is not None:
+            lo += int(np.searchsorted(self.times[lo:hi], start_time, side='left'))
+        if end_time is not None:
+            hi = self.offsets[i] + int(np.searchsorted(self.times[self.offsets[i]:hi], end_time, side='right'))
+        part = slice(lo, hi)
+        return {
+            "row_ids": self.row_ids[part],
+            "times": self.times[part],
+            "lats": self.lats[part],
+            "lons": self.lons[part],
+            "sogs": self.sogs[part] if self.sogs is not None else None,
+            "cogs": self.cogs[part] if self.cogs is not None else None
+        }
+
+    def last_positions(self):
+        """Vị trí cuối cùng của mỗi tàu (chỉ số bản ghi trong kho)"""
+        return self.offsets[1:] - 1
+
+    def step_distance_km(self):
+        """Khoảng cách từ bản ghi trước đó trong cùng hành trình (NaN ở đầu hành trình)"""
+        dist = np.full(len(self), np.nan)
+        if len(self) > 1:
+            dist[1:] = haversine_km(self.lats[:-1], self.lons[:-1], self.lats[1:], self.lons[1:])
+        dist[self.track_starts()] = np.nan
+        return dist
+
+    def implied_speed_knots(self):
+        """Tốc độ suy ra từ hai vị trí liên tiếp (NaN ở đầu hành trình hoặc khi trùng thời gian)"""
+        dt = np.full(len(self), np.nan)
+        if len(self) > 1:
+            dt[1:] = np.diff(self.times).astype(np.float64)
+        dt[dt <= 0] = np.nan
+        return self.step_distance_km() / KM_PER_NM / (dt / 3600)
+
+    def route_deviation_km(self):
+        """
+        Độ lệch của mỗi vị trí so với vị trí nội suy theo thời gian giữa điểm trước và sau
+
+        Vị trí đầu/cuối hành trình không có điểm kề nên độ lệch bằng 0.
+        """
+        deviation = np.zeros(len(self))
+        if len(self) < 3:
+            return deviation
+        prev, cur, nxt = slice(0, -2), slice(1, -1), slice(2, None)
+        span = (self.times[nxt] - self.times[prev]).astype(np.float64)
+        frac = np.divide((self.times[cur] - self.times[prev]).astype(np.float64), span,
+                         out=np.full(len(span), 0.5), where=span > 0)
+        expected_lat = self.lats[prev] + (self.lats[nxt] - self.lats[prev]) * frac
+        # Nội suy kinh độ theo đường ngắn nhất qua kinh tuyến 180
+        dlon = (self.lons[nxt] - self.lons[prev] + 180) % 360 - 180
+        expected_lon = (self.lons[prev] + dlon * frac + 180) % 360 - 180
+        interior = haversine_km(self.lats[cur], self.lons[cur], expected_lat, expected_lon)
+
+        # Chỉ giữ các điểm có điểm trước và sau thuộc cùng hành trình
+        starts = self.track_starts()
+        ends = np.r_[starts[1:], True]
+        has_neighbours = ~starts[1:-1] & ~ends[1:-1]
+        deviation[1:-1] = np.where(has_neighbours, interior, 0)
+        return deviation
+
+    def row_mask(self, index):
+        """Mặt nạ (theo thứ tự kho) các bản ghi có mã dòng thuộc index, ví dụ dữ liệu đang lọc"""
+        return pd.Index(index).get_indexer(self.row_ids) >= 0
+
+    def to_row_order(self, values, index):
+        """Sắp xếp lại một mảng theo thứ tự kho về thứ tự dòng của index (NaN nếu không thuộc kho)"""
+        return pd.Series(values, index=self.row_ids).reindex(index).to_numpy()
+
+    def summary(self):
+        lengths = self.lengths
+        return {
+            "vessels": int(self.n_vessels),
+            "positions": int(len(self)),
+            "max_track_length": int(lengths.max()) if len(lengths) else 0,
+            "avg_track_length": float(lengths.mean()) if len(lengths) else 0.0
+        }
@@ -0,0 +1,251 @@
+import os
+import hashlib
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+# Lớp thời tiết dạng lưới (gió, sóng) theo các lát thời gian.
+# Giá trị được lấy mẫu tại từng vị trí AIS bằng phép tính chỉ số trên lưới đều,
+# các lát thời gian đã đọc được giữ trong bộ nhớ đệm LRU.
+#
+# Định dạng hỗ trợ:
+# - Thư mục chứa grid.npz (lat, lon, time) và <field>.npy dạng (time, lat, lon),
+#   các file .npy được ánh xạ bộ nhớ nên chỉ đọc lát thời gian cần dùng
+# - File .npz chứa lat, lon, time và các trường (time, lat, lon)
+# - NetCDF/GRIB qua thư viện xarray (tùy chọn)
+#
+# Thời gian tính bằng giây kể từ epoch (UTC), tốc độ gió tính bằng m/s,
+# chiều cao sóng tính bằng mét.
+
+# Tên trường được nhận diện
+WIND_FIELDS = ['wind_speed', 'wind', 'ws', 'si10']
+WIND_COMPONENTS = [('u10', 'v10'), ('u', 'v'), ('uwnd', 'vwnd')]
+WAVE_FIELDS = ['wave_height', 'swh', 'hs', 'htsgwsfc']
+
+MS_TO_KNOTS = 1.943844
+
+# Số lát thời gian giữ trong bộ nhớ đệm
+SLICE_CACHE_SIZE = 32
+
+def _axis_index(axis, values):
+    """Chỉ số ô lưới gần nhất cho mỗi giá trị (-1 nếu nằm ngoài lưới)"""
+    n = len(axis)
+    if n == 1:
+        index = np.zeros(len(values), dtype=np.int64)
+        step = 0.0
+    else:
+        steps = np.diff(axis)
+        step = steps[0]
+        if np.allclose(steps, step, rtol=1e-4, atol=1e-9):
+            # Lưới đều: tính trực tiếp bằng số học chỉ số
+            index = np.rint((values - axis[0]) / step)
+        else:
+            # Lưới không đều: tìm kiếm nhị phân rồi chọn điểm gần hơn
+            ascending = axis if step > 0 else axis[::-1]
+            right = np.clip(np.searchsorted(ascending, values), 1, n - 1)
+            left = right - 1
+            nearest = np.where(np.abs(values - ascending[left]) <= np.abs(ascending[right] - values), left, right)
+            index = nearest if step > 0 else n - 1 - nearest
+            step = np.max(np.abs(steps))
+    # Cho phép lệch tối đa nửa ô ngoài biên
+    half = abs(step) / 2
+    low, high = min(axis[0], axis[-1]) - half, max(axis[0], axis[-1]) + half
+    outside = ~np.isfinite(values) | (values < low) | (values > high)
+    index = np.where(outside, -1, index)
+    return np.clip(np.nan_to_num(index, nan=-1), -1, n - 1).astype(np.int64)
+
+class WeatherLayer:
+    """Lưới thời tiết theo thời gian với bộ nhớ đệm LRU cho các lát"""
+
+    def __init__(self, name, lats, lons, times, fields, version=None):
+        self.name = name
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.times = np.asarray(times, dtype=np.int64)
+        # fields: tên trường -> hàm đọc lát thời gian thứ t (trả về mảng lat x lon)
+        self.fields = fields
+        self.version = version or hashlib.sha1(name.encode("utf-8")).hexdigest()[:16]
+        self._slices = OrderedDict()
+
+        # Lưới kinh độ toàn cầu thì cho phép quấn vòng
+        span = abs(self.lons[-1] - self.lons[0]) if len(self.lons) > 1 else 0
+        step = abs(self.lons[1] - self.lons[0]) if len(self.lons) > 1 else 0
+        self.lon_wraps = span + step >= 359.9
+        self.lon_positive = self.lons.min() >= 0
+
+    def _slice(self, field, t):
+        key = (field, t)
+        if key in self._slices:
+            self._slices.move_to_end(key)
+            return self._slices[key]
+        values = np.asarray(self.fields[field](t), dtype=np.float32)
+        self._slices[key] = values
+        while len(self._slices) > SLICE_CACHE_SIZE:
+            self._slices.popitem(last=False)
+        return values
+
+    def time_index(self, times_s):
+        """Lát thời gian gần nhất cho mỗi thời điểm (-1 nếu ngoài phạm vi dữ liệu)"""
+        return _axis_index(self.times.astype(np.float64), np.asarray(times_s, dtype=np.float64))
+
+    def sample(self, lats, lons, times_s, field_names=None):
+        """
+        Lấy mẫu các trường thời tiết tại từng vị trí và thời điểm
+
+        Parameters:
+        -----------
+        lats, lons : array-like
+            Vị trí (độ)
+        times_s : array-like
+            Thời điểm (giây kể từ epoch, NaN nếu không có)
+        field_names : list, optional
+            Các trường cần lấy, mặc định là tất cả
+
+        Returns:
+        --------
+        dict
+            Tên trường -> mảng giá trị (NaN nếu vị trí/thời điểm nằm ngoài lưới)
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        if self.lon_positive:
+            lons = np.mod(lons, 360)
+        elif self.lon_wraps:
+            lons = (lons + 180) % 360 - 180
+
+        lat_idx = _axis_index(self.lats, lats)
+        if self.lon_wraps:
+            # Lưới toàn cầu: điểm nằm giữa ô cuối và ô đầu thuộc về ô đầu
+            finite = np.isfinite(lons)
+            step = self.lons[1] - self.lons[0]
+            lon_idx = np.full(len(lons), -1, dtype=np.int64)
+            lon_idx[finite] = np.rint((lons[finite] - self.lons[0]) / step).astype(np.int64) % len(self.lons)
+        else:
+            lon_idx = _axis_index(self.lons, lons)
+        time_idx = self.time_index(times_s)
+
+        valid = (lat_idx >= 0) & (lon_idx >= 0) & (time_idx >= 0)
+        rows = np.flatnonzero(valid)
+        # Nhóm các vị trí theo lát thời gian để mỗi lát chỉ đọc một lần
+        order = rows[np.argsort(time_idx[rows], kind="stable")]
+        slice_ids, starts = np.unique(time_idx[order], return_index=True)
+        bounds = np.append(starts, len(order))
+
+        result = {}
+        for field in field_names or list(self.fields):
+            values = np.full(len(lats), np.nan, dtype=np.float32)
+            for k, t in enumerate(slice_ids):
+                part = order[bounds[k]:bounds[k + 1]]
+                values[part] = self._slice(field, int(t))[lat_idx[part], lon_idx[part]]
+            result[field] = values
+        return result
+
+    def summary(self):
+        return {
+            "name": self.name,
+            "version": self.version,
+            "fields": list(self.fields),
+            "grid": [len(self.times), len(self.lats), len(self.lons)],
+            "time_range": [
+                pd.to_datetime(int(self.times.min()), unit="s").strftime('%Y-%m-%d %H:%M'),
+                pd.to_datetime(int(self.times.max()), unit="s").strftime('%Y-%m-%d %H:%M')
+            ],
+            "cached_slices": len(self._slices)
+        }
+
+def _file_version(path):
+    """Phiên bản của nguồn dữ liệu dựa trên đường dẫn, kích thước và thời gian sửa đổi"""
+    hasher = hashlib.sha1(os.path.abspath(path).encode("utf-8"))
+    paths = [os.path.join(path, f) for f in sorted(os.listdir(path))] if os.path.isdir(path) else [path]
+    for p in paths:
+        stat = os.stat(p)
+        hasher.update(f"{os.path.basename(p)}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+    return hasher.hexdigest()[:16]
+
+def _to_epoch_seconds(times):
+    times = np.asarray(times)
+    if np.issubdtype(times.dtype, np.datetime64):
+        return times.astype("datetime64[s]").astype(np.int64)
+    return times.astype(np.int64)
+
+def _from_npy_dir(path):
+    with np.load(os.path.join(path, "grid.npz")) as grid:
+        lats, lons, times = grid["lat"], grid["lon"], _to_epoch_seconds(grid["time"])
+    fields = {}
+    for filename in sorted(os.listdir(path)):
+        if filename.endswith(".npy"):
+            array = np.load(os.path.join(path, filename), mmap_mode="r")
+            fields[filename[:-4]] = (lambda a: lambda t: a[t])(array)
+    return WeatherLayer(os.path.basename(path.rstrip(os.sep)), lats, lons, times, fields, _file_version(path))
+
+def _from_npz(path):
+    with np.load(path) as data:
+        arrays = {key: data[key] for key in data.files}
+    lats, lons, times = arrays.pop("lat"), arrays.pop("lon"), _to_epoch_seconds(arrays.pop("time"))
+    fields = {name: (lambda a: lambda t: a[t])(array) for name, array in arrays.items() if array.ndim == 3}
+    return WeatherLayer(os.path.basename(path), lats, lons, times, fields, _file_version(path))
+
+def _from_xarray(path):
+    try:
+        import xarray as xr
+    except ImportError:
+        raise ValueError("Reading NetCDF/GRIB files requires the 'xarray' package")
+
+    engine = "cfgrib" if path.lower().endswith((".grib", ".grb", ".grb2", ".grib2")) else None
+    ds = xr.open_dataset(path, engine=engine)
+    lat_name = next((n for n in ['latitude', 'lat'] if n in ds.coords), None)
+    lon_name = next((n for n in ['longitude', 'lon'] if n in ds.coords), None)
+    time_name = next((n for n in ['time', 'valid_time'] if n in ds.coords), None)
+    if not all([lat_name, lon_name, time_name]):
+        raise ValueError("Dataset must have latitude, longitude and time coordinates")
+
+    fields = {}
+    for name, var in ds.data_vars.items():
+        if set(var.dims) == {time_name, lat_name, lon_name}:
+            var = var.transpose(time_name, lat_name, lon_name)
+            fields[name] = (lambda v: lambda t: v.isel({time_name: t}).values)(var)
+    times = np.atleast_1d(_to_epoch_seconds(ds[time_name].values))
+    return WeatherLayer(os.path.basename(path), ds[lat_name].values, ds[lon_name].values, times, fields,
+                        _file_version(path))
+
+def load_weather_layer(path):
+    """Nạp lớp thời tiết từ thư mục .npy, file .npz hoặc NetCDF/GRIB"""
+    if os.path.isdir(path):
+        return _from_npy_dir(path)
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".npz":
+        return _from_npz(path)
+    if ext in (".nc", ".nc4", ".netcdf", ".grib", ".grb", ".grb2", ".grib2"):
+        return _from_xarray(path)
+    raise ValueError(f"Unsupported weather layer format: {ext}")
+
+def weather_risk(layer, lats, lons, times_s):
+    """
+    Tính điểm rủi ro thời tiết (0-100) từ gió và sóng tại từng vị trí
+
+    Gió: 0 điểm ở mức 10 knot trở xuống, 100 điểm từ 48 knot (bão).
+    Sóng: 0 điểm ở mức 1 m trở xuống, 100 điểm từ 6 m.
+    Trả về NaN ở những vị trí không có dữ liệu.
+    """
+    wind_field = next((f for f in WIND_FIELDS if f in layer.fields), None)
+    components = next((c for c in WIND_COMPONENTS if c[0] in layer.fields and c[1] in layer.fields), None)
+    wave_field = next((f for f in WAVE_FIELDS if f in layer.fields), None)
+
+    wanted = [f for f in [wind_field, wave_field] if f] + (list(components) if components and not wind_field else [])
+    if not wanted:
+        raise ValueError("Weather layer has no recognised wind or wave field")
+    sampled = layer.sample(lats, lons, times_s, wanted)
+
+    scores = []
+    if wind_field:
+        wind_kn = sampled[wind_field].astype(np.float64) * MS_TO_KNOTS
+        scores.append(np.clip((wind_kn - 10) / (48 - 10), 0, 1) * 100)
+    elif components:
+        wind_kn = np.hypot(sampled[components[0]], sampled[components[1]]).astype(np.float64) * MS_TO_KNOTS
+        scores.append(np.clip((wind_kn - 10) / (48 - 10), 0, 1) * 100)
+    if wave_field:
+        wave_m = sampled[wave_field].astype(np.float64)
+        scores.append(np.clip((wave_m - 1) / (6 - 1), 0, 1) * 100)
+
+    # Lấy yếu tố nguy hiểm hơn giữa gió và sóng (bỏ qua NaN nếu chỉ thiếu một yếu tố)
+    return np.fmax.reduce(np.vstack(scores), axis=0)